@@ -1,5 +1,5 @@
 import httpx
-from httpx_sse import connect_sse
+from httpx_sse import aconnect_sse
 from typing import Any, AsyncIterable
 from common.types import (
     AgentCard,
@@ -23,13 +23,17 @@ import json
 
 
 class A2AClient:
-    def __init__(self, agent_card: AgentCard = None, url: str = None):
+    def __init__(
+        self, agent_card: AgentCard = None, url: str = None, timeout: float | None = 60
+    ):
         if agent_card:
             self.url = agent_card.url
         elif url:
             self.url = url
         else:
             raise ValueError("Must provide either agent_card or url")
+        # Timeout in seconds of the non-streaming requests. None disables it.
+        self.timeout = timeout
 
     async def send_task(self, payload: dict[str, Any]) -> SendTaskResponse:
         request = SendTaskRequest(params=payload)
@@ -39,12 +43,14 @@ class A2AClient:
         self, payload: dict[str, Any]
     ) -> AsyncIterable[SendTaskStreamingResponse]:
         request = SendTaskStreamingRequest(params=payload)
-        with httpx.Client(timeout=None) as client:
-            with connect_sse(
+        # An async client keeps the event loop free while waiting for events,
+        # so several streams (e.g. parallel subtasks) can progress together.
+        async with httpx.AsyncClient(timeout=None) as client:
+            async with aconnect_sse(
                 client, "POST", self.url, json=request.model_dump()
             ) as event_source:
                 try:
-                    for sse in event_source.iter_sse():
+                    async for sse in event_source.aiter_sse():
                         yield SendTaskStreamingResponse(**json.loads(sse.data))
                 except json.JSONDecodeError as e:
                     raise A2AClientJSONError(str(e)) from e
@@ -56,7 +62,7 @@ class A2AClient:
             try:
                 # Image generation could take time, adding timeout
                 response = await client.post(
-                    self.url, json=request.model_dump(), timeout=60  # TODO : タイムアウトを外部から設定できるようにしたい
+                    self.url, json=request.model_dump(), timeout=self.timeout
                 )
                 response.raise_for_status()
                 return response.json()
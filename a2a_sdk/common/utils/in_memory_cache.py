@@ -1,14 +1,526 @@
-"""In Memory Cache utility."""
+"""In Memory Cache utility.
 
+The module provides a family of bounded caches:
+
+* ``LRUCache``: a thread-safe cache bounded by entry count and/or bytes, with
+  per-key TTL, LRU eviction, named namespaces and hit/miss/eviction statistics.
+  Keys are spread over several independently locked segments so that
+  concurrent callers rarely contend on the same lock.
+* ``AsyncLRUCache``: the same cache exposed through coroutines, with an
+  asyncio based expiry sweeper.
+* ``InMemoryCache``: the historical process-wide singleton, kept as a thin
+  compatibility shim over ``LRUCache``.
+"""
+
+import asyncio
+import heapq
+import itertools
+import sys
 import threading
 import time
-from typing import Any, Dict, Optional
+from collections import OrderedDict
+from dataclasses import dataclass, fields
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+DEFAULT_NAMESPACE = "default"
+
+_MISSING = object()
+
+
+@dataclass
+class CacheStats:
+    """Counters describing the cache activity."""
+
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    entries: int = 0
+    bytes: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        """Ratio of hits over all lookups, 0.0 when nothing was looked up."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def merge(self, other: "CacheStats") -> "CacheStats":
+        """Returns a new CacheStats summing both operands."""
+        return CacheStats(
+            **{f.name: getattr(self, f.name) + getattr(other, f.name) for f in fields(self)}
+        )
+
+
+def estimate_size(value: Any) -> int:
+    """Cheap approximation of the memory held by a cached value.
+
+    Strings and bytes are measured by length, containers are walked one level
+    deep and everything else falls back to ``sys.getsizeof``.
+    """
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return len(value)
+    if isinstance(value, str):
+        return len(value.encode("utf-8", errors="ignore"))
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(
+            sys.getsizeof(k) + sys.getsizeof(v) for k, v in value.items()
+        )
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sys.getsizeof(value) + sum(sys.getsizeof(v) for v in value)
+    return sys.getsizeof(value)
+
+
+class _Entry:
+    __slots__ = ("value", "size", "expires_at", "sequence")
+
+    def __init__(
+        self, value: Any, size: int, expires_at: Optional[float], sequence: int
+    ):
+        self.value = value
+        self.size = size
+        self.expires_at = expires_at
+        # Global access order, used to pick the LRU entry across segments.
+        self.sequence = sequence
+
+
+class _Totals:
+    """Entry and byte counts of the whole cache.
+
+    The lock is a leaf: it may be taken while holding a segment lock, never
+    the other way around.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = 0
+        self.bytes = 0
+
+    def add(self, entries: int, size: int) -> None:
+        with self.lock:
+            self.entries += entries
+            self.bytes += size
+
+    def exceeds(self, max_entries: Optional[int], max_bytes: Optional[int]) -> bool:
+        with self.lock:
+            return (max_entries is not None and self.entries > max_entries) or (
+                max_bytes is not None and self.bytes > max_bytes
+            )
+
+
+class _Segment:
+    """One lock stripe of an LRUCache: an ordered dict plus an expiry heap."""
+
+    def __init__(self, totals: _Totals):
+        self.lock = threading.Lock()
+        self.totals = totals
+        self.data: "OrderedDict[Tuple[str, Hashable], _Entry]" = OrderedDict()
+        self.bytes = 0
+        # (expires_at, sequence, key). Entries are never removed eagerly from
+        # the heap; stale ones are skipped when popped.
+        self.expiry_heap: List[Tuple[float, int, Tuple[str, Hashable]]] = []
+        self.stats: Dict[str, CacheStats] = {}
+
+    def stats_for(self, namespace: str) -> CacheStats:
+        stats = self.stats.get(namespace)
+        if stats is None:
+            stats = self.stats[namespace] = CacheStats()
+        return stats
+
+    def remove(self, key: Tuple[str, Hashable]) -> _Entry:
+        entry = self.data.pop(key)
+        self.bytes -= entry.size
+        self.totals.add(-1, -entry.size)
+        stats = self.stats_for(key[0])
+        stats.entries -= 1
+        stats.bytes -= entry.size
+        return entry
+
+    def insert(self, key: Tuple[str, Hashable], entry: _Entry) -> None:
+        self.data[key] = entry
+        self.bytes += entry.size
+        self.totals.add(1, entry.size)
+        stats = self.stats_for(key[0])
+        stats.entries += 1
+        stats.bytes += entry.size
+
+    def sweep(self, now: float) -> int:
+        removed = 0
+        heap = self.expiry_heap
+        while heap and heap[0][0] <= now:
+            expires_at, _, key = heapq.heappop(heap)
+            entry = self.data.get(key)
+            if entry is not None and entry.expires_at == expires_at:
+                self.remove(key)
+                self.stats_for(key[0]).expirations += 1
+                removed += 1
+        # Keys that are re-set with a new TTL leave stale heap items behind;
+        # rebuild the heap once they dominate it.
+        if len(heap) > 2 * len(self.data) + 64:
+            self.expiry_heap = [
+                item for item in heap
+                if item[2] in self.data and self.data[item[2]].expires_at == item[0]
+            ]
+            heapq.heapify(self.expiry_heap)
+        return removed
+
+
+class LRUCache:
+    """A bounded, thread-safe LRU cache with TTL and namespaces.
+
+    The key space is split over ``stripes`` segments, each guarded by its own
+    lock, so lookups and writes never contend on a global lock. ``max_entries``
+    and ``max_bytes`` bound the whole cache: every entry carries a global
+    access sequence, and when a write takes the cache over a cap the entry
+    with the oldest sequence across all segments is evicted first.
+
+    Expired entries are dropped when they are read, when a segment is written
+    to, and by ``sweep``; ``start_sweeper`` runs ``sweep`` periodically on a
+    daemon thread so that entries which are never read again do not leak.
+    """
+
+    def __init__(
+        self,
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        default_ttl: Optional[float] = None,
+        stripes: int = 16,
+        sizeof: Callable[[Any], int] = estimate_size,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """Initialize the cache.
+
+        Args:
+            max_entries: Maximum number of entries. None means unbounded.
+            max_bytes: Maximum total size of the values as measured by
+                ``sizeof``. None means unbounded. A single value larger than
+                this is not stored.
+            default_ttl: TTL in seconds applied when ``set`` is called without
+                one. None means entries do not expire.
+            stripes: Number of lock stripes.
+            sizeof: Function measuring the size of a value in bytes.
+            clock: Monotonic time source, injectable for tests.
+        """
+        if max_entries is not None and max_entries <= 0:
+            raise ValueError("max_entries must be positive")
+        if max_bytes is not None and max_bytes <= 0:
+            raise ValueError("max_bytes must be positive")
+        stripes = max(1, stripes)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self._sizeof = sizeof
+        self._clock = clock
+        self._sequence = itertools.count()
+        self._totals = _Totals()
+        self._segments = [_Segment(self._totals) for _ in range(stripes)]
+        self._sweeper: Optional[threading.Thread] = None
+        self._sweeper_stop = threading.Event()
+
+    def _segment(self, key: Tuple[str, Hashable]) -> _Segment:
+        return self._segments[hash(key) % len(self._segments)]
+
+    def set(
+        self,
+        key: Hashable,
+        value: Any,
+        ttl: Optional[float] = None,
+        namespace: str = DEFAULT_NAMESPACE,
+    ) -> None:
+        """Set a key-value pair.
+
+        Args:
+            key: The key for the data.
+            value: The data to store.
+            ttl: Time to live in seconds. Falls back to ``default_ttl`` when None.
+            namespace: The namespace the key belongs to.
+        """
+        ttl = self.default_ttl if ttl is None else ttl
+        full_key = (namespace, key)
+        size = self._sizeof(value)
+        segment = self._segment(full_key)
+        now = self._clock()
+        expires_at = now + ttl if ttl is not None else None
+        with segment.lock:
+            segment.sweep(now)
+            if full_key in segment.data:
+                segment.remove(full_key)
+            if self.max_bytes is not None and size > self.max_bytes:
+                # The value can never fit, storing it would only flush the cache.
+                segment.stats_for(namespace).evictions += 1
+                return
+            segment.insert(
+                full_key, _Entry(value, size, expires_at, next(self._sequence))
+            )
+            if expires_at is not None:
+                heapq.heappush(
+                    segment.expiry_heap, (expires_at, next(self._sequence), full_key)
+                )
+        self._evict_overflow()
+
+    def _evict_overflow(self) -> None:
+        """Evict the least recently used entries until the caps are met."""
+        while self._totals.exceeds(self.max_entries, self.max_bytes):
+            # Segment locks are taken one at a time, so concurrent writers may
+            # race for the same victim; the loop re-checks the totals.
+            victim = None
+            oldest = None
+            for segment in self._segments:
+                with segment.lock:
+                    if segment.data:
+                        sequence = next(iter(segment.data.values())).sequence
+                        if oldest is None or sequence < oldest:
+                            oldest, victim = sequence, segment
+            if victim is None:
+                return
+            with victim.lock:
+                if victim.data:
+                    key = next(iter(victim.data))
+                    victim.remove(key)
+                    victim.stats_for(key[0]).evictions += 1
+
+    def get(
+        self,
+        key: Hashable,
+        default: Any = None,
+        namespace: str = DEFAULT_NAMESPACE,
+    ) -> Any:
+        """Get the value associated with a key.
+
+        Args:
+            key: The key for the data.
+            default: The value to return if the key is not found or expired.
+            namespace: The namespace the key belongs to.
+
+        Returns:
+            The cached value, or the default value if not found.
+        """
+        full_key = (namespace, key)
+        segment = self._segment(full_key)
+        with segment.lock:
+            entry = segment.data.get(full_key)
+            stats = segment.stats_for(namespace)
+            if entry is None:
+                stats.misses += 1
+                return default
+            if entry.expires_at is not None and self._clock() >= entry.expires_at:
+                segment.remove(full_key)
+                stats.expirations += 1
+                stats.misses += 1
+                return default
+            segment.data.move_to_end(full_key)
+            entry.sequence = next(self._sequence)
+            stats.hits += 1
+            return entry.value
+
+    def delete(self, key: Hashable, namespace: str = DEFAULT_NAMESPACE) -> bool:
+        """Delete a specific key-value pair from the cache.
+
+        Args:
+            key: The key to delete.
+            namespace: The namespace the key belongs to.
+
+        Returns:
+            True if the key was found and deleted, False otherwise.
+        """
+        full_key = (namespace, key)
+        segment = self._segment(full_key)
+        with segment.lock:
+            if full_key in segment.data:
+                segment.remove(full_key)
+                return True
+            return False
+
+    def clear(self, namespace: Optional[str] = None) -> bool:
+        """Remove all data, or only the data of one namespace.
+
+        Returns:
+            True once the data was cleared.
+        """
+        for segment in self._segments:
+            with segment.lock:
+                if namespace is None:
+                    self._totals.add(-len(segment.data), -segment.bytes)
+                    segment.data.clear()
+                    segment.expiry_heap.clear()
+                    segment.bytes = 0
+                    for stats in segment.stats.values():
+                        stats.entries = 0
+                        stats.bytes = 0
+                else:
+                    for full_key in [k for k in segment.data if k[0] == namespace]:
+                        segment.remove(full_key)
+        return True
+
+    def __contains__(self, key: Hashable) -> bool:
+        full_key = (DEFAULT_NAMESPACE, key)
+        segment = self._segment(full_key)
+        with segment.lock:
+            entry = segment.data.get(full_key)
+            return entry is not None and (
+                entry.expires_at is None or self._clock() < entry.expires_at
+            )
+
+    def __len__(self) -> int:
+        return sum(len(segment.data) for segment in self._segments)
+
+    def namespace(self, name: str) -> "CacheNamespace":
+        """Returns a view of the cache bound to one namespace."""
+        return CacheNamespace(self, name)
+
+    def namespaces(self) -> List[str]:
+        """Names of the namespaces that have been used on this cache."""
+        names = set()
+        for segment in self._segments:
+            with segment.lock:
+                names.update(segment.stats)
+        return sorted(names)
+
+    def stats(self, namespace: Optional[str] = None) -> CacheStats:
+        """Snapshot of the statistics, for the whole cache or one namespace."""
+        total = CacheStats()
+        for segment in self._segments:
+            with segment.lock:
+                if namespace is None:
+                    for stats in segment.stats.values():
+                        total = total.merge(stats)
+                elif namespace in segment.stats:
+                    total = total.merge(segment.stats[namespace])
+        return total
+
+    def sweep(self) -> int:
+        """Drop every expired entry.
+
+        Returns:
+            The number of entries removed.
+        """
+        removed = 0
+        for segment in self._segments:
+            with segment.lock:
+                removed += segment.sweep(self._clock())
+        return removed
+
+    def start_sweeper(self, interval: float = 30.0) -> None:
+        """Run ``sweep`` every ``interval`` seconds on a daemon thread."""
+        if self._sweeper is not None and self._sweeper.is_alive():
+            return
+        self._sweeper_stop.clear()
+
+        def run():
+            while not self._sweeper_stop.wait(interval):
+                self.sweep()
+
+        self._sweeper = threading.Thread(
+            target=run, name="lru-cache-sweeper", daemon=True
+        )
+        self._sweeper.start()
+
+    def stop_sweeper(self) -> None:
+        """Stop the background sweeper started by ``start_sweeper``."""
+        self._sweeper_stop.set()
+        if self._sweeper is not None:
+            self._sweeper.join()
+            self._sweeper = None
+
+
+class CacheNamespace:
+    """A view of an LRUCache restricted to one namespace."""
+
+    def __init__(self, cache: LRUCache, name: str):
+        self.cache = cache
+        self.name = name
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        self.cache.set(key, value, ttl=ttl, namespace=self.name)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        return self.cache.get(key, default, namespace=self.name)
+
+    def delete(self, key: Hashable) -> bool:
+        return self.cache.delete(key, namespace=self.name)
+
+    def clear(self) -> bool:
+        return self.cache.clear(namespace=self.name)
+
+    def stats(self) -> CacheStats:
+        return self.cache.stats(namespace=self.name)
+
+
+class AsyncLRUCache:
+    """Coroutine interface over an LRUCache.
+
+    Critical sections of LRUCache never block on I/O, so the coroutines call
+    straight into it; the class mainly exists to give async code a uniform
+    interface and an expiry sweeper that lives on the event loop instead of a
+    separate thread.
+    """
+
+    def __init__(self, cache: Optional[LRUCache] = None, **kwargs: Any):
+        """Initialize the cache.
+
+        Args:
+            cache: An existing LRUCache to wrap. A new one is created from
+                ``kwargs`` when omitted.
+        """
+        self.cache = cache if cache is not None else LRUCache(**kwargs)
+        self._sweeper: Optional[asyncio.Task] = None
+
+    async def set(
+        self,
+        key: Hashable,
+        value: Any,
+        ttl: Optional[float] = None,
+        namespace: str = DEFAULT_NAMESPACE,
+    ) -> None:
+        self.cache.set(key, value, ttl=ttl, namespace=namespace)
+
+    async def get(
+        self,
+        key: Hashable,
+        default: Any = None,
+        namespace: str = DEFAULT_NAMESPACE,
+    ) -> Any:
+        return self.cache.get(key, default, namespace=namespace)
+
+    async def delete(self, key: Hashable, namespace: str = DEFAULT_NAMESPACE) -> bool:
+        return self.cache.delete(key, namespace=namespace)
+
+    async def clear(self, namespace: Optional[str] = None) -> bool:
+        return self.cache.clear(namespace=namespace)
+
+    def stats(self, namespace: Optional[str] = None) -> CacheStats:
+        return self.cache.stats(namespace=namespace)
+
+    def start_sweeper(self, interval: float = 30.0) -> asyncio.Task:
+        """Run ``sweep`` every ``interval`` seconds on the running event loop."""
+        if self._sweeper is not None and not self._sweeper.done():
+            return self._sweeper
+
+        async def run():
+            while True:
+                await asyncio.sleep(interval)
+                self.cache.sweep()
+
+        self._sweeper = asyncio.get_running_loop().create_task(run())
+        return self._sweeper
+
+    async def stop_sweeper(self) -> None:
+        """Cancel the sweeper task started by ``start_sweeper``."""
+        if self._sweeper is None:
+            return
+        self._sweeper.cancel()
+        try:
+            await self._sweeper
+        except asyncio.CancelledError:
+            pass
+        self._sweeper = None
 
 
 class InMemoryCache:
     """A thread-safe Singleton class to manage cache data.
 
     Ensures only one instance of the cache exists across the application.
+    This is kept for compatibility; new code should create its own
+    ``LRUCache`` so that it gets bounded memory and separate statistics.
     """
 
     _instance: Optional["InMemoryCache"] = None
@@ -38,10 +550,7 @@ class InMemoryCache:
         if not self._initialized:
             with self._lock:
                 if not self._initialized:
-                    # print("Initializing SessionCache storage")
-                    self._cache_data: Dict[str, Dict[str, Any]] = {}
-                    self._ttl: Dict[str, float] = {}
-                    self._data_lock: threading.Lock = threading.Lock()
+                    self._cache = LRUCache(clock=time.time)
                     self._initialized = True
 
     def set(self, key: str, value: Any, ttl: Optional[int] = None) -> None:
@@ -52,14 +561,7 @@ class InMemoryCache:
             value: The data to store.
             ttl: Time to live in seconds. If None, data will not expire.
         """
-        with self._data_lock:
-            self._cache_data[key] = value
-
-            if ttl is not None:
-                self._ttl[key] = time.time() + ttl
-            else:
-                if key in self._ttl:
-                    del self._ttl[key]
+        self._cache.set(key, value, ttl=ttl)
 
     def get(self, key: str, default: Any = None) -> Any:
         """Get the value associated with a key.
@@ -71,14 +573,9 @@ class InMemoryCache:
         Returns:
             The cached value, or the default value if not found.
         """
-        with self._data_lock:
-            if key in self._ttl and time.time() > self._ttl[key]:
-                del self._cache_data[key]
-                del self._ttl[key]
-                return default
-            return self._cache_data.get(key, default)
+        return self._cache.get(key, default)
 
-    def delete(self, key: str) -> None:
+    def delete(self, key: str) -> bool:
         """Delete a specific key-value pair from a cache.
 
         Args:
@@ -87,14 +584,7 @@ class InMemoryCache:
         Returns:
             True if the key was found and deleted, False otherwise.
         """
-
-        with self._data_lock:
-            if key in self._cache_data:
-                del self._cache_data[key]
-                if key in self._ttl:
-                    del self._ttl[key]
-                return True
-            return False
+        return self._cache.delete(key)
 
     def clear(self) -> bool:
         """Remove all data.
@@ -102,8 +592,8 @@ class InMemoryCache:
         Returns:
             True if the data was cleared, False otherwise.
         """
-        with self._data_lock:
-            self._cache_data.clear()
-            self._ttl.clear()
-            return True
-        return False
+        return self._cache.clear()
+
+    def stats(self) -> CacheStats:
+        """Hit, miss and eviction statistics of the shared cache."""
+        return self._cache.stats()
@@ -0,0 +1,402 @@
+"""Memoization utility.
+
+``cached`` memoizes sync and async functions on top of pluggable backends:
+
+    @cached(ttl=300)
+    def lookup(name: str) -> dict: ...
+
+    @cached(ttl=lambda card: 60 if card else 5, backend=DiskBackend("/tmp/cards"))
+    async def fetch_card(url: str) -> AgentCard: ...
+
+Arguments are normalized against the function signature and hashed from a
+canonical JSON form, so ``f(1, b=2)`` and ``f(a=1, b=2)`` share an entry and
+keys stay stable across processes (needed by the disk backend). Concurrent
+callers asking for the same key are coalesced so the underlying function runs
+once per key at a time ("single flight"), and failures listed in
+``cache_errors`` are cached for ``error_ttl`` seconds so a failing lookup is not
+hammered.
+"""
+
+import asyncio
+import concurrent.futures
+import dataclasses
+import datetime
+import enum
+import functools
+import hashlib
+import inspect
+import json
+import logging
+import os
+import pickle
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Iterable, Optional, Tuple, Type, Union
+
+from common.utils.in_memory_cache import CacheStats, LRUCache
+
+logger = logging.getLogger(__name__)
+
+MISSING = object()
+
+TTL = Union[None, float, Callable[[Any], Optional[float]]]
+
+
+class CacheBackend(ABC):
+    """Storage used by ``cached``. Keys are hex digests."""
+
+    # Set to True when the backend performs I/O, so that async callers run it
+    # in a worker thread instead of on the event loop.
+    blocking: bool = False
+
+    @abstractmethod
+    def get(self, key: str) -> Any:
+        """Returns the stored value or ``MISSING``."""
+
+    @abstractmethod
+    def set(self, key: str, value: Any, ttl: Optional[float]) -> None:
+        pass
+
+    @abstractmethod
+    def delete(self, key: str) -> bool:
+        pass
+
+    @abstractmethod
+    def clear(self) -> None:
+        pass
+
+
+class MemoryBackend(CacheBackend):
+    """Stores entries in an LRUCache namespace."""
+
+    def __init__(
+        self,
+        cache: Optional[LRUCache] = None,
+        namespace: str = "memoize",
+        maxsize: Optional[int] = 1024,
+    ):
+        self.cache = cache if cache is not None else LRUCache(max_entries=maxsize)
+        self.namespace = namespace
+
+    def get(self, key: str) -> Any:
+        return self.cache.get(key, MISSING, namespace=self.namespace)
+
+    def set(self, key: str, value: Any, ttl: Optional[float]) -> None:
+        self.cache.set(key, value, ttl=ttl, namespace=self.namespace)
+
+    def delete(self, key: str) -> bool:
+        return self.cache.delete(key, namespace=self.namespace)
+
+    def clear(self) -> None:
+        self.cache.clear(namespace=self.namespace)
+
+
+class DiskBackend(CacheBackend):
+    """Stores one pickle file per entry in a local directory.
+
+    Files are written to a temporary name and renamed into place, so readers
+    never observe a partially written entry, even across processes.
+    """
+
+    blocking = True
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.pkl")
+
+    def get(self, key: str) -> Any:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                expires_at, value = pickle.load(f)
+        except FileNotFoundError:
+            return MISSING
+        except Exception as e:
+            logger.warning(f"Dropping unreadable cache entry {path}: {e}")
+            self.delete(key)
+            return MISSING
+        if expires_at is not None and time.time() >= expires_at:
+            self.delete(key)
+            return MISSING
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float]) -> None:
+        expires_at = time.time() + ttl if ttl is not None else None
+        try:
+            payload = pickle.dumps((expires_at, value))
+        except Exception as e:
+            logger.warning(f"Value for cache key {key} is not picklable: {e}")
+            return
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(payload)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def delete(self, key: str) -> bool:
+        try:
+            os.remove(self._path(key))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def clear(self) -> None:
+        for name in os.listdir(self.directory):
+            if name.endswith(".pkl"):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    pass
+
+
+class _CachedError:
+    """Marks a cached exception so it is raised instead of returned."""
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def _canonical(value: Any) -> Any:
+    """Converts a value into a JSON-serializable form that is stable across runs."""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return {"__bytes__": hashlib.sha256(bytes(value)).hexdigest()}
+    if isinstance(value, enum.Enum):
+        return {"__enum__": type(value).__qualname__, "value": _canonical(value.value)}
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return {"__datetime__": value.isoformat()}
+    if isinstance(value, dict):
+        items = [(_canonical(k), _canonical(v)) for k, v in value.items()]
+        items.sort(key=lambda kv: json.dumps(kv[0], sort_keys=True, default=str))
+        return {"__dict__": items}
+    if isinstance(value, (list, tuple)):
+        return {"__" + type(value).__name__ + "__": [_canonical(v) for v in value]}
+    if isinstance(value, (set, frozenset)):
+        members = [_canonical(v) for v in value]
+        members.sort(key=lambda v: json.dumps(v, sort_keys=True, default=str))
+        return {"__set__": members}
+    if hasattr(value, "model_dump"):
+        return {"__model__": type(value).__qualname__, "data": _canonical(value.model_dump())}
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return {"__dataclass__": type(value).__qualname__, "data": _canonical(dataclasses.asdict(value))}
+    # Objects without a value representation fall back to repr(). This is only
+    # stable when the class defines __repr__; use `ignore` or `key` otherwise.
+    return {"__repr__": repr(value)}
+
+
+def make_key(
+    func: Callable[..., Any],
+    args: Tuple[Any, ...],
+    kwargs: dict,
+    ignore: Iterable[str] = (),
+) -> str:
+    """Builds the cache key for a call of ``func``.
+
+    Args:
+        func: The memoized function.
+        args: Positional arguments of the call.
+        kwargs: Keyword arguments of the call.
+        ignore: Parameter names left out of the key (e.g. ``self``).
+
+    Returns:
+        A hex digest identifying the function and its normalized arguments.
+    """
+    try:
+        bound = inspect.signature(func).bind(*args, **kwargs)
+        bound.apply_defaults()
+        arguments = {k: v for k, v in bound.arguments.items() if k not in ignore}
+    except (TypeError, ValueError):
+        arguments = {"args": args, "kwargs": kwargs}
+    payload = json.dumps(
+        [func.__module__, func.__qualname__, _canonical(arguments)],
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def cached(
+    ttl: TTL = None,
+    *,
+    backend: Optional[CacheBackend] = None,
+    maxsize: Optional[int] = 1024,
+    key: Optional[Callable[..., str]] = None,
+    ignore: Iterable[str] = (),
+    cache_errors: Tuple[Type[BaseException], ...] = (),
+    error_ttl: Optional[float] = 30.0,
+):
+    """Memoizes a sync or async function.
+
+    Args:
+        ttl: Seconds a result stays cached. Either a number, None (no expiry)
+            or a callable receiving the result and returning the TTL for that
+            particular call; returning 0 skips caching the result.
+        backend: Where results are stored. Defaults to a private in-memory
+            LRU holding ``maxsize`` entries.
+        maxsize: Size of the default in-memory backend.
+        key: Custom key function receiving the call arguments.
+        ignore: Parameter names excluded from the default key.
+        cache_errors: Exception types whose occurrence is cached too.
+        error_ttl: Seconds a cached exception is replayed.
+
+    Returns:
+        A decorator. The decorated function exposes ``cache_key``,
+        ``invalidate``, ``cache_clear`` and ``stats``.
+    """
+    if backend is None:
+        backend = MemoryBackend(maxsize=maxsize)
+    ignore = tuple(ignore)
+
+    def decorator(func):
+        stats = CacheStats()
+        stats_lock = threading.Lock()
+        inflight: dict[str, concurrent.futures.Future] = {}
+        async_inflight: dict[Tuple[int, str], asyncio.Future] = {}
+        inflight_lock = threading.Lock()
+
+        def cache_key(*args, **kwargs) -> str:
+            if key is not None:
+                return hashlib.sha256(str(key(*args, **kwargs)).encode("utf-8")).hexdigest()
+            return make_key(func, args, kwargs, ignore)
+
+        def record(hit: bool):
+            with stats_lock:
+                if hit:
+                    stats.hits += 1
+                else:
+                    stats.misses += 1
+
+        def unwrap(value: Any) -> Any:
+            if isinstance(value, _CachedError):
+                raise value.error
+            return value
+
+        def store(k: str, result: Any) -> None:
+            result_ttl = ttl(result) if callable(ttl) else ttl
+            if result_ttl is not None and result_ttl <= 0:
+                return
+            backend.set(k, result, result_ttl)
+
+        def store_error(k: str, error: BaseException) -> None:
+            if cache_errors and isinstance(error, cache_errors):
+                backend.set(k, _CachedError(error), error_ttl)
+
+        if inspect.iscoroutinefunction(func):
+
+            async def call_backend(method, *args):
+                if backend.blocking:
+                    return await asyncio.to_thread(method, *args)
+                return method(*args)
+
+            async def compute(k: str, args, kwargs):
+                try:
+                    result = await func(*args, **kwargs)
+                except Exception as e:
+                    await call_backend(store_error, k, e)
+                    raise
+                await call_backend(store, k, result)
+                return result
+
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                k = cache_key(*args, **kwargs)
+                value = await call_backend(backend.get, k)
+                if value is not MISSING:
+                    record(hit=True)
+                    return unwrap(value)
+                loop = asyncio.get_running_loop()
+                flight_key = (id(loop), k)
+                task = async_inflight.get(flight_key)
+                if task is None and backend.blocking:
+                    # The lookup above awaited a worker thread, so a leader may
+                    # have stored the value and left meanwhile; look again
+                    # before starting a new call.
+                    value = await call_backend(backend.get, k)
+                    if value is not MISSING:
+                        record(hit=True)
+                        return unwrap(value)
+                    task = async_inflight.get(flight_key)
+                if task is None:
+                    record(hit=False)
+                    task = loop.create_task(compute(k, args, kwargs))
+                    async_inflight[flight_key] = task
+                    task.add_done_callback(lambda _: async_inflight.pop(flight_key, None))
+                else:
+                    record(hit=True)
+                # Shield so that a cancelled caller does not cancel the call
+                # other callers are waiting on.
+                return await asyncio.shield(task)
+
+        else:
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                k = cache_key(*args, **kwargs)
+                value = backend.get(k)
+                if value is not MISSING:
+                    record(hit=True)
+                    return unwrap(value)
+                with inflight_lock:
+                    future = inflight.get(k)
+                    leader = future is None
+                    if leader:
+                        future = inflight[k] = concurrent.futures.Future()
+                if not leader:
+                    record(hit=True)
+                    return future.result()
+                try:
+                    # The previous leader stores its result before leaving
+                    # `inflight`, so a value written after the lookup above is
+                    # visible here.
+                    value = backend.get(k)
+                    if value is MISSING:
+                        record(hit=False)
+                        try:
+                            result = func(*args, **kwargs)
+                        except Exception as e:
+                            store_error(k, e)
+                            raise
+                        store(k, result)
+                    else:
+                        # A replayed error is already stored; only hand it on.
+                        record(hit=True)
+                        result = unwrap(value)
+                except Exception as e:
+                    future.set_exception(e)
+                    raise
+                else:
+                    future.set_result(result)
+                    return result
+                finally:
+                    with inflight_lock:
+                        inflight.pop(k, None)
+                    if not future.done():
+                        # BaseException (e.g. KeyboardInterrupt) in the leader.
+                        future.cancel()
+
+        def invalidate(*args, **kwargs) -> bool:
+            return backend.delete(cache_key(*args, **kwargs))
+
+        def get_stats() -> CacheStats:
+            with stats_lock:
+                return CacheStats(hits=stats.hits, misses=stats.misses)
+
+        wrapper.cache_key = cache_key
+        wrapper.invalidate = invalidate
+        wrapper.cache_clear = backend.clear
+        wrapper.stats = get_stats
+        wrapper.backend = backend
+        return wrapper
+
+    return decorator
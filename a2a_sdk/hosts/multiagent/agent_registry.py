@@ -0,0 +1,152 @@
+import json
+import math
+import re
+from collections import Counter
+
+from common.types import AgentCard
+
+_WORD = re.compile(r"[0-9a-z]+")
+_CJK_RUN = re.compile(r"[\u3040-\u30ff\u3400-\u9fff\uf900-\ufaff\uff66-\uff9f]+")
+
+
+def tokenize(text: str) -> list[str]:
+  """Splits text into index terms.
+
+  Latin text is split into lowercase words. Japanese text has no spaces, so
+  runs of kana/kanji are split into character bigrams instead.
+  """
+  if not text:
+    return []
+  text = text.lower()
+  tokens = _WORD.findall(text)
+  for run in _CJK_RUN.findall(text):
+    if len(run) == 1:
+      tokens.append(run)
+    else:
+      tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+  return tokens
+
+
+def card_text(card: AgentCard) -> str:
+  """The searchable text of a card: name, description and skills."""
+  fields = [card.name, card.description or ""]
+  for skill in card.skills or []:
+    fields.append(skill.name)
+    fields.append(skill.description or "")
+    fields.extend(skill.tags or [])
+    fields.extend(skill.examples or [])
+  return "\n".join(fields)
+
+
+class AgentRegistry:
+  """Incremental BM25 index over agent cards.
+
+  Registering or removing a card only touches the postings of that card, and
+  the one-line JSON description used in prompts is serialized once at
+  registration time instead of on every model call.
+  """
+
+  def __init__(self, k1: float = 1.5, b: float = 0.75):
+    self.k1 = k1
+    self.b = b
+    self._cards: dict[str, AgentCard] = {}
+    self._descriptions: dict[str, str] = {}
+    self._term_counts: dict[str, Counter] = {}
+    self._doc_lengths: dict[str, int] = {}
+    self._total_length = 0
+    # term -> {agent name: term frequency}
+    self._postings: dict[str, dict[str, int]] = {}
+
+  def __len__(self) -> int:
+    return len(self._cards)
+
+  def __contains__(self, name: str) -> bool:
+    return name in self._cards
+
+  @property
+  def cards(self) -> list[AgentCard]:
+    return list(self._cards.values())
+
+  def get(self, name: str) -> AgentCard | None:
+    return self._cards.get(name)
+
+  def register(self, card: AgentCard):
+    if card.name in self._cards:
+      self.remove(card.name)
+    counts = Counter(tokenize(card_text(card)))
+    self._cards[card.name] = card
+    self._descriptions[card.name] = json.dumps(
+        {"name": card.name, "description": card.description})
+    self._term_counts[card.name] = counts
+    length = sum(counts.values())
+    self._doc_lengths[card.name] = length
+    self._total_length += length
+    for term, tf in counts.items():
+      self._postings.setdefault(term, {})[card.name] = tf
+
+  def remove(self, name: str):
+    if name not in self._cards:
+      return
+    for term in self._term_counts.pop(name):
+      postings = self._postings[term]
+      del postings[name]
+      if not postings:
+        del self._postings[term]
+    self._total_length -= self._doc_lengths.pop(name)
+    del self._cards[name]
+    del self._descriptions[name]
+
+  def search(self, query: str, top_k: int = 5) -> list[tuple[str, float]]:
+    """Ranks the agents against the query.
+
+    Returns:
+      Up to top_k (agent name, score) pairs with a positive score, best first.
+    """
+    if not self._cards:
+      return []
+    n = len(self._cards)
+    avg_length = self._total_length / n or 1.0
+    scores: dict[str, float] = {}
+    for term in set(tokenize(query)):
+      postings = self._postings.get(term)
+      if not postings:
+        continue
+      idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+      for name, tf in postings.items():
+        norm = self.k1 * (1 - self.b + self.b * self._doc_lengths[name] / avg_length)
+        scores[name] = scores.get(name, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+    return sorted(scores.items(), key=lambda x: (-x[1], x[0]))[:top_k]
+
+  def candidates(
+      self,
+      query: str,
+      top_k: int = 5,
+      always_include: list[str] | None = None,
+  ) -> list[str]:
+    """Names of the agents worth showing to the routing model.
+
+    Every agent is returned while the registry holds at most top_k of them.
+    Otherwise the best matches are returned, completed with the first
+    registered agents when the query matches fewer than top_k.
+    """
+    if len(self._cards) <= top_k:
+      return list(self._cards)
+    names = [n for n in always_include or [] if n in self._cards]
+    for name, _ in self.search(query, top_k):
+      if len(names) >= top_k:
+        break
+      if name not in names:
+        names.append(name)
+    for name in self._cards:
+      if len(names) >= top_k:
+        break
+      if name not in names:
+        names.append(name)
+    return names
+
+  def describe(self, names: list[str] | None = None) -> str:
+    """Prompt lines describing the given agents, or all of them."""
+    if names is None:
+      return "\n".join(self._descriptions.values())
+    return "\n".join(
+        self._descriptions[n] for n in names if n in self._descriptions)
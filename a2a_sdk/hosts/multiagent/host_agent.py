@@ -15,10 +15,9 @@ from google.adk.agents.readonly_context import ReadonlyContext
 from google.adk.agents.callback_context import CallbackContext
 from google.adk.tools.base_tool import BaseTool
 from google.adk.tools.tool_context import ToolContext
-from .remote_agent_connection import (
-    RemoteAgentConnections,
-    TaskUpdateCallback
-)
+from .remote_agent_connection import PollPolicy, TaskUpdateCallback
+from .remote_agent_pool import RemoteAgentConnectionPool
+from .agent_registry import AgentRegistry
 from common.client import A2ACardResolver
 from common.types import (
     AgentCard,
@@ -49,30 +48,70 @@ class HostAgent:
   def __init__(
       self,
       remote_agent_addresses: List[str],
-      task_callback: TaskUpdateCallback | None = None
+      task_callback: TaskUpdateCallback | None = None,
+      max_parallel_tasks: int = 4,
+      subtask_timeout: float = 120.0,
+      routing_top_k: int = 5,
+      push_notification_hub=None,
+      poll_policy: PollPolicy | None = None,
   ):
     self.task_callback = task_callback
-    self.remote_agent_connections: dict[str, RemoteAgentConnections] = {}
+    # Non-streaming agents that accept tasks asynchronously are polled with
+    # poll_policy, or woken up through the hub when they support push
+    # notifications.
+    self.push_notification_hub = push_notification_hub
+    self.poll_policy = poll_policy
+    # Bounds for send_tasks_parallel: number of subtasks in flight at once and
+    # the deadline, in seconds, applied to each of them.
+    self.max_parallel_tasks = max_parallel_tasks
+    self.subtask_timeout = subtask_timeout
+    # Number of candidate agents described in the routing instruction.
+    self.routing_top_k = routing_top_k
+    self.remote_agent_connections: dict[str, RemoteAgentConnectionPool] = {}
     self.cards: dict[str, AgentCard] = {}
+    self.registry = AgentRegistry()
     for address in remote_agent_addresses:
       card_resolver = A2ACardResolver(address)
       card = card_resolver.get_agent_card()
-      remote_connection = RemoteAgentConnections(card)
-      self.remote_agent_connections[card.name] = remote_connection
-      self.cards[card.name] = card
-    agent_info = []
-    for ra in self.list_remote_agents():
-      agent_info.append(json.dumps(ra))
-    self.agents = '\n'.join(agent_info)
+      self.register_agent_card(card)
 
   def register_agent_card(self, card: AgentCard):
-    remote_connection = RemoteAgentConnections(card)
-    self.remote_agent_connections[card.name] = remote_connection
+    """Registers a card in place; the agent built by create_agent picks it up
+    on its next model call, so the runner does not need to be rebuilt."""
+    # A card whose name is already known but served from another url is a
+    # replica of that agent: it joins the existing pool. The same url again
+    # refreshes the card and keeps the pool with its breakers and sessions.
+    pool = self.remote_agent_connections.get(card.name)
+    if pool and card.url != pool.card.url:
+      pool.add_endpoint(card.url)
+      return
+    if pool:
+      pool.update_card(card)
+    else:
+      self.remote_agent_connections[card.name] = RemoteAgentConnectionPool(
+          card,
+          poll_policy=self.poll_policy,
+          notification_hub=self.push_notification_hub,
+      )
+    if self.push_notification_hub and card.capabilities.pushNotifications:
+      self.push_notification_hub.add_jwks(
+          card.url.rstrip('/') + '/.well-known/jwks.json')
     self.cards[card.name] = card
-    agent_info = []
-    for ra in self.list_remote_agents():
-      agent_info.append(json.dumps(ra))
-    self.agents = '\n'.join(agent_info)
+    self.registry.register(card)
+
+  @property
+  def agents(self) -> str:
+    """Prompt lines describing every registered agent."""
+    return self.registry.describe()
+
+  def routing_candidates(self, context: ReadonlyContext) -> list[str]:
+    """Agents to describe in the instruction for the current user request."""
+    active_agent = self.check_state(context)['active_agent']
+    return self.registry.candidates(
+        get_user_text(context),
+        top_k=self.routing_top_k,
+        always_include=[active_agent] if active_agent != "None" else None,
+    )
 
   def create_agent(self) -> Agent:
     return Agent(
@@ -89,6 +128,7 @@ class HostAgent:
         tools=[
             self.list_remote_agents,
             self.send_task,
+            self.send_tasks_parallel,
         ],
     )
 
@@ -104,6 +144,9 @@ can use to delegate the task.
 Execution:
 - For actionable tasks, you can use `create_task` to assign tasks to remote agents to perform.
 Be sure to include the remote agent name when you respond to the user.
+- When the request splits into independent parts (e.g. comparing several
+companies), use `send_tasks_parallel` to send them all at once instead of
+calling `send_task` repeatedly.
 
 You can use `check_pending_task_states` to check the states of the pending
 tasks.
@@ -113,8 +156,8 @@ Focus on the most recent parts of the conversation primarily.
 
 If there is an active agent, send the request to that agent with the update task tool.
 
-Agents:
-{self.agents}
+Agents most relevant to the request (use `list_remote_agents` to see all {len(self.registry)}):
+{self.registry.describe(self.routing_candidates(context))}
 
 Current agent: {current_agent['active_agent']}
 """
@@ -180,7 +223,6 @@ Current agent: {current_agent['active_agent']}
       raise ValueError(f"Agent {agent_name} not found")
     state = tool_context.state
     state['agent'] = agent_name
-    card = self.cards[agent_name]
     client = self.remote_agent_connections[agent_name]
     if not client:
       raise ValueError(f"Client not available for {agent_name}")
@@ -188,29 +230,7 @@ Current agent: {current_agent['active_agent']}
       taskId = state['task_id']
     else:
       taskId = str(uuid.uuid4())
-    sessionId = state['session_id']
-    task: Task
-    messageId = ""
-    metadata = {}
-    if 'input_message_metadata' in state:
-      metadata.update(**state['input_message_metadata'])
-      if 'message_id' in state['input_message_metadata']:
-        messageId = state['input_message_metadata']['message_id']
-    if not messageId:
-      messageId = str(uuid.uuid4())
-    metadata.update(**{'conversation_id': sessionId, 'message_id': messageId})
-    request: TaskSendParams = TaskSendParams(
-        id=taskId,
-        sessionId=sessionId,
-        message=Message(
-            role="user",
-            parts=[TextPart(text=message)],
-            metadata=metadata,
-        ),
-        acceptedOutputModes=["text", "text/plain", "image/png"],
-        # pushNotification=None,
-        metadata={'conversation_id': sessionId},
-    )
+    request = self._build_task_request(taskId, message, state)
     task = await client.send_task(request, self.task_callback)
 
     # Assume completion unless a state returns that isn't complete
@@ -230,19 +250,144 @@ Current agent: {current_agent['active_agent']}
     elif task.status.state == TaskState.FAILED:
       # Raise error for failure
       raise ValueError(f"Agent {agent_name} task {task.id} failed")
-    response = []
-    if task.status.message:
-      # Assume the information is in the task message.
-      response.extend(convert_parts(task.status.message.parts, tool_context))
-    if task.artifacts:
-      for artifact in task.artifacts:
-        response.extend(convert_parts(artifact.parts, tool_context))
+    response = convert_task(task, tool_context)
 
     # debug
     logger.info(f"task response: {response}")
 
     return response
 
+  async def send_tasks_parallel(
+      self,
+      agent_names: list[str],
+      messages: list[str],
+      tool_context: ToolContext):
+    """Sends several independent tasks to remote agents at the same time.
+
+    Use this instead of repeated send_task calls when a request splits into
+    parts that do not depend on each other, e.g. analyzing several companies.
+    The i-th message is sent to the i-th agent; the same agent may appear
+    more than once.
+
+    Args:
+      agent_names: The names of the agents to send the tasks to.
+      messages: The messages to send, one per entry of agent_names.
+      tool_context: The tool context this method runs in.
+
+    Returns:
+      One result per subtask, in the order given, each holding the agent
+      name, the final task state and either the response or an error.
+    """
+    if len(agent_names) != len(messages):
+      raise ValueError("agent_names and messages must have the same length")
+    for agent_name in agent_names:
+      if agent_name not in self.remote_agent_connections:
+        raise ValueError(f"Agent {agent_name} not found")
+    state = tool_context.state
+    semaphore = asyncio.Semaphore(max(1, self.max_parallel_tasks))
+
+    async def run_subtask(agent_name: str, message: str):
+      # Subtasks always open fresh remote tasks; they are not resumed later,
+      # so they must not overwrite the active task/agent of the session.
+      request = self._build_task_request(
+          str(uuid.uuid4()), message, state, new_message_id=True)
+      async with semaphore:
+        task = await asyncio.wait_for(
+            self.remote_agent_connections[agent_name].send_task(
+                request, self.task_callback),
+            timeout=self.subtask_timeout)
+      return task
+
+    results: list[dict[str, Any]] = [
+        {"agent_name": agent_name, "state": TaskState.UNKNOWN.value}
+        for agent_name in agent_names
+    ]
+    pending = {
+        asyncio.ensure_future(run_subtask(agent_name, message)): i
+        for i, (agent_name, message) in enumerate(zip(agent_names, messages))
+    }
+    # Aggregate results as they arrive so one slow agent only delays itself.
+    while pending:
+      done, _ = await asyncio.wait(
+          pending.keys(), return_when=asyncio.FIRST_COMPLETED)
+      for future in done:
+        index = pending.pop(future)
+        result = results[index]
+        try:
+          task = future.result()
+        except asyncio.TimeoutError:
+          result["state"] = TaskState.FAILED.value
+          result["error"] = f"timed out after {self.subtask_timeout} seconds"
+        except Exception as e:
+          result["state"] = TaskState.FAILED.value
+          result["error"] = str(e)
+        else:
+          if task is None:
+            result["error"] = "no task was returned"
+          else:
+            result["task_id"] = task.id
+            result["state"] = task.status.state.value
+            result["response"] = convert_task(task, tool_context)
+        logger.info(f"subtask {index} for {result['agent_name']} finished: "
+                    f"{result['state']}")
+    return results
+
+  def _build_task_request(
+      self,
+      task_id: str,
+      message: str,
+      state: dict[str, Any],
+      new_message_id: bool = False,
+  ) -> TaskSendParams:
+    sessionId = state['session_id']
+    messageId = ""
+    metadata = {}
+    if 'input_message_metadata' in state:
+      metadata.update(**state['input_message_metadata'])
+      if 'message_id' in state['input_message_metadata']:
+        messageId = state['input_message_metadata']['message_id']
+    if new_message_id:
+      # Parallel subtasks each need their own id, since the UI de-duplicates
+      # messages by id; keep the id of the user message they came from.
+      if messageId:
+        metadata['parent_message_id'] = messageId
+      messageId = ""
+    if not messageId:
+      messageId = str(uuid.uuid4())
+    metadata.update(**{'conversation_id': sessionId, 'message_id': messageId})
+    return TaskSendParams(
+        id=task_id,
+        sessionId=sessionId,
+        message=Message(
+            role="user",
+            parts=[TextPart(text=message)],
+            metadata=metadata,
+        ),
+        acceptedOutputModes=["text", "text/plain", "image/png"],
+        # pushNotification=None,
+        metadata={'conversation_id': sessionId},
+    )
+
+def get_user_text(context: ReadonlyContext) -> str:
+  """Text of the user message that started the current invocation."""
+  content = getattr(context, 'user_content', None)
+  if content is None:
+    invocation_context = getattr(context, '_invocation_context', None)
+    content = getattr(invocation_context, 'user_content', None)
+  if not content or not content.parts:
+    return ""
+  return " ".join(p.text for p in content.parts if getattr(p, 'text', None))
+
+def convert_task(task: Task, tool_context: ToolContext):
+  response = []
+  if task.status.message:
+    # Assume the information is in the task message.
+    response.extend(convert_parts(task.status.message.parts, tool_context))
+  if task.artifacts:
+    for artifact in task.artifacts:
+      response.extend(convert_parts(artifact.parts, tool_context))
+  return response
+
 def convert_parts(parts: list[Part], tool_context: ToolContext):
   rval = []
   for p in parts:
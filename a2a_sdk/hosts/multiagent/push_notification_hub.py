@@ -0,0 +1,121 @@
+import asyncio
+import threading
+from collections import OrderedDict
+from logging import getLogger
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+from common.utils.push_notification_auth import PushNotificationReceiverAuth
+
+logger = getLogger(__name__)
+
+
+class PushNotificationHub:
+  """Receives push notifications from remote agents and wakes up pollers.
+
+  A notification only tells the host that a task changed; the waiting
+  RemoteAgentConnections then fetches the task with `tasks/get`. A forged
+  notification can therefore at worst trigger an extra poll, but when the
+  agents publish a JWKS the notifications are verified anyway.
+
+  The hub is thread safe: notifications usually arrive on the web server's
+  event loop while tasks are awaited on other loops.
+  """
+
+  def __init__(self, url: str, max_unclaimed: int = 1024):
+    """
+    Args:
+      url: The public url of the notification endpoint, sent to the agents.
+      max_unclaimed: How many notifications nobody waited for are remembered.
+    """
+    self.url = url
+    self.max_unclaimed = max_unclaimed
+    self._lock = threading.Lock()
+    self._waiters: dict[str, list[tuple[asyncio.AbstractEventLoop, asyncio.Event]]] = {}
+    # Notifications that arrived while nobody was waiting for the task.
+    self._unclaimed: OrderedDict[str, None] = OrderedDict()
+    self._jwks_urls: list[str] = []
+    self._receivers: dict[str, PushNotificationReceiverAuth] = {}
+
+  def add_jwks(self, jwks_url: str):
+    """Trusts the signing keys published at jwks_url."""
+    with self._lock:
+      if jwks_url not in self._jwks_urls:
+        self._jwks_urls.append(jwks_url)
+
+  async def wait(self, task_id: str, timeout: float) -> bool:
+    """Waits until the task is notified or the timeout expires.
+
+    Returns:
+      True if a notification was received.
+    """
+    event = asyncio.Event()
+    entry = (asyncio.get_running_loop(), event)
+    with self._lock:
+      if task_id in self._unclaimed:
+        del self._unclaimed[task_id]
+        return True
+      self._waiters.setdefault(task_id, []).append(entry)
+    try:
+      await asyncio.wait_for(event.wait(), timeout)
+      return True
+    except asyncio.TimeoutError:
+      return False
+    finally:
+      with self._lock:
+        waiters = self._waiters.get(task_id, [])
+        if entry in waiters:
+          waiters.remove(entry)
+        if not waiters:
+          self._waiters.pop(task_id, None)
+
+  def notify(self, task_id: str):
+    with self._lock:
+      waiters = list(self._waiters.get(task_id, []))
+      if not waiters:
+        self._unclaimed[task_id] = None
+        self._unclaimed.move_to_end(task_id)
+        while len(self._unclaimed) > self.max_unclaimed:
+          self._unclaimed.popitem(last=False)
+        return
+    for loop, event in waiters:
+      loop.call_soon_threadsafe(event.set)
+
+  async def _verify(self, request: Request) -> bool:
+    with self._lock:
+      jwks_urls = list(self._jwks_urls)
+    if not jwks_urls:
+      return True
+    for jwks_url in jwks_urls:
+      receiver = self._receivers.get(jwks_url)
+      if receiver is None:
+        receiver = PushNotificationReceiverAuth()
+        await receiver.load_jwks(jwks_url)
+        self._receivers[jwks_url] = receiver
+      try:
+        if await receiver.verify_push_notification(request):
+          return True
+      except Exception as e:
+        logger.debug(f"Push notification not signed by {jwks_url}: {e}")
+    return False
+
+  async def handle_notification(self, request: Request) -> Response:
+    try:
+      data = await request.json()
+    except Exception:
+      return Response(status_code=400)
+    if not await self._verify(request):
+      logger.warning("Rejected push notification with an invalid signature")
+      return Response(status_code=401)
+    task_id = data.get("id") if isinstance(data, dict) else None
+    if not task_id:
+      return Response(status_code=400)
+    self.notify(task_id)
+    return Response(status_code=200)
+
+  async def handle_validation_check(self, request: Request) -> Response:
+    validation_token = request.query_params.get("validationToken")
+    if not validation_token:
+      return Response(status_code=400)
+    return Response(content=validation_token, status_code=200)
@@ -1,7 +1,13 @@
+import asyncio
+import random
+import time
+from dataclasses import dataclass
+from logging import getLogger
 from typing import Callable
 import uuid
 from common.types import (
     AgentCard,
+    PushNotificationConfig,
     Task,
     TaskSendParams,
     TaskStatusUpdateEvent,
@@ -14,12 +20,59 @@ from common.client import A2AClient
 TaskCallbackArg = Task | TaskStatusUpdateEvent | TaskArtifactUpdateEvent
 TaskUpdateCallback = Callable[[TaskCallbackArg, AgentCard], Task]
 
+logger = getLogger(__name__)
+
+# States in which a remote task is still running and has to be polled.
+RUNNING_STATES = (TaskState.SUBMITTED, TaskState.WORKING)
+
+
+@dataclass
+class PollPolicy:
+  """How a non-streaming task is followed until it leaves WORKING.
+
+  The poll interval starts at `initial_interval` and grows by `multiplier`
+  up to `max_interval` while the task does not change, and falls back to
+  `initial_interval` whenever it does. `jitter` spreads the polls of
+  concurrent tasks by +/- that fraction of the interval. When push
+  notifications are active, polls are only a safety net and happen every
+  `push_interval` seconds unless a notification arrives first.
+  """
+  initial_interval: float = 1.0
+  max_interval: float = 30.0
+  multiplier: float = 2.0
+  jitter: float = 0.1
+  push_interval: float = 60.0
+  timeout: float = 3600.0
+  request_timeout: float | None = 60.0
+
+  def next_interval(self, interval: float) -> float:
+    return min(interval * self.multiplier, self.max_interval)
+
+  def jittered(self, interval: float) -> float:
+    return max(0.0, interval * (1 + random.uniform(-self.jitter, self.jitter)))
+
+
 class RemoteAgentConnections:
   """A class to hold the connections to the remote agents."""
 
-  def __init__(self, agent_card: AgentCard):
-    self.agent_client = A2AClient(agent_card)
+  def __init__(
+      self,
+      agent_card: AgentCard,
+      poll_policy: PollPolicy | None = None,
+      notification_hub=None,
+  ):
+    """
+    Args:
+      agent_card: The card of the remote agent.
+      poll_policy: How running non-streaming tasks are polled.
+      notification_hub: A PushNotificationHub. When set and the agent
+        supports push notifications, polls are triggered by notifications.
+    """
+    self.poll_policy = poll_policy or PollPolicy()
+    self.agent_client = A2AClient(
+        agent_card, timeout=self.poll_policy.request_timeout)
     self.card = agent_card
+    self.notification_hub = notification_hub
 
     self.conversation_name = None
     self.conversation = None
@@ -65,24 +118,90 @@ class RemoteAgentConnections:
           break
       return task
     else: # Non-streaming
+      use_push = bool(self.notification_hub and
+                      self.card.capabilities.pushNotifications)
+      if use_push and request.pushNotification is None:
+        request = request.model_copy(update={
+            'pushNotification': PushNotificationConfig(
+                url=self.notification_hub.url)
+        })
       response = await self.agent_client.send_task(request.model_dump())
-      merge_metadata(response.result, request)
-      # For task status updates, we need to propagate metadata and provide
-      # a unique message id.
-      if (hasattr(response.result, 'status') and
-          hasattr(response.result.status, 'message') and
-          response.result.status.message):
-        merge_metadata(response.result.status.message, request.message)
-        m = response.result.status.message
-        if not m.metadata:
-          m.metadata = {}
-        if 'message_id' in m.metadata:
-          m.metadata['last_message_id'] = m.metadata['message_id']
-        m.metadata['message_id'] = str(uuid.uuid4())
+      if response.error:
+        raise ValueError(
+            f"Agent {self.card.name} rejected the task: {response.error.message}")
+      task = prepare_task(response.result, request)
+      if task_callback:
+        task_callback(task, self.card)
+      # Agents that accept the task right away report it as WORKING and
+      # finish it in the background.
+      if task.status.state in RUNNING_STATES:
+        task = await self._poll_task(task, request, task_callback, use_push)
+      return task
 
+  async def _poll_task(
+      self,
+      task: Task,
+      request: TaskSendParams,
+      task_callback: TaskUpdateCallback | None,
+      use_push: bool,
+  ) -> Task:
+    """Polls `tasks/get` until the task leaves the running states."""
+    policy = self.poll_policy
+    deadline = time.monotonic() + policy.timeout
+    interval = policy.initial_interval
+    last_seen = task_fingerprint(task)
+    while task.status.state in RUNNING_STATES:
+      remaining = deadline - time.monotonic()
+      if remaining <= 0:
+        raise TimeoutError(
+            f"Task {task.id} of {self.card.name} still "
+            f"{task.status.state.value} after {policy.timeout}s")
+      if use_push:
+        await self.notification_hub.wait(
+            task.id, min(policy.jittered(policy.push_interval), remaining))
+      else:
+        await asyncio.sleep(min(policy.jittered(interval), remaining))
+      response = await self.agent_client.get_task({'id': task.id})
+      if response.error or response.result is None:
+        message = response.error.message if response.error else 'not found'
+        raise ValueError(
+            f"Failed to get task {task.id} from {self.card.name}: {message}")
+      fingerprint = task_fingerprint(response.result)
+      if fingerprint == last_seen:
+        interval = policy.next_interval(interval)
+        continue
+      logger.debug(f"Task {task.id} of {self.card.name} is now "
+                   f"{response.result.status.state.value}")
+      last_seen = fingerprint
+      interval = policy.initial_interval
+      task = prepare_task(response.result, request)
       if task_callback:
-        task_callback(response.result, self.card)
-      return response.result
+        task_callback(task, self.card)
+    return task
+
+
+def task_fingerprint(task: Task) -> tuple:
+  """What has to change for a polled task to be reported again."""
+  return (
+      task.status.state,
+      task.status.timestamp,
+      len(task.artifacts or []),
+      len(task.history or []),
+  )
+
+
+def prepare_task(task: Task, request: TaskSendParams) -> Task:
+  """Propagates the request metadata and gives the status message a unique id."""
+  merge_metadata(task, request)
+  if task.status.message:
+    merge_metadata(task.status.message, request.message)
+    m = task.status.message
+    if not m.metadata:
+      m.metadata = {}
+    if 'message_id' in m.metadata:
+      m.metadata['last_message_id'] = m.metadata['message_id']
+    m.metadata['message_id'] = str(uuid.uuid4())
+  return task
 
 def merge_metadata(target, source):
   if not hasattr(target, 'metadata') or not hasattr(source, 'metadata'):
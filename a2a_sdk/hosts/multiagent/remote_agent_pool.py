@@ -0,0 +1,314 @@
+import asyncio
+import itertools
+import time
+from collections import deque
+from logging import getLogger
+
+import httpx
+
+from common.types import AgentCard, Task, TaskSendParams
+from common.utils.in_memory_cache import LRUCache
+from .remote_agent_connection import (
+    PollPolicy,
+    RemoteAgentConnections,
+    TaskUpdateCallback,
+)
+
+logger = getLogger(__name__)
+
+
+class CircuitBreaker:
+  """Error-rate circuit breaker for one endpoint.
+
+  The breaker opens once at least `min_requests` calls were made within the
+  last `window_seconds` and the share of failures among them reaches
+  `failure_rate_threshold`. After `open_seconds` a single trial call is let
+  through (half-open); its outcome closes or re-opens the breaker.
+  """
+
+  CLOSED = "closed"
+  OPEN = "open"
+  HALF_OPEN = "half_open"
+
+  def __init__(
+      self,
+      failure_rate_threshold: float = 0.5,
+      min_requests: int = 5,
+      window_seconds: float = 60.0,
+      open_seconds: float = 30.0,
+      clock=time.monotonic,
+  ):
+    self.failure_rate_threshold = failure_rate_threshold
+    self.min_requests = min_requests
+    self.window_seconds = window_seconds
+    self.open_seconds = open_seconds
+    self._clock = clock
+    self._outcomes: deque[tuple[float, bool]] = deque()
+    self._state = self.CLOSED
+    self._opened_at = 0.0
+    self._trial_in_flight = False
+
+  @property
+  def state(self) -> str:
+    if (self._state == self.OPEN and
+        self._clock() - self._opened_at >= self.open_seconds):
+      self._state = self.HALF_OPEN
+      self._trial_in_flight = False
+    return self._state
+
+  def allow_request(self) -> bool:
+    """Returns True if a call may be sent, reserving the half-open trial."""
+    state = self.state
+    if state == self.CLOSED:
+      return True
+    if state == self.HALF_OPEN and not self._trial_in_flight:
+      self._trial_in_flight = True
+      return True
+    return False
+
+  def is_available(self) -> bool:
+    """Like allow_request, without reserving anything."""
+    state = self.state
+    return state == self.CLOSED or (
+        state == self.HALF_OPEN and not self._trial_in_flight)
+
+  def release(self):
+    """Gives back a half-open trial that ended without an outcome."""
+    self._trial_in_flight = False
+
+  def record_success(self):
+    if self._state == self.HALF_OPEN:
+      self._state = self.CLOSED
+      self._outcomes.clear()
+      return
+    self._record(True)
+
+  def record_failure(self):
+    if self._state == self.HALF_OPEN:
+      self._open()
+      return
+    self._record(False)
+    failures = sum(1 for _, ok in self._outcomes if not ok)
+    if (len(self._outcomes) >= self.min_requests and
+        failures / len(self._outcomes) >= self.failure_rate_threshold):
+      self._open()
+
+  def _record(self, ok: bool):
+    now = self._clock()
+    self._outcomes.append((now, ok))
+    while self._outcomes and now - self._outcomes[0][0] > self.window_seconds:
+      self._outcomes.popleft()
+
+  def _open(self):
+    self._state = self.OPEN
+    self._opened_at = self._clock()
+    self._trial_in_flight = False
+    self._outcomes.clear()
+
+
+class AgentEndpoint:
+  """One replica of a remote agent and its bookkeeping."""
+
+  def __init__(self, agent_card: AgentCard, breaker: CircuitBreaker,
+               **connection_kwargs):
+    self.url = agent_card.url
+    self.connection = RemoteAgentConnections(agent_card, **connection_kwargs)
+    self.breaker = breaker
+    self.outstanding = 0
+    self.healthy = True
+    self.last_error: str | None = None
+
+  def is_available(self) -> bool:
+    return self.healthy and self.breaker.is_available()
+
+
+class RemoteAgentConnectionPool:
+  """Spreads the tasks for one agent card over several replicas.
+
+  It offers the same `send_task` interface as RemoteAgentConnections.
+  Endpoints are probed through their agent card endpoint, requests go to the
+  available endpoint with the fewest outstanding requests, failing endpoints
+  are taken out of rotation by a circuit breaker, and every session sticks to
+  the endpoint that served it first, since agents keep session state in
+  process.
+  """
+
+  def __init__(
+      self,
+      agent_card: AgentCard,
+      replica_urls: list[str] | None = None,
+      health_check_interval: float = 30.0,
+      health_check_timeout: float = 5.0,
+      agent_card_path: str = "/.well-known/agent.json",
+      max_sessions: int = 10000,
+      session_ttl: float = 3600.0,
+      breaker_factory=CircuitBreaker,
+      poll_policy: PollPolicy | None = None,
+      notification_hub=None,
+  ):
+    self.card = agent_card
+    self.poll_policy = poll_policy
+    self.notification_hub = notification_hub
+    self.health_check_interval = health_check_interval
+    self.health_check_timeout = health_check_timeout
+    self.agent_card_path = agent_card_path
+    self._breaker_factory = breaker_factory
+    self._endpoints: dict[str, AgentEndpoint] = {}
+    self._round_robin = itertools.count()
+    self._last_health_check = 0.0
+    self._health_task: asyncio.Task | None = None
+    self._check_task: asyncio.Task | None = None
+    # sessionId -> endpoint url
+    self._affinity = LRUCache(max_entries=max_sessions, default_ttl=session_ttl)
+    self.add_endpoint(agent_card.url)
+    for url in replica_urls or []:
+      self.add_endpoint(url)
+
+  @property
+  def endpoints(self) -> list[AgentEndpoint]:
+    return list(self._endpoints.values())
+
+  def get_agent(self) -> AgentCard:
+    return self.card
+
+  def add_endpoint(self, url: str):
+    if url in self._endpoints:
+      return
+    self._endpoints[url] = AgentEndpoint(
+        self.card.model_copy(update={'url': url}), self._breaker_factory(),
+        poll_policy=self.poll_policy, notification_hub=self.notification_hub)
+
+  def remove_endpoint(self, url: str):
+    self._endpoints.pop(url, None)
+
+  def update_card(self, agent_card: AgentCard):
+    """Takes a refreshed card of the same agent without dropping the
+    endpoints, their breakers or the session affinity."""
+    self.card = agent_card
+    for endpoint in self.endpoints:
+      endpoint.connection.card = agent_card.model_copy(
+          update={'url': endpoint.url})
+
+  async def check_health(self):
+    """Probes the agent card endpoint of every replica once."""
+    self._last_health_check = time.monotonic()
+    async with httpx.AsyncClient(timeout=self.health_check_timeout) as client:
+      await asyncio.gather(
+          *(self._probe(client, endpoint) for endpoint in self.endpoints))
+
+  async def _probe(self, client: httpx.AsyncClient, endpoint: AgentEndpoint):
+    url = endpoint.url.rstrip("/") + self.agent_card_path
+    try:
+      response = await client.get(url)
+      response.raise_for_status()
+      healthy = response.json().get("name") == self.card.name
+      endpoint.last_error = None if healthy else "agent card mismatch"
+    except Exception as e:
+      healthy = False
+      endpoint.last_error = str(e)
+    if healthy != endpoint.healthy:
+      logger.info(f"Endpoint {endpoint.url} of {self.card.name} is now "
+                  f"{'healthy' if healthy else 'unhealthy'}")
+    endpoint.healthy = healthy
+
+  def start_health_checks(self) -> asyncio.Task:
+    """Probes the replicas periodically on the running event loop."""
+    if self._health_task is None or self._health_task.done():
+      async def run():
+        while True:
+          await self.check_health()
+          await asyncio.sleep(self.health_check_interval)
+      self._health_task = asyncio.get_running_loop().create_task(run())
+    return self._health_task
+
+  def _maybe_check_health(self):
+    # Without a background checker, refresh the view lazily. The probe runs
+    # as its own task so that no request waits on it, and at most one probe
+    # is in flight. A single endpoint has nothing to fail over to, so it is
+    # not probed.
+    if len(self._endpoints) < 2:
+      return
+    if self._health_task is not None and not self._health_task.done():
+      return
+    if self._check_task is not None and not self._check_task.done():
+      return
+    if time.monotonic() - self._last_health_check < self.health_check_interval:
+      return
+    self._last_health_check = time.monotonic()
+    self._check_task = asyncio.get_running_loop().create_task(
+        self._check_health_quietly())
+
+  async def _check_health_quietly(self):
+    try:
+      await self.check_health()
+    except Exception as e:
+      logger.warning(f"Health check of {self.card.name} failed: {e}")
+
+  def _select(self, session_id: str | None,
+              exclude: set[str]) -> AgentEndpoint | None:
+    if session_id:
+      url = self._affinity.get(session_id)
+      endpoint = self._endpoints.get(url) if url else None
+      if (endpoint and endpoint.url not in exclude and
+          endpoint.is_available()):
+        return endpoint
+    candidates = [
+        e for e in self.endpoints if e.url not in exclude and e.is_available()
+    ]
+    if not candidates:
+      # Fail open when every replica looks down: the checks may be stale.
+      candidates = [
+          e for e in self.endpoints
+          if e.url not in exclude and e.breaker.is_available()
+      ]
+    if not candidates:
+      return None
+    fewest = min(e.outstanding for e in candidates)
+    candidates = [e for e in candidates if e.outstanding == fewest]
+    return candidates[next(self._round_robin) % len(candidates)]
+
+  async def send_task(
+      self,
+      request: TaskSendParams,
+      task_callback: TaskUpdateCallback | None,
+  ) -> Task | None:
+    self._maybe_check_health()
+    tried: set[str] = set()
+    while True:
+      endpoint = self._select(request.sessionId, tried)
+      if endpoint is None:
+        raise ValueError(
+            f"No available endpoint for agent {self.card.name}")
+      if not endpoint.breaker.allow_request():
+        tried.add(endpoint.url)
+        continue
+      tried.add(endpoint.url)
+      if request.sessionId:
+        self._affinity.set(request.sessionId, endpoint.url)
+      endpoint.outstanding += 1
+      try:
+        task = await endpoint.connection.send_task(request, task_callback)
+      except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+        # The request never reached the replica, so it is safe to retry it
+        # on another one.
+        endpoint.breaker.record_failure()
+        endpoint.healthy = False
+        endpoint.last_error = str(e)
+        logger.warning(f"Endpoint {endpoint.url} unreachable, failing over: {e}")
+        if request.sessionId:
+          self._affinity.delete(request.sessionId)
+        continue
+      except Exception as e:
+        endpoint.breaker.record_failure()
+        endpoint.last_error = str(e)
+        raise
+      except asyncio.CancelledError:
+        # The caller gave up (e.g. a subtask timeout), which says nothing
+        # about the replica; free the trial so the breaker can still close.
+        endpoint.breaker.release()
+        raise
+      else:
+        endpoint.breaker.record_success()
+        return task
+      finally:
+        endpoint.outstanding -= 1
@@ -4,16 +4,19 @@ It initializes the A2A server, defines the agent's capabilities,
 and starts the server to handle incoming requests.
 """
 
-from agent import AssetSecuritiesReportAgent, AssetSecuritiesReportAgentConfig
+from agent import AssetSecuritiesReportAgent, create_agent_config
 import click
 from common.server import A2AServer
 from common.types import (
     AgentCapabilities, AgentCard, AgentSkill, MissingAPIKeyError
 )
+from common.utils.push_notification_auth import PushNotificationSenderAuth
 import logging
 import os
 from task_manager import AgentTaskManager
 from dotenv import load_dotenv
+from starlette.requests import Request
+from starlette.responses import JSONResponse
 
 load_dotenv()
 
@@ -23,7 +26,15 @@ logger = logging.getLogger(__name__)
 @click.command()
 @click.option("--host", "host", default="localhost")
 @click.option("--port", "port", default=10020)
-def main(host, port):
+@click.option(
+    "--async-tasks/--sync-tasks", "async_tasks", default=False,
+    help="Return WORKING immediately and analyze the report in the background.",
+)
+@click.option(
+    "--push-notifications/--no-push-notifications", "push_notifications", default=False,
+    help="Notify clients when a background task changes (requires --async-tasks).",
+)
+def main(host, port, async_tasks, push_notifications):
     """Entry point for the A2A + analyze the financial report using agent."""
     try:
         if not os.getenv("GOOGLE_API_KEY"):
@@ -38,7 +49,11 @@ def main(host, port):
             # llm model nameは設定されていないケースも許容しても良さそう
             raise MissingAPIKeyError("LLM_MODEL_NAME environment variable not set.")
 
-        capabilities = AgentCapabilities(streaming=False)
+        # プッシュ通知はバックグラウンド実行時のみ意味を持つ
+        push_notifications = async_tasks and push_notifications
+        capabilities = AgentCapabilities(
+            streaming=False, pushNotifications=push_notifications
+        )
         skill = AgentSkill(
             id="asset_securities_report_agent",
             name="Asset Securities Report",
@@ -66,18 +81,65 @@ def main(host, port):
             skills=[skill],
         )
 
-        config = AssetSecuritiesReportAgentConfig(
-            log_bucket_name=str(os.getenv("GCS_LOG_BUCKET_NAME")),
-            llm_model_name=str(os.getenv("LLM_MODEL_NAME")),
-        )
+        config = create_agent_config()
+        agent = AssetSecuritiesReportAgent(config=config)
+        notification_sender_auth = None
+        if push_notifications:
+            notification_sender_auth = PushNotificationSenderAuth()
+            notification_sender_auth.generate_jwk()
         server = A2AServer(
             agent_card=agent_card,
             task_manager=AgentTaskManager(
-                agent=AssetSecuritiesReportAgent(config=config)
+                agent=agent,
+                async_mode=async_tasks,
+                notification_sender_auth=notification_sender_auth,
             ),
             host=host,
             port=port,
         )
+        if notification_sender_auth:
+            # 通知の署名検証用の公開鍵をクライアントに公開する
+            server.app.add_route(
+                "/.well-known/jwks.json",
+                notification_sender_auth.handle_jwks_endpoint,
+                methods=["GET"],
+            )
+
+        # 解析結果のキャッシュのヒット率を公開する
+        async def handle_llm_cache_metrics(request: Request) -> JSONResponse:
+            return JSONResponse(agent.get_llm_cache_metrics())
+
+        server.app.add_route("/metrics/llm_cache", handle_llm_cache_metrics, methods=["GET"])
+
+        # ルーティングと企業名抽出の経路(rule, cache, llm)ごとのレイテンシを公開する
+        async def handle_routing_metrics(request: Request) -> JSONResponse:
+            return JSONResponse(agent.get_routing_metrics())
+
+        server.app.add_route("/metrics/routing", handle_routing_metrics, methods=["GET"])
+
+        # bigqueryのクエリごとのキャッシュヒット率、レイテンシ、スキャン量を公開する
+        async def handle_bigquery_metrics(request: Request) -> JSONResponse:
+            return JSONResponse(agent.get_bigquery_metrics())
+
+        server.app.add_route("/metrics/bigquery", handle_bigquery_metrics, methods=["GET"])
+
+        # 前処理で削減したページ数・トークン数と、解析のレイテンシを公開する
+        async def handle_preprocess_report(request: Request) -> JSONResponse:
+            return JSONResponse(agent.get_preprocess_report())
+
+        server.app.add_route("/metrics/preprocess", handle_preprocess_report, methods=["GET"])
+
+        # map-reduce型の分析の観点ごとの失敗・再試行と、並列化による短縮を公開する
+        async def handle_map_reduce_metrics(request: Request) -> JSONResponse:
+            return JSONResponse(agent.get_map_reduce_metrics())
+
+        server.app.add_route("/metrics/map_reduce", handle_map_reduce_metrics, methods=["GET"])
+
+        # 追加の質問でコンテキストから再利用したトークン数と、ターンごとのレイテンシを公開する
+        async def handle_document_context_metrics(request: Request) -> JSONResponse:
+            return JSONResponse(agent.get_document_context_metrics())
+
+        server.app.add_route("/metrics/document_context", handle_document_context_metrics, methods=["GET"])
         logger.info(f"Starting server on {host}:{port}")
         server.start()
     except MissingAPIKeyError as e:
@@ -1,18 +1,19 @@
-from typing import Any, Dict, AsyncIterable, List, Literal
+from typing import Any, Callable, Dict, AsyncIterable, List, Literal, Optional
 from pydantic import BaseModel
 import os
 import vertexai
 from collections.abc import Iterable
 from datetime import datetime
 import json
+import time
 from vertexai.generative_models import (
     GenerationConfig,
     GenerationResponse,
     GenerativeModel,
     SafetySetting,
+    Content,
     Part as vertexai_part
 )
-from google.cloud import bigquery
 from proto.marshal.collections import RepeatedComposite
 from logging import StreamHandler, getLogger
 from typing_extensions import TypedDict
@@ -22,6 +23,21 @@ from langgraph.graph.state import CompiledStateGraph
 
 from util.gcp_util import upload_file_into_gcs
 from util.edinet_wrapper import EdinetUtil, EdinetWrapper
+from util.document_context import create_document_context_store
+from util.bq_repository import BigQueryRepository, EdinetDocumentRepository
+from util.filer_index import FilerIndex
+from util.llm_result_cache import create_llm_result_cache
+from util.map_reduce_analyzer import AnalysisPerspective, MapReduceAnalyzer, MapReduceResult, PerspectiveResult
+from util.report_preprocessor import DEFAULT_SECTIONS, PreprocessResult, ReportPreprocessor
+from util.routing_classifier import (
+    AFFIRMATIVE_REPLIES,
+    PATH_CACHE,
+    PATH_LLM,
+    PATH_RULE,
+    PathLatencyMetrics,
+    RoutingPreClassifier,
+    normalize_message,
+)
 
 from common.types import (
     TaskState,
@@ -45,6 +61,26 @@ class AssetSecuritiesReportAgentConfig(BaseModel):
     log_bucket_name: str = "sakamomo_family_service"
     log_base_folder: str = "log"
     debug_mode: bool = False
+    # 解析結果のキャッシュ("local", "gcs", "none")
+    # プロンプトを変えずに解析方法を変えた場合は、llm_cache_versionを上げて古い結果を無効化する
+    llm_cache_backend: str = "local"
+    llm_cache_ttl_seconds: Optional[int] = 30 * 24 * 60 * 60
+    llm_cache_version: str = "1"
+    # 有価証券報告書から分析に必要な章のみを抜き出してから、LLMに送る
+    preprocess_report: bool = True
+    # 抜き出したPDFがこれより大きい場合は、GCSの元のPDFを送る
+    max_inline_pdf_bytes: int = 15 * 1024 * 1024
+    # 分析の方法("single": 1回のLLMの呼び出しで全観点を分析, "map_reduce": 観点ごとに並列に分析してまとめる)
+    analysis_mode: str = "single"
+    map_reduce_concurrency: int = 4
+    map_reduce_max_retries: int = 2
+    # 分析後の追加の質問で、資料を送り直さずに使うコンテキスト("vertexai", "local", "none")
+    document_context_backend: str = "vertexai"
+    document_context_ttl_seconds: int = 60 * 60
+    # 追加の質問で送る、直近の会話の数
+    document_context_history_turns: int = 2
+    # 提出者名のインデックスに、新しい書類を取り込む間隔
+    filer_index_refresh_seconds: int = 60 * 60
     analyze_prompt: str = """
 上記の決算資料から、後述する観点についてそれぞれ分析を行なって、分析結果をまとめてください。
 
@@ -90,13 +126,38 @@ class AssetSecuritiesReportAgentConfig(BaseModel):
         """
 
 
+def create_agent_config() -> AssetSecuritiesReportAgentConfig:
+    config = AssetSecuritiesReportAgentConfig(
+        log_bucket_name=str(os.getenv("GCS_LOG_BUCKET_NAME")),
+        llm_model_name=str(os.getenv("LLM_MODEL_NAME")),
+    )
+    # 解析結果のキャッシュの設定は、環境変数があれば上書きする
+    if os.getenv("LLM_CACHE_BACKEND"):
+        config.llm_cache_backend = os.getenv("LLM_CACHE_BACKEND")
+    if os.getenv("LLM_CACHE_TTL_SECONDS"):
+        ttl_seconds = int(os.getenv("LLM_CACHE_TTL_SECONDS"))
+        # 0以下は期限なし
+        config.llm_cache_ttl_seconds = ttl_seconds if ttl_seconds > 0 else None
+    if os.getenv("LLM_CACHE_VERSION"):
+        config.llm_cache_version = os.getenv("LLM_CACHE_VERSION")
+    if os.getenv("ANALYSIS_MODE"):
+        config.analysis_mode = os.getenv("ANALYSIS_MODE")
+    if os.getenv("MAP_REDUCE_CONCURRENCY"):
+        config.map_reduce_concurrency = int(os.getenv("MAP_REDUCE_CONCURRENCY"))
+    if os.getenv("DOCUMENT_CONTEXT_BACKEND"):
+        config.document_context_backend = os.getenv("DOCUMENT_CONTEXT_BACKEND")
+    return config
+
+
 class AgentWorkflowState(TypedDict):
     session_id: str
     message: str
     company_name: str
     report_company_name: str
+    report_doc_id: str
     report_gcs_uri: str
     report_title: str
+    conversation: List[dict]
     response: str
     task_state: TaskState
 
@@ -154,15 +215,67 @@ class AssetSecuritiesReportAgent:
             output_folder=self.__output_folder
         )
 
+        # bigqueryへのアクセス（クライアントは共有し、検索結果はキャッシュする）
+        self.__bq_repository = BigQueryRepository()
+        self.__document_repository = EdinetDocumentRepository(repository=self.__bq_repository)
+
+        # 提出者名のインデックス（初回の読み込みと定期的な差分の取り込みはバックグラウンドで行う）
+        self.__filer_index = FilerIndex(fetch_rows=self.__document_repository.fetch_reports_since)
+        self.__filer_index.start_auto_refresh(interval_seconds=config.filer_index_refresh_seconds)
+
+        # ルーティングと企業名抽出の前段の分類器
+        self.__pre_classifier = RoutingPreClassifier(filer_name_lookup=self.__filer_index.get_filer_name)
+        self.__path_metrics = PathLatencyMetrics()
+
+        # 有価証券報告書の前処理（抜き出したPDFはdoc_idごとにキャッシュする）
+        self.__report_preprocessor = (
+            ReportPreprocessor(cache_folder=os.path.join(os.path.dirname(__file__), "cache", "preprocessed"))
+            if config.preprocess_report
+            else None
+        )
+
+        # 観点ごとの並列の分析（観点で使う章ごとに前処理を分ける）
+        self.__map_reduce_analyzer = MapReduceAnalyzer(
+            generate=lambda contents: self.__model.generate_content(
+                contents=contents,
+                generation_config=self.__generation_config
+            ),
+            max_concurrency=config.map_reduce_concurrency,
+            max_retries=config.map_reduce_max_retries,
+        )
+        self.__section_preprocessors: Dict[tuple, ReportPreprocessor] = {}
+        # 分析中の観点ごとの結果の通知先（session_id -> callback）
+        self.__partial_callbacks: Dict[str, Callable[[PerspectiveResult], None]] = {}
+
+        # 追加の質問のための資料ごとのコンテキスト
+        self.__document_context_store = create_document_context_store(
+            backend_name=config.document_context_backend,
+            model_name=config.llm_model_name,
+            ttl_seconds=config.document_context_ttl_seconds,
+            state_file=os.path.join(os.path.dirname(__file__), "cache", "document_context", "state.json"),
+        )
+
+        # 解析結果のキャッシュの初期化
+        self.__llm_result_cache = create_llm_result_cache(
+            backend_name=config.llm_cache_backend,
+            ttl_seconds=config.llm_cache_ttl_seconds,
+            version=config.llm_cache_version,
+            local_folder=os.path.join(os.path.dirname(__file__), "cache", "llm"),
+            project_id=os.environ["GCP_PROJECT"],
+            bucket_name=config.log_bucket_name,
+        )
+
     @staticmethod
     def get_supported_content_types() -> list:
         return ["text", "text/plain"]
 
-    def invoke(self, query, sessionId) -> AgentResponse:
+    def invoke(self, query, sessionId, on_partial: Optional[Callable[[PerspectiveResult], None]] = None) -> AgentResponse:
         message = query["message"]
         config = {
             "configurable": {"thread_id": sessionId}
         }
+        if on_partial is not None:
+            self.__partial_callbacks[sessionId] = on_partial
         try:
             self.__graph.invoke(
                 {
@@ -178,6 +291,8 @@ class AssetSecuritiesReportAgent:
             state = self.__graph.get_state(config)
             state.values["response"] = f"エラーが発生したため、処理が失敗しました"
             state.values["task_state"] = TaskState.FAILED
+        finally:
+            self.__partial_callbacks.pop(sessionId, None)
 
         # debug
         logger.info("invoke: sessionId: %s, state: %s", sessionId, state)
@@ -194,6 +309,57 @@ class AssetSecuritiesReportAgent:
     async def stream(self, query, sessionId) -> AsyncIterable[Dict[str, Any]]:
         pass
 
+    def get_llm_cache_metrics(self) -> dict:
+        if self.__llm_result_cache is None:
+            return {"backend": "none"}
+        return self.__llm_result_cache.get_metrics()
+
+    def get_routing_metrics(self) -> dict:
+        return self.__path_metrics.get_metrics()
+
+    def get_bigquery_metrics(self) -> dict:
+        return self.__bq_repository.get_metrics()
+
+    def get_map_reduce_metrics(self) -> dict:
+        return self.__map_reduce_analyzer.get_metrics()
+
+    def get_document_context_metrics(self) -> dict:
+        if self.__document_context_store is None:
+            return {"backend": "none"}
+        return self.__document_context_store.get_metrics()
+
+    def get_preprocess_report(self) -> dict:
+        if self.__report_preprocessor is None:
+            return {"analyses": 0}
+        return self.__report_preprocessor.get_report()
+
+    def warm_up_analysis_cache(self, doc_ids: List[str]) -> dict:
+        # 指定した有価証券報告書をまとめて解析し、キャッシュに載せておく
+        # キャッシュ済みのものはLLMを呼ばずにスキップされる
+        result = {"success_doc_ids": [], "error_doc_ids": []}
+        for doc_id in doc_ids:
+            try:
+                if self.__get_cached_analysis(doc_id=doc_id, prompt=self.config.analyze_prompt) is None:
+                    current_time = datetime.now()
+                    gcs_uri = self.__upload_financial_report_into_gcs(
+                        edinet_doc_id=doc_id,
+                        current_time=current_time,
+                        request_id="warm_up"
+                    )
+                    self.__analyze_financial_report(
+                        gcs_uri=gcs_uri,
+                        message="",
+                        prompt=self.config.analyze_prompt,
+                        request_id="warm_up",
+                        timestamp=current_time,
+                        doc_id=doc_id
+                    )
+                result["success_doc_ids"].append(doc_id)
+            except Exception as e:
+                logger.error("failed to warm up the analysis of %s: %s", doc_id, e)
+                result["error_doc_ids"].append(doc_id)
+        return result
+
     def get_workflow(self, memory_server) -> CompiledStateGraph:
         builder = StateGraph(AgentWorkflowState)
         # builder.set_entry_point(START)
@@ -221,13 +387,57 @@ class AssetSecuritiesReportAgent:
         # セッションから過去のメッセージを取得
         session_id = state["session_id"]
         current_message = state["message"]
-        conversation_history = []
-
+        previous_message = None
+        finish_search = False
         if session_id in session_store:
             previous_state = session_store[session_id]
-            if "message" in previous_state:
-                conversation_history.append(f"過去のメッセージ: {previous_state['message']}")
+            previous_message = previous_state.get("message")
+            finish_search = "report_gcs_uri" in previous_state
+
+        # 明らかなメッセージはルールで、判定済みのメッセージはメモから判定し、LLMの呼び出しを省く
+        start_time = time.perf_counter()
+        path = PATH_RULE
+        node_name = self.__pre_classifier.classify_routing(current_message, finish_search)
+        if node_name is None:
+            path = PATH_CACHE
+            memo_key = RoutingPreClassifier.routing_memo_key(previous_message, current_message)
+            node_name = self.__pre_classifier.routing_memo.get(memo_key)
+        if node_name is None:
+            path = PATH_LLM
+            node_name = self.__route_with_llm(previous_message, current_message)
+            if node_name in ("analyze_report", "extract_company_name", "ask_human"):
+                self.__pre_classifier.routing_memo.put(memo_key, node_name)
+        self.__path_metrics.record("routing", path, time.perf_counter() - start_time)
+
+        # debug
+        logger.info("routing node name: %s (%s)", node_name, path)
+        logger.info("routing finish_search: %s", finish_search)
+        logger.info("routing session_store: %s", session_store)
+        if "report_gcs_uri" in state:
+            logger.info("gcs_uri: %s", state["report_gcs_uri"])
+
+        # ルールを使って、最終的なルーティングを実施
+        if node_name == "analyze_report":
+            if finish_search:
+                # すでに取得済みの有価証券報告書がある場合は、分析処理を行う
+                return "analyze_report"
+            else:
+                # まだ取得していない場合は、ユーザーに質問を行う
+                return "extract_company_name"
+        elif node_name == "ask_human":
+            # ユーザーへの質問を実施
+            return "ask_human"
+        elif node_name == "extract_company_name":
+            # 上記以外は、企業名の抽出を行い、レポート検索を行う
+            return "extract_company_name"
+        else:
+            # それ以外の名前の場合は、例外として発火する
+            raise ValueError(f"Invalid node name: {node_name}")
 
+    def __route_with_llm(self, previous_message: Optional[str], current_message: str) -> str:
+        conversation_history = []
+        if previous_message is not None:
+            conversation_history.append(f"過去のメッセージ: {previous_message}")
         conversation_history.append(f"現在のメッセージ: {current_message}")
         messages_text = "\n".join(conversation_history)
 
@@ -253,38 +463,7 @@ ask_human
 {messages_text}
         """
         response = self.__model.generate_content(contents=[prompt])
-
-        # ルールを使って、最終的なルーティングを実施
-        node_name = response.text.strip()
-        if session_id in session_store:
-            state_of_history = session_store[session_id]
-            finish_search = "report_gcs_uri" in state_of_history
-        else:
-            finish_search = False
-
-        # debug
-        logger.info("routing node name: %s", node_name)
-        logger.info("routing finish_search: %s", finish_search)
-        logger.info("routing session_store: %s", session_store)
-        if "report_gcs_uri" in state:
-            logger.info("gcs_uri: %s", state["report_gcs_uri"])
-
-        if node_name == "analyze_report":
-            if finish_search:
-                # すでに取得済みの有価証券報告書がある場合は、分析処理を行う
-                return "analyze_report"
-            else:
-                # まだ取得していない場合は、ユーザーに質問を行う
-                return "extract_company_name"
-        elif node_name == "ask_human":
-            # ユーザーへの質問を実施
-            return "ask_human"
-        elif node_name == "extract_company_name":
-            # 上記以外は、企業名の抽出を行い、レポート検索を行う
-            return "extract_company_name"
-        else:
-            # それ以外の名前の場合は、例外として発火する
-            raise ValueError(f"Invalid node name: {node_name}")
+        return response.text.strip()
 
     def __extract_company_name_node(self, state: AgentWorkflowState) -> dict:
         # 企業名を抽出する処理
@@ -295,7 +474,7 @@ ask_human
 
     def __search_financial_report_node(self, state: AgentWorkflowState) -> dict:
         # 有価証券報告書のuriをデータベースから検索する
-        items = self.__search_financial_report_url_in_bq_table(state["company_name"])
+        items = self.__search_financial_report(state["company_name"])
 
         # もしドキュメントがない場合は、ドキュメントがない旨を通知
         # TODO : 現状はエラーとして通知ではなく、例外発火している（ちゃんとエラーハンドリングをする）
@@ -313,6 +492,7 @@ ask_human
         # TODO : LLMなどを使って、有価証券報告書を選定する
         res = {
             "report_company_name": item["filer_name"],
+            "report_doc_id": item["doc_id"],
             "report_title": item["doc_description"],
             "report_gcs_uri": gcs_uri,
             "task_state": TaskState.INPUT_REQUIRED
@@ -325,6 +505,7 @@ ask_human
             "message": state["message"],
             "company_name": state["company_name"],
             "report_company_name": res["report_company_name"],
+            "report_doc_id": res["report_doc_id"],
             "report_title": res["report_title"],
             "report_gcs_uri": res["report_gcs_uri"],
             "task_state": TaskState.INPUT_REQUIRED
@@ -336,13 +517,34 @@ ask_human
         # 有価証券報告書の分析を行う
         message = state["message"]
         gcs_uri = state["report_gcs_uri"]
-        response = self.__analyze_financial_report(
-            gcs_uri=gcs_uri,
-            message=message,
-            prompt=self.config.analyze_prompt,
-            request_id=state["session_id"],
-            timestamp=datetime.now()
-        )
+        session = session_store.get(state["session_id"], {})
+        conversation = session.get("conversation", [])
+        if self.__is_followup_question(message=message, conversation=conversation):
+            # 分析済みの資料への追加の質問は、資料のコンテキストを再利用して回答する
+            response = self.__answer_followup_question(
+                gcs_uri=gcs_uri,
+                message=message,
+                conversation=conversation,
+                request_id=state["session_id"],
+                timestamp=datetime.now(),
+                doc_id=state.get("report_doc_id")
+            )
+            question = message
+        else:
+            response = self.__analyze_financial_report(
+                gcs_uri=gcs_uri,
+                message=message,
+                prompt=self.config.analyze_prompt,
+                request_id=state["session_id"],
+                timestamp=datetime.now(),
+                doc_id=state.get("report_doc_id"),
+                on_partial=self.__partial_callbacks.get(state["session_id"])
+            )
+            question = "有価証券報告書を分析してください。"
+
+        # 追加の質問で使うため、会話をセッションに残す
+        if state["session_id"] in session_store:
+            session_store[state["session_id"]]["conversation"] = conversation + [{"question": question, "answer": response}]
         return {
             "response": response,
             "task_state": TaskState.COMPLETED
@@ -356,6 +558,23 @@ ask_human
         }
 
     def __extract_company_name(self, query: str) -> str:
+        # 提出者名そのもののメッセージと、抽出済みのメッセージはLLMを呼ばない
+        start_time = time.perf_counter()
+        path = PATH_RULE
+        company_name = self.__pre_classifier.match_filer_name(query)
+        if company_name is None:
+            path = PATH_CACHE
+            memo_key = RoutingPreClassifier.company_name_memo_key(query)
+            company_name = self.__pre_classifier.company_name_memo.get(memo_key)
+        if company_name is None:
+            path = PATH_LLM
+            company_name = self.__extract_company_name_with_llm(query=query)
+            if company_name:
+                self.__pre_classifier.company_name_memo.put(memo_key, company_name)
+        self.__path_metrics.record("extract_company_name", path, time.perf_counter() - start_time)
+        return company_name
+
+    def __extract_company_name_with_llm(self, query: str) -> str:
         prompt = f"""
 下記から企業名のみを抽出してください。ただし、ルールに沿って抽出をしてください。
 
@@ -373,46 +592,97 @@ ask_human
         # TDDO : 企業名が正しく出力できるようにバリデーションやフォーマット指定を行いたい
         return company_name
 
-    def __search_financial_report_url_in_bq_table(self, company_name: str) -> List[dict]:
-        # 会社名から、bigqueryを検索し、有価証券報告書のリストを取得する
-        client = bigquery.Client()
-        items: List[dict] = []
-        with open(os.path.join(os.path.dirname(__file__), "sql", "search_company.sql"), "r") as f:
-            query = f.read().format(company_name=company_name)
-            query_job = client.query(query)
-            rows = query_job.result()
-            for row in rows:
-                doc_id = row["docID"]
-                item = {
-                    "doc_id": doc_id,
-                    "filer_name": row["filerName"],
-                    "doc_description": row["docDescription"],
-                    "doc_url": f"{EdinetUtil.get_document_url_from_doc_id(doc_id=doc_id)}",
+    def __search_financial_report(self, company_name: str) -> List[dict]:
+        # 会社名から、有価証券報告書のリストを一致度の高い企業の最新のものから順に取得する
+        # インデックスを使えない場合のみ、bigqueryを検索する
+        try:
+            documents = self.__filer_index.search(company_name)
+        except Exception as e:
+            logger.error("failed to search filer index: %s", e)
+            documents = []
+        if documents:
+            items = [
+                {
+                    "doc_id": document.doc_id,
+                    "filer_name": document.filer_name,
+                    "doc_description": document.doc_description,
+                    "doc_url": EdinetUtil.get_document_url_from_doc_id(doc_id=document.doc_id),
                 }
-                items.append(item)
+                for document in documents
+            ]
+        else:
+            items = self.__search_financial_report_url_in_bq_table(company_name)
 
         # 企業の件数が0件の場合は例外を発火
         if len(items) == 0:
             raise ValueError(f"no documents found for {company_name}")
-
-        # TODO : 最新の有価証券報告書をとるように修正（LLMに判断させる？）
         return items
 
+    def __search_financial_report_url_in_bq_table(self, company_name: str) -> List[dict]:
+        # 会社名から、bigqueryを検索し、企業ごとに最新の有価証券報告書のリストを取得する
+        rows = self.__document_repository.search_latest_reports(company_name=company_name)
+        return [
+            {
+                "doc_id": row["docID"],
+                "filer_name": row["filerName"],
+                "doc_description": row["docDescription"],
+                "doc_url": EdinetUtil.get_document_url_from_doc_id(doc_id=row["docID"]),
+            }
+            for row in rows
+        ]
+
     def __analyze_financial_report(self,
                                    gcs_uri: str,
-                                   message: str,  # TODO : messageを使うように修正が必要
+                                   message: str,  # 追加の質問は__answer_followup_questionで扱う
                                    prompt: str,
                                    request_id: str,
-                                   timestamp: datetime) -> str:
-        # gcs uriからpdfデータを取得
-        file_data = vertexai_part.from_uri(uri=gcs_uri, mime_type="application/pdf")
+                                   timestamp: datetime,
+                                   doc_id: Optional[str] = None,
+                                   on_partial: Optional[Callable[[PerspectiveResult], None]] = None) -> str:
+        # 同じ資料・同じプロンプトの解析結果がキャッシュにあれば、LLMを呼ばずに返す
+        cache_key = self.__analysis_cache_key(doc_id=doc_id, gcs_uri=gcs_uri, prompt=prompt)
+        if cache_key is not None:
+            cached_response = self.__llm_result_cache.get(cache_key)
+            if cached_response is not None:
+                logger.info("analysis cache hit: doc_id=%s, request_id=%s", doc_id, request_id)
+                return cached_response
+
+        if self.__config.analysis_mode == "map_reduce":
+            result = self.__analyze_financial_report_with_map_reduce(
+                gcs_uri=gcs_uri,
+                prompt=prompt,
+                request_id=request_id,
+                timestamp=timestamp,
+                doc_id=doc_id,
+                on_partial=on_partial
+            )
+            # 失敗した観点や総括を含む結果はキャッシュせず、次の依頼で分析し直す
+            if cache_key is not None and result.is_complete:
+                self.__llm_result_cache.put(
+                    cache_key,
+                    result.text,
+                    meta={"doc_id": doc_id, "gcs_uri": gcs_uri, "request_id": request_id}
+                )
+            return result.text
+
+        # 分析に必要な章のみのpdfデータを取得（前処理できない場合はgcs uriの元のpdfを使う）
+        file_data, preprocess_result = self.__get_report_part(gcs_uri=gcs_uri, doc_id=doc_id)
 
         # LLMを利用した解析処理を実施
         contents = [file_data, prompt]
+        start_time = time.perf_counter()
         response = self.__model.generate_content(
             contents=contents,
             generation_config=self.__generation_config
         )
+        if preprocess_result is not None:
+            usage_metadata = response.usage_metadata
+            self.__report_preprocessor.record_analysis(
+                result=preprocess_result,
+                prompt_token_count=usage_metadata.prompt_token_count,
+                candidates_token_count=usage_metadata.candidates_token_count,
+                llm_seconds=time.perf_counter() - start_time,
+            )
 
         # 解析結果含めて、ログとして出力
         # TODO : パラメーターにcompany_nameなども追加したい
@@ -429,9 +699,174 @@ ask_human
             gcs_uri=gcs_uri
         )
 
-        # 解析結果を返す
+        # 解析結果をキャッシュに保存して返す
+        if cache_key is not None:
+            self.__llm_result_cache.put(
+                cache_key,
+                response.text,
+                meta={"doc_id": doc_id, "gcs_uri": gcs_uri, "request_id": request_id}
+            )
         return response.text
 
+    def __is_followup_question(self, message: str, conversation: List[dict]) -> bool:
+        # 分析の前の確認への返答(「はい」など)は、分析の依頼として扱う
+        if self.__document_context_store is None or not conversation:
+            return False
+        return normalize_message(message) not in AFFIRMATIVE_REPLIES
+
+    def __answer_followup_question(self,
+                                   gcs_uri: str,
+                                   message: str,
+                                   conversation: List[dict],
+                                   request_id: str,
+                                   timestamp: datetime,
+                                   doc_id: Optional[str] = None) -> str:
+        # 資料はコンテキストにあるため、直近の会話と質問の分のみを送る
+        contents = []
+        for turn in conversation[-self.__config.document_context_history_turns:]:
+            contents.append(Content(role="user", parts=[vertexai_part.from_text(turn["question"])]))
+            contents.append(Content(role="model", parts=[vertexai_part.from_text(turn["answer"])]))
+        prompt = f"""
+上記の有価証券報告書とこれまでの会話を踏まえて、下記の質問に回答してください。
+有価証券報告書に記載がない内容は、記載がない旨を明記してください。
+
+★質問
+{message}
+        """
+        contents.append(Content(role="user", parts=[vertexai_part.from_text(prompt)]))
+
+        # 資料のキーが同じであれば、セッションをまたいでコンテキストを共有する
+        if doc_id and self.__report_preprocessor is not None:
+            document_key = f"{self.__config.llm_model_name}:edinet:{self.__report_preprocessor.get_cache_key(doc_id)}"
+        elif doc_id:
+            document_key = f"{self.__config.llm_model_name}:edinet:{doc_id}"
+        else:
+            document_key = f"{self.__config.llm_model_name}:{gcs_uri}"
+        response = self.__document_context_store.ask(
+            document_key=document_key,
+            build_document_part=lambda: self.__get_report_part(gcs_uri=gcs_uri, doc_id=doc_id)[0],
+            contents=contents,
+            generation_config=self.__generation_config
+        )
+
+        AgentUtil.upload_llm_log(
+            work_folder=self.__work_folder,
+            log_bucket_name=self.__config.log_bucket_name,
+            log_base_folder=self.__config.log_base_folder,
+            llm_model_name=self.__config.llm_model_name,
+            temperature=self.__config.temperature,
+            response=response,
+            request_id=request_id,
+            prompt=prompt,
+            timestamp=timestamp,
+            gcs_uri=gcs_uri
+        )
+        return response.text
+
+    def __analyze_financial_report_with_map_reduce(self,
+                                                   gcs_uri: str,
+                                                   prompt: str,
+                                                   request_id: str,
+                                                   timestamp: datetime,
+                                                   doc_id: Optional[str] = None,
+                                                   on_partial: Optional[Callable[[PerspectiveResult], None]] = None) -> MapReduceResult:
+        # 観点ごとに、その観点で使う章のみのpdfを送って並列に分析し、最後に総括する
+        def get_document_part(perspective: AnalysisPerspective) -> vertexai_part:
+            preprocessor = self.__get_section_preprocessor(perspective.sections)
+            file_data, _ = self.__get_report_part(gcs_uri=gcs_uri, doc_id=doc_id, preprocessor=preprocessor)
+            return file_data
+
+        result = self.__map_reduce_analyzer.analyze(
+            prompt=prompt,
+            get_document_part=get_document_part,
+            on_partial=on_partial
+        )
+        logger.info(
+            "map reduce analysis: request_id=%s, %.1fs, failed=%s",
+            request_id, result.wall_seconds, result.failed_perspectives,
+        )
+
+        # 観点ごとのレスポンスを並列に書き出すとログのファイルが衝突するため、総括のレスポンスのみを残す
+        if result.reduce_response is not None:
+            AgentUtil.upload_llm_log(
+                work_folder=self.__work_folder,
+                log_bucket_name=self.__config.log_bucket_name,
+                log_base_folder=self.__config.log_base_folder,
+                llm_model_name=self.__config.llm_model_name,
+                temperature=self.__config.temperature,
+                response=result.reduce_response,
+                request_id=request_id,
+                prompt=result.reduce_prompt,
+                timestamp=timestamp,
+                gcs_uri=gcs_uri
+            )
+        return result
+
+    def __get_section_preprocessor(self, sections: List[str]) -> Optional[ReportPreprocessor]:
+        # 章が指定されていない観点は、既定の前処理を使う
+        if self.__report_preprocessor is None or not sections:
+            return self.__report_preprocessor
+        key = tuple(sections)
+        if key not in self.__section_preprocessors:
+            self.__section_preprocessors[key] = ReportPreprocessor(
+                cache_folder=self.__report_preprocessor.cache_folder,
+                sections={name: DEFAULT_SECTIONS.get(name) for name in sections}
+            )
+        return self.__section_preprocessors[key]
+
+    def __get_report_part(self,
+                          gcs_uri: str,
+                          doc_id: Optional[str],
+                          preprocessor: Optional[ReportPreprocessor] = None) -> tuple[vertexai_part, Optional[PreprocessResult]]:
+        preprocessor = preprocessor or self.__report_preprocessor
+        if preprocessor is None or not doc_id:
+            return vertexai_part.from_uri(uri=gcs_uri, mime_type="application/pdf"), None
+        try:
+            # ダウンロード済みのpdfがあれば、それを使う
+            pdf_path = self.__edinet_wrapper.download_pdf_of_financial_report(doc_id=doc_id)
+            result = preprocessor.preprocess(doc_id=doc_id, pdf_path=pdf_path)
+        except Exception as e:
+            logger.error("failed to preprocess %s: %s", doc_id, e)
+            return vertexai_part.from_uri(uri=gcs_uri, mime_type="application/pdf"), None
+
+        logger.info(
+            "preprocessed %s: %d/%d pages, sections=%s, cached=%s",
+            doc_id, len(result.selected_pages), result.total_pages, result.selected_sections, result.cached,
+        )
+        if result.file_path == pdf_path or os.path.getsize(result.file_path) > self.__config.max_inline_pdf_bytes:
+            # 元のpdfをそのまま送るため、前処理は適用されていない（削減量として記録しない）
+            return vertexai_part.from_uri(uri=gcs_uri, mime_type="application/pdf"), None
+        with open(result.file_path, "rb") as f:
+            return vertexai_part.from_data(data=f.read(), mime_type="application/pdf"), result
+
+    def __analysis_cache_key(self, doc_id: Optional[str], gcs_uri: str, prompt: str) -> Optional[str]:
+        if self.__llm_result_cache is None:
+            return None
+        # gcs uriはリクエストごとに変わるため、doc_idがあればdoc_idで資料を特定する
+        # 前処理で抜き出すページが変わる場合に備えて、前処理の設定もキーに含める
+        if doc_id and self.__report_preprocessor is not None:
+            document_key = f"edinet:{self.__report_preprocessor.get_cache_key(doc_id)}"
+        elif doc_id:
+            document_key = f"edinet:{doc_id}"
+        else:
+            document_key = gcs_uri
+        generation_config = self.__generation_config.to_dict()
+        if self.__config.analysis_mode == "map_reduce":
+            # 分析の方法で結果の構成が変わるため、別のキャッシュとして扱う
+            generation_config["analysis_mode"] = self.__config.analysis_mode
+        return self.__llm_result_cache.make_key(
+            model_name=self.__config.llm_model_name,
+            prompt=prompt,
+            document_key=document_key,
+            generation_config=generation_config,
+        )
+
+    def __get_cached_analysis(self, doc_id: str, prompt: str) -> Optional[str]:
+        cache_key = self.__analysis_cache_key(doc_id=doc_id, gcs_uri="", prompt=prompt)
+        if cache_key is None:
+            return None
+        return self.__llm_result_cache.get(cache_key)
+
     def __upload_financial_report_into_gcs(self,
                                            edinet_doc_id: str,
                                            current_time: datetime,
@@ -0,0 +1,15 @@
+select
+    docID,
+    filerName,
+    docDescription,
+    submitDateTime
+from
+    `line_sakamomo_family_api.edinet_document_metadata`
+where
+    CONTAINS_SUBSTR(docDescription, "有価証券報告書")
+    AND
+    pdfFlag = "1"
+    AND
+    filerName is not null
+    AND
+    (@since is null or submitDateTime >= @since)
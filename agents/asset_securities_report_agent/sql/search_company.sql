@@ -1,14 +1,20 @@
 select
     docID,
     filerName,
-    docDescription
+    docDescription,
+    submitDateTime
 from
     `line_sakamomo_family_api.edinet_document_metadata`
 where
-    CONTAINS_SUBSTR(filerName, "{company_name}")
+    CONTAINS_SUBSTR(filerName, @company_name)
     AND
     CONTAINS_SUBSTR(docDescription, "有価証券報告書")
     AND
     pdfFlag = "1"
+    AND
+    submitDateTime >= @min_submit_datetime
+qualify
+    row_number() over (partition by filerName order by submitDateTime DESC) = 1
 order by
     submitDateTime DESC
+limit @limit
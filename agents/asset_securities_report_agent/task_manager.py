@@ -1,12 +1,15 @@
 from typing import AsyncIterable, Union
+import asyncio
 import logging
 
 from common.server import utils
 from common.types import (
     Artifact,
+    InvalidParamsError,
     SendTaskRequest,
     SendTaskResponse,
     JSONRPCResponse,
+    Message,
     SendTaskStreamingRequest,
     SendTaskStreamingResponse,
     TaskSendParams,
@@ -17,16 +20,28 @@ from common.types import (
     Part
 )
 from common.server.task_manager import InMemoryTaskManager
+from common.utils.push_notification_auth import PushNotificationSenderAuth
 from agent import AssetSecuritiesReportAgent
+from util.map_reduce_analyzer import STATUS_SUCCEEDED, PerspectiveResult
 
 
 logger = logging.getLogger(__name__)
 
 
 class AgentTaskManager(InMemoryTaskManager):
-    def __init__(self, agent: AssetSecuritiesReportAgent):
+    def __init__(
+        self,
+        agent: AssetSecuritiesReportAgent,
+        async_mode: bool = False,
+        notification_sender_auth: PushNotificationSenderAuth | None = None,
+    ):
         super().__init__()
         self.agent = agent
+        # 非同期モードではタスクを受け付けた時点でWORKINGを返し、
+        # 分析はバックグラウンドで実行する。クライアントはtasks/getでポーリングする。
+        self.async_mode = async_mode
+        self.notification_sender_auth = notification_sender_auth
+        self.background_tasks: set[asyncio.Task] = set()
         # self.task_messages = {}
 
     async def on_send_task(self, request: SendTaskRequest) -> SendTaskResponse:
@@ -46,7 +61,31 @@ class AgentTaskManager(InMemoryTaskManager):
         task_send_params: TaskSendParams = request.params
         await self.upsert_task(task_send_params)
 
-        return await self._invoke(request)
+        if task_send_params.pushNotification:
+            if not await self._set_push_notification(task_send_params):
+                return SendTaskResponse(
+                    id=request.id,
+                    error=InvalidParamsError(
+                        message="Push notification URL is invalid"
+                    ),
+                )
+
+        if not self.async_mode:
+            return await self._invoke(request)
+
+        # 分析には数分かかるため、リクエストを保持せずにWORKINGを即時に返す
+        task = await self.update_store(
+            task_send_params.id, TaskStatus(state=TaskState.WORKING), None
+        )
+        await self._send_push_notification(task)
+        background_task = asyncio.create_task(self._invoke_in_background(request))
+        # create_taskの戻り値は参照を保持しないとGCされる可能性がある
+        self.background_tasks.add(background_task)
+        background_task.add_done_callback(self.background_tasks.discard)
+        return SendTaskResponse(
+            id=request.id,
+            result=self.append_task_history(task, task_send_params.historyLength),
+        )
 
     async def on_send_task_subscribe(
         self, request: SendTaskStreamingRequest
@@ -80,6 +119,79 @@ class AgentTaskManager(InMemoryTaskManager):
         )
         return SendTaskResponse(id=request.id, result=task)
 
+    async def _invoke_in_background(self, request: SendTaskRequest):
+        task_send_params: TaskSendParams = request.params
+        query = self.__convert_params_to_dict(task_send_params)
+        logger.info("sessionId: %s, query: %s", task_send_params.sessionId, query)
+
+        # map-reduce型の分析では、観点ごとの結果が出るたびにWORKINGのメッセージとして通知する
+        loop = asyncio.get_running_loop()
+        partial_notifications = []
+
+        def on_partial(perspective_result: PerspectiveResult):
+            partial_notifications.append(asyncio.run_coroutine_threadsafe(
+                self._notify_partial_result(task_send_params.id, perspective_result), loop
+            ))
+
+        try:
+            # agent.invokeは同期処理のため、イベントループを塞がないようにスレッドで実行する
+            result = await asyncio.to_thread(
+                self.agent.invoke, query, task_send_params.sessionId, on_partial
+            )
+            status = TaskStatus(state=result["task_state"])
+            artifacts = [Artifact(parts=[TextPart(text=result["response"])])]
+            logger.info(f"Final Result ===> {result}")
+        except Exception as e:
+            logger.error("Error invoking agent: %s", e)
+            status = TaskStatus(state=TaskState.FAILED)
+            artifacts = [Artifact(parts=[TextPart(text=f"Error invoking agent: {e}")])]
+
+        # 途中経過の通知が、最終的な状態を上書きしないように待つ
+        await asyncio.gather(
+            *(asyncio.wrap_future(f) for f in partial_notifications), return_exceptions=True
+        )
+        task = await self.update_store(task_send_params.id, status, artifacts)
+        await self._send_push_notification(task)
+
+    async def _notify_partial_result(self, task_id: str, perspective_result: PerspectiveResult):
+        text = perspective_result.text
+        if perspective_result.status != STATUS_SUCCEEDED:
+            text = f"{perspective_result.perspective.heading} の分析に失敗しました"
+        message = Message(
+            role="agent",
+            parts=[TextPart(text=text)],
+            metadata={
+                "perspective": perspective_result.perspective.heading,
+                "status": perspective_result.status,
+            },
+        )
+        task = await self.update_store(
+            task_id, TaskStatus(state=TaskState.WORKING, message=message), None
+        )
+        await self._send_push_notification(task)
+
+    async def _set_push_notification(self, task_send_params: TaskSendParams) -> bool:
+        if self.notification_sender_auth is None:
+            # プッシュ通知に対応していない場合は設定を無視し、ポーリングに任せる
+            return True
+        url = task_send_params.pushNotification.url
+        if not await PushNotificationSenderAuth.verify_push_notification_url(url):
+            return False
+        await self.set_push_notification_info(
+            task_send_params.id, task_send_params.pushNotification
+        )
+        return True
+
+    async def _send_push_notification(self, task: Task):
+        if self.notification_sender_auth is None:
+            return
+        if not await self.has_push_notification_info(task.id):
+            return
+        push_info = await self.get_push_notification_info(task.id)
+        await self.notification_sender_auth.send_push_notification(
+            push_info.url, data=task.model_dump(exclude_none=True)
+        )
+
     async def __update_store_task(
         self, task_id: str, status: TaskStatus, artifacts: list[Artifact]
     ) -> Task:
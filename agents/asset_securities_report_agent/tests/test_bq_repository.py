@@ -0,0 +1,112 @@
+import re
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+from util.bq_repository import SQL_FOLDER, BigQueryRepository, EdinetDocumentRepository
+
+
+class FakeJob:
+    def __init__(self, rows, total_bytes_processed=0, total_bytes_billed=0):
+        self.rows = rows
+        self.total_bytes_processed = total_bytes_processed
+        self.total_bytes_billed = total_bytes_billed
+
+    def result(self):
+        return [dict(row) for row in self.rows]
+
+
+class FakeClient:
+    """実行したクエリとパラメーターを記録し、決まった行を返す"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = []
+
+    def query(self, sql, job_config):
+        self.queries.append((sql, job_config))
+        if job_config.dry_run:
+            return FakeJob([], total_bytes_processed=1000)
+        return FakeJob(self.rows, total_bytes_processed=1000, total_bytes_billed=10485760)
+
+
+def sql_parameter_names(name: str) -> set:
+    with open(f"{SQL_FOLDER}/{name}.sql", "r") as f:
+        return set(re.findall(r"@(\w+)", f.read()))
+
+
+class BigQueryRepositoryTest(unittest.TestCase):
+    """BigQueryへのクエリのパラメーターとキャッシュのテスト"""
+
+    def setUp(self) -> None:
+        self.client = FakeClient([{"docID": "S1", "filerName": "トヨタ自動車株式会社"}])
+        patcher = mock.patch("util.bq_repository.bigquery.Client", return_value=self.client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.repository = BigQueryRepository(project_id="test-project")
+        self.documents = EdinetDocumentRepository(repository=self.repository)
+
+    def executed_parameters(self, index: int = -1) -> dict:
+        _, job_config = self.client.queries[index]
+        return {p.name: (p.type_, p.value) for p in job_config.query_parameters}
+
+    def test_search_parameters(self):
+        rows = self.documents.search_latest_reports("トヨタ自動車", limit=5)
+        self.assertEqual(rows, [{"docID": "S1", "filerName": "トヨタ自動車株式会社"}])
+        parameters = self.executed_parameters()
+        min_submit_datetime = (datetime.now() - timedelta(days=5 * 365)).strftime("%Y-%m-%d")
+        self.assertEqual(parameters, {
+            "company_name": ("STRING", "トヨタ自動車"),
+            "min_submit_datetime": ("STRING", min_submit_datetime),
+            "limit": ("INT64", 5),
+        })
+        # SQLの中のパラメーターと、渡すパラメーターが一致する
+        self.assertEqual(set(parameters), sql_parameter_names("search_company"))
+        # 企業名はSQLに埋め込まない
+        sql, _ = self.client.queries[-1]
+        self.assertNotIn("トヨタ", sql)
+
+    def test_snapshot_parameters(self):
+        self.documents.fetch_reports_since(None)
+        self.assertEqual(self.executed_parameters(), {"since": ("STRING", None)})
+        self.documents.fetch_reports_since("2024-06-20 15:00")
+        self.assertEqual(self.executed_parameters(), {"since": ("STRING", "2024-06-20 15:00")})
+        self.assertEqual(set(self.executed_parameters()), sql_parameter_names("filer_index_snapshot"))
+
+    def test_search_results_are_cached(self):
+        self.documents.search_latest_reports("トヨタ自動車")
+        self.documents.search_latest_reports("トヨタ自動車")
+        self.documents.search_latest_reports("ソニー")
+        # ドライランは初回のみ
+        dry_runs = [c for _, c in self.client.queries if c.dry_run]
+        runs = [c for _, c in self.client.queries if not c.dry_run]
+        self.assertEqual((len(dry_runs), len(runs)), (1, 2))
+        metrics = self.repository.get_metrics()["search_company"]
+        self.assertEqual((metrics["calls"], metrics["cache_hits"], metrics["queries"]), (3, 1, 2))
+        self.assertEqual(metrics["estimated_bytes_processed"], 1000)
+        self.assertEqual(metrics["total_bytes_processed"], 2000)
+        self.assertEqual(metrics["total_bytes_billed"], 2 * 10485760)
+
+    def test_snapshot_is_not_cached(self):
+        self.documents.fetch_reports_since("2024-06-20 15:00")
+        self.documents.fetch_reports_since("2024-06-20 15:00")
+        metrics = self.repository.get_metrics()["filer_index_snapshot"]
+        self.assertEqual((metrics["cache_hits"], metrics["queries"]), (0, 2))
+
+    def test_cached_results_are_bounded(self):
+        repository = BigQueryRepository(project_id="test-project", max_cached_results=2)
+        documents = EdinetDocumentRepository(repository=repository)
+        for name in ("a", "b", "c"):
+            documents.search_latest_reports(name)
+        # 期限の近いものから捨てる
+        documents.search_latest_reports("c")
+        documents.search_latest_reports("a")
+        metrics = repository.get_metrics()["search_company"]
+        self.assertEqual((metrics["cache_hits"], metrics["queries"]), (1, 4))
+        repository.clear_cache()
+        documents.search_latest_reports("c")
+        self.assertEqual(repository.get_metrics()["search_company"]["queries"], 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
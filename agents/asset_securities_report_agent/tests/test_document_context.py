@@ -0,0 +1,177 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from google.api_core.exceptions import NotFound
+from vertexai.generative_models import Content, Part
+
+from util.document_context import DocumentContext, DocumentContextStore, LocalContextBackend
+
+
+def make_response(prompt_token_count: int = 1000, cached_content_token_count: int = 0):
+    return SimpleNamespace(
+        text="回答",
+        usage_metadata=SimpleNamespace(
+            prompt_token_count=prompt_token_count,
+            cached_content_token_count=cached_content_token_count,
+            candidates_token_count=10,
+        ),
+    )
+
+
+class FakeCacheBackend:
+    """VertexAIのコンテキストキャッシュの代わりに、リソース名を払い出すバックエンド"""
+
+    name = "vertexai"
+
+    def __init__(self, create_error: Exception = None, ttl_seconds: int = 3600) -> None:
+        self.create_error = create_error
+        self.ttl_seconds = ttl_seconds
+        self.created = []
+        self.deleted = []
+        self.missing = set()
+
+    def create(self, document_key, document_part) -> DocumentContext:
+        if self.create_error is not None:
+            raise self.create_error
+        handle = f"cachedContents/{len(self.created)}"
+        self.created.append(document_key)
+        return DocumentContext(document_key=document_key, backend=self.name, handle=handle, token_count=900,
+                               expire_time=time.time() + self.ttl_seconds)
+
+    def generate(self, context, contents, generation_config):
+        if context.handle in self.missing:
+            raise NotFound("cached content not found")
+        return make_response(prompt_token_count=1000, cached_content_token_count=900)
+
+    def delete(self, context):
+        self.deleted.append(context.handle)
+
+
+class FakeModel:
+    def __init__(self) -> None:
+        self.calls = []
+
+    def generate_content(self, contents, generation_config=None):
+        self.calls.append(contents)
+        return make_response()
+
+
+def question(text: str = "売上高は？"):
+    return [Content(role="user", parts=[Part.from_text(text)])]
+
+
+class DocumentContextStoreTest(unittest.TestCase):
+    """資料ごとのコンテキストの作成と再利用のテスト"""
+
+    def setUp(self) -> None:
+        self.folder = tempfile.mkdtemp()
+        self.state_file = os.path.join(self.folder, "document_context", "state.json")
+        self.builds = []
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def ask(self, store: DocumentContextStore, document_key: str = "S100ABCD", text: str = "売上高は？"):
+        def build_document_part():
+            self.builds.append(document_key)
+            return Part.from_text(f"資料:{document_key}")
+
+        return store.ask(document_key, build_document_part, question(text), generation_config=None)
+
+    def test_context_is_reused(self):
+        backend = FakeCacheBackend()
+        store = DocumentContextStore(backend)
+        self.ask(store)
+        self.ask(store, text="利益は？")
+        self.assertEqual(self.builds, ["S100ABCD"])
+        self.assertEqual(backend.created, ["S100ABCD"])
+        metrics = store.get_metrics()
+        self.assertEqual((metrics["turns"], metrics["context_builds"], metrics["contexts"]), (2, 1, 1))
+        self.assertEqual(metrics["mean_reused_turn_incremental_tokens"], 100)
+        self.assertAlmostEqual(metrics["cached_token_rate"], 0.9)
+
+    def test_missing_cache_is_rebuilt(self):
+        backend = FakeCacheBackend()
+        store = DocumentContextStore(backend)
+        self.ask(store)
+        backend.missing.add("cachedContents/0")
+        self.ask(store)
+        self.assertEqual(backend.created, ["S100ABCD", "S100ABCD"])
+        self.assertEqual(store.get_metrics()["context_builds"], 2)
+
+    def test_falls_back_from_vertexai(self):
+        model = FakeModel()
+        store = DocumentContextStore(FakeCacheBackend(create_error=ValueError("too few tokens")),
+                                     fallback_backend=LocalContextBackend(model))
+        self.ask(store)
+        self.ask(store, text="利益は？")
+        self.assertEqual(self.builds, ["S100ABCD"])
+        # ローカルの代替では、資料を毎回最初の発言に含めて送る
+        self.assertEqual(len(model.calls), 2)
+        for contents in model.calls:
+            self.assertEqual(contents[0].parts[0].text, "資料:S100ABCD")
+        self.assertEqual(store.get_metrics()["recent"][-1]["backend"], "local")
+
+    def test_create_error_without_fallback(self):
+        store = DocumentContextStore(FakeCacheBackend(create_error=ValueError("too few tokens")))
+        with self.assertRaises(ValueError):
+            self.ask(store)
+
+    def test_state_is_persisted(self):
+        backend = FakeCacheBackend()
+        store = DocumentContextStore(backend, state_file=self.state_file)
+        self.ask(store, "S100ABCD")
+        self.ask(store, "S100EFGH")
+
+        restarted_backend = FakeCacheBackend()
+        restarted = DocumentContextStore(restarted_backend, state_file=self.state_file)
+        self.assertEqual(restarted.get_metrics()["contexts"], 2)
+        self.ask(restarted, "S100ABCD")
+        self.assertEqual(restarted_backend.created, [])
+        self.assertEqual(self.builds, ["S100ABCD", "S100EFGH"])
+
+        # 有効期限が近いコンテキストは読み込まない
+        with mock.patch("util.document_context.time.time", return_value=time.time() + 3600):
+            expired = DocumentContextStore(FakeCacheBackend(), state_file=self.state_file)
+        self.assertEqual(expired.get_metrics()["contexts"], 0)
+
+    def test_local_contexts_are_not_persisted(self):
+        store = DocumentContextStore(LocalContextBackend(FakeModel()), state_file=self.state_file)
+        self.ask(store)
+        restarted = DocumentContextStore(LocalContextBackend(FakeModel()), state_file=self.state_file)
+        self.assertEqual(restarted.get_metrics()["contexts"], 0)
+
+    def test_least_recently_used_contexts_are_evicted(self):
+        backend = FakeCacheBackend()
+        store = DocumentContextStore(backend, max_contexts=2)
+        self.ask(store, "A")
+        self.ask(store, "B")
+        self.ask(store, "A")
+        self.ask(store, "C")
+        self.assertEqual(store.get_metrics()["contexts"], 2)
+        # 最も長く使われていないBを外し、キャッシュも削除する
+        self.assertEqual(backend.deleted, ["cachedContents/1"])
+        self.ask(store, "A")
+        self.ask(store, "B")
+        self.assertEqual(self.builds, ["A", "B", "C", "B"])
+
+    def test_expired_contexts_are_evicted(self):
+        backend = LocalContextBackend(FakeModel(), ttl_seconds=60)
+        store = DocumentContextStore(backend, refresh_margin_seconds=0)
+        now = time.time()
+        with mock.patch("util.document_context.time.time", return_value=now):
+            self.ask(store, "A")
+        with mock.patch("util.document_context.time.time", return_value=now + 61):
+            self.ask(store, "B")
+        self.assertEqual(store.get_metrics()["contexts"], 1)
+        self.ask(store, "B")
+        self.assertEqual(self.builds, ["A", "B"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,252 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import httpx
+
+from util.edinet_downloader import STATUS_DOWNLOADED, STATUS_FAILED, STATUS_SKIPPED, EdinetBulkDownloader
+from util.edinet_wrapper import EdinetWrapper
+
+PDF = b"%PDF-1.7\n" + b"0" * 4000 + b"\n%%EOF\n"
+
+
+class BrokenStream(httpx.AsyncByteStream):
+    """途中まで返してから接続が切れるレスポンスのボディ"""
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+    async def __aiter__(self):
+        yield self.data
+        raise httpx.ReadError("connection reset")
+
+
+class FakeDocumentApi:
+    """documents/{doc_id}のPDF。responsesに設定した応答を先に返し、以降はRangeに対応して返す"""
+
+    def __init__(self):
+        self.responses = []
+        self.ranges = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.ranges.append(request.headers.get("range"))
+        if self.responses:
+            return self.responses.pop(0)(request)
+        offset = int(request.headers["range"][len("bytes="):-1]) if "range" in request.headers else 0
+        status_code = 206 if offset else 200
+        return httpx.Response(status_code, content=PDF[offset:], headers={"content-type": "application/pdf"})
+
+
+def broken_response(request: httpx.Request) -> httpx.Response:
+    return httpx.Response(200, stream=BrokenStream(PDF[:1000]), headers={"content-type": "application/pdf"})
+
+
+def status_response(status_code: int):
+    return lambda request: httpx.Response(status_code, content=b"")
+
+
+class EdinetBulkDownloaderTest(unittest.TestCase):
+    """PDFの並列ダウンロードの再試行と再開のテスト"""
+
+    def setUp(self) -> None:
+        self.folder = tempfile.mkdtemp()
+        self.api = FakeDocumentApi()
+        # 再試行の待ち時間は待たない
+        patcher = mock.patch("util.edinet_downloader.asyncio.sleep", new=mock.AsyncMock())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def download(self, *doc_ids, **kwargs):
+        downloader = EdinetBulkDownloader(
+            api_key="test-key",
+            output_folder=self.folder,
+            rate_limit_per_second=0,
+            # 切れる前に受け取った分を書き込むように、小さく区切る
+            chunk_size=500,
+            transport=httpx.MockTransport(self.api),
+            **kwargs,
+        )
+        return downloader.download(doc_ids=list(doc_ids)).get_documents()
+
+    def assert_no_partial_files(self):
+        self.assertEqual([name for name in os.listdir(self.folder) if name.endswith(".part")], [])
+
+    def test_resume_after_connection_reset(self):
+        self.api.responses = [broken_response]
+        document, = self.download("S1")
+        self.assertEqual(document.status, STATUS_DOWNLOADED)
+        self.assertEqual(document.attempts, 2)
+        self.assertEqual(document.resumed_bytes, 1000)
+        self.assertEqual(self.api.ranges, [None, "bytes=1000-"])
+        with open(document.file_path, "rb") as f:
+            self.assertEqual(f.read(), PDF)
+        self.assert_no_partial_files()
+
+    def test_unsatisfiable_range_restarts(self):
+        self.api.responses = [broken_response, status_response(416)]
+        document, = self.download("S1")
+        self.assertEqual(document.status, STATUS_DOWNLOADED)
+        self.assertEqual(self.api.ranges, [None, "bytes=1000-", None])
+        with open(document.file_path, "rb") as f:
+            self.assertEqual(f.read(), PDF)
+
+    def test_server_errors_are_retried(self):
+        self.api.responses = [status_response(503), status_response(429)]
+        document, = self.download("S1")
+        self.assertEqual(document.status, STATUS_DOWNLOADED)
+        self.assertEqual(document.attempts, 3)
+
+    def test_gives_up_after_max_retries(self):
+        self.api.responses = [broken_response, status_response(500), status_response(500)]
+        document, = self.download("S1", max_retries=2)
+        self.assertEqual(document.status, STATUS_FAILED)
+        self.assertEqual(document.attempts, 3)
+        self.assertFalse(os.path.exists(os.path.join(self.folder, "S1.pdf")))
+        self.assert_no_partial_files()
+
+    def test_json_response_is_not_retried(self):
+        self.api.responses = [lambda request: httpx.Response(200, json={"metadata": {"status": "404"}})]
+        document, = self.download("S1")
+        self.assertEqual(document.status, STATUS_FAILED)
+        self.assertEqual(document.attempts, 1)
+        self.assert_no_partial_files()
+
+    def test_valid_file_is_skipped_and_duplicates_are_merged(self):
+        with open(os.path.join(self.folder, "S1.pdf"), "wb") as f:
+            f.write(PDF)
+        documents = self.download("S1", "S2", "S2")
+        self.assertEqual([(d.doc_id, d.status) for d in documents],
+                         [("S1", STATUS_SKIPPED), ("S2", STATUS_DOWNLOADED)])
+        self.assertEqual(len(self.api.ranges), 1)
+
+
+class FakeResponse:
+    def __init__(self, chunks, status_code=200, content_type="application/pdf"):
+        self.chunks = chunks
+        self.status_code = status_code
+        self.headers = {"content-type": content_type}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def iter_content(self, chunk_size):
+        for chunk in self.chunks:
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+
+
+class FakeSession:
+    """
+    requests.Sessionの代わり。作られたセッションと、それを使ったスレッドを記録する
+    responsesに設定した応答を先に返し、以降は完全なPDFを返す
+    """
+
+    instances = []
+    responses = []
+
+    def __init__(self):
+        self.threads = set()
+        FakeSession.instances.append(self)
+
+    def get(self, url, params=None, stream=False, timeout=None):
+        self.threads.add(threading.get_ident())
+        try:
+            return FakeSession.responses.pop(0)
+        except IndexError:
+            return FakeResponse([PDF[:2000], PDF[2000:]])
+
+
+class EdinetWrapperTest(unittest.TestCase):
+    """1書類のダウンロードのテスト"""
+
+    def setUp(self) -> None:
+        self.folder = tempfile.mkdtemp()
+        FakeSession.instances = []
+        FakeSession.responses = []
+        patcher = mock.patch("util.edinet_wrapper.requests.Session", new=FakeSession)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.wrapper = EdinetWrapper(api_key="test-key", output_folder=self.folder)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_session_per_thread(self):
+        paths = []
+
+        def run(doc_id):
+            paths.append(self.wrapper.download_pdf_of_financial_report(doc_id))
+
+        threads = [threading.Thread(target=run, args=(f"S{i}",)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(paths), 4)
+        self.assertEqual(len(FakeSession.instances), 4)
+        self.assertTrue(all(len(session.threads) == 1 for session in FakeSession.instances))
+
+        # 同じスレッドではセッションを使い回す
+        self.wrapper.download_pdf_of_financial_report("S10")
+        self.wrapper.download_pdf_of_financial_report("S11")
+        self.assertEqual(len(FakeSession.instances), 5)
+
+    def test_concurrent_downloads_of_the_same_document(self):
+        barrier = threading.Barrier(4)
+        paths = []
+        errors = []
+
+        class SlowResponse(FakeResponse):
+            def iter_content(self, chunk_size):
+                yield PDF[:2000]
+                barrier.wait()
+                yield PDF[2000:]
+
+        FakeSession.responses = [SlowResponse([]) for _ in range(4)]
+
+        def run():
+            try:
+                paths.append(self.wrapper.download_pdf_of_financial_report("S1"))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=run) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(set(paths), {os.path.join(self.folder, "S1.pdf")})
+        with open(paths[0], "rb") as f:
+            self.assertEqual(f.read(), PDF)
+        self.assertEqual(os.listdir(self.folder), ["S1.pdf"])
+
+    def test_incomplete_download_is_discarded(self):
+        FakeSession.responses = [FakeResponse([PDF[:2000]]), FakeResponse([PDF[:2000], OSError("reset")])]
+        with self.assertRaises(Exception):
+            self.wrapper.download_pdf_of_financial_report("S1")
+        with self.assertRaises(OSError):
+            self.wrapper.download_pdf_of_financial_report("S1")
+        self.assertEqual(os.listdir(self.folder), [])
+        # 次の呼び出しで取得し直す
+        self.assertTrue(self.wrapper.download_pdf_of_financial_report("S1").endswith("S1.pdf"))
+
+    def test_existing_pdf_is_reused(self):
+        with open(os.path.join(self.folder, "S1.pdf"), "wb") as f:
+            f.write(PDF)
+        self.wrapper.download_pdf_of_financial_report("S1")
+        self.assertEqual(FakeSession.instances, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,161 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import date
+from unittest import mock
+
+import httpx
+
+from util.edinet_sync import STATE_FILE_NAME, EdinetSyncPipeline, read_documents
+
+
+def make_document(doc_id: str, submit_date: date, filer_name: str = "トヨタ自動車株式会社") -> dict:
+    return {
+        "seqNumber": 1,
+        "docID": doc_id,
+        "edinetCode": "E02144",
+        "secCode": "72030",
+        "filerName": filer_name,
+        "docTypeCode": "120",
+        "periodStart": "2023-04-01",
+        "periodEnd": "2024-03-31",
+        "submitDateTime": f"{submit_date.isoformat()} 15:00",
+        "docDescription": "有価証券報告書－第120期",
+        "pdfFlag": "1",
+    }
+
+
+class FakeEdinetApi:
+    """日付ごとの書類一覧を返すdocuments.json。statusesに設定したHTTPステータスを先に返す"""
+
+    def __init__(self):
+        self.documents = {}
+        self.statuses = {}
+        self.requests = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        target_date = request.url.params["date"]
+        self.requests.append(target_date)
+        statuses = self.statuses.get(target_date)
+        if statuses:
+            return httpx.Response(statuses.pop(0), json={"metadata": {"status": "500"}})
+        return httpx.Response(200, json={
+            "metadata": {"status": "200"},
+            "results": self.documents.get(target_date, []),
+        })
+
+    def requested_dates(self):
+        return sorted(set(self.requests))
+
+
+class EdinetSyncPipelineTest(unittest.TestCase):
+    """EDINETの書類一覧の同期のテスト"""
+
+    def setUp(self) -> None:
+        self.folder = tempfile.mkdtemp()
+        self.api = FakeEdinetApi()
+        # 再試行の待ち時間は待たない
+        patcher = mock.patch("util.edinet_sync.asyncio.sleep", new=mock.AsyncMock())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def make_pipeline(self, **kwargs) -> EdinetSyncPipeline:
+        return EdinetSyncPipeline(
+            api_key="test-key",
+            output_folder=self.folder,
+            rate_limit_per_second=0,
+            transport=httpx.MockTransport(self.api),
+            progress_callback=lambda done, total, result: None,
+            **kwargs,
+        )
+
+    def test_first_sync_requires_start_date(self):
+        with self.assertRaises(ValueError):
+            self.make_pipeline().sync(end_date=date(2024, 6, 3))
+
+    def test_cursor_advances(self):
+        self.api.documents["2024-06-02"] = [make_document("S1", date(2024, 6, 2))]
+        pipeline = self.make_pipeline()
+        result = pipeline.sync(start_date=date(2024, 6, 1), end_date=date(2024, 6, 3))
+        self.assertEqual(result.error_dates, [])
+        self.assertEqual(result.document_count, 1)
+        self.assertEqual(result.high_water_mark, date(2024, 6, 3))
+        with open(os.path.join(self.folder, STATE_FILE_NAME)) as f:
+            self.assertEqual(json.load(f)["high_water_mark"], "2024-06-03")
+
+        # 次回はhigh water markの日(overlap_days=1)から取得する
+        self.api.requests.clear()
+        result = pipeline.sync(end_date=date(2024, 6, 5))
+        self.assertEqual(self.api.requested_dates(), ["2024-06-03", "2024-06-04", "2024-06-05"])
+        self.assertEqual(pipeline.get_high_water_mark(), date(2024, 6, 5))
+
+    def test_resume_after_failure(self):
+        # 6/2は再試行しても失敗する
+        self.api.statuses["2024-06-02"] = [503, 503]
+        pipeline = self.make_pipeline(max_retries=1)
+        result = pipeline.sync(start_date=date(2024, 6, 1), end_date=date(2024, 6, 3))
+        self.assertEqual(result.error_dates, [date(2024, 6, 2)])
+        self.assertEqual(result.success_dates, [date(2024, 6, 1), date(2024, 6, 3)])
+        self.assertEqual(result.retry_count, 1)
+        # 失敗した日の前日までしか進めない
+        self.assertEqual(pipeline.get_high_water_mark(), date(2024, 6, 1))
+
+        self.api.requests.clear()
+        self.api.documents["2024-06-02"] = [make_document("S2", date(2024, 6, 2))]
+        result = pipeline.sync(end_date=date(2024, 6, 3))
+        self.assertEqual(result.error_dates, [])
+        self.assertIn("2024-06-02", self.api.requested_dates())
+        self.assertEqual(pipeline.get_high_water_mark(), date(2024, 6, 3))
+        self.assertEqual(read_documents(self.folder).column("docID").to_pylist(), ["S2"])
+
+    def test_retryable_status_is_retried(self):
+        self.api.statuses["2024-06-01"] = [429, 500]
+        self.api.documents["2024-06-01"] = [make_document("S1", date(2024, 6, 1))]
+        result = self.make_pipeline(max_retries=3).sync(start_date=date(2024, 6, 1), end_date=date(2024, 6, 1))
+        self.assertEqual(result.success_dates, [date(2024, 6, 1)])
+        self.assertEqual((result.request_count, result.retry_count), (3, 2))
+
+    def test_client_error_is_not_retried(self):
+        self.api.statuses["2024-06-01"] = [400]
+        result = self.make_pipeline(max_retries=3).sync(start_date=date(2024, 6, 1), end_date=date(2024, 6, 1))
+        self.assertEqual(result.error_dates, [date(2024, 6, 1)])
+        self.assertEqual(result.request_count, 1)
+        self.assertIsNone(result.high_water_mark)
+
+    def test_resynced_dates_are_not_duplicated(self):
+        self.api.documents["2024-06-01"] = [make_document("S1", date(2024, 6, 1))]
+        self.api.documents["2024-06-02"] = [make_document("S2", date(2024, 6, 2))]
+        pipeline = self.make_pipeline(overlap_days=2)
+        pipeline.sync(start_date=date(2024, 6, 1), end_date=date(2024, 6, 2))
+
+        # 訂正された書類は、重複せずに置き換わる
+        self.api.documents["2024-06-02"] = [make_document("S2", date(2024, 6, 2), filer_name="トヨタ自動車(株)")]
+        self.api.documents["2024-06-03"] = [make_document("S3", date(2024, 6, 3))]
+        self.api.requests.clear()
+        pipeline.sync(end_date=date(2024, 6, 3))
+        self.assertEqual(self.api.requested_dates(), ["2024-06-01", "2024-06-02", "2024-06-03"])
+
+        table = read_documents(self.folder)
+        self.assertEqual(sorted(table.column("docID").to_pylist()), ["S1", "S2", "S3"])
+        rows = {row["docID"]: row for row in table.to_pylist()}
+        self.assertEqual(rows["S2"]["filerName"], "トヨタ自動車(株)")
+        self.assertEqual(
+            read_documents(self.folder, start_date=date(2024, 6, 2), end_date=date(2024, 6, 2)).num_rows, 1)
+
+    def test_schema_conversion(self):
+        self.api.documents["2024-06-01"] = [make_document("S1", date(2024, 6, 1))]
+        self.make_pipeline().sync(start_date=date(2024, 6, 1), end_date=date(2024, 6, 1))
+        row = read_documents(self.folder).to_pylist()[0]
+        self.assertEqual(row["periodEnd"], date(2024, 3, 31))
+        self.assertEqual(row["submitDateTime"].isoformat(), "2024-06-01T15:00:00")
+        self.assertEqual(row["seqNumber"], 1)
+        self.assertIsNone(row["fundCode"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+import unittest
+
+from util.filer_index import FilerIndex, normalize_company_name
+
+
+def make_row(doc_id: str, filer_name: str, submit_datetime: str) -> dict:
+    return {
+        "docID": doc_id,
+        "filerName": filer_name,
+        "docDescription": "有価証券報告書－第30期",
+        "submitDateTime": submit_datetime,
+    }
+
+
+class SnapshotTable:
+    """submitDateTimeがsince以降の行を返す、edinet_document_metadataの代わり"""
+
+    def __init__(self, rows):
+        self.rows = list(rows)
+        self.calls = []
+
+    def __call__(self, since):
+        self.calls.append(since)
+        return [row for row in self.rows if since is None or row["submitDateTime"] >= since]
+
+
+class NormalizeCompanyNameTest(unittest.TestCase):
+    def test_variants_are_folded(self):
+        cases = [
+            ("株式会社ＡＣＣＥＳＳ", "access"),
+            ("ACCESS (株)", "access"),
+            ("トヨタ自動車株式会社", "とよた自動車"),
+            ("とよた 自動車", "とよた自動車"),
+            ("髙島屋", "高島屋"),
+            ("株式会社 澤藤電機", "沢藤電機"),
+            ("「ソニーグループ」", "そにーぐるーぷ"),
+            ("霞ヶ関キャピタル", "霞け関きゃぴたる"),
+            ("霞ケ関キャピタル", "霞け関きゃぴたる"),
+        ]
+        for name, expected in cases:
+            self.assertEqual(normalize_company_name(name), expected, name)
+
+
+class FilerIndexTest(unittest.TestCase):
+    """提出者名のn-gramインデックスのテスト"""
+
+    def make_index(self, rows) -> FilerIndex:
+        index = FilerIndex(fetch_rows=SnapshotTable(rows))
+        index.ensure_loaded()
+        return index
+
+    def test_exact_match_ranks_first(self):
+        index = self.make_index([
+            make_row("S1", "トヨタ自動車株式会社", "2024-06-18 15:00"),
+            make_row("S2", "トヨタ自動車九州株式会社", "2024-06-20 15:00"),
+            make_row("S3", "豊田自動織機株式会社", "2024-06-19 15:00"),
+        ])
+        documents = index.search("トヨタ自動車")
+        self.assertEqual([d.doc_id for d in documents[:2]], ["S1", "S2"])
+        self.assertNotIn("S3", [d.doc_id for d in documents])
+
+    def test_partial_match_prefers_shorter_names(self):
+        index = self.make_index([
+            make_row("S1", "株式会社セブン＆アイ・ホールディングス", "2024-05-23 15:00"),
+            make_row("S2", "株式会社セブン銀行", "2024-06-20 15:00"),
+        ])
+        self.assertEqual(index.search("セブン")[0].doc_id, "S2")
+        self.assertEqual(index.search("セブン＆アイ")[0].doc_id, "S1")
+
+    def test_single_character_query(self):
+        index = self.make_index([
+            make_row("S1", "株式会社ＩＨＩ", "2024-06-21 15:00"),
+            make_row("S2", "株式会社ＫＤＤＩ", "2024-06-19 15:00"),
+        ])
+        self.assertEqual({d.doc_id for d in index.search("ｉ")}, {"S1", "S2"})
+        self.assertEqual(index.search("株式会社"), [])
+
+    def test_documents_of_a_filer_are_newest_first(self):
+        index = self.make_index([
+            make_row("S1", "株式会社ＡＣＣＥＳＳ", "2023-04-20 15:00"),
+            make_row("S2", "株式会社ACCESS", "2024-04-19 15:00"),
+            make_row("S3", "株式会社ＡＣＣＥＳＳ", "2022-04-21 15:00"),
+        ])
+        self.assertEqual([d.doc_id for d in index.search("access")], ["S2", "S1", "S3"])
+        self.assertEqual([d.doc_id for d in index.search("access", limit=2)], ["S2", "S1"])
+        # 提出者名は最新の書類の表記にそろえる
+        self.assertEqual(index.get_filer_name("ＡＣＣＥＳＳ"), "株式会社ACCESS")
+        self.assertEqual(len(index), 1)
+
+    def test_incremental_refresh(self):
+        table = SnapshotTable([
+            make_row("S1", "トヨタ自動車株式会社", "2024-06-18 15:00"),
+            make_row("S2", "ソニーグループ株式会社", "2024-06-20 15:00"),
+        ])
+        index = FilerIndex(fetch_rows=table)
+        self.assertEqual(index.refresh(), 2)
+        self.assertEqual(index.high_water_mark, "2024-06-20 15:00")
+
+        # 最後の提出日時と同じ時刻に、後から登録された書類も取り込む
+        table.rows.append(make_row("S3", "任天堂株式会社", "2024-06-20 15:00"))
+        table.rows.append(make_row("S4", "トヨタ自動車株式会社", "2025-06-18 15:00"))
+        self.assertEqual(index.refresh(), 2)
+        self.assertEqual(table.calls, [None, "2024-06-20 15:00"])
+        self.assertEqual(index.high_water_mark, "2025-06-18 15:00")
+        self.assertEqual(index.get_filer_name("任天堂"), "任天堂株式会社")
+        self.assertEqual([d.doc_id for d in index.search("トヨタ自動車")], ["S4", "S1"])
+
+        # 差分がなければ、境界の行は読み飛ばされて何も追加されない
+        self.assertEqual(index.refresh(), 0)
+        self.assertEqual(len(index), 3)
+
+    def test_invalid_rows_are_skipped(self):
+        index = FilerIndex(fetch_rows=SnapshotTable([]))
+        added = index.add_rows([
+            make_row("", "トヨタ自動車株式会社", "2024-06-18 15:00"),
+            make_row("S1", "", "2024-06-18 15:00"),
+            make_row("S2", "株式会社", "2024-06-18 15:00"),
+            make_row("S3", "トヨタ自動車株式会社", "2024-06-18 15:00"),
+            make_row("S3", "トヨタ自動車株式会社", "2024-06-18 15:00"),
+        ])
+        self.assertEqual(added, 1)
+        self.assertEqual(len(index), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from util.llm_result_cache import LLMResultCache, LocalDiskCacheBackend
+
+
+class LLMResultCacheTest(unittest.TestCase):
+    """LLMの解析結果のキャッシュのテスト"""
+
+    def setUp(self) -> None:
+        self.folder = tempfile.mkdtemp()
+        self.backend = LocalDiskCacheBackend(folder=self.folder)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def make_key(self, cache: LLMResultCache, **overrides) -> str:
+        args = {
+            "model_name": "gemini-2.0-flash-001",
+            "prompt": "分析してください",
+            "document_key": "edinet:S100ABCD",
+            "generation_config": {"temperature": 0, "max_output_tokens": 8192},
+        }
+        args.update(overrides)
+        return cache.make_key(**args)
+
+    def test_key_derivation(self):
+        cache = LLMResultCache(self.backend)
+        key = self.make_key(cache)
+        self.assertEqual(key, self.make_key(cache))
+        # 生成設定の順序はキーに影響しない
+        self.assertEqual(key, self.make_key(cache, generation_config={"max_output_tokens": 8192, "temperature": 0}))
+        for overrides in (
+            {"model_name": "gemini-2.5-pro"},
+            {"prompt": "要約してください"},
+            {"document_key": "edinet:S100EFGH"},
+            {"generation_config": {"temperature": 0.5, "max_output_tokens": 8192}},
+        ):
+            self.assertNotEqual(key, self.make_key(cache, **overrides), overrides)
+
+    def test_round_trip(self):
+        cache = LLMResultCache(self.backend)
+        key = self.make_key(cache)
+        self.assertIsNone(cache.get(key))
+        cache.put(key, "分析結果", meta={"doc_id": "S100ABCD"})
+        self.assertEqual(cache.get(key), "分析結果")
+        metrics = cache.get_metrics()
+        self.assertEqual((metrics["hits"], metrics["misses"], metrics["stores"]), (1, 1, 1))
+        self.assertEqual(metrics["hit_rate"], 0.5)
+
+    def test_ttl(self):
+        cache = LLMResultCache(self.backend, ttl_seconds=60)
+        key = self.make_key(cache)
+        now = time.time()
+        with mock.patch("util.llm_result_cache.time.time", return_value=now):
+            cache.put(key, "分析結果")
+        with mock.patch("util.llm_result_cache.time.time", return_value=now + 60):
+            self.assertEqual(cache.get(key), "分析結果")
+        with mock.patch("util.llm_result_cache.time.time", return_value=now + 61):
+            self.assertIsNone(cache.get(key))
+        # 期限切れのエントリは削除される
+        self.assertIsNone(self.backend.get(key))
+        self.assertEqual(cache.get_metrics()["expired"], 1)
+
+    def test_version_invalidates_entries(self):
+        old_cache = LLMResultCache(self.backend, version="1")
+        old_cache.put(self.make_key(old_cache), "古い分析結果")
+        new_cache = LLMResultCache(self.backend, version="2")
+        self.assertNotEqual(self.make_key(old_cache), self.make_key(new_cache))
+        self.assertIsNone(new_cache.get(self.make_key(new_cache)))
+        self.assertEqual(old_cache.get(self.make_key(old_cache)), "古い分析結果")
+
+    def test_corrupted_entry_is_dropped(self):
+        cache = LLMResultCache(self.backend)
+        for i, value in enumerate(['{"created_at": 1', '{"created_at": 1}', '[]']):
+            key = self.make_key(cache, document_key=f"edinet:{i}")
+            self.backend.put(key, value)
+            self.assertIsNone(cache.get(key))
+            self.assertIsNone(self.backend.get(key))
+        metrics = cache.get_metrics()
+        self.assertEqual(metrics["corrupted"], 3)
+        self.assertEqual(metrics["hit_rate"], 0.0)
+
+    def test_backend_errors_are_misses(self):
+        backend = mock.Mock()
+        backend.get.side_effect = OSError("unavailable")
+        backend.put.side_effect = OSError("unavailable")
+        cache = LLMResultCache(backend)
+        key = self.make_key(cache)
+        self.assertIsNone(cache.get(key))
+        cache.put(key, "分析結果")
+        self.assertEqual(cache.get_metrics()["errors"], 2)
+
+    def test_local_backend_shards_by_key_prefix(self):
+        self.backend.put("abcdef", "{}")
+        self.assertTrue(os.path.exists(os.path.join(self.folder, "ab", "abcdef.json")))
+        self.backend.delete("abcdef")
+        self.backend.delete("abcdef")
+        self.assertIsNone(self.backend.get("abcdef"))
+
+
+if __name__ == "__main__":
+    unittest.main()
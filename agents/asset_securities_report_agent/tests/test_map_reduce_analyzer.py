@@ -0,0 +1,170 @@
+import threading
+import unittest
+from types import SimpleNamespace
+
+from util.map_reduce_analyzer import STATUS_FAILED, STATUS_SUCCEEDED, MapReduceAnalyzer, split_analyze_prompt
+
+# agent.pyのAssetSecuritiesReportAgentConfig.analyze_promptと同じプロンプト
+ANALYZE_PROMPT = """
+上記の決算資料から、後述する観点についてそれぞれ分析を行なって、分析結果をまとめてください。
+
+1. 経営戦略と事業内容:
+    企業のビジョン、ミッション、経営理念を明確化し、その内容を評価してください。
+    主要な事業セグメントとその内容、売上高、利益への貢献度を分析してください。
+    市場における競争優位性と、その持続可能性について評価してください。
+    今後の事業展開の方向性と、その実現可能性について分析してください。
+    事業ポートフォリオを分析し、多角化の程度やリスク分散の状況を評価してください。
+
+2. 財務状況:
+    収益性、安全性、効率性の観点から財務状況を分析し、改善点や課題を指摘してください。
+    収益性分析では、売上高総利益率、営業利益率などの指標の推移を分析し、その要因を考察してください。
+    安全性分析では、流動比率、自己資本比率などの指標を分析し、財務リスクを評価してください。
+    効率性分析では、総資産回転率、棚卸資産回転率などの指標を分析し、資産の運用効率を評価してください。
+    キャッシュフロー計算書を分析し、資金繰りの状況を評価してください。
+
+3. リスク:
+    事業報告書に記載されているリスク要因を分析し、その重要度と影響度を評価してください。
+    業界全体の動向や競合との競争環境などを考慮し、潜在的なリスクを特定してください。
+    リスク管理体制の adequacy を評価し、改善点があれば指摘してください。
+
+4. コーポレートガバナンス:
+    コーポレートガバナンスの体制、取締役会の構成、独立役員の役割などを分析してください。
+    株主との関係、情報開示の状況などを評価してください。
+    企業倫理、コンプライアンスに関する取り組みを評価してください。
+
+5. ESG:
+    環境問題への取り組み、社会貢献活動、企業統治の状況を分析してください。
+    ESGに関する情報開示の adequacy を評価してください。
+    ESGの観点から、企業の持続可能性を評価してください。
+    分析結果の出力形式:
+    各観点ごとに章立てし、分析結果を明確に記述してください。
+    図表やグラフなどを用いて、分析結果を視覚的に表現してください。
+    具体的な根拠に基づいた客観的な分析を行い、結論を明確に示してください。
+    必要に応じて、改善点や提言などを提示してください。
+    その他:
+    分析対象の有価証券報告書の発行企業、発行年を明記してください。
+    最新の情報やデータを入手し、分析に活用してください。
+
+6. 株価状況
+    直近1年の株価の推移について、前述の分析結果を元に判定してください。
+        """
+
+
+class FakeModel:
+    """
+    観点ごとの分析には「## 見出し」を、総括には「## 総括」を返す
+    failingに含まれる見出しの観点と、reduce_failsがTrueの場合の総括は例外になる
+    """
+
+    def __init__(self, failing=(), reduce_fails: bool = False) -> None:
+        self.failing = set(failing)
+        self.reduce_fails = reduce_fails
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def __call__(self, contents):
+        with self.lock:
+            self.calls.append(contents)
+        prompt = contents[-1]
+        if len(contents) == 1:
+            if self.reduce_fails:
+                raise RuntimeError("reduce failed")
+            return SimpleNamespace(text="## 総括\n総括の結果")
+        heading = next(line.strip()[4:] for line in prompt.splitlines() if line.strip().startswith("「## "))
+        heading = heading.split("」")[0]
+        if heading in self.failing:
+            raise RuntimeError(f"{heading} failed")
+        return SimpleNamespace(text=f"## {heading}\n{heading}の結果")
+
+
+class SplitAnalyzePromptTest(unittest.TestCase):
+    """分析のプロンプトの観点ごとの分割のテスト"""
+
+    def test_split_the_analyze_prompt(self):
+        split = split_analyze_prompt(ANALYZE_PROMPT)
+        self.assertEqual(
+            [p.heading for p in split.perspectives],
+            ["1. 経営戦略と事業内容", "2. 財務状況", "3. リスク", "4. コーポレートガバナンス", "5. ESG", "6. 株価状況"],
+        )
+        # 他の観点の結果を使うのは株価状況のみ
+        self.assertEqual([p.heading for p in split.reduce_perspectives], ["6. 株価状況"])
+        self.assertEqual(len(split.map_perspectives), 5)
+        self.assertTrue(split.header.startswith("上記の決算資料から"))
+        # 出力形式などの共通の指示は、ESGの観点には含めない
+        esg = split.perspectives[4]
+        self.assertNotIn("分析結果の出力形式", esg.body)
+        self.assertIn("ESGの観点から", esg.body)
+        self.assertIn("発行年を明記", split.shared_instructions)
+        self.assertEqual(split.perspectives[1].sections, ["事業の状況", "経理の状況"])
+        self.assertEqual(split.perspectives[3].sections, ["提出会社の状況"])
+
+
+class MapReduceAnalyzerTest(unittest.TestCase):
+    """観点ごとの並列の分析と総括のテスト"""
+
+    def analyze(self, model: FakeModel, **kwargs):
+        analyzer = MapReduceAnalyzer(model, max_retries=1, retry_backoff_seconds=0, **kwargs)
+        partials = []
+        result = analyzer.analyze(
+            prompt=ANALYZE_PROMPT,
+            get_document_part=lambda perspective: f"document:{perspective.number}",
+            on_partial=partials.append,
+        )
+        return analyzer, result, partials
+
+    def test_all_perspectives_succeed(self):
+        model = FakeModel()
+        analyzer, result, partials = self.analyze(model)
+        self.assertEqual(len(partials), 5)
+        self.assertEqual(result.failed_perspectives, [])
+        self.assertTrue(result.text.startswith("## 1. 経営戦略と事業内容"))
+        self.assertTrue(result.text.endswith("## 総括\n総括の結果"))
+        # 観点ごとに資料を付けて分析し、総括は結果のみから行う
+        self.assertEqual(sorted(contents[0] for contents in model.calls if len(contents) == 2),
+                         [f"document:{i}" for i in range(1, 6)])
+        self.assertIn("6. 株価状況", result.reduce_prompt)
+        self.assertIn("## 3. リスク\n3. リスクの結果", result.reduce_prompt)
+        self.assertTrue(result.is_complete)
+        metrics = analyzer.get_metrics()
+        self.assertEqual((metrics["analyses"], metrics["perspectives"], metrics["failed_perspectives"]), (1, 5, 0))
+
+    def test_failed_perspective(self):
+        model = FakeModel(failing={"3. リスク"})
+        analyzer, result, partials = self.analyze(model)
+        self.assertEqual(result.failed_perspectives, ["3. リスク"])
+        failed = result.perspective_results[2]
+        self.assertEqual((failed.status, failed.attempts, failed.error), (STATUS_FAILED, 2, "3. リスク failed"))
+        self.assertEqual([r.status for r in result.perspective_results].count(STATUS_SUCCEEDED), 4)
+        self.assertIn("## 3. リスク\nこの観点は、分析に失敗したため結果がありません。", result.text)
+        self.assertIn("## 3. リスク\n（分析に失敗しました）", result.reduce_prompt)
+        self.assertIn("## 4. コーポレートガバナンス\n4. コーポレートガバナンスの結果", result.text)
+        # 失敗した観点を含む結果はキャッシュしない
+        self.assertFalse(result.is_complete)
+        metrics = analyzer.get_metrics()
+        self.assertEqual((metrics["failed_perspectives"], metrics["retries"]), (1, 1))
+
+    def test_all_perspectives_fail(self):
+        model = FakeModel(failing={p.heading for p in split_analyze_prompt(ANALYZE_PROMPT).perspectives})
+        analyzer = MapReduceAnalyzer(model, max_retries=0, retry_backoff_seconds=0)
+        with self.assertRaisesRegex(Exception, "^all perspectives failed: 1. 経営戦略と事業内容 failed$"):
+            analyzer.analyze(prompt=ANALYZE_PROMPT, get_document_part=lambda perspective: None)
+        # 総括は行わない
+        self.assertTrue(all(len(contents) == 2 for contents in model.calls))
+
+    def test_failed_reduce(self):
+        model = FakeModel(reduce_fails=True)
+        analyzer, result, _ = self.analyze(model)
+        self.assertIsNone(result.reduce_response)
+        self.assertNotIn("## 総括", result.text)
+        self.assertTrue(result.text.endswith("## 5. ESG\n5. ESGの結果"))
+        self.assertFalse(result.is_complete)
+        self.assertEqual(analyzer.get_metrics()["reduce_failures"], 1)
+
+    def test_prompt_without_perspectives(self):
+        analyzer = MapReduceAnalyzer(FakeModel(), retry_backoff_seconds=0)
+        with self.assertRaises(ValueError):
+            analyzer.analyze(prompt="決算資料を要約してください", get_document_part=lambda perspective: None)
+
+
+if __name__ == "__main__":
+    unittest.main()
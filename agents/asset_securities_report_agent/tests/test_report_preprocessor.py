@@ -0,0 +1,148 @@
+import os
+import shutil
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+from pypdf import PdfReader, PdfWriter
+
+from util.report_preprocessor import TOKENS_PER_PAGE, ReportPreprocessor, parse_sections
+
+
+def write_pdf(path: str, total_pages: int, outline=()) -> str:
+    writer = PdfWriter()
+    for _ in range(total_pages):
+        writer.add_blank_page(width=595, height=842)
+    for title, page_number in outline:
+        writer.add_outline_item(title, page_number)
+    with open(path, "wb") as f:
+        writer.write(f)
+    return path
+
+
+class FakePage:
+    def __init__(self, text: str) -> None:
+        self.text = text
+
+    def extract_text(self) -> str:
+        return self.text
+
+
+class ParseSectionsTest(unittest.TestCase):
+    """章の範囲の検出のテスト"""
+
+    def setUp(self) -> None:
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_sections_from_outline(self):
+        path = write_pdf(os.path.join(self.folder, "report.pdf"), 10, outline=[
+            ("第一部【企業情報】", 1),
+            ("第１【企業の概況】", 1),
+            ("第2 【事業の状況】", 3),
+            ("第５【経理の状況】", 6),
+        ])
+        sections = parse_sections(PdfReader(path))
+        self.assertEqual(
+            [(s.title, s.start_page, s.end_page) for s in sections],
+            [("企業の概況", 1, 3), ("事業の状況", 3, 6), ("経理の状況", 6, 10)],
+        )
+
+    def test_sections_from_text_skip_table_of_contents(self):
+        reader = SimpleNamespace(outline=[], pages=[
+            FakePage("有価証券報告書"),
+            # 目次のページ
+            FakePage("第１【企業の概況】\n第２【事業の状況】\n第３【設備の状況】"),
+            FakePage("第１【企業の概況】\n１【主要な経営指標等の推移】"),
+            FakePage("２【沿革】"),
+            FakePage("第２【事業の状況】"),
+            FakePage("本文中で第１【企業の概況】に触れる"),
+        ])
+        sections = parse_sections(reader)
+        self.assertEqual(
+            [(s.title, s.start_page, s.end_page) for s in sections],
+            [("企業の概況", 2, 4), ("事業の状況", 4, 6)],
+        )
+
+    def test_no_headings(self):
+        reader = SimpleNamespace(outline=[], pages=[FakePage("表紙"), FakePage("本文")])
+        self.assertEqual(parse_sections(reader), [])
+
+
+class ReportPreprocessorTest(unittest.TestCase):
+    """分析に必要なページの抜き出しのテスト"""
+
+    def setUp(self) -> None:
+        self.folder = tempfile.mkdtemp()
+        self.cache_folder = os.path.join(self.folder, "cache")
+        self.pdf_path = write_pdf(os.path.join(self.folder, "S100ABCD.pdf"), 20, outline=[
+            ("第１【企業の概況】", 2),
+            ("第２【設備の状況】", 4),
+            ("第３【事業の状況】", 6),
+            ("第４【経理の状況】", 9),
+        ])
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_pruned_pages(self):
+        preprocessor = ReportPreprocessor(self.cache_folder, sections={
+            "企業の概況": None,
+            "事業の状況": None,
+            "経理の状況": 5,
+        })
+        result = preprocessor.preprocess("S100ABCD", self.pdf_path)
+        self.assertFalse(result.cached)
+        # 表紙は常に含め、設備の状況は含めず、経理の状況は先頭の5ページのみ
+        self.assertEqual(result.selected_pages, [0, 2, 3, 6, 7, 8, 9, 10, 11, 12, 13])
+        self.assertEqual(result.selected_sections, ["企業の概況", "事業の状況", "経理の状況"])
+        self.assertNotEqual(result.file_path, self.pdf_path)
+        self.assertEqual(len(PdfReader(result.file_path).pages), 11)
+        self.assertEqual(result.estimated_full_tokens, 20 * TOKENS_PER_PAGE)
+        self.assertEqual(result.estimated_tokens, 11 * TOKENS_PER_PAGE)
+
+    def test_cached_result(self):
+        preprocessor = ReportPreprocessor(self.cache_folder)
+        first = preprocessor.preprocess("S100ABCD", self.pdf_path)
+        second = ReportPreprocessor(self.cache_folder).preprocess("S100ABCD", self.pdf_path)
+        self.assertTrue(second.cached)
+        self.assertEqual(second.selected_pages, first.selected_pages)
+        self.assertEqual(second.file_path, first.file_path)
+        # 抜き出したPDFが消えていれば作り直す
+        os.remove(first.file_path)
+        self.assertFalse(preprocessor.preprocess("S100ABCD", self.pdf_path).cached)
+
+    def test_sections_change_the_cache_key(self):
+        default = ReportPreprocessor(self.cache_folder)
+        other = ReportPreprocessor(self.cache_folder, sections={"経理の状況": None})
+        self.assertNotEqual(default.get_cache_key("S100ABCD"), other.get_cache_key("S100ABCD"))
+        default.preprocess("S100ABCD", self.pdf_path)
+        result = other.preprocess("S100ABCD", self.pdf_path)
+        self.assertFalse(result.cached)
+        self.assertEqual(result.selected_pages, [0] + list(range(9, 20)))
+
+    def test_no_sections_uses_the_original(self):
+        pdf_path = write_pdf(os.path.join(self.folder, "S100EFGH.pdf"), 3)
+        preprocessor = ReportPreprocessor(self.cache_folder)
+        result = preprocessor.preprocess("S100EFGH", pdf_path)
+        self.assertEqual(result.file_path, pdf_path)
+        self.assertEqual(result.selected_pages, [0, 1, 2])
+        self.assertEqual(result.estimated_tokens, result.estimated_full_tokens)
+        self.assertTrue(preprocessor.preprocess("S100EFGH", pdf_path).cached)
+
+    def test_report(self):
+        preprocessor = ReportPreprocessor(self.cache_folder, sections={"企業の概況": None})
+        self.assertEqual(preprocessor.get_report()["estimated_token_reduction"], 0.0)
+        result = preprocessor.preprocess("S100ABCD", self.pdf_path)
+        preprocessor.record_analysis(result, prompt_token_count=900, candidates_token_count=100, llm_seconds=1.5)
+        report = preprocessor.get_report()
+        self.assertEqual(report["analyses"], 1)
+        self.assertEqual(report["estimated_tokens"], 3 * TOKENS_PER_PAGE)
+        self.assertAlmostEqual(report["estimated_token_reduction"], 1 - 3 / 20)
+        self.assertEqual((report["prompt_tokens"], report["output_tokens"]), (900, 100))
+
+
+if __name__ == "__main__":
+    unittest.main()
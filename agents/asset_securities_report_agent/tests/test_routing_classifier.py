@@ -0,0 +1,102 @@
+import unittest
+
+from util.filer_index import FilerIndex
+from util.routing_classifier import LRUMemo, PATH_LLM, PATH_RULE, PathLatencyMetrics, RoutingPreClassifier
+
+
+def make_row(doc_id: str, filer_name: str, submit_datetime: str) -> dict:
+    return {
+        "docID": doc_id,
+        "filerName": filer_name,
+        "docDescription": "有価証券報告書",
+        "submitDateTime": submit_datetime,
+    }
+
+
+class FakeRows:
+    """refreshのたびに、次の行のまとまりを返す"""
+
+    def __init__(self, *batches):
+        self.batches = list(batches)
+        self.calls = []
+
+    def __call__(self, since):
+        self.calls.append(since)
+        return self.batches.pop(0) if self.batches else []
+
+
+class RoutingPreClassifierTest(unittest.TestCase):
+    """ルールによるルーティングの前段の判定のテスト"""
+
+    def make_classifier(self, *batches):
+        index = FilerIndex(fetch_rows=FakeRows(*batches))
+        return index, RoutingPreClassifier(filer_name_lookup=index.get_filer_name)
+
+    def test_filer_name_matches_after_normalization(self):
+        _, classifier = self.make_classifier([make_row("S1", "株式会社ＡＣＣＥＳＳ", "2024-06-01 10:00")])
+        self.assertEqual(classifier.match_filer_name("access"), "株式会社ＡＣＣＥＳＳ")
+        self.assertEqual(classifier.match_filer_name(" ＡＣＣＥＳＳ株式会社 "), "株式会社ＡＣＣＥＳＳ")
+        self.assertIsNone(classifier.match_filer_name("ACCESSの業績"))
+        self.assertIsNone(classifier.match_filer_name("株式会社"))
+
+    def test_refreshed_index_is_used(self):
+        index, classifier = self.make_classifier(
+            [make_row("S1", "株式会社ＡＣＣＥＳＳ", "2024-06-01 10:00")],
+            [make_row("S2", "トヨタ自動車株式会社", "2024-06-20 15:00")],
+        )
+        self.assertIsNone(classifier.match_filer_name("トヨタ自動車"))
+        index.refresh()
+        self.assertEqual(classifier.match_filer_name("トヨタ自動車"), "トヨタ自動車株式会社")
+
+    def test_lookup_failure_falls_back_to_llm(self):
+        def fail(name):
+            raise RuntimeError("BigQuery is unavailable")
+
+        classifier = RoutingPreClassifier(filer_name_lookup=fail)
+        self.assertIsNone(classifier.match_filer_name("トヨタ自動車"))
+        self.assertIsNone(classifier.classify_routing("トヨタ自動車", finish_search=False))
+
+    def test_classify_routing(self):
+        _, classifier = self.make_classifier([make_row("S1", "トヨタ自動車株式会社", "2024-06-20 15:00")])
+        self.assertEqual(classifier.classify_routing("はい、お願いします。", finish_search=True), "analyze_report")
+        self.assertIsNone(classifier.classify_routing("はい、お願いします。", finish_search=False))
+        self.assertEqual(classifier.classify_routing("トヨタ自動車", finish_search=False), "extract_company_name")
+        self.assertIsNone(classifier.classify_routing("トヨタ自動車の株価を教えて", finish_search=False))
+
+    def test_memo_keys_are_normalized(self):
+        self.assertEqual(
+            RoutingPreClassifier.routing_memo_key("候補はこちら", "ＯＫ！"),
+            RoutingPreClassifier.routing_memo_key("候補は こちら", "ok"),
+        )
+        self.assertEqual(
+            RoutingPreClassifier.company_name_memo_key("トヨタ自動車を分析して。"),
+            RoutingPreClassifier.company_name_memo_key("トヨタ自動車を 分析して"),
+        )
+
+
+class LRUMemoTest(unittest.TestCase):
+    def test_least_recently_used_is_dropped(self):
+        memo = LRUMemo(max_items=2)
+        memo.put("a", "1")
+        memo.put("b", "2")
+        self.assertEqual(memo.get("a"), "1")
+        memo.put("c", "3")
+        self.assertIsNone(memo.get("b"))
+        self.assertEqual((memo.get("a"), memo.get("c")), ("1", "3"))
+        self.assertEqual(len(memo), 2)
+
+
+class PathLatencyMetricsTest(unittest.TestCase):
+    def test_llm_skip_rate(self):
+        metrics = PathLatencyMetrics()
+        metrics.record("routing", PATH_RULE, 0.001)
+        metrics.record("routing", PATH_RULE, 0.003)
+        metrics.record("routing", PATH_LLM, 1.0)
+        routing = metrics.get_metrics()["routing"]
+        self.assertEqual(routing[PATH_RULE]["count"], 2)
+        self.assertAlmostEqual(routing[PATH_RULE]["mean_ms"], 2.0)
+        self.assertAlmostEqual(routing["llm_skip_rate"], 2 / 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
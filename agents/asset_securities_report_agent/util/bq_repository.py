@@ -0,0 +1,178 @@
+"""
+BigQueryへのアクセスをまとめたリポジトリ
+クライアントの共有、クエリパラメーター、結果のキャッシュ、ドライランによるスキャン量の見積もりを行う
+"""
+
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from logging import getLogger
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from google.cloud import bigquery
+
+logger = getLogger(__name__)
+
+SQL_FOLDER = os.path.join(os.path.dirname(os.path.dirname(__file__)), "sql")
+
+
+class BigQueryRepository:
+    """
+    sqlフォルダのクエリを、名前とパラメーターを指定して実行する
+    結果はクエリ名とパラメーターごとにttl_secondsの間キャッシュする（ttl_secondsが0の場合はキャッシュしない）
+    各クエリは初めて実行する時にドライランを行い、スキャン量の見積もりをメトリクスとして公開する
+    """
+
+    def __init__(self, project_id: Optional[str] = None, sql_folder: str = SQL_FOLDER, max_cached_results: int = 1024) -> None:
+        self.__project_id = project_id
+        self.__sql_folder = sql_folder
+        self.max_cached_results = max_cached_results
+        self.__client: Optional[bigquery.Client] = None
+        self.__lock = threading.Lock()
+        self.__sql: Dict[str, str] = {}
+        # (クエリ名, パラメーター) -> (期限, 結果)
+        self.__results: Dict[Tuple, Tuple[float, List[dict]]] = {}
+        self.__metrics: Dict[str, Dict[str, Any]] = {}
+
+    @property
+    def client(self) -> bigquery.Client:
+        # クライアントの生成は重いため、プロセスで1つを共有する
+        with self.__lock:
+            if self.__client is None:
+                self.__client = bigquery.Client(project=self.__project_id)
+            return self.__client
+
+    def __get_sql(self, name: str) -> str:
+        with self.__lock:
+            if name not in self.__sql:
+                with open(os.path.join(self.__sql_folder, f"{name}.sql"), "r") as f:
+                    self.__sql[name] = f.read()
+            return self.__sql[name]
+
+    def __metric(self, name: str) -> Dict[str, Any]:
+        return self.__metrics.setdefault(name, {
+            "calls": 0,
+            "cache_hits": 0,
+            "queries": 0,
+            "total_query_ms": 0.0,
+            "estimated_bytes_processed": None,
+            "total_bytes_processed": 0,
+            "total_bytes_billed": 0,
+        })
+
+    def query(
+        self,
+        name: str,
+        parameters: Sequence[bigquery.ScalarQueryParameter] = (),
+        ttl_seconds: float = 0,
+    ) -> List[dict]:
+        cache_key = (name, tuple((p.name, p.type_, p.value) for p in parameters))
+        now = time.monotonic()
+        with self.__lock:
+            metric = self.__metric(name)
+            metric["calls"] += 1
+            cached = self.__results.get(cache_key)
+            if cached is not None and cached[0] > now:
+                metric["cache_hits"] += 1
+                return list(cached[1])
+            estimate = metric["estimated_bytes_processed"] is None
+
+        sql = self.__get_sql(name)
+        if estimate:
+            self.__dry_run(name, sql, parameters)
+
+        start_time = time.perf_counter()
+        job = self.client.query(sql, job_config=bigquery.QueryJobConfig(query_parameters=list(parameters)))
+        rows = [dict(row.items()) for row in job.result()]
+        elapsed = time.perf_counter() - start_time
+
+        with self.__lock:
+            metric = self.__metric(name)
+            metric["queries"] += 1
+            metric["total_query_ms"] += elapsed * 1000
+            metric["total_bytes_processed"] += job.total_bytes_processed or 0
+            metric["total_bytes_billed"] += job.total_bytes_billed or 0
+            if ttl_seconds > 0:
+                self.__results[cache_key] = (time.monotonic() + ttl_seconds, rows)
+                self.__evict_results()
+        return list(rows)
+
+    def __dry_run(self, name: str, sql: str, parameters: Sequence[bigquery.ScalarQueryParameter]):
+        # 課金されないドライランで、スキャン量を見積もる
+        try:
+            job = self.client.query(sql, job_config=bigquery.QueryJobConfig(
+                query_parameters=list(parameters), dry_run=True, use_query_cache=False
+            ))
+        except Exception as e:
+            logger.warning("failed to dry run %s: %s", name, e)
+            return
+        logger.info("estimated bytes processed by %s: %s", name, job.total_bytes_processed)
+        with self.__lock:
+            self.__metric(name)["estimated_bytes_processed"] = job.total_bytes_processed
+
+    def __evict_results(self):
+        # 期限切れのものを捨て、それでも多い場合は期限の近いものから捨てる
+        now = time.monotonic()
+        if len(self.__results) <= self.max_cached_results:
+            return
+        for key in [k for k, (expires, _) in self.__results.items() if expires <= now]:
+            del self.__results[key]
+        if len(self.__results) > self.max_cached_results:
+            for key, _ in sorted(self.__results.items(), key=lambda item: item[1][0])[:len(self.__results) - self.max_cached_results]:
+                del self.__results[key]
+
+    def clear_cache(self):
+        with self.__lock:
+            self.__results.clear()
+
+    def get_metrics(self) -> Dict[str, Dict[str, Any]]:
+        with self.__lock:
+            metrics = {}
+            for name, metric in self.__metrics.items():
+                metrics[name] = dict(metric)
+                metrics[name]["mean_query_ms"] = metric["total_query_ms"] / metric["queries"] if metric["queries"] else 0.0
+                metrics[name]["cache_hit_rate"] = metric["cache_hits"] / metric["calls"] if metric["calls"] else 0.0
+            return metrics
+
+
+class EdinetDocumentRepository:
+    """edinet_document_metadataの有価証券報告書の検索"""
+
+    def __init__(
+        self,
+        repository: BigQueryRepository,
+        search_ttl_seconds: float = 10 * 60,
+        lookback_days: int = 5 * 365,
+    ) -> None:
+        self.repository = repository
+        self.search_ttl_seconds = search_ttl_seconds
+        # 提出日時で古い書類を検索結果から除く
+        # submitDateTimeは文字列の列で、テーブルのパーティション列ではないため、スキャン量は減らない
+        # （スキャン量は/metrics/bigqueryのestimated_bytes_processedとtotal_bytes_processedで確認する）
+        self.lookback_days = lookback_days
+
+    def __min_submit_datetime(self) -> str:
+        # 日単位に丸めて、同じ日の検索は同じパラメーター(キャッシュのキー)にする
+        return (datetime.now() - timedelta(days=self.lookback_days)).strftime("%Y-%m-%d")
+
+    def search_latest_reports(self, company_name: str, limit: int = 10) -> List[dict]:
+        # 提出者ごとに最新の有価証券報告書1件のみを、新しい順に返す
+        return self.repository.query(
+            "search_company",
+            [
+                bigquery.ScalarQueryParameter("company_name", "STRING", company_name),
+                bigquery.ScalarQueryParameter("min_submit_datetime", "STRING", self.__min_submit_datetime()),
+                bigquery.ScalarQueryParameter("limit", "INT64", limit),
+            ],
+            ttl_seconds=self.search_ttl_seconds,
+        )
+
+    def fetch_reports_since(self, since: Optional[str]) -> List[dict]:
+        # since以降に提出された有価証券報告書を返す（sinceがNoneの場合は全件）
+        # 同じ提出日時の書類を取りこぼさないようにsinceちょうどの行も返す。取り込み済みの行はFilerIndexが読み飛ばす
+        # 差分の取り込みに使うため、キャッシュはしない
+        return self.repository.query(
+            "filer_index_snapshot",
+            [bigquery.ScalarQueryParameter("since", "STRING", since)],
+        )
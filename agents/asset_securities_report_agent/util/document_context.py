@@ -0,0 +1,326 @@
+"""
+有価証券報告書についての追加の質問のための、資料ごとのコンテキスト
+一度処理した資料をコンテキストとして保持し、同じ資料への質問では資料を送り直さずに質問の分のトークンのみで回答する
+VertexAIのコンテキストキャッシュを使い、使えない場合(トークン数が下限未満など)は資料を毎回送るローカルの代替を使う
+"""
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from datetime import timedelta
+from logging import getLogger
+from typing import Any, Callable, Dict, List, Optional
+
+from google.api_core.exceptions import NotFound
+from vertexai.generative_models import Content, GenerationConfig, GenerativeModel, Part
+from vertexai.preview import caching
+from vertexai.preview.generative_models import GenerativeModel as PreviewGenerativeModel
+
+logger = getLogger(__name__)
+
+SYSTEM_INSTRUCTION = "あなたは有価証券報告書の分析を行うアナリストです。提供された有価証券報告書の内容に基づいて回答してください。"
+
+
+@dataclass
+class DocumentContext:
+    document_key: str
+    backend: str
+    # VertexAIはキャッシュのリソース名、ローカルは資料のPart
+    handle: Any
+    # コンテキストに含まれる資料のトークン数（不明な場合は0）
+    token_count: int = 0
+    # 有効期限(UNIX時間)。Noneは期限なし
+    expire_time: Optional[float] = None
+    build_seconds: float = 0.0
+
+    def is_valid(self, margin_seconds: float = 0) -> bool:
+        return self.expire_time is None or self.expire_time - margin_seconds > time.time()
+
+
+@dataclass
+class ContextTurn:
+    """1回の質問の記録"""
+    document_key: str
+    backend: str
+    built: bool
+    prompt_token_count: int
+    cached_token_count: int
+    candidates_token_count: int
+    seconds: float
+    build_seconds: float
+
+    @property
+    def incremental_token_count(self) -> int:
+        return self.prompt_token_count - self.cached_token_count
+
+
+class LocalContextBackend:
+    """
+    資料を手元に保持して、質問のたびに資料と一緒に送る代替のバックエンド
+    コンテキストキャッシュを使えないモデルや資料と、テストで使う
+    """
+
+    name = "local"
+
+    def __init__(self, model: GenerativeModel, ttl_seconds: int = 60 * 60) -> None:
+        self.__model = model
+        self.ttl_seconds = ttl_seconds
+
+    def create(self, document_key: str, document_part: Part) -> DocumentContext:
+        # 資料をメモリに保持するため、VertexAIのキャッシュと同じく有効期限を付ける
+        return DocumentContext(document_key=document_key, backend=self.name, handle=document_part,
+                               expire_time=time.time() + self.ttl_seconds)
+
+    def generate(self, context: DocumentContext, contents: List[Content], generation_config: GenerationConfig) -> Any:
+        # 資料は最初の発言に含める
+        first = Content(role=contents[0].role, parts=[context.handle, *contents[0].parts])
+        return self.__model.generate_content(contents=[first, *contents[1:]], generation_config=generation_config)
+
+    def delete(self, context: DocumentContext):
+        pass
+
+
+class VertexAIContextCacheBackend:
+    """VertexAIのコンテキストキャッシュに資料を載せ、質問はキャッシュを参照して行うバックエンド"""
+
+    name = "vertexai"
+
+    def __init__(self, model_name: str, ttl_seconds: int = 60 * 60) -> None:
+        self.__model_name = model_name
+        self.ttl_seconds = ttl_seconds
+
+    def create(self, document_key: str, document_part: Part) -> DocumentContext:
+        cached_content = caching.CachedContent.create(
+            model_name=self.__model_name,
+            system_instruction=SYSTEM_INSTRUCTION,
+            contents=[Content(role="user", parts=[document_part])],
+            ttl=timedelta(seconds=self.ttl_seconds),
+            display_name=document_key[:120],
+        )
+        usage_metadata = getattr(cached_content.gca_resource, "usage_metadata", None)
+        return DocumentContext(
+            document_key=document_key,
+            backend=self.name,
+            handle=cached_content.resource_name,
+            token_count=getattr(usage_metadata, "total_token_count", 0) or 0,
+            expire_time=cached_content.expire_time.timestamp(),
+        )
+
+    def generate(self, context: DocumentContext, contents: List[Content], generation_config: GenerationConfig) -> Any:
+        model = PreviewGenerativeModel.from_cached_content(cached_content=context.handle)
+        return model.generate_content(contents=contents, generation_config=generation_config)
+
+    def delete(self, context: DocumentContext):
+        try:
+            caching.CachedContent(cached_content_name=context.handle).delete()
+        except NotFound:
+            pass
+
+
+class DocumentContextStore:
+    """
+    資料のキー(doc_idと前処理の設定)ごとに、コンテキストを作成・再利用する
+    同じ資料のコンテキストはセッションをまたいで共有する。backendでの作成に失敗した場合は、fallback_backendを使う
+    リソース名で参照できるコンテキストはstate_fileに保存し、再起動後も有効期限まで再利用する
+    保持するコンテキストは最大max_contexts件で、有効期限を過ぎたものと、超えた分の最も長く使われていないものを破棄する
+    """
+
+    def __init__(
+        self,
+        backend,
+        fallback_backend=None,
+        state_file: Optional[str] = None,
+        refresh_margin_seconds: float = 5 * 60,
+        max_contexts: int = 100,
+    ) -> None:
+        self.backend = backend
+        self.fallback_backend = fallback_backend
+        self.__backends = {b.name: b for b in (backend, fallback_backend) if b is not None}
+        self.__state_file = state_file
+        self.refresh_margin_seconds = refresh_margin_seconds
+        self.max_contexts = max_contexts
+        self.__lock = threading.Lock()
+        self.__key_locks: Dict[str, threading.Lock] = {}
+        self.__contexts: "OrderedDict[str, DocumentContext]" = OrderedDict(self.__load_state())
+        self.__turns: List[ContextTurn] = []
+
+    def ask(
+        self,
+        document_key: str,
+        build_document_part: Callable[[], Part],
+        contents: List[Content],
+        generation_config: GenerationConfig,
+    ) -> Any:
+        context, built = self.__get_or_create(document_key, build_document_part)
+        start_time = time.perf_counter()
+        try:
+            response = self.__backends[context.backend].generate(context, contents, generation_config)
+        except NotFound:
+            # 有効期限前に削除されたキャッシュは、作り直して1回だけ再試行する
+            logger.warning("document context %s was not found, rebuilding", document_key)
+            self.__discard(document_key)
+            context, built = self.__get_or_create(document_key, build_document_part)
+            start_time = time.perf_counter()
+            response = self.__backends[context.backend].generate(context, contents, generation_config)
+        seconds = time.perf_counter() - start_time
+        self.__record(context, built, response, seconds)
+        return response
+
+    def __get_or_create(self, document_key: str, build_document_part: Callable[[], Part]) -> tuple:
+        with self.__lock:
+            key_lock = self.__key_locks.setdefault(document_key, threading.Lock())
+        # 同じ資料のコンテキストを、同時に複数作らないようにする
+        with key_lock:
+            with self.__lock:
+                context = self.__contexts.get(document_key)
+                if context is not None:
+                    self.__contexts.move_to_end(document_key)
+            if context is not None and context.is_valid(self.refresh_margin_seconds):
+                return context, False
+
+            start_time = time.perf_counter()
+            document_part = build_document_part()
+            try:
+                context = self.backend.create(document_key, document_part)
+            except Exception as e:
+                if self.fallback_backend is None:
+                    raise
+                logger.warning("failed to create document context with %s, using %s: %s",
+                               self.backend.name, self.fallback_backend.name, e)
+                context = self.fallback_backend.create(document_key, document_part)
+            context.build_seconds = time.perf_counter() - start_time
+            with self.__lock:
+                self.__contexts[document_key] = context
+                self.__contexts.move_to_end(document_key)
+                evicted = self.__evict()
+                self.__save_state()
+            logger.info("document context created: %s (%s, %d tokens)", document_key, context.backend, context.token_count)
+        self.__delete_contexts(evicted)
+        return context, True
+
+    def __evict(self) -> List[DocumentContext]:
+        # 有効期限を過ぎたコンテキストと、max_contextsを超えた分の最も長く使われていないコンテキストを外す（__lockを取得して呼ぶ）
+        evicted = [self.__contexts.pop(key) for key, context in list(self.__contexts.items()) if not context.is_valid()]
+        while len(self.__contexts) > self.max_contexts:
+            evicted.append(self.__contexts.popitem(last=False)[1])
+        for context in evicted:
+            key_lock = self.__key_locks.get(context.document_key)
+            if key_lock is not None and not key_lock.locked():
+                del self.__key_locks[context.document_key]
+        return evicted
+
+    def __delete_contexts(self, contexts: List[DocumentContext]):
+        # 有効期限前に外したVertexAIのキャッシュは、課金が続かないように削除する
+        for context in contexts:
+            logger.info("document context evicted: %s (%s)", context.document_key, context.backend)
+            if not context.is_valid():
+                continue
+            try:
+                self.__backends[context.backend].delete(context)
+            except Exception as e:
+                logger.warning("failed to delete document context %s: %s", context.document_key, e)
+
+    def __discard(self, document_key: str):
+        with self.__lock:
+            self.__contexts.pop(document_key, None)
+            self.__save_state()
+
+    def __load_state(self) -> Dict[str, DocumentContext]:
+        if self.__state_file is None or not os.path.exists(self.__state_file):
+            return {}
+        try:
+            with open(self.__state_file, "r") as f:
+                contexts = {key: DocumentContext(**value) for key, value in json.load(f).items()}
+        except Exception as e:
+            logger.warning("failed to load document context state: %s", e)
+            return {}
+        return {
+            key: context for key, context in contexts.items()
+            if context.backend in self.__backends and context.is_valid(self.refresh_margin_seconds)
+        }
+
+    def __save_state(self):
+        # 資料そのものを持つローカルのコンテキストは保存しない
+        if self.__state_file is None:
+            return
+        state = {key: asdict(context) for key, context in self.__contexts.items() if isinstance(context.handle, str)}
+        os.makedirs(os.path.dirname(self.__state_file), exist_ok=True)
+        tmp_path = f"{self.__state_file}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, self.__state_file)
+
+    def __record(self, context: DocumentContext, built: bool, response: Any, seconds: float):
+        usage_metadata = response.usage_metadata
+        turn = ContextTurn(
+            document_key=context.document_key,
+            backend=context.backend,
+            built=built,
+            prompt_token_count=usage_metadata.prompt_token_count,
+            cached_token_count=getattr(usage_metadata, "cached_content_token_count", 0) or 0,
+            candidates_token_count=usage_metadata.candidates_token_count,
+            seconds=seconds,
+            build_seconds=context.build_seconds if built else 0.0,
+        )
+        logger.info(
+            "document context turn: %s, %d incremental tokens, %d cached tokens, %.1fs",
+            turn.document_key, turn.incremental_token_count, turn.cached_token_count, turn.seconds,
+        )
+        with self.__lock:
+            self.__turns.append(turn)
+            del self.__turns[:-1000]
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self.__lock:
+            turns = list(self.__turns)
+            contexts = len(self.__contexts)
+        # コンテキストを作ったターンと、再利用したターンで、トークン数とレイテンシを比べる
+        built = [t for t in turns if t.built]
+        reused = [t for t in turns if not t.built]
+        prompt_tokens = sum(t.prompt_token_count for t in turns)
+        cached_tokens = sum(t.cached_token_count for t in turns)
+
+        def mean(values: List[float]) -> float:
+            return sum(values) / len(values) if values else 0.0
+
+        return {
+            "backend": self.backend.name,
+            "contexts": contexts,
+            "turns": len(turns),
+            "context_builds": len(built),
+            "prompt_tokens": prompt_tokens,
+            "cached_tokens": cached_tokens,
+            "incremental_tokens": prompt_tokens - cached_tokens,
+            "cached_token_rate": cached_tokens / prompt_tokens if prompt_tokens else 0.0,
+            "mean_build_turn_seconds": mean([t.seconds + t.build_seconds for t in built]),
+            "mean_reused_turn_seconds": mean([t.seconds for t in reused]),
+            "mean_reused_turn_incremental_tokens": mean([t.incremental_token_count for t in reused]),
+            "recent": [dict(asdict(t), incremental_token_count=t.incremental_token_count) for t in turns[-10:]],
+        }
+
+
+def create_document_context_store(
+    backend_name: str,
+    model_name: str,
+    ttl_seconds: int,
+    state_file: Optional[str] = None,
+) -> Optional[DocumentContextStore]:
+    # backend_nameは"vertexai", "local", "none"のいずれか
+    if backend_name == "none":
+        return None
+    local_backend = LocalContextBackend(
+        model=GenerativeModel(model_name=model_name, system_instruction=SYSTEM_INSTRUCTION),
+        ttl_seconds=ttl_seconds,
+    )
+    if backend_name == "local":
+        return DocumentContextStore(backend=local_backend)
+    if backend_name == "vertexai":
+        return DocumentContextStore(
+            backend=VertexAIContextCacheBackend(model_name=model_name, ttl_seconds=ttl_seconds),
+            fallback_backend=local_backend,
+            state_file=state_file,
+        )
+    raise ValueError(f"Invalid document context backend: {backend_name}")
@@ -0,0 +1,261 @@
+"""
+EDINETから有価証券報告書のPDFをまとめてダウンロードするダウンローダー
+接続を使い回して並列にダウンロードし、一時ファイルへのストリーミング書き込みとリネームで
+途中のファイルを残さない。通信が途切れた場合は、再試行でRangeリクエストを使い続きから再開する
+"""
+
+import asyncio
+import os
+import tempfile
+import time
+from copy import deepcopy
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from logging import getLogger
+from typing import Dict, Iterable, List, Optional
+
+import httpx
+
+from util.edinet_sync import RateLimiter
+
+logger = getLogger(__name__)
+
+DOCUMENT_URL = "https://api.edinet-fsa.go.jp/api/v2/documents/{doc_id}"
+
+# ダウンロードの結果
+STATUS_DOWNLOADED = "downloaded"
+STATUS_SKIPPED = "skipped"
+STATUS_FAILED = "failed"
+
+
+def is_valid_pdf(file_path: str) -> bool:
+    # 先頭のヘッダーと末尾の%%EOFで、PDFが最後まで書き込まれているかを確認する
+    try:
+        size = os.path.getsize(file_path)
+        if size < 8:
+            return False
+        with open(file_path, "rb") as f:
+            if f.read(5) != b"%PDF-":
+                return False
+            f.seek(max(0, size - 1024))
+            return b"%%EOF" in f.read()
+    except OSError:
+        return False
+
+
+@dataclass
+class DocumentDownload:
+    """1書類のダウンロードの結果"""
+    doc_id: str
+    status: str
+    file_path: Optional[str] = None
+    bytes: int = 0
+    seconds: float = 0.0
+    attempts: int = 0
+    resumed_bytes: int = 0
+    error: Optional[str] = None
+
+
+class DownloadResult:
+    def __init__(self, target_date: Optional[datetime] = None) -> None:
+        self.target_date = target_date
+        self.elapsed_seconds = 0.0
+        self.__success_document_ids = []
+        self.__error_document_ids = []
+        self.__documents: List[DocumentDownload] = []
+
+    def get_success_counts(self) -> int:
+        return len(self.__success_document_ids)
+
+    def get_error_counts(self) -> int:
+        return len(self.__error_document_ids)
+
+    def append_success_doc_id(self, doc_id: str):
+        self.__success_document_ids.append(doc_id)
+
+    def append_error_doc_id(self, doc_id: str):
+        self.__error_document_ids.append(doc_id)
+
+    def get_success_doc_ids(self) -> list:
+        return deepcopy(self.__success_document_ids)
+
+    def get_error_doc_ids(self) -> list:
+        return deepcopy(self.__error_document_ids)
+
+    def append_document(self, document: DocumentDownload):
+        # スキップした書類は、ダウンロード済みとして成功に数える
+        self.__documents.append(document)
+        if document.status == STATUS_FAILED:
+            self.append_error_doc_id(document.doc_id)
+        else:
+            self.append_success_doc_id(document.doc_id)
+
+    def get_documents(self) -> List[DocumentDownload]:
+        return deepcopy(self.__documents)
+
+    def get_skipped_doc_ids(self) -> list:
+        return [d.doc_id for d in self.__documents if d.status == STATUS_SKIPPED]
+
+    def get_total_bytes(self) -> int:
+        return sum(d.bytes for d in self.__documents if d.status == STATUS_DOWNLOADED)
+
+    def get_throughput(self) -> float:
+        # 1秒あたりのダウンロードバイト数
+        return self.get_total_bytes() / self.elapsed_seconds if self.elapsed_seconds else 0.0
+
+    def get_metrics(self) -> Dict[str, object]:
+        downloaded = [d for d in self.__documents if d.status == STATUS_DOWNLOADED]
+        seconds = sorted(d.seconds for d in downloaded)
+        return {
+            "target_date": self.target_date.strftime("%Y-%m-%d") if self.target_date else None,
+            "documents": len(self.__documents),
+            "downloaded": len(downloaded),
+            "skipped": len(self.get_skipped_doc_ids()),
+            "failed": self.get_error_counts(),
+            "total_bytes": self.get_total_bytes(),
+            "resumed_bytes": sum(d.resumed_bytes for d in downloaded),
+            "elapsed_seconds": self.elapsed_seconds,
+            "bytes_per_second": self.get_throughput(),
+            "p50_seconds": seconds[len(seconds) // 2] if seconds else 0.0,
+            "max_seconds": seconds[-1] if seconds else 0.0,
+            "per_document": [asdict(d) for d in self.__documents],
+        }
+
+
+class _RetryableError(Exception):
+    pass
+
+
+class EdinetBulkDownloader:
+    """
+    有価証券報告書のPDFを、接続を使い回してconcurrency件ずつ並列にダウンロードする
+    output_folderに検証済みのPDF({doc_id}.pdf)がある書類はダウンロードしない
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        output_folder: str,
+        concurrency: int = 4,
+        rate_limit_per_second: float = 2.0,
+        max_retries: int = 3,
+        timeout_seconds: float = 60.0,
+        chunk_size: int = 256 * 1024,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ) -> None:
+        self.__api_key = api_key
+        self.output_folder = output_folder
+        self.concurrency = concurrency
+        self.rate_limit_per_second = rate_limit_per_second
+        self.max_retries = max_retries
+        self.timeout_seconds = timeout_seconds
+        self.chunk_size = chunk_size
+        self.__transport = transport
+        os.makedirs(self.output_folder, exist_ok=True)
+
+    def get_file_path(self, doc_id: str) -> str:
+        return os.path.join(self.output_folder, f"{doc_id}.pdf")
+
+    def download(self, doc_ids: Iterable[str], target_date: Optional[datetime] = None) -> DownloadResult:
+        return asyncio.run(self.download_async(doc_ids=doc_ids, target_date=target_date))
+
+    async def download_async(self, doc_ids: Iterable[str], target_date: Optional[datetime] = None) -> DownloadResult:
+        result = DownloadResult(target_date=target_date)
+        started = time.perf_counter()
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        rate_limiter = RateLimiter(self.rate_limit_per_second)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        async with httpx.AsyncClient(limits=limits, timeout=self.timeout_seconds, transport=self.__transport) as client:
+
+            async def download_one(doc_id: str) -> DocumentDownload:
+                async with semaphore:
+                    return await self.__download_document(client, rate_limiter, doc_id)
+
+            # 同じdoc_idが複数回指定されても、1回だけダウンロードする
+            documents = await asyncio.gather(*(download_one(doc_id) for doc_id in dict.fromkeys(doc_ids)))
+        for document in documents:
+            result.append_document(document)
+        result.elapsed_seconds = time.perf_counter() - started
+        logger.info(
+            "downloaded %d documents (%d skipped, %d failed, %.1f MB/s)",
+            result.get_success_counts(), len(result.get_skipped_doc_ids()), result.get_error_counts(),
+            result.get_throughput() / 1024 / 1024,
+        )
+        return result
+
+    async def __download_document(
+        self,
+        client: httpx.AsyncClient,
+        rate_limiter: RateLimiter,
+        doc_id: str,
+    ) -> DocumentDownload:
+        file_path = self.get_file_path(doc_id)
+        if is_valid_pdf(file_path):
+            return DocumentDownload(doc_id=doc_id, status=STATUS_SKIPPED, file_path=file_path,
+                                    bytes=os.path.getsize(file_path))
+
+        document = DocumentDownload(doc_id=doc_id, status=STATUS_FAILED)
+        # 同じ書類を別のダウンローダーが同時に取得しても衝突しないように、一時ファイルは呼び出しごとに別の名前にする
+        with tempfile.NamedTemporaryFile(dir=self.output_folder, prefix=f"{doc_id}.", suffix=".part", delete=False) as f:
+            tmp_path = f.name
+        started = time.perf_counter()
+        for attempt in range(self.max_retries + 1):
+            document.attempts += 1
+            await rate_limiter.wait()
+            try:
+                await self.__stream_to_file(client, doc_id, tmp_path, document)
+            except _RetryableError as e:
+                document.error = str(e)
+            except httpx.TransportError as e:
+                # 書き込み済みの部分は残し、次の試行で続きから取得する
+                document.error = f"request failed: {e!r}"
+            except Exception as e:
+                document.error = str(e)
+                break
+            else:
+                if not is_valid_pdf(tmp_path):
+                    os.remove(tmp_path)
+                    document.error = "downloaded file is not a complete pdf"
+                    break
+                os.replace(tmp_path, file_path)
+                document.status = STATUS_DOWNLOADED
+                document.file_path = file_path
+                document.bytes = os.path.getsize(file_path)
+                document.error = None
+                break
+            if attempt < self.max_retries:
+                await asyncio.sleep(2 ** attempt)
+        document.seconds = time.perf_counter() - started
+        if document.status == STATUS_FAILED:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            logger.error("failed to download %s: %s", doc_id, document.error)
+        return document
+
+    async def __stream_to_file(self, client: httpx.AsyncClient, doc_id: str, tmp_path: str, document: DocumentDownload):
+        params = {"type": 2, "Subscription-Key": self.__api_key}  # PDFを取得する場合は2を指定
+        offset = os.path.getsize(tmp_path) if os.path.exists(tmp_path) else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        async with client.stream("GET", DOCUMENT_URL.format(doc_id=doc_id), params=params, headers=headers) as res:
+            if res.status_code == 416:
+                # 途中のファイルが使えないため、最初から取得し直す
+                os.remove(tmp_path)
+                raise _RetryableError(f"range of {doc_id} is not satisfiable")
+            if res.status_code == 429 or res.status_code >= 500:
+                raise _RetryableError(f"http status code is {res.status_code}")
+            if res.status_code not in (200, 206):
+                raise Exception(f"fail to download {doc_id} document. status code is {res.status_code}")
+            # 書類がない場合なども200でJSONが返るため、Content-Typeを確認する
+            content_type = res.headers.get("content-type", "")
+            if "json" in content_type:
+                raise Exception(f"fail to download {doc_id} document. {(await res.aread()).decode(errors='replace')}")
+
+            if res.status_code == 206:
+                document.resumed_bytes += offset
+                mode = "ab"
+            else:
+                # Rangeに対応していない場合は、最初から書き直す
+                mode = "wb"
+            with open(tmp_path, mode) as f:
+                async for chunk in res.aiter_bytes(self.chunk_size):
+                    f.write(chunk)
@@ -0,0 +1,329 @@
+"""
+EDINETの書類一覧を非同期で取得し、提出日ごとのParquetに保存する同期パイプライン
+前回の同期が完了した日(high water mark)以降のみを取得するため、数年分のバックフィルの後は差分だけを取り込める
+
+使い方:
+  python -m util.edinet_sync --output-folder output/edinet --start-date 2020-01-01
+"""
+
+import asyncio
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from logging import getLogger
+from typing import Callable, Dict, List, Optional
+
+import httpx
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+logger = getLogger(__name__)
+
+DOCUMENTS_URL = "https://disclosure.edinet-fsa.go.jp/api/v2/documents.json"
+STATE_FILE_NAME = "_sync_state.json"
+
+# documents.jsonのresultsの列と型（フラグ類はBigQueryのテーブルに合わせて文字列のまま保存する）
+DOCUMENT_SCHEMA = pa.schema([
+    ("seqNumber", pa.int32()),
+    ("docID", pa.string()),
+    ("edinetCode", pa.string()),
+    ("secCode", pa.string()),
+    ("JCN", pa.string()),
+    ("filerName", pa.string()),
+    ("fundCode", pa.string()),
+    ("ordinanceCode", pa.string()),
+    ("formCode", pa.string()),
+    ("docTypeCode", pa.string()),
+    ("periodStart", pa.date32()),
+    ("periodEnd", pa.date32()),
+    ("submitDateTime", pa.timestamp("s")),
+    ("docDescription", pa.string()),
+    ("issuerEdinetCode", pa.string()),
+    ("subjectEdinetCode", pa.string()),
+    ("subsidiaryEdinetCode", pa.string()),
+    ("currentReportReason", pa.string()),
+    ("parentDocID", pa.string()),
+    ("opeDateTime", pa.timestamp("s")),
+    ("withdrawalStatus", pa.string()),
+    ("docInfoEditStatus", pa.string()),
+    ("disclosureStatus", pa.string()),
+    ("xbrlFlag", pa.string()),
+    ("pdfFlag", pa.string()),
+    ("attachDocFlag", pa.string()),
+    ("englishDocFlag", pa.string()),
+    ("csvFlag", pa.string()),
+    ("legalStatus", pa.string()),
+])
+
+
+@dataclass
+class SyncResult:
+    """同期の結果とメトリクス"""
+    start_date: date
+    end_date: date
+    success_dates: List[date] = field(default_factory=list)
+    error_dates: List[date] = field(default_factory=list)
+    document_count: int = 0
+    request_count: int = 0
+    retry_count: int = 0
+    response_bytes: int = 0
+    elapsed_seconds: float = 0.0
+    high_water_mark: Optional[date] = None
+
+    def get_metrics(self) -> Dict[str, object]:
+        return {
+            "start_date": self.start_date.isoformat(),
+            "end_date": self.end_date.isoformat(),
+            "success_dates": len(self.success_dates),
+            "error_dates": len(self.error_dates),
+            "documents": self.document_count,
+            "requests": self.request_count,
+            "retries": self.retry_count,
+            "response_bytes": self.response_bytes,
+            "elapsed_seconds": self.elapsed_seconds,
+            "dates_per_second": len(self.success_dates) / self.elapsed_seconds if self.elapsed_seconds else 0.0,
+            "high_water_mark": self.high_water_mark.isoformat() if self.high_water_mark else None,
+        }
+
+
+class RateLimiter:
+    """リクエストの間隔を1/rate_per_second秒以上あける"""
+
+    def __init__(self, rate_per_second: float) -> None:
+        self.__interval = 1.0 / rate_per_second if rate_per_second > 0 else 0.0
+        self.__next_time = 0.0
+        self.__lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self.__lock:
+            now = time.monotonic()
+            wait_seconds = self.__next_time - now
+            self.__next_time = max(now, self.__next_time) + self.__interval
+        if wait_seconds > 0:
+            await asyncio.sleep(wait_seconds)
+
+
+def _to_date(value: Optional[str]) -> Optional[date]:
+    return datetime.strptime(value, "%Y-%m-%d").date() if value else None
+
+
+def _to_datetime(value: Optional[str]) -> Optional[datetime]:
+    return datetime.strptime(value, "%Y-%m-%d %H:%M") if value else None
+
+
+def documents_to_table(documents: List[dict]) -> pa.Table:
+    # APIの文字列を、スキーマの型に変換する
+    columns: Dict[str, list] = {name: [] for name in DOCUMENT_SCHEMA.names}
+    for document in documents:
+        for name in DOCUMENT_SCHEMA.names:
+            value = document.get(name)
+            if name in ("periodStart", "periodEnd"):
+                value = _to_date(value)
+            elif name in ("submitDateTime", "opeDateTime"):
+                value = _to_datetime(value)
+            elif name == "seqNumber":
+                value = int(value) if value is not None else None
+            elif value is not None:
+                value = str(value)
+            columns[name].append(value)
+    return pa.table(columns, schema=DOCUMENT_SCHEMA)
+
+
+class EdinetSyncPipeline:
+    """
+    EDINETの書類一覧を、日付ごとに並列で取得してParquetに保存する
+    出力はoutput_folder/submit_date=YYYY-MM-DD/documents.parquetで、同じ日を再取得した場合は上書きする
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        output_folder: str,
+        concurrency: int = 4,
+        rate_limit_per_second: float = 2.0,
+        max_retries: int = 3,
+        timeout_seconds: float = 30.0,
+        overlap_days: int = 1,
+        progress_callback: Optional[Callable[[int, int, SyncResult], None]] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ) -> None:
+        self.__api_key = api_key
+        self.output_folder = output_folder
+        self.concurrency = concurrency
+        self.rate_limit_per_second = rate_limit_per_second
+        self.max_retries = max_retries
+        self.timeout_seconds = timeout_seconds
+        # 書類の訂正や取下げを反映するため、high water markの数日前から取得し直す
+        self.overlap_days = overlap_days
+        self.progress_callback = progress_callback or self.__log_progress
+        self.__transport = transport
+        os.makedirs(self.output_folder, exist_ok=True)
+
+    # high water mark
+
+    def __state_path(self) -> str:
+        return os.path.join(self.output_folder, STATE_FILE_NAME)
+
+    def get_high_water_mark(self) -> Optional[date]:
+        try:
+            with open(self.__state_path(), "r") as f:
+                return _to_date(json.load(f).get("high_water_mark"))
+        except FileNotFoundError:
+            return None
+
+    def __save_high_water_mark(self, high_water_mark: date):
+        tmp_path = f"{self.__state_path()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"high_water_mark": high_water_mark.isoformat(), "updated_at": datetime.now().isoformat()}, f)
+        os.replace(tmp_path, self.__state_path())
+
+    # 同期
+
+    def sync(self, start_date: Optional[date] = None, end_date: Optional[date] = None) -> SyncResult:
+        return asyncio.run(self.sync_async(start_date=start_date, end_date=end_date))
+
+    async def sync_async(self, start_date: Optional[date] = None, end_date: Optional[date] = None) -> SyncResult:
+        # start_dateを指定しない場合は、high water markから差分を取得する
+        end_date = end_date or date.today()
+        high_water_mark = self.get_high_water_mark()
+        if start_date is None:
+            if high_water_mark is None:
+                raise ValueError("start_date is required for the first sync")
+            start_date = high_water_mark - timedelta(days=self.overlap_days - 1)
+
+        dates = [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+        result = SyncResult(start_date=start_date, end_date=end_date, high_water_mark=high_water_mark)
+        started = time.perf_counter()
+        logger.info("syncing edinet documents from %s to %s (%d dates)", start_date, end_date, len(dates))
+
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        rate_limiter = RateLimiter(self.rate_limit_per_second)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        async with httpx.AsyncClient(limits=limits, timeout=self.timeout_seconds, transport=self.__transport) as client:
+
+            async def sync_date(target_date: date):
+                async with semaphore:
+                    try:
+                        documents = await self.__fetch_documents(client, rate_limiter, target_date, result)
+                        await asyncio.to_thread(self.__write_partition, target_date, documents)
+                        result.success_dates.append(target_date)
+                        result.document_count += len(documents)
+                    except Exception as e:
+                        logger.error("failed to sync edinet documents of %s: %s", target_date, e)
+                        result.error_dates.append(target_date)
+                    result.elapsed_seconds = time.perf_counter() - started
+                    self.progress_callback(len(result.success_dates) + len(result.error_dates), len(dates), result)
+
+            await asyncio.gather(*(sync_date(d) for d in dates))
+
+        # 失敗した日より前までを同期済みとする（次回は失敗した日から取得し直す）
+        # high water markとの間に同期していない日がある場合は進めない
+        if high_water_mark is None or start_date <= high_water_mark + timedelta(days=1):
+            succeeded = set(result.success_dates)
+            for target_date in dates:
+                if target_date not in succeeded:
+                    break
+                result.high_water_mark = max(result.high_water_mark or target_date, target_date)
+        if result.high_water_mark is not None and result.high_water_mark != high_water_mark:
+            self.__save_high_water_mark(result.high_water_mark)
+        result.success_dates.sort()
+        result.error_dates.sort()
+        result.elapsed_seconds = time.perf_counter() - started
+        logger.info("synced edinet documents: %s", result.get_metrics())
+        return result
+
+    async def __fetch_documents(
+        self,
+        client: httpx.AsyncClient,
+        rate_limiter: RateLimiter,
+        target_date: date,
+        result: SyncResult,
+    ) -> List[dict]:
+        params = {
+            "date": target_date.strftime("%Y-%m-%d"),
+            "type": 2,  # 2は有価証券報告書などの決算書類
+            "Subscription-Key": self.__api_key,
+        }
+        for attempt in range(self.max_retries + 1):
+            await rate_limiter.wait()
+            result.request_count += 1
+            try:
+                response = await client.get(DOCUMENTS_URL, params=params)
+            except httpx.TransportError as e:
+                error = f"request failed: {e!r}"
+            else:
+                result.response_bytes += len(response.content)
+                # 429と5xxは時間をおいて再試行する
+                if response.status_code == 429 or response.status_code >= 500:
+                    error = f"http status code is {response.status_code}"
+                elif response.status_code != 200:
+                    raise Exception(f"failed to get document list! http status code is {response.status_code}")
+                else:
+                    json_data = response.json()
+                    status_code = int(json_data["metadata"]["status"])
+                    if status_code != 200:
+                        raise Exception(f"failed to get document list! status code is {status_code}")
+                    return json_data.get("results") or []
+            if attempt < self.max_retries:
+                result.retry_count += 1
+                await asyncio.sleep(2 ** attempt)
+        raise Exception(f"failed to get document list! {error}")
+
+    def __write_partition(self, target_date: date, documents: List[dict]):
+        folder = os.path.join(self.output_folder, f"submit_date={target_date.isoformat()}")
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, "documents.parquet")
+        tmp_path = f"{path}.tmp"
+        pq.write_table(documents_to_table(documents), tmp_path, compression="zstd")
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def __log_progress(done: int, total: int, result: SyncResult):
+        if done == total or done % 30 == 0:
+            logger.info(
+                "synced %d/%d dates (%d errors, %d documents, %.1fs)",
+                done, total, len(result.error_dates), result.document_count, result.elapsed_seconds,
+            )
+
+
+def read_documents(output_folder: str, start_date: Optional[date] = None, end_date: Optional[date] = None) -> pa.Table:
+    # 同期済みのParquetを、提出日で絞り込んで読み込む（読まないパーティションは開かない）
+    filters = []
+    if start_date is not None:
+        filters.append(("submit_date", ">=", start_date.isoformat()))
+    if end_date is not None:
+        filters.append(("submit_date", "<=", end_date.isoformat()))
+    return pq.read_table(output_folder, partitioning="hive", filters=filters or None)
+
+
+if __name__ == "__main__":
+    import logging
+
+    import click
+    from dotenv import load_dotenv
+
+    @click.command()
+    @click.option("--output-folder", "output_folder", required=True)
+    @click.option("--start-date", "start_date", default=None, help="YYYY-MM-DD. Required for the first sync.")
+    @click.option("--end-date", "end_date", default=None, help="YYYY-MM-DD. Defaults to today.")
+    @click.option("--concurrency", "concurrency", default=4)
+    @click.option("--rate-limit", "rate_limit", default=2.0, help="Requests per second to the EDINET API.")
+    def main(output_folder, start_date, end_date, concurrency, rate_limit):
+        """Sync the EDINET document list into Parquet files partitioned by submit date."""
+        load_dotenv()
+        logging.basicConfig(level=logging.INFO)
+        # URLにAPIキーが含まれるため、リクエストごとのログは出さない
+        logging.getLogger("httpx").setLevel(logging.WARNING)
+        pipeline = EdinetSyncPipeline(
+            api_key=os.environ["EDINET_API_KEY"],
+            output_folder=output_folder,
+            concurrency=concurrency,
+            rate_limit_per_second=rate_limit,
+        )
+        result = pipeline.sync(start_date=_to_date(start_date), end_date=_to_date(end_date))
+        print(json.dumps(result.get_metrics(), ensure_ascii=False, indent=2))
+        exit(1 if result.error_dates else 0)
+
+    main()
@@ -5,37 +5,18 @@ https://disclosure2dl.edinet-fsa.go.jp/guide/static/disclosure/WZEK0110.html
 """
 
 import os
-import sys
+import tempfile
+import threading
 from copy import deepcopy
 from datetime import datetime, timedelta
+from logging import getLogger
 
 import pandas as pd
 import requests
 
+from util.edinet_downloader import DownloadResult, EdinetBulkDownloader, is_valid_pdf
 
-class DownloadResult:
-    def __init__(self, target_date: datetime) -> None:
-        self.target_date = target_date
-        self.__success_document_ids = []
-        self.__error_document_ids = []
-
-    def get_success_counts(self) -> int:
-        return len(self.__success_document_ids)
-
-    def get_error_counts(self) -> int:
-        return len(self.__error_document_ids)
-
-    def append_success_doc_id(self, doc_id: str):
-        self.__success_document_ids.append(doc_id)
-
-    def append_error_doc_id(self, doc_id: str):
-        self.__error_document_ids.append(doc_id)
-
-    def get_success_doc_ids(self) -> list:
-        return deepcopy(self.__success_document_ids)
-
-    def get_error_doc_ids(self) -> list:
-        return deepcopy(self.__error_document_ids)
+logger = getLogger(__name__)
 
 
 class GetDocumentListResult:
@@ -79,6 +60,15 @@ class EdinetWrapper:
             else output_folder
         )
         os.makedirs(self.__output_folder, exist_ok=True)
+        # 接続を使い回すため、スレッドごとにセッションを持つ（requests.Sessionはスレッドセーフではない）
+        self.__local = threading.local()
+
+    def __get_session(self) -> requests.Session:
+        session = getattr(self.__local, "session", None)
+        if session is None:
+            session = requests.Session()
+            self.__local.session = session
+        return session
 
     def get_documents_info_dataframe(self, target_date: datetime) -> pd.DataFrame:
         url = "https://disclosure.edinet-fsa.go.jp/api/v2/documents.json"
@@ -87,7 +77,7 @@ class EdinetWrapper:
             "type": 2,  # 2は有価証券報告書などの決算書類
             "Subscription-Key": self.__api_key,
         }
-        response = requests.get(url, params=params)
+        response = self.__get_session().get(url, params=params)
         if response.status_code != 200:
             raise Exception(f"failed to get document list! http status code is {response.status_code}")
 
@@ -101,51 +91,56 @@ class EdinetWrapper:
         return df
 
     def download_pdf_of_financial_report(self, doc_id: str) -> str:
+        # ダウンロード済みで、最後まで書き込まれているPDFがあればそれを使う
+        output_path = os.path.join(self.__output_folder, f"{doc_id}.pdf")
+        if is_valid_pdf(output_path):
+            return output_path
+
         url = EdinetUtil.get_document_url_from_doc_id(doc_id=doc_id)
         params = {"type": 2, "Subscription-Key": self.__api_key}  # PDFを取得する場合は2を指定
-
-        try:
-            res = requests.get(url, params=params, verify=False)
-            output_path = os.path.join(self.__output_folder, f"{doc_id}.pdf")
-            if res.status_code != 200:
+        with self.__get_session().get(url, params=params, stream=True, timeout=60) as res:
+            if res.status_code != 200 or "json" in res.headers.get("content-type", ""):
                 raise Exception(f"fail to download {doc_id} document. status code is {res.status_code}")
 
-            with open(output_path, "wb") as file_out:
-                file_out.write(res.content)
-                return output_path
-        except urllib.error.HTTPError as e:
-            if e.code >= 400:
-                sys.stderr.write(e.reason + "\n")
-            else:
-                raise e
-
-    def download_pdfs_of_financial_report_target_date(self, target_date: datetime) -> DownloadResult:
+            # メモリに載せずに一時ファイルへ書き込み、書き終わってからリネームする
+            # 同じ書類を同時にダウンロードしても衝突しないように、一時ファイルは呼び出しごとに別の名前にする
+            with tempfile.NamedTemporaryFile(
+                dir=self.__output_folder, prefix=f"{doc_id}.", suffix=".part", delete=False
+            ) as file_out:
+                tmp_path = file_out.name
+                try:
+                    for chunk in res.iter_content(chunk_size=256 * 1024):
+                        file_out.write(chunk)
+                except BaseException:
+                    os.remove(tmp_path)
+                    raise
+        if not is_valid_pdf(tmp_path):
+            os.remove(tmp_path)
+            raise Exception(f"fail to download {doc_id} document. the file is not a complete pdf")
+        os.replace(tmp_path, output_path)
+        return output_path
+
+    def download_pdfs_of_financial_report_target_date(
+        self,
+        target_date: datetime,
+        concurrency: int = 4,
+    ) -> DownloadResult:
         # EDINETから指定した日付の有価証券報告書のリストを取得する
         df = self.get_documents_info_dataframe(target_date=target_date)
 
-        # 有価証券報告書を指定したフォルダにダウンロードする
-        res = DownloadResult(target_date=target_date)
-        for _, doc in df.iterrows():
-            print(
-                doc["edinetCode"],
-                doc["docID"],
-                doc["filerName"],
-                doc["docDescription"],
-                doc["submitDateTime"],
-                sep="\t",
-            )
-            doc_id = doc["docID"]
-
-            try:
-                self.download_pdf_of_financial_report(doc_id=doc_id)
-                res.append_success_doc_id(doc_id=doc_id)
-            except Exception as e:
-                print(e)
-                res.append_error_doc_id(doc_id=doc_id)
-
-        return res
+        # 有価証券報告書を指定したフォルダに並列でダウンロードする
+        downloader = EdinetBulkDownloader(
+            api_key=self.__api_key,
+            output_folder=self.__output_folder,
+            concurrency=concurrency,
+        )
+        if "pdfFlag" in df:
+            df = df[df["pdfFlag"] == "1"]
+        doc_ids = list(df["docID"]) if "docID" in df else []
+        return downloader.download(doc_ids=doc_ids, target_date=target_date)
 
     def get_documents_list(self, duration_days: int) -> GetDocumentListResult:
+        # 数日分の取得用。数年分のバックフィルや定期的な同期にはutil/edinet_sync.pyを使う
         current_date = datetime.now()
         dfs = []
         res = GetDocumentListResult(current_date=current_date)
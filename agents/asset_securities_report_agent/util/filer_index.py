@@ -0,0 +1,242 @@
+"""
+EDINETの提出者名のインメモリ全文インデックス
+edinet_document_metadataのスナップショットから、有価証券報告書のある提出者をn-gramで索引し、
+企業名の解決をBigQueryを呼ばずにプロセス内で行う
+"""
+
+import re
+import threading
+import unicodedata
+from dataclasses import dataclass, field
+from logging import getLogger
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+logger = getLogger(__name__)
+
+# 法人格の表記は検索に影響しないため取り除く
+_COMPANY_TYPES = re.compile(r"株式会社|有限会社|合同会社|\(株\)|\(有\)|\(同\)")
+_IGNORED_CHARS = re.compile(r"[\s、。，．,.!！?？「」『』\"'・]")
+# 旧字体・異体字を常用漢字に寄せる（提出者名によく出るもののみ）
+_KANJI_VARIANTS = str.maketrans({
+    "髙": "高",
+    "﨑": "崎",
+    "嵜": "崎",
+    "德": "徳",
+    "濱": "浜",
+    "濵": "浜",
+    "邊": "辺",
+    "邉": "辺",
+    "齋": "斎",
+    "齊": "斉",
+    "澤": "沢",
+    "櫻": "桜",
+    "國": "国",
+    "廣": "広",
+    "實": "実",
+    "藝": "芸",
+    "會": "会",
+    "鐵": "鉄",
+    "眞": "真",
+    "冨": "富",
+    "ヶ": "ケ",
+    "ヵ": "カ",
+})
+# カタカナはひらがなに寄せて、表記ゆれを吸収する
+_KATAKANA_TO_HIRAGANA = {code: code - 0x60 for code in range(ord("ァ"), ord("ヶ") + 1)}
+_KATAKANA_TO_HIRAGANA.pop(ord("ヶ"))
+
+# インデックスするn-gramの長さ
+_GRAM_SIZES = (2, 3)
+
+
+def normalize_company_name(name: str) -> str:
+    # 全角/半角、大文字/小文字、カタカナ/ひらがな、旧字体、法人格の違いを吸収する
+    text = unicodedata.normalize("NFKC", name).lower()
+    text = _COMPANY_TYPES.sub("", text)
+    text = _IGNORED_CHARS.sub("", text)
+    text = text.translate(_KANJI_VARIANTS)
+    return text.translate(_KATAKANA_TO_HIRAGANA)
+
+
+def to_grams(text: str, size: int) -> Set[str]:
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+@dataclass
+class FilerDocument:
+    doc_id: str
+    filer_name: str
+    doc_description: str
+    submit_datetime: str
+
+
+@dataclass
+class _Filer:
+    name: str
+    # 提出日時の新しい順
+    documents: List[FilerDocument] = field(default_factory=list)
+
+
+class FilerIndex:
+    """
+    提出者名のn-gramインデックス
+    fetch_rowsはsubmitDateTimeがsince以降の行(docID, filerName, docDescription, submitDateTime)を
+    返す関数で、sinceがNoneの場合はスナップショット全体を返す。refreshで差分だけを取り込む。
+    """
+
+    def __init__(self, fetch_rows: Callable[[Optional[str]], Iterable[dict]], min_score: float = 0.5) -> None:
+        self.__fetch_rows = fetch_rows
+        self.min_score = min_score
+        self.__lock = threading.Lock()
+        self.__refresh_lock = threading.Lock()
+        self.__documents: Dict[str, FilerDocument] = {}
+        # 正規化した提出者名 -> 提出者
+        self.__filers: Dict[str, _Filer] = {}
+        # n-gram -> 正規化した提出者名
+        self.__grams: Dict[str, Set[str]] = {}
+        self.__high_water_mark: Optional[str] = None
+        self.__loaded = False
+        self.__refresh_thread: Optional[threading.Thread] = None
+        self.__stop = threading.Event()
+
+    @property
+    def high_water_mark(self) -> Optional[str]:
+        return self.__high_water_mark
+
+    def ensure_loaded(self):
+        if self.__loaded:
+            return
+        with self.__refresh_lock:
+            # バックグラウンドの初回の読み込みが終わっていれば、何もしない
+            if not self.__loaded:
+                self.__refresh()
+
+    def refresh(self) -> int:
+        with self.__refresh_lock:
+            return self.__refresh()
+
+    def __refresh(self) -> int:
+        # 最後に取り込んだ提出日時以降の行のみを取得して、インデックスに追加する
+        # （最後の提出日時ちょうどの行は再び返るが、取り込み済みのdoc_idはadd_rowsで読み飛ばす）
+        rows = list(self.__fetch_rows(self.__high_water_mark))
+        added = self.add_rows(rows)
+        self.__loaded = True
+        logger.info("filer index refreshed: %d documents added, high water mark %s", added, self.__high_water_mark)
+        return added
+
+    def add_rows(self, rows: Iterable[dict]) -> int:
+        added = 0
+        changed: Set[str] = set()
+        with self.__lock:
+            for row in rows:
+                doc_id = row["docID"]
+                filer_name = row["filerName"]
+                if not doc_id or not filer_name or doc_id in self.__documents:
+                    continue
+                document = FilerDocument(
+                    doc_id=doc_id,
+                    filer_name=filer_name,
+                    doc_description=row["docDescription"] or "",
+                    submit_datetime=str(row["submitDateTime"] or ""),
+                )
+                self.__documents[doc_id] = document
+                key = normalize_company_name(filer_name)
+                if not key:
+                    continue
+                if key not in self.__filers:
+                    self.__filers[key] = _Filer(name=filer_name)
+                    for size in _GRAM_SIZES:
+                        for gram in to_grams(key, size):
+                            self.__grams.setdefault(gram, set()).add(key)
+                self.__filers[key].documents.append(document)
+                changed.add(key)
+                if self.__high_water_mark is None or document.submit_datetime > self.__high_water_mark:
+                    self.__high_water_mark = document.submit_datetime
+                added += 1
+            for key in changed:
+                filer = self.__filers[key]
+                filer.documents.sort(key=lambda d: d.submit_datetime, reverse=True)
+                # 提出者名は最新の書類の表記にそろえる
+                filer.name = filer.documents[0].filer_name
+        return added
+
+    def get_filer_name(self, company_name: str) -> Optional[str]:
+        """企業名が提出者名と一致する(正規化して同じになる)場合のみ、その提出者名を返す"""
+        self.ensure_loaded()
+        key = normalize_company_name(company_name)
+        with self.__lock:
+            filer = self.__filers.get(key)
+            return filer.name if filer is not None else None
+
+    def search(self, company_name: str, limit: int = 10) -> List[FilerDocument]:
+        """企業名に一致する提出者の書類を、一致度の高い提出者の最新の書類から順に返す"""
+        self.ensure_loaded()
+        query = normalize_company_name(company_name)
+        if not query:
+            return []
+        with self.__lock:
+            scores = self.__score_filers(query)
+            ranked = sorted(
+                scores.items(),
+                key=lambda item: (item[1], self.__filers[item[0]].documents[0].submit_datetime),
+                reverse=True,
+            )
+            documents: List[FilerDocument] = []
+            for key, _ in ranked:
+                documents.extend(self.__filers[key].documents[:limit - len(documents)])
+                if len(documents) >= limit:
+                    break
+            return documents
+
+    def __score_filers(self, query: str) -> Dict[str, float]:
+        scores: Dict[str, float] = {}
+        if query in self.__filers:
+            # 完全一致は最優先
+            scores[query] = 3.0
+        size = 3 if len(query) >= 3 else 2
+        grams = to_grams(query, size)
+        if not grams:
+            # 1文字の検索は提出者名の部分一致で探す
+            for key in self.__filers:
+                if query in key:
+                    scores.setdefault(key, 1.0 + 1 / len(key))
+            return scores
+
+        counts: Dict[str, int] = {}
+        for gram in grams:
+            for key in self.__grams.get(gram, ()):
+                counts[key] = counts.get(key, 0) + 1
+        for key, count in counts.items():
+            if key in scores:
+                continue
+            score = count / len(grams)
+            if score < self.min_score:
+                continue
+            if query in key:
+                # 部分一致は、提出者名が短い(余計な語が少ない)ほど上位にする
+                score += 1.0 + len(query) / len(key)
+            scores[key] = score
+        return scores
+
+    def start_auto_refresh(self, interval_seconds: float):
+        # 初回の読み込みと、その後の定期的な差分の取り込みをバックグラウンドで行う
+        if self.__refresh_thread is not None:
+            return
+
+        def run():
+            while True:
+                try:
+                    self.refresh()
+                except Exception as e:
+                    logger.error("failed to refresh filer index: %s", e)
+                if self.__stop.wait(interval_seconds):
+                    return
+
+        self.__refresh_thread = threading.Thread(target=run, name="filer-index-refresh", daemon=True)
+        self.__refresh_thread.start()
+
+    def stop_auto_refresh(self):
+        self.__stop.set()
+
+    def __len__(self) -> int:
+        return len(self.__filers)
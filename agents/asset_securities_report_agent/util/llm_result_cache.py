@@ -0,0 +1,209 @@
+"""
+LLMの解析結果を永続化するキャッシュ
+temperature=0で同じ資料・同じプロンプトを解析する場合は結果が決定的になるため、
+モデル名・プロンプト・資料・生成設定が一致すれば、前回の解析結果を再利用する
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from logging import getLogger
+from typing import Any, Dict, Optional
+
+from google.api_core.exceptions import NotFound
+from google.cloud import storage
+
+logger = getLogger(__name__)
+
+
+class LocalDiskCacheBackend:
+    """ローカルディスクにエントリを1ファイルずつ保存するバックエンド"""
+
+    def __init__(self, folder: str) -> None:
+        self.__folder = folder
+        os.makedirs(self.__folder, exist_ok=True)
+
+    def __path(self, key: str) -> str:
+        # 1フォルダのファイル数が増えすぎないように、キーの先頭2文字で分ける
+        return os.path.join(self.__folder, key[:2], f"{key}.json")
+
+    def get(self, key: str) -> Optional[str]:
+        try:
+            with open(self.__path(key), "r") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: str, value: str):
+        path = self.__path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 書き込み途中のファイルを読まないように、一時ファイルから置き換える
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(value)
+        os.replace(tmp_path, path)
+
+    def delete(self, key: str):
+        try:
+            os.remove(self.__path(key))
+        except FileNotFoundError:
+            pass
+
+
+class GCSCacheBackend:
+    """GCS(またはGCS互換のストレージ)にエントリを保存するバックエンド"""
+
+    def __init__(self, project_id: str, bucket_name: str, base_folder: str = "llm_cache") -> None:
+        self.__bucket = storage.Client(project=project_id).bucket(bucket_name)
+        self.__base_folder = base_folder
+
+    def __blob(self, key: str) -> storage.Blob:
+        return self.__bucket.blob(f"{self.__base_folder}/{key}.json")
+
+    def get(self, key: str) -> Optional[str]:
+        try:
+            return self.__blob(key).download_as_text()
+        except NotFound:
+            return None
+
+    def put(self, key: str, value: str):
+        self.__blob(key).upload_from_string(value, content_type="application/json")
+
+    def delete(self, key: str):
+        try:
+            self.__blob(key).delete()
+        except NotFound:
+            pass
+
+
+class LLMResultCache:
+    """
+    LLMの解析結果のキャッシュ
+    キーはモデル名、プロンプトのハッシュ、資料のキー(doc_idまたは内容のハッシュ)、生成設定、
+    キャッシュのバージョンから作成する。プロンプトやバージョンが変わればキーも変わるため、
+    古いエントリは参照されなくなる。ttl_secondsを過ぎたエントリは削除してミスとして扱う。
+    """
+
+    def __init__(self, backend, ttl_seconds: Optional[int] = None, version: str = "1") -> None:
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.version = version
+        self.__lock = threading.Lock()
+        self.__counts = {"hits": 0, "misses": 0, "expired": 0, "errors": 0, "corrupted": 0, "stores": 0}
+
+    @staticmethod
+    def hash_text(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def hash_file(file_path: str) -> str:
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def make_key(
+        self,
+        model_name: str,
+        prompt: str,
+        document_key: str,
+        generation_config: Dict[str, Any],
+    ) -> str:
+        key_data = {
+            "version": self.version,
+            "model_name": model_name,
+            "prompt_hash": self.hash_text(prompt),
+            "document_key": document_key,
+            "generation_config": generation_config,
+        }
+        return self.hash_text(json.dumps(key_data, sort_keys=True, ensure_ascii=False))
+
+    def get(self, key: str) -> Optional[str]:
+        # キャッシュの障害で解析自体が失敗しないように、エラーはミスとして扱う
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            logger.warning("failed to read llm result cache: %s", e)
+            self.__count("errors")
+            return None
+        if value is None:
+            self.__count("misses")
+            return None
+
+        try:
+            entry = json.loads(value)
+            created_at = entry["created_at"]
+            response = entry["response"]
+        except (ValueError, TypeError, KeyError) as e:
+            # 書き込み途中や形式の変わったエントリは削除して、ミスとして扱う
+            logger.warning("dropping corrupted llm result cache entry %s: %s", key, e)
+            self.__count("corrupted")
+            self.__delete(key)
+            return None
+        if self.ttl_seconds is not None and time.time() - created_at > self.ttl_seconds:
+            self.__count("expired")
+            self.__delete(key)
+            return None
+        self.__count("hits")
+        return response
+
+    def put(self, key: str, response: str, meta: Optional[Dict[str, Any]] = None):
+        entry = {
+            "created_at": time.time(),
+            "version": self.version,
+            "response": response,
+            "meta": meta or {},
+        }
+        try:
+            self.backend.put(key, json.dumps(entry, ensure_ascii=False))
+            self.__count("stores")
+        except Exception as e:
+            logger.warning("failed to write llm result cache: %s", e)
+            self.__count("errors")
+
+    def __delete(self, key: str):
+        try:
+            self.backend.delete(key)
+        except Exception as e:
+            logger.warning("failed to delete llm result cache: %s", e)
+
+    def __count(self, name: str):
+        with self.__lock:
+            self.__counts[name] += 1
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self.__lock:
+            counts = dict(self.__counts)
+        # 期限切れ、読み込みエラー、壊れたエントリもミスとして数える
+        lookups = counts["hits"] + counts["misses"] + counts["expired"] + counts["errors"] + counts["corrupted"]
+        return {
+            "backend": type(self.backend).__name__,
+            "version": self.version,
+            "ttl_seconds": self.ttl_seconds,
+            **counts,
+            "hit_rate": counts["hits"] / lookups if lookups else 0.0,
+        }
+
+
+def create_llm_result_cache(
+    backend_name: str,
+    ttl_seconds: Optional[int],
+    version: str,
+    local_folder: str,
+    project_id: Optional[str] = None,
+    bucket_name: Optional[str] = None,
+    base_folder: str = "llm_cache",
+) -> Optional[LLMResultCache]:
+    # backend_nameは"local", "gcs", "none"のいずれか
+    if backend_name == "none":
+        return None
+    if backend_name == "local":
+        backend = LocalDiskCacheBackend(folder=local_folder)
+    elif backend_name == "gcs":
+        backend = GCSCacheBackend(project_id=project_id, bucket_name=bucket_name, base_folder=base_folder)
+    else:
+        raise ValueError(f"Invalid llm cache backend: {backend_name}")
+    return LLMResultCache(backend=backend, ttl_seconds=ttl_seconds, version=version)
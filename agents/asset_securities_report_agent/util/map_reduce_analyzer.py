@@ -0,0 +1,333 @@
+"""
+有価証券報告書のmap-reduce型の分析
+分析のプロンプトを観点ごとに分割し、観点ごとの分析(map)を並列に実行してから、
+最後に各観点の結果を元にした総括(reduce)を行う。観点ごとに再試行し、失敗した観点があっても残りの結果を返す
+"""
+
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from logging import getLogger
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = getLogger(__name__)
+
+# 観点の見出しの例: 1. 経営戦略と事業内容:、6. 株価状況
+_PERSPECTIVE_HEADING = re.compile(r"^(\d+)\.\s*(.+?)\s*[:：]?\s*$")
+# 観点の中に書かれている、全体の出力形式などの共通の指示の見出し
+_SHARED_HEADINGS = ("分析結果の出力形式", "その他")
+# 他の観点の分析結果を使う観点は、reduceで分析する
+_DEPENDENT_MARKERS = ("前述の分析結果", "上記の分析結果", "各観点の分析結果")
+
+# 観点のタイトルに含まれる語と、分析に使う有価証券報告書の章
+PERSPECTIVE_SECTIONS: Dict[str, List[str]] = {
+    "経営戦略": ["企業の概況", "事業の状況"],
+    "事業内容": ["企業の概況", "事業の状況"],
+    "財務": ["事業の状況", "経理の状況"],
+    "リスク": ["事業の状況"],
+    "ガバナンス": ["提出会社の状況"],
+    "ESG": ["事業の状況", "提出会社の状況"],
+    "株価": ["提出会社の状況"],
+}
+
+STATUS_SUCCEEDED = "succeeded"
+STATUS_FAILED = "failed"
+
+
+@dataclass
+class AnalysisPerspective:
+    number: str
+    title: str
+    body: str
+    # 分析に使う章（空の場合は前処理の既定の章をすべて使う）
+    sections: List[str] = field(default_factory=list)
+    depends_on_others: bool = False
+
+    @property
+    def heading(self) -> str:
+        return f"{self.number}. {self.title}"
+
+
+@dataclass
+class SplitPrompt:
+    header: str
+    perspectives: List[AnalysisPerspective]
+    shared_instructions: str
+
+    @property
+    def map_perspectives(self) -> List[AnalysisPerspective]:
+        return [p for p in self.perspectives if not p.depends_on_others]
+
+    @property
+    def reduce_perspectives(self) -> List[AnalysisPerspective]:
+        return [p for p in self.perspectives if p.depends_on_others]
+
+
+@dataclass
+class PerspectiveResult:
+    perspective: AnalysisPerspective
+    status: str
+    text: str = ""
+    attempts: int = 0
+    seconds: float = 0.0
+    error: Optional[str] = None
+
+
+@dataclass
+class MapReduceResult:
+    text: str
+    perspective_results: List[PerspectiveResult]
+    reduce_prompt: str = ""
+    # reduceのLLMのレスポンス（reduceに失敗した場合はNone）
+    reduce_response: Any = None
+    wall_seconds: float = 0.0
+
+    @property
+    def failed_perspectives(self) -> List[str]:
+        return [r.perspective.heading for r in self.perspective_results if r.status == STATUS_FAILED]
+
+    @property
+    def is_complete(self) -> bool:
+        # すべての観点と総括に成功した結果のみ、キャッシュして再利用してよい
+        return not self.failed_perspectives and self.reduce_response is not None
+
+
+def split_analyze_prompt(prompt: str) -> SplitPrompt:
+    """分析のプロンプトを、前文・観点ごとの指示・共通の指示に分割する"""
+    header_lines: List[str] = []
+    shared_lines: List[str] = []
+    perspectives: List[AnalysisPerspective] = []
+    body_lines: List[str] = []
+    in_shared = False
+
+    def close_perspective():
+        if perspectives:
+            perspectives[-1].body = "\n".join(body_lines).strip("\n")
+        body_lines.clear()
+
+    for line in prompt.strip("\n").splitlines():
+        match = _PERSPECTIVE_HEADING.match(line)
+        if match:
+            close_perspective()
+            in_shared = False
+            perspectives.append(AnalysisPerspective(number=match.group(1), title=match.group(2), body=""))
+            continue
+        if any(line.strip().startswith(heading) for heading in _SHARED_HEADINGS):
+            in_shared = True
+        if in_shared:
+            shared_lines.append(line.strip())
+        elif perspectives:
+            body_lines.append(line)
+        else:
+            header_lines.append(line)
+    close_perspective()
+
+    for perspective in perspectives:
+        perspective.sections = sections_for_perspective(perspective.title)
+        perspective.depends_on_others = any(marker in perspective.body for marker in _DEPENDENT_MARKERS)
+    return SplitPrompt(
+        header="\n".join(header_lines).strip(),
+        perspectives=perspectives,
+        shared_instructions="\n".join(line for line in shared_lines if line),
+    )
+
+
+def sections_for_perspective(title: str) -> List[str]:
+    sections: List[str] = []
+    for keyword, names in PERSPECTIVE_SECTIONS.items():
+        if keyword.lower() in title.lower():
+            sections.extend(name for name in names if name not in sections)
+    return sections
+
+
+class MapReduceAnalyzer:
+    """
+    観点ごとの分析を、最大max_concurrency件ずつ並列に実行してからまとめる
+    generateはcontents(資料とプロンプトのリスト)を受け取り、textを持つLLMのレスポンスを返す関数
+    """
+
+    def __init__(
+        self,
+        generate: Callable[[List[Any]], Any],
+        max_concurrency: int = 4,
+        max_retries: int = 2,
+        retry_backoff_seconds: float = 2.0,
+    ) -> None:
+        self.__generate = generate
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.retry_backoff_seconds = retry_backoff_seconds
+        self.__lock = threading.Lock()
+        self.__metrics = {
+            "analyses": 0,
+            "perspectives": 0,
+            "failed_perspectives": 0,
+            "retries": 0,
+            "reduce_failures": 0,
+            "total_wall_seconds": 0.0,
+            "total_perspective_seconds": 0.0,
+            "total_reduce_seconds": 0.0,
+        }
+
+    def analyze(
+        self,
+        prompt: str,
+        get_document_part: Callable[[AnalysisPerspective], Any],
+        on_partial: Optional[Callable[[PerspectiveResult], None]] = None,
+    ) -> MapReduceResult:
+        started = time.perf_counter()
+        split = split_analyze_prompt(prompt)
+        if not split.map_perspectives:
+            raise ValueError("no perspectives found in the analyze prompt")
+
+        # 資料の準備(ダウンロードや前処理)は同じファイルを扱うため、並列にせず先に行う
+        jobs: List[Tuple[AnalysisPerspective, List[Any]]] = [
+            (perspective, [get_document_part(perspective), self.__map_prompt(perspective)])
+            for perspective in split.map_perspectives
+        ]
+
+        # map: 観点ごとの分析を並列に実行し、終わったものから通知する
+        results: Dict[str, PerspectiveResult] = {}
+        with ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="map-reduce") as executor:
+            futures = {executor.submit(self.__analyze_perspective, perspective, contents): perspective
+                       for perspective, contents in jobs}
+            for future in as_completed(futures):
+                result = future.result()
+                results[result.perspective.number] = result
+                logger.info("perspective %s %s in %.1fs (%d attempts)",
+                            result.perspective.heading, result.status, result.seconds, result.attempts)
+                if on_partial is not None:
+                    try:
+                        on_partial(result)
+                    except Exception as e:
+                        logger.warning("failed to notify partial result: %s", e)
+
+        perspective_results = [results[p.number] for p in split.map_perspectives]
+        succeeded = [r for r in perspective_results if r.status == STATUS_SUCCEEDED]
+        if not succeeded:
+            raise Exception(f"all perspectives failed: {perspective_results[0].error}")
+
+        # reduce: 各観点の結果を元に、総括と他の観点に依存する観点を分析する
+        reduce_prompt = self.__reduce_prompt(split, perspective_results)
+        reduce_started = time.perf_counter()
+        reduce_response = None
+        try:
+            reduce_response = self.__generate_with_retry([reduce_prompt])[0]
+            summary = reduce_response.text
+        except Exception as e:
+            # 総括に失敗しても、観点ごとの結果は返す
+            logger.error("failed to reduce the perspective results: %s", e)
+            summary = ""
+        reduce_seconds = time.perf_counter() - reduce_started
+
+        result = MapReduceResult(
+            text=self.__merge(perspective_results, summary),
+            perspective_results=perspective_results,
+            reduce_prompt=reduce_prompt,
+            reduce_response=reduce_response,
+            wall_seconds=time.perf_counter() - started,
+        )
+        self.__record(result, reduce_seconds)
+        return result
+
+    def __analyze_perspective(self, perspective: AnalysisPerspective, contents: List[Any]) -> PerspectiveResult:
+        started = time.perf_counter()
+        result = PerspectiveResult(perspective=perspective, status=STATUS_FAILED)
+        try:
+            response, result.attempts = self.__generate_with_retry(contents)
+            result.text = response.text
+            result.status = STATUS_SUCCEEDED
+        except Exception as e:
+            result.attempts = self.max_retries + 1
+            result.error = str(e)
+            logger.error("failed to analyze perspective %s: %s", perspective.heading, e)
+        result.seconds = time.perf_counter() - started
+        return result
+
+    def __generate_with_retry(self, contents: List[Any]) -> Tuple[Any, int]:
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.__generate(contents)
+                # 安全性などでブロックされた場合は、textの取得で例外になる
+                if not response.text.strip():
+                    raise ValueError("empty response")
+                return response, attempt + 1
+            except Exception as e:
+                if attempt >= self.max_retries:
+                    raise
+                logger.warning("llm call failed (attempt %d): %s", attempt + 1, e)
+                with self.__lock:
+                    self.__metrics["retries"] += 1
+                time.sleep(self.retry_backoff_seconds * 2 ** attempt)
+
+    @staticmethod
+    def __map_prompt(perspective: AnalysisPerspective) -> str:
+        return f"""
+上記の決算資料から、下記の観点について分析を行なってください。
+他の観点は別に分析するため、この観点のみを分析してください。
+
+{perspective.heading}:
+{perspective.body}
+
+分析結果の出力形式:
+    「## {perspective.heading}」を見出しとして、分析結果を明確に記述してください。
+    具体的な根拠に基づいた客観的な分析を行い、結論を明確に示してください。
+        """
+
+    @staticmethod
+    def __reduce_prompt(split: SplitPrompt, perspective_results: List[PerspectiveResult]) -> str:
+        results_text = "\n\n".join(
+            r.text if r.status == STATUS_SUCCEEDED else f"## {r.perspective.heading}\n（分析に失敗しました）"
+            for r in perspective_results
+        )
+        dependent_text = "\n\n".join(f"{p.heading}:\n{p.body}" for p in split.reduce_perspectives)
+        return f"""
+下記は、有価証券報告書を観点ごとに分析した結果です。
+各観点の分析結果を元に、全体の総括を行なってください。
+各観点の分析結果そのものは別に提示するため、繰り返さないでください。
+
+★元の依頼
+{split.header}
+
+★総括で分析する観点
+{dependent_text or "なし"}
+
+★総括の出力形式
+「## 総括」を見出しとして、上記の観点があればそれぞれ章立てしてください。
+{split.shared_instructions}
+
+★観点ごとの分析結果
+{results_text}
+        """
+
+    @staticmethod
+    def __merge(perspective_results: List[PerspectiveResult], summary: str) -> str:
+        blocks = []
+        for result in perspective_results:
+            if result.status == STATUS_SUCCEEDED:
+                blocks.append(result.text.strip())
+            else:
+                blocks.append(f"## {result.perspective.heading}\nこの観点は、分析に失敗したため結果がありません。")
+        if summary.strip():
+            blocks.append(summary.strip())
+        return "\n\n".join(blocks)
+
+    def __record(self, result: MapReduceResult, reduce_seconds: float):
+        with self.__lock:
+            self.__metrics["analyses"] += 1
+            self.__metrics["perspectives"] += len(result.perspective_results)
+            self.__metrics["failed_perspectives"] += len(result.failed_perspectives)
+            self.__metrics["reduce_failures"] += 1 if result.reduce_response is None else 0
+            self.__metrics["total_wall_seconds"] += result.wall_seconds
+            self.__metrics["total_perspective_seconds"] += sum(r.seconds for r in result.perspective_results)
+            self.__metrics["total_reduce_seconds"] += reduce_seconds
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self.__lock:
+            metrics = dict(self.__metrics)
+        # 観点ごとの分析を順に実行した場合の時間と比べた、並列化による短縮の割合
+        sequential_seconds = metrics["total_perspective_seconds"] + metrics["total_reduce_seconds"]
+        metrics["speedup"] = sequential_seconds / metrics["total_wall_seconds"] if metrics["total_wall_seconds"] else 0.0
+        return metrics
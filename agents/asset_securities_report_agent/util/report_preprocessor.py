@@ -0,0 +1,240 @@
+"""
+有価証券報告書のPDFから、分析に必要な章のページのみを抜き出す前処理
+目次(しおり)またはテキストの見出しから章の範囲を求め、分析のプロンプトが扱う章のみのPDFを作る
+結果はdoc_idと抜き出す章の設定ごとにキャッシュする
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from logging import getLogger
+from typing import Dict, List, Optional, Tuple
+
+from pypdf import PdfReader, PdfWriter
+
+logger = getLogger(__name__)
+
+# Geminiは、PDFの1ページを約258トークンとして数える
+TOKENS_PER_PAGE = 258
+
+# 章の見出しの例: 第１【企業の概況】、第2 【事業の状況】
+_SECTION_HEADING = re.compile(r"第\s*[0-9０-９一二三四五六七八九十]+\s*【\s*(.+?)\s*】")
+
+# 分析のプロンプトが扱う章と、章ごとの最大ページ数（Noneは全ページ）
+# 事業の状況: 経営方針、サステナビリティ、事業等のリスク、経営者による分析
+# 提出会社の状況: コーポレート・ガバナンスの状況等
+# 経理の状況: 財務諸表（注記は長いため先頭のみ）
+DEFAULT_SECTIONS: Dict[str, Optional[int]] = {
+    "企業の概況": None,
+    "事業の状況": None,
+    "提出会社の状況": None,
+    "経理の状況": 30,
+}
+
+
+@dataclass
+class Section:
+    title: str
+    start_page: int
+    end_page: int  # この章の最後のページの次のページ
+
+
+@dataclass
+class PreprocessResult:
+    doc_id: str
+    file_path: str
+    total_pages: int
+    selected_pages: List[int] = field(default_factory=list)
+    selected_sections: List[str] = field(default_factory=list)
+    cached: bool = False
+    seconds: float = 0.0
+    cache_key: str = ""
+
+    @property
+    def estimated_full_tokens(self) -> int:
+        return self.total_pages * TOKENS_PER_PAGE
+
+    @property
+    def estimated_tokens(self) -> int:
+        return len(self.selected_pages) * TOKENS_PER_PAGE
+
+
+def parse_sections(reader: PdfReader) -> List[Section]:
+    # しおりがあればしおりから、なければ各ページの見出しから章の範囲を求める
+    starts = _sections_from_outline(reader) or _sections_from_text(reader)
+    starts.sort(key=lambda item: item[1])
+    sections = []
+    for i, (title, start_page) in enumerate(starts):
+        end_page = starts[i + 1][1] if i + 1 < len(starts) else len(reader.pages)
+        if end_page > start_page:
+            sections.append(Section(title=title, start_page=start_page, end_page=end_page))
+    return sections
+
+
+def _normalize_title(title: str) -> str:
+    match = _SECTION_HEADING.search(title)
+    if match:
+        return match.group(1)
+    return title.strip().strip("【】")
+
+
+def _sections_from_outline(reader: PdfReader) -> List[Tuple[str, int]]:
+    starts: List[Tuple[str, int]] = []
+
+    def walk(items):
+        for item in items:
+            if isinstance(item, list):
+                walk(item)
+                continue
+            try:
+                title = item.title
+                page = reader.get_destination_page_number(item)
+            except Exception:
+                continue
+            if _SECTION_HEADING.search(title or ""):
+                starts.append((_normalize_title(title), page))
+
+    try:
+        walk(reader.outline)
+    except Exception as e:
+        logger.warning("failed to read pdf outline: %s", e)
+    return starts
+
+
+def _sections_from_text(reader: PdfReader) -> List[Tuple[str, int]]:
+    # 目次のページにも見出しが並ぶため、1ページに複数の見出しがあるページは目次として飛ばす
+    starts: List[Tuple[str, int]] = []
+    seen = set()
+    for page_number, page in enumerate(reader.pages):
+        try:
+            text = page.extract_text() or ""
+        except Exception:
+            continue
+        titles = _SECTION_HEADING.findall(text[:400])
+        if len(titles) != 1 or titles[0] in seen:
+            continue
+        seen.add(titles[0])
+        starts.append((titles[0], page_number))
+    return starts
+
+
+class ReportPreprocessor:
+    """
+    有価証券報告書のPDFから、sectionsに含まれる章のページと表紙のみを抜き出したPDFを作る
+    章が見つからない場合は、元のPDFをそのまま返す
+    """
+
+    def __init__(self, cache_folder: str, sections: Optional[Dict[str, Optional[int]]] = None) -> None:
+        self.cache_folder = cache_folder
+        self.sections = sections or DEFAULT_SECTIONS
+        os.makedirs(self.cache_folder, exist_ok=True)
+        # 設定が変われば、キャッシュのキーも変わる
+        self.__config_key = hashlib.sha256(
+            json.dumps(self.sections, sort_keys=True, ensure_ascii=False).encode("utf-8")
+        ).hexdigest()[:12]
+        self.__lock = threading.Lock()
+        self.__records: List[Dict[str, object]] = []
+
+    def get_cache_key(self, doc_id: str) -> str:
+        return f"{doc_id}.{self.__config_key}"
+
+    def preprocess(self, doc_id: str, pdf_path: str) -> PreprocessResult:
+        started = time.perf_counter()
+        cache_key = self.get_cache_key(doc_id)
+        reduced_path = os.path.join(self.cache_folder, f"{cache_key}.pdf")
+        meta_path = os.path.join(self.cache_folder, f"{cache_key}.json")
+        result = None
+        if os.path.exists(meta_path):
+            with open(meta_path, "r") as f:
+                result = PreprocessResult(**json.load(f))
+            # 章が見つからなかった場合は、元のPDFを指している
+            if os.path.exists(result.file_path):
+                result.cached = True
+            else:
+                result = None
+        if result is None:
+            result = self.__build(doc_id, pdf_path, reduced_path)
+            result.cache_key = cache_key
+            tmp_path = f"{meta_path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(asdict(result), f, ensure_ascii=False)
+            os.replace(tmp_path, meta_path)
+        result.seconds = time.perf_counter() - started
+        return result
+
+    def __build(self, doc_id: str, pdf_path: str, reduced_path: str) -> PreprocessResult:
+        reader = PdfReader(pdf_path)
+        total_pages = len(reader.pages)
+        selected_pages = {0} if total_pages else set()
+        selected_sections = []
+        for section in parse_sections(reader):
+            matched = next((key for key in self.sections if key in section.title), None)
+            if matched is None:
+                continue
+            max_pages = self.sections[matched]
+            end_page = section.end_page if max_pages is None else min(section.end_page, section.start_page + max_pages)
+            selected_pages.update(range(section.start_page, end_page))
+            selected_sections.append(section.title)
+
+        if not selected_sections:
+            # 章が見つからない場合は、元のPDFを使う
+            logger.warning("no sections found in %s, using the whole document", doc_id)
+            return PreprocessResult(doc_id=doc_id, file_path=pdf_path, total_pages=total_pages,
+                                    selected_pages=list(range(total_pages)))
+
+        writer = PdfWriter()
+        for page_number in sorted(selected_pages):
+            writer.add_page(reader.pages[page_number])
+        tmp_path = f"{reduced_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            writer.write(f)
+        os.replace(tmp_path, reduced_path)
+        return PreprocessResult(
+            doc_id=doc_id,
+            file_path=reduced_path,
+            total_pages=total_pages,
+            selected_pages=sorted(selected_pages),
+            selected_sections=selected_sections,
+        )
+
+    def record_analysis(
+        self,
+        result: PreprocessResult,
+        prompt_token_count: int,
+        candidates_token_count: int,
+        llm_seconds: float,
+    ):
+        # 解析ごとに、全ページを送った場合の見積もりと比べたトークン数とレイテンシを記録する
+        with self.__lock:
+            self.__records.append({
+                "doc_id": result.doc_id,
+                "total_pages": result.total_pages,
+                "selected_pages": len(result.selected_pages),
+                "estimated_full_tokens": result.estimated_full_tokens,
+                "estimated_tokens": result.estimated_tokens,
+                "prompt_token_count": prompt_token_count,
+                "candidates_token_count": candidates_token_count,
+                "preprocess_seconds": result.seconds,
+                "llm_seconds": llm_seconds,
+                "cached": result.cached,
+            })
+            del self.__records[:-100]
+
+    def get_report(self) -> Dict[str, object]:
+        with self.__lock:
+            records = list(self.__records)
+        full_tokens = sum(r["estimated_full_tokens"] for r in records)
+        tokens = sum(r["estimated_tokens"] for r in records)
+        return {
+            "analyses": len(records),
+            "estimated_full_tokens": full_tokens,
+            "estimated_tokens": tokens,
+            "estimated_token_reduction": 1 - tokens / full_tokens if full_tokens else 0.0,
+            "prompt_tokens": sum(r["prompt_token_count"] for r in records),
+            "output_tokens": sum(r["candidates_token_count"] for r in records),
+            "recent": records[-10:],
+        }
@@ -0,0 +1,162 @@
+"""
+ルーティングと企業名抽出のLLM呼び出しを減らすための前段の分類器
+明らかに判定できるメッセージはルールで判定し、LLMの判定結果は正規化したメッセージ単位でメモ化する
+"""
+
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from logging import getLogger
+from typing import Callable, Dict, Optional, Tuple
+
+from util.filer_index import normalize_company_name
+
+logger = getLogger(__name__)
+
+# 判定の経路
+PATH_RULE = "rule"
+PATH_CACHE = "cache"
+PATH_LLM = "llm"
+
+# 空白と句読点は判定に影響しないため取り除く（長音記号は企業名に含まれるので残す）
+_IGNORED_CHARS = re.compile(r"[\s、。，．,.!！?？「」『』\"'・]")
+
+# 報告書の候補を提示している時に、そのまま分析して良いと判断できる返答
+AFFIRMATIVE_REPLIES = frozenset([
+    "はい",
+    "うん",
+    "ええ",
+    "yes",
+    "y",
+    "ok",
+    "okay",
+    "それで",
+    "それでお願いします",
+    "お願い",
+    "お願いします",
+    "おねがいします",
+    "はいお願いします",
+    "はいそれでお願いします",
+    "よろしく",
+    "よろしくお願いします",
+    "はいよろしくお願いします",
+    "良いです",
+    "いいです",
+    "大丈夫です",
+    "問題ないです",
+    "分析して",
+    "分析してください",
+    "はい分析してください",
+    "分析をお願いします",
+])
+
+
+def normalize_message(message: str) -> str:
+    # 全角/半角や大文字/小文字の違いを吸収する
+    text = unicodedata.normalize("NFKC", message).lower()
+    return _IGNORED_CHARS.sub("", text)
+
+
+class LRUMemo:
+    """件数の上限つきのメモ（古く参照されたものから捨てる）"""
+
+    def __init__(self, max_items: int = 1024) -> None:
+        self.max_items = max_items
+        self.__items: OrderedDict = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def get(self, key) -> Optional[str]:
+        with self.__lock:
+            if key not in self.__items:
+                return None
+            self.__items.move_to_end(key)
+            return self.__items[key]
+
+    def put(self, key, value: str):
+        with self.__lock:
+            self.__items[key] = value
+            self.__items.move_to_end(key)
+            while len(self.__items) > self.max_items:
+                self.__items.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self.__items)
+
+
+class PathLatencyMetrics:
+    """処理(routing, extract_company_name)と経路(rule, cache, llm)ごとの件数とレイテンシ"""
+
+    def __init__(self) -> None:
+        self.__lock = threading.Lock()
+        self.__stats: Dict[Tuple[str, str], Dict[str, float]] = {}
+
+    def record(self, stage: str, path: str, seconds: float):
+        with self.__lock:
+            stats = self.__stats.setdefault((stage, path), {"count": 0, "total": 0.0, "max": 0.0})
+            stats["count"] += 1
+            stats["total"] += seconds
+            stats["max"] = max(stats["max"], seconds)
+
+    def get_metrics(self) -> Dict[str, Dict[str, Dict[str, float]]]:
+        metrics: Dict[str, Dict[str, Dict[str, float]]] = {}
+        with self.__lock:
+            for (stage, path), stats in self.__stats.items():
+                metrics.setdefault(stage, {})[path] = {
+                    "count": stats["count"],
+                    "mean_ms": stats["total"] / stats["count"] * 1000,
+                    "max_ms": stats["max"] * 1000,
+                }
+        # LLMを呼ばずに済んだ割合
+        for stage, paths in metrics.items():
+            total = sum(p["count"] for p in paths.values())
+            llm = paths.get(PATH_LLM, {}).get("count", 0)
+            paths["llm_skip_rate"] = (total - llm) / total if total else 0.0
+        return metrics
+
+
+class RoutingPreClassifier:
+    """
+    LLMを呼ぶ前に、ルールとメモで判定できるものを判定する
+    filer_name_lookupは企業名に一致する提出者名(なければNone)を返す関数で、呼び出しのたびに参照する
+    （提出者名は手元に持たないため、インデックスの更新はそのまま判定に反映される。
+    参照に失敗した場合は、ルールの判定を諦めてLLMに任せる）
+    """
+
+    def __init__(
+        self,
+        filer_name_lookup: Callable[[str], Optional[str]],
+        max_memo_items: int = 1024,
+    ) -> None:
+        self.__filer_name_lookup = filer_name_lookup
+        self.routing_memo = LRUMemo(max_items=max_memo_items)
+        self.company_name_memo = LRUMemo(max_items=max_memo_items)
+
+    def match_filer_name(self, message: str) -> Optional[str]:
+        # メッセージが提出者名と一致する場合のみ、その提出者名を返す
+        if not normalize_company_name(message):
+            return None
+        try:
+            return self.__filer_name_lookup(message)
+        except Exception as e:
+            logger.warning("failed to look up filer name: %s", e)
+            return None
+
+    def classify_routing(self, message: str, finish_search: bool) -> Optional[str]:
+        normalized = normalize_message(message)
+        if finish_search and normalized in AFFIRMATIVE_REPLIES:
+            # 報告書の候補を提示済みで、肯定の返答があった場合は分析に進む
+            return "analyze_report"
+        if self.match_filer_name(message) is not None:
+            # 企業名だけのメッセージは検索に進む
+            return "extract_company_name"
+        return None
+
+    @staticmethod
+    def routing_memo_key(previous_message: Optional[str], message: str) -> Tuple[str, str]:
+        # ルーティングのプロンプトには直前のメッセージも含まれるため、キーに含める
+        return normalize_message(previous_message or ""), normalize_message(message)
+
+    @staticmethod
+    def company_name_memo_key(message: str) -> str:
+        return normalize_message(message)
@@ -0,0 +1,49 @@
+"""Warm up the analysis cache of the agent.
+
+Analyzes the given annual securities reports in bulk and stores the results
+in the LLM result cache, so that later requests for them skip the model call.
+Reports that are already cached are skipped.
+"""
+
+import logging
+import sys
+
+import click
+from dotenv import load_dotenv
+
+from agent import AssetSecuritiesReportAgent, create_agent_config
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+@click.command()
+@click.option("--doc-id", "doc_ids", multiple=True, help="EDINET document id to analyze.")
+@click.option(
+    "--doc-id-file", "doc_id_file", type=click.File("r"),
+    help="File with one EDINET document id per line.",
+)
+def main(doc_ids, doc_id_file):
+    """Analyze the reports and store the results in the cache."""
+    doc_ids = list(doc_ids)
+    if doc_id_file:
+        doc_ids.extend(line.strip() for line in doc_id_file if line.strip())
+    if not doc_ids:
+        logger.error("No document ids given")
+        sys.exit(1)
+
+    agent = AssetSecuritiesReportAgent(config=create_agent_config())
+    result = agent.warm_up_analysis_cache(doc_ids=doc_ids)
+    logger.info(
+        "Warmed up %d reports, %d failed. Cache metrics: %s",
+        len(result["success_doc_ids"]),
+        len(result["error_doc_ids"]),
+        agent.get_llm_cache_metrics(),
+    )
+    sys.exit(1 if result["error_doc_ids"] else 0)
+
+
+if __name__ == "__main__":
+    main()
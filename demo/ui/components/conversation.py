@@ -7,7 +7,7 @@ import functools
 import threading
 
 from state.state import AppState, SettingsState, StateMessage
-from state.host_agent_service import SendMessage, ListConversations, convert_message_to_state
+from state.host_agent_service import SendMessage, ListConversations, convert_message_to_state, AddSendError, MessageNotSentError
 from .chat_bubble import chat_bubble
 from .form_render import is_form, render_form, form_sent
 from .async_poller import async_poller, AsyncAction
@@ -58,7 +58,10 @@ async def send_message(message: str, message_id: str = ""):
       app_state.conversations), None)
   if conversation:
     conversation.message_ids.append(state_message.message_id)
-  response = await SendMessage(request)
+  try:
+    await SendMessage(request)
+  except MessageNotSentError as e:
+    AddSendError(app_state, message_id, message, e)
 
 
 async def send_message_enter(e: me.InputEnterEvent):  # pylint: disable=unused-argument
@@ -4,7 +4,7 @@ from typing import Literal, Any, Tuple
 import uuid
 import dataclasses
 from state.state import AppState, StateMessage
-from state.host_agent_service import SendMessage
+from state.host_agent_service import SendMessage, AddSendError, MessageNotSentError
 from common.types import Message, DataPart, TextPart
 
 ROW_GAP = 15
@@ -270,7 +270,13 @@ async def cancel_form(e: me.ClickEvent):
           'message_id': message_id,
       },
   )
-  response = await SendMessage(request)
+  try:
+    await SendMessage(request)
+  except MessageNotSentError as err:
+    # Show the form again so that it can be cancelled once more.
+    app_state.completed_forms.pop(e.key, None)
+    app_state.form_responses.pop(message_id, None)
+    AddSendError(app_state, message_id, "rejected form entry", err)
 
 async def send_response(id: str, state: State, app_state: AppState):
   message_id = str(uuid.uuid4())
@@ -286,7 +292,13 @@ async def send_response(id: str, state: State, app_state: AppState):
           'message_id': message_id,
       }
   )
-  response = await SendMessage(request)
+  try:
+    await SendMessage(request)
+  except MessageNotSentError as e:
+    # Show the form again so that it can be submitted once more.
+    app_state.completed_forms.pop(id, None)
+    app_state.form_responses.pop(message_id, None)
+    AddSendError(app_state, message_id, json.dumps(form.data), e)
 
 async def submit_form(e: me.ClickEvent):
   try:
@@ -3,10 +3,12 @@ import mesop.labs as mel
 
 from .side_nav import sidenav
 from .async_poller import async_poller, AsyncAction
+from .state_stream import state_stream
 from .poller import polling_buttons
 
 from state.state import AppState
-from state.host_agent_service import UpdateAppState
+from state.host_agent_service import UpdateAppState, ApplyStateDelta
+from service.types import StateSnapshot
 
 from styles.styles import (
     MAIN_COLUMN_STYLE,
@@ -24,6 +26,22 @@ async def refresh_app_state(e: mel.WebEvent):  # pylint: disable=unused-argument
     yield
 
 
+async def apply_state_delta(e: mel.WebEvent):
+    """Server-pushed state delta event handler"""
+    ApplyStateDelta(me.state(AppState), StateSnapshot(**e.value))
+    yield
+
+
+async def update_stream_status(e: mel.WebEvent):
+    """Stream connection status event handler"""
+    app_state = me.state(AppState)
+    app_state.stream_connected = e.value["connected"]
+    if not app_state.stream_connected:
+        # Catch up at once instead of waiting for the first poll.
+        await UpdateAppState(app_state, app_state.current_conversation_id)
+    yield
+
+
 @me.content_component
 def page_scaffold():
     """page scaffold component"""
@@ -36,9 +54,21 @@ def page_scaffold():
         if app_state
         else None
     )
-    async_poller(
-        action=action, trigger_event=refresh_app_state
+    state_stream(
+        delta_event=apply_state_delta,
+        status_event=update_stream_status,
+        conversation_id=app_state.current_conversation_id,
+        messages_since=(
+            app_state.messages_cursor
+            if app_state.messages_conversation_id == app_state.current_conversation_id
+            else 0),
+        tasks_since=app_state.task_cursor,
     )
+    # Polling is only needed while the server cannot push updates.
+    if not app_state.stream_connected:
+        async_poller(
+            action=action, trigger_event=refresh_app_state
+        )
 
     sidenav("")
 
@@ -0,0 +1,91 @@
+import {
+  LitElement,
+  html,
+} from 'https://cdn.jsdelivr.net/gh/lit/dist@3/core/lit-core.min.js';
+
+class StateStream extends LitElement {
+  static properties = {
+    deltaEvent: {type: String},
+    statusEvent: {type: String},
+    url: {type: String},
+    conversation_id: {type: String},
+    messages_since: {type: Number},
+    tasks_since: {type: Number},
+  };
+
+  constructor() {
+    super();
+    this.source = null;
+    this.connected = false;
+    this.retryDelay = 1000;
+    this.retryTimer = null;
+    this.streamConversation = null;
+  }
+
+  render() {
+    return html`<div></div>`;
+  }
+
+  disconnectedCallback() {
+    super.disconnectedCallback();
+    this.close();
+  }
+
+  updated() {
+    // Cursors change with every applied delta; only a new conversation
+    // needs a new stream.
+    if (this.source === null || this.streamConversation !== this.conversation_id) {
+      this.open();
+    }
+  }
+
+  open() {
+    this.close();
+    this.streamConversation = this.conversation_id;
+    const params = new URLSearchParams({
+      conversation_id: this.conversation_id || '',
+      messages_since: this.messages_since || 0,
+      tasks_since: this.tasks_since || 0,
+    });
+    this.source = new EventSource(`${this.url}?${params}`);
+    this.source.onopen = () => {
+      this.retryDelay = 1000;
+      this.setConnected(true);
+    };
+    this.source.addEventListener('delta', (e) => {
+      const delta = JSON.parse(e.data);
+      // Resume from the latest cursors when reconnecting.
+      this.messages_since = delta.messages_since;
+      this.tasks_since = delta.tasks_since;
+      this.dispatchEvent(new MesopEvent(this.deltaEvent, delta));
+    });
+    this.source.onerror = () => {
+      // Hand over to polling while disconnected and retry with backoff.
+      this.close();
+      this.setConnected(false);
+      this.retryTimer = setTimeout(() => this.open(), this.retryDelay);
+      this.retryDelay = Math.min(this.retryDelay * 2, 30000);
+    };
+  }
+
+  close() {
+    if (this.retryTimer !== null) {
+      clearTimeout(this.retryTimer);
+      this.retryTimer = null;
+    }
+    if (this.source !== null) {
+      this.source.close();
+      this.source = null;
+    }
+  }
+
+  setConnected(connected) {
+    if (this.connected === connected) {
+      return;
+    }
+    this.connected = connected;
+    this.dispatchEvent(new MesopEvent(this.statusEvent, {connected: connected}));
+  }
+}
+
+customElements.define('state-stream-component', StateStream);
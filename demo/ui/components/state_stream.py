@@ -0,0 +1,41 @@
+from typing import Any, Callable
+
+import mesop.labs as mel
+
+
+@mel.web_component(path="./state_stream.js")
+def state_stream(
+    *,
+    delta_event: Callable[[mel.WebEvent], Any],
+    status_event: Callable[[mel.WebEvent], Any],
+    conversation_id: str = "",
+    messages_since: int = 0,
+    tasks_since: int = 0,
+    url: str = "/state/stream",
+    key: str | None = None,
+):
+  """Creates an invisible component that receives state deltas from the server.
+
+  The component keeps a server-sent events connection to the
+  ConversationServer open and fires `delta_event` for every change. The
+  cursors are only used to open the stream; a new stream is opened when the
+  conversation changes. `status_event` reports whether the stream is
+  connected, so that the page can fall back to polling when it is not.
+
+  Returns:
+    The web component that was created.
+  """
+  return mel.insert_web_component(
+      name="state-stream-component",
+      key=key,
+      events={
+          "deltaEvent": delta_event,
+          "statusEvent": status_event,
+      },
+      properties={
+          "url": url,
+          "conversation_id": conversation_id,
+          "messages_since": messages_since,
+          "tasks_since": tasks_since,
+      },
+  )
@@ -1,3 +1,5 @@
+import asyncio
+import threading
 import httpx
 from httpx_sse import connect_sse
 from typing import Any, AsyncIterable
@@ -24,29 +26,66 @@ from service.types import (
     AgentClientJSONError,
     JSONRPCRequest,
     Conversation,
+    StateSnapshotRequest,
+    StateSnapshotResponse,
 )
 import json
 
 class ConversationClient:
+  """Client of the ConversationServer.
 
-  def __init__(self, base_url):
+  All requests go through one pooled httpx client living on a background
+  event loop for the lifetime of the client, so that connections are reused
+  whatever event loop the caller runs on (Mesop handlers do not share one).
+  """
+
+  def __init__(self, base_url, timeout: float | None = 30.0):
     self.base_url = base_url.rstrip("/")
+    self.timeout = timeout
+    self._lock = threading.Lock()
+    self._loop: asyncio.AbstractEventLoop | None = None
+    self._http: httpx.AsyncClient | None = None
+
+  def _pool(self) -> asyncio.AbstractEventLoop:
+    with self._lock:
+      if self._loop is None:
+        loop = asyncio.new_event_loop()
+        threading.Thread(
+            target=loop.run_forever, name="conversation-client", daemon=True
+        ).start()
+        self._http = httpx.AsyncClient(timeout=self.timeout)
+        self._loop = loop
+      return self._loop
+
+  async def _post(self, url: str, json: dict[str, Any]) -> httpx.Response:
+    loop = self._pool()
+    future = asyncio.run_coroutine_threadsafe(
+        self._http.post(url, json=json), loop)
+    return await asyncio.wrap_future(future)
+
+  def close(self):
+    with self._lock:
+      loop, http = self._loop, self._http
+      self._loop = self._http = None
+    if loop is None:
+      return
+    asyncio.run_coroutine_threadsafe(http.aclose(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
 
   async def send_message(self, payload: SendMessageRequest) -> SendMessageResponse:
     return SendMessageResponse(**await self._send_request(payload))
 
   async def _send_request(self, request: JSONRPCRequest) -> dict[str, Any]:
-    async with httpx.AsyncClient() as client:
-      try:
-        response = await client.post(
-          self.base_url + "/" + request.method, json=request.model_dump()
-        )
-        response.raise_for_status()
-        return response.json()
-      except httpx.HTTPStatusError as e:
-        raise AgentClientHTTPError(e.response.status_code, str(e)) from e
-      except json.JSONDecodeError as e:
-        raise AgentClientJSONError(str(e)) from e
+    try:
+      response = await self._post(
+        self.base_url + "/" + request.method, json=request.model_dump()
+      )
+      response.raise_for_status()
+      return response.json()
+    except httpx.HTTPStatusError as e:
+      raise AgentClientHTTPError(e.response.status_code, str(e)) from e
+    except json.JSONDecodeError as e:
+      raise AgentClientJSONError(str(e)) from e
 
   async def create_conversation(self, payload: CreateConversationRequest) -> CreateConversationResponse:
     return CreateConversationResponse(**await self._send_request(payload))
@@ -73,3 +112,5 @@ class ConversationClient:
   async def list_agents(self, payload: ListAgentRequest) -> ListAgentResponse:
     return ListAgentResponse(**await self._send_request(payload))
 
+  async def get_state_snapshot(self, payload: StateSnapshotRequest) -> StateSnapshotResponse:
+    return StateSnapshotResponse(**await self._send_request(payload))
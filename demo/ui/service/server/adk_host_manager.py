@@ -2,6 +2,7 @@ import asyncio
 import datetime
 import json
 import os
+from logging import getLogger
 from typing import Tuple, Optional, Any
 import uuid
 from service.types import Conversation, Event
@@ -21,11 +22,20 @@ from common.types import (
     Part,
 )
 from hosts.multiagent.host_agent import HostAgent
+from hosts.multiagent.push_notification_hub import PushNotificationHub
 from hosts.multiagent.remote_agent_connection import (
     TaskCallbackArg,
 )
 from utils.agent_card import get_agent_card
 from service.server.application_manager import ApplicationManager
+from service.server.artifact_assembler import ArtifactAssembler, TERMINAL_STATES
+from service.server.sqlite_adk_services import (
+    SQLiteArtifactService,
+    SQLiteSessionService,
+)
+from service.server.sqlite_database import SQLiteDatabase
+from service.server.sqlite_state_store import SQLiteStateStore
+from service.server.state_store import StateStore
 from google.adk import Runner
 from google.adk.sessions.in_memory_session_service import InMemorySessionService
 from google.adk.memory.in_memory_memory_service import InMemoryMemoryService
@@ -35,6 +45,8 @@ from google.adk.events.event_actions import EventActions as ADKEventActions
 from google.genai import types
 import base64
 
+logger = getLogger(__name__)
+
 
 class ADKHostManager(ApplicationManager):
   """An implementation of memory based management with fake agent actions
@@ -43,26 +55,37 @@ class ADKHostManager(ApplicationManager):
   the AgentServer. This acts as the service contract that the Mesop app
   uses to send messages to the agent and provide information for the frontend.
   """
-  _conversations: list[Conversation]
-  _messages: list[Message]
-  _tasks: list[Task]
-  _events: dict[str, Event]
-  _pending_message_ids: list[str]
+  _store: StateStore
   _agents: list[AgentCard]
   _task_map: dict[str, str]
 
   def __init__(self, api_key: str = "", uses_vertex_ai: bool = False):
-    self._conversations = []
-    self._messages = []
-    self._tasks = []
-    self._events = {}
-    self._pending_message_ids = []
+    # Conversations, messages, tasks and events, indexed by id. With
+    # A2A_STATE_DB they are also kept in that SQLite file, together with the
+    # ADK sessions and artifacts, and survive a restart.
+    state_db = os.environ.get("A2A_STATE_DB", "")
+    if state_db:
+      self._db = SQLiteDatabase(state_db)
+      self._store = SQLiteStateStore(self._db)
+      self._session_service = SQLiteSessionService(self._db)
+      self._artifact_service = SQLiteArtifactService(self._db)
+    else:
+      self._db = None
+      self._store = StateStore()
+      self._session_service = InMemorySessionService()
+      self._artifact_service = InMemoryArtifactService()
     self._agents = []
-    self._artifact_chunks = {}
-    self._session_service = InMemorySessionService()
-    self._artifact_service = InMemoryArtifactService()
+    # Chunks of the artifacts still being streamed by remote agents.
+    self.artifact_assembler = ArtifactAssembler()
     self._memory_service = InMemoryMemoryService()
-    self._host_agent = HostAgent([], self.task_callback)
+    # Public url of the /task/notify route. When set, agents supporting push
+    # notifications wake up the host instead of being polled.
+    notification_url = os.environ.get("A2A_PUSH_NOTIFICATION_URL", "")
+    self.push_notification_hub = (
+        PushNotificationHub(notification_url) if notification_url else None)
+    self._host_agent = HostAgent(
+        [], self.task_callback,
+        push_notification_hub=self.push_notification_hub)
     self.user_id = "test_user"
     self.app_name = "A2A"
     self.api_key = api_key or os.environ.get("GOOGLE_API_KEY", "")
@@ -111,7 +134,7 @@ class ADKHostManager(ApplicationManager):
         user_id=self.user_id)
     conversation_id = session.id
     c = Conversation(conversation_id=conversation_id, is_active=True)
-    self._conversations.append(c)
+    self._store.add_conversation(c)
     return c
 
   def sanitize_message(self, message: Message) -> Message:
@@ -130,10 +153,10 @@ class ADKHostManager(ApplicationManager):
     return message
 
   async def process_message(self, message: Message):
-    self._messages.append(message)
+    self._store.add_message(message)
     message_id = get_message_id(message)
     if message_id:
-      self._pending_message_ids.append(message_id)
+      self._store.add_pending_message(message_id)
     conversation_id = (
         message.metadata['conversation_id']
         if 'conversation_id' in message.metadata
@@ -142,7 +165,7 @@ class ADKHostManager(ApplicationManager):
     # Now check the conversation and attach the message id.
     conversation = self.get_conversation(conversation_id)
     if conversation:
-      conversation.messages.append(message)
+      self._store.add_conversation_message(conversation, message)
     self.add_event(Event(
         id=str(uuid.uuid4()),
         actor='user',
@@ -163,11 +186,7 @@ class ADKHostManager(ApplicationManager):
     last_message_id = get_last_message_id(message)
     if (last_message_id and
         last_message_id in self._task_map and
-        task_still_open(next(
-            filter(
-                lambda x: x.id == self._task_map[last_message_id],
-                self._tasks),
-            None))):
+        task_still_open(self._store.get_task(self._task_map[last_message_id]))):
           state_update['task_id'] = self._task_map[last_message_id]
     # Need to upsert session state now, only way is to append an event.
     self._session_service.append_event(session, ADKEvent(
@@ -204,20 +223,17 @@ class ADKHostManager(ApplicationManager):
           **{'last_message_id': last_message_id,
              'message_id': new_message_id}
       }
-      self._messages.append(response)
+      self._store.add_message(response)
 
     if conversation:
-      conversation.messages.append(response)
-    self._pending_message_ids.remove(message_id)
+      self._store.add_conversation_message(conversation, response)
+    self._store.remove_pending_message(message_id)
 
   def add_task(self, task: Task):
-    self._tasks.append(task)
+    self._store.add_task(task)
 
   def update_task(self, task: Task):
-    for i, t in enumerate(self._tasks):
-      if t.id == task.id:
-        self._tasks[i] = task
-        return
+    self._store.update_task(task)
 
   def task_callback(self, task: TaskCallbackArg, agent_card: AgentCard):
     self.emit_event(task, agent_card)
@@ -228,6 +244,7 @@ class ADKHostManager(ApplicationManager):
       self.insert_message_history(current_task, task.status.message)
       self.update_task(current_task)
       self.insert_id_trace(task.status.message)
+      self.release_artifact_chunks(current_task)
       return current_task
     elif isinstance(task, TaskArtifactUpdateEvent):
       current_task = self.add_or_get_task(task)
@@ -235,17 +252,27 @@ class ADKHostManager(ApplicationManager):
       self.update_task(current_task)
       return current_task
     # Otherwise this is a Task, either new or updated
-    elif not any(filter(lambda x: x.id == task.id, self._tasks)):
+    elif not self._store.has_task(task.id):
       self.attach_message_to_task(task.status.message, task.id)
       self.insert_id_trace(task.status.message)
       self.add_task(task)
+      self.release_artifact_chunks(task)
       return task
     else:
       self.attach_message_to_task(task.status.message, task.id)
       self.insert_id_trace(task.status.message)
       self.update_task(task)
+      self.release_artifact_chunks(task)
       return task
 
+  def release_artifact_chunks(self, task: Task):
+    """Frees the chunks of unfinished artifacts once the task is over."""
+    if task.status and task.status.state in TERMINAL_STATES:
+      dropped = self.artifact_assembler.discard(task.id)
+      if dropped:
+        logger.warning(
+            f"Dropped {dropped} incomplete artifacts of task {task.id}")
+
   def emit_event(self, task: TaskCallbackArg, agent_card: AgentCard):
     content = None
     conversation_id = get_conversation_id(task)
@@ -309,15 +336,11 @@ class ADKHostManager(ApplicationManager):
     message_id = get_message_id(message)
     if not message_id:
       return
-    if get_message_id(task.status.message) not in [
-        get_message_id(x) for x in task.history
-    ]:
-      task.history.append(task.status.message)
-    else:
+    if not self._store.add_task_message(task, task.status.message):
       print("Message id already in history", get_message_id(task.status.message), task.history)
 
   def add_or_get_task(self, task: TaskCallbackArg):
-    current_task = next(filter(lambda x: x.id == task.id, self._tasks), None)
+    current_task = self._store.get_task(task.id)
     if not current_task:
       conversation_id = None
       if task.metadata and 'conversation_id' in task.metadata:
@@ -335,48 +358,28 @@ class ADKHostManager(ApplicationManager):
     return current_task
 
   def process_artifact_event(self, current_task:Task, task_update_event: TaskArtifactUpdateEvent):
-    artifact = task_update_event.artifact
-    if not artifact.append:
-      #received the first chunk or entire payload for an artifact
-      if artifact.lastChunk is None or artifact.lastChunk:
-        #lastChunk bit is missing or is set to true, so this is the entire payload
-        #add this to artifacts
-        if not current_task.artifacts:
-          current_task.artifacts = []
-        current_task.artifacts.append(artifact)
-      else:
-        #this is a chunk of an artifact, stash it in temp store for assemling
-        if not task_update_event.id in self._artifact_chunks:
-              self._artifact_chunks[task_update_event.id] = {}
-        self._artifact_chunks[task_update_event.id][artifact.index] = artifact
-    else:
-        # we received an append chunk, add to the existing temp artifact
-        current_temp_artifact = self._artifact_chunks[task_update_event.id][artifact.index]
-        # TODO handle if current_temp_artifact is missing
-        current_temp_artifact.parts.extend(artifact.parts)
-        if artifact.lastChunk:
-          current_task.artifacts.append(current_temp_artifact)
-          del self._artifact_chunks[task_update_event.id][artifact.index]
+    artifact = self.artifact_assembler.add(
+        task_update_event.id, task_update_event.artifact)
+    if artifact:
+      if not current_task.artifacts:
+        current_task.artifacts = []
+      current_task.artifacts.append(artifact)
 
   def add_event(self, event: Event):
-    self._events[event.id] = event
+    self._store.add_event(event)
 
   def get_conversation(
       self,
       conversation_id: Optional[str]
   ) -> Optional[Conversation]:
-    if not conversation_id:
-      return None
-    return next(
-        filter(lambda c: c.conversation_id == conversation_id,
-               self._conversations), None)
+    return self._store.get_conversation(conversation_id)
 
   def get_pending_messages(self) -> list[Tuple[str, str]]:
     rval = []
-    for message_id in self._pending_message_ids:
+    for message_id in self._store.pending_message_ids:
       if message_id in self._task_map:
         task_id = self._task_map[message_id]
-        task = next(filter(lambda x: x.id == task_id, self._tasks), None)
+        task = self._store.get_task(task_id)
         if not task:
           rval.append((message_id, ""))
         elif task.history and task.history[-1].parts:
@@ -396,9 +399,9 @@ class ADKHostManager(ApplicationManager):
     if not agent_data.url:
       agent_data.url = url
     self._agents.append(agent_data)
+    # The host agent reads its registry on every model call, so the runner
+    # picks up the new agent without being rebuilt.
     self._host_agent.register_agent_card(agent_data)
-    # Now update the host agent definition
-    self._initialize_host()
 
   @property
   def agents(self) -> list[AgentCard]:
@@ -406,15 +409,48 @@ class ADKHostManager(ApplicationManager):
 
   @property
   def conversations(self) -> list[Conversation]:
-    return self._conversations
+    return self._store.conversations
 
   @property
   def tasks(self) -> list[Task]:
-    return self._tasks
+    return self._store.tasks
 
   @property
   def events(self) -> list[Event]:
-    return sorted(self._events.values(), key=lambda x: x.timestamp)
+    return self._store.events
+
+  def events_since(
+      self, since: int = 0, limit: Optional[int] = None
+  ) -> Tuple[list[Event], int]:
+    return self._store.events_since(since, limit)
+
+  def tasks_since(
+      self, since: int = 0, limit: Optional[int] = None
+  ) -> Tuple[list[Task], int]:
+    return self._store.tasks_since(since, limit)
+
+  def messages_since(
+      self, conversation_id: str, since: int = 0, limit: Optional[int] = None
+  ) -> Tuple[list[Message], int]:
+    return self._store.conversation_messages_since(conversation_id, since, limit)
+
+  def conversation_message_ids(self, conversation_id: str) -> list[str]:
+    return self._store.message_ids(conversation_id)
+
+  @property
+  def notifies_changes(self) -> bool:
+    return True
+
+  def add_change_listener(self, listener) -> bool:
+    self._store.add_listener(listener)
+    return True
+
+  def remove_change_listener(self, listener):
+    self._store.remove_listener(listener)
+
+  @property
+  def versions(self) -> dict[str, int]:
+    return self._store.versions
 
   def adk_content_from_message(self, message: Message) -> types.Content:
     parts: list[types.Part] = []
@@ -1,4 +1,5 @@
 from abc import ABC, abstractmethod
+from typing import Callable, Optional, Tuple
 from common.types import Message, Task, AgentCard
 from service.types import Conversation, Event
 
@@ -44,3 +45,49 @@ class ApplicationManager(ABC):
   def events(self) -> list[Event]:
     pass
 
+
+  # Incremental feeds. Each returns the items recorded after the cursor
+  # `since` and the cursor to pass on the next call. Managers without a
+  # change log return everything with cursor 0.
+
+  def events_since(
+      self, since: int = 0, limit: Optional[int] = None
+  ) -> Tuple[list[Event], int]:
+    return self.events, 0
+
+  def tasks_since(
+      self, since: int = 0, limit: Optional[int] = None
+  ) -> Tuple[list[Task], int]:
+    return self.tasks, 0
+
+  def messages_since(
+      self, conversation_id: str, since: int = 0, limit: Optional[int] = None
+  ) -> Tuple[list[Message], int]:
+    conversation = next(
+        (c for c in self.conversations if c.conversation_id == conversation_id),
+        None)
+    return (conversation.messages if conversation else []), 0
+
+  def conversation_message_ids(self, conversation_id: str) -> list[str]:
+    """Ids of the messages of a conversation, without loading them."""
+    messages, _ = self.messages_since(conversation_id)
+    return [(m.metadata or {}).get('message_id', '') for m in messages]
+
+  # Change notifications, used to push updates to the browsers. Managers
+  # that cannot notify return False and the UI keeps polling.
+
+  @property
+  def notifies_changes(self) -> bool:
+    """Whether add_change_listener is supported."""
+    return False
+
+  def add_change_listener(self, listener: Callable[[int], None]) -> bool:
+    return False
+
+  def remove_change_listener(self, listener: Callable[[int], None]):
+    pass
+
+  @property
+  def versions(self) -> dict[str, int]:
+    """Sequence numbers of the last change of each view, if tracked."""
+    return {}
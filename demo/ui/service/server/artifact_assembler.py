@@ -0,0 +1,251 @@
+import base64
+import binascii
+import threading
+from collections import OrderedDict
+from logging import getLogger
+from typing import Any, Optional, Tuple
+from common.types import Artifact, FileContent, FilePart, Part, TaskState, TextPart
+
+logger = getLogger(__name__)
+
+TERMINAL_STATES = (TaskState.COMPLETED, TaskState.CANCELED, TaskState.FAILED)
+
+# Optional position of a chunk in its artifact, in the artifact metadata.
+# Without it chunks are assumed to arrive in order.
+CHUNK_INDEX_KEY = "chunk_index"
+
+
+class _PendingArtifact:
+  """The chunks received so far for one artifact of one task."""
+
+  def __init__(self):
+    self.header: Optional[Artifact] = None
+    # chunk position -> parts
+    self.chunks: dict[int, list[Part]] = {}
+    self.last: Optional[int] = None
+    # Next position of a chunk that does not carry one; 0 is the first chunk.
+    self.next_position = 1
+    self.size = 0
+
+  def complete(self) -> bool:
+    return (self.header is not None and self.last is not None and
+            len(self.chunks) == self.last + 1)
+
+
+def _part_size(part: Part) -> int:
+  if isinstance(part, TextPart):
+    return len(part.text)
+  if isinstance(part, FilePart):
+    return len(part.file.bytes or part.file.uri or "")
+  return len(str(part.data))
+
+
+class ArtifactAssembler:
+  """Reassembles artifacts streamed in chunks by remote agents.
+
+  Chunks are kept per task and artifact index until the last one arrives.
+  They may arrive out of order or more than once, even after the artifact
+  was completed, when they carry their position in
+  `metadata["chunk_index"]`; otherwise a chunk appended before the first one
+  is kept until the first one arrives. When an artifact is complete, the
+  text of consecutive text parts is joined once and the bytes of consecutive
+  file parts are copied into one buffer of the final size.
+
+  Pending chunks are bounded per task and in total: the artifact going over
+  the task limit is dropped, and the least recently updated artifacts are
+  evicted to stay under the global limit. `discard` frees the chunks of a
+  task that reached a terminal state.
+  """
+
+  def __init__(
+      self,
+      max_task_bytes: int = 64 * 1024 * 1024,
+      max_total_bytes: int = 256 * 1024 * 1024,
+  ):
+    self.max_task_bytes = max_task_bytes
+    self.max_total_bytes = max_total_bytes
+    self._lock = threading.Lock()
+    # (task id, artifact index) -> chunks, least recently updated first.
+    self._pending: OrderedDict[Tuple[str, int], _PendingArtifact] = OrderedDict()
+    # task id -> indexes of its pending artifacts, and their size.
+    self._task_artifacts: dict[str, set[int]] = {}
+    self._task_bytes: dict[str, int] = {}
+    self._total_bytes = 0
+    # Recently completed artifacts, to recognize late duplicate chunks.
+    self._completed: OrderedDict[Tuple[str, int], None] = OrderedDict()
+    self._max_completed = 4096
+    self._counters = {
+        "completed": 0,
+        "duplicates": 0,
+        "out_of_order": 0,
+        "dropped": 0,
+        "evicted": 0,
+        "discarded": 0,
+    }
+
+  def add(self, task_id: str, artifact: Artifact) -> Optional[Artifact]:
+    """Adds a chunk.
+
+    Returns:
+      The whole artifact once its last chunk is in, otherwise None.
+    """
+    first = not artifact.append
+    if first and (artifact.lastChunk is None or artifact.lastChunk):
+      # Not chunked at all.
+      with self._lock:
+        self._counters["completed"] += 1
+      return artifact
+    key = (task_id, artifact.index)
+    with self._lock:
+      if key in self._completed:
+        if self._position(artifact, -1) != -1:
+          self._counters["duplicates"] += 1
+          return None
+        # Chunks without position: a new artifact with the same index.
+        del self._completed[key]
+      pending = self._pending.get(key)
+      if (first and pending is not None and pending.header is not None and
+          self._position(artifact, -1) == -1):
+        # A first chunk without position: the agent started over.
+        self._remove(key)
+        self._counters["dropped"] += 1
+        pending = None
+      if pending is None:
+        pending = self._pending[key] = _PendingArtifact()
+        self._task_artifacts.setdefault(task_id, set()).add(artifact.index)
+        self._task_bytes.setdefault(task_id, 0)
+      self._pending.move_to_end(key)
+      position = self._position(artifact, 0 if first else pending.next_position)
+      if position in pending.chunks:
+        self._counters["duplicates"] += 1
+        return None
+      if first:
+        pending.header = artifact
+      else:
+        if pending.header is None or position < max(pending.chunks, default=0):
+          self._counters["out_of_order"] += 1
+        pending.next_position = max(pending.next_position, position + 1)
+      if artifact.lastChunk:
+        pending.last = position
+      size = sum(map(_part_size, artifact.parts))
+      pending.chunks[position] = artifact.parts
+      pending.size += size
+      self._charge(task_id, size)
+      if self._task_bytes.get(task_id, 0) > self.max_task_bytes:
+        logger.warning(
+            "Dropping artifact %s of task %s: over %d bytes",
+            artifact.index, task_id, self.max_task_bytes)
+        self._remove(key)
+        self._counters["dropped"] += 1
+        return None
+      while self._total_bytes > self.max_total_bytes:
+        oldest = next(iter(self._pending))
+        logger.warning("Evicting artifact %s of task %s", oldest[1], oldest[0])
+        self._remove(oldest)
+        self._counters["evicted"] += 1
+        if oldest == key:
+          return None
+      if not pending.complete():
+        return None
+      self._remove(key)
+      self._counters["completed"] += 1
+      self._completed[key] = None
+      if len(self._completed) > self._max_completed:
+        self._completed.popitem(last=False)
+    return _assemble(pending)
+
+  def discard(self, task_id: str) -> int:
+    """Frees the chunks of a task, e.g. once it reached a terminal state.
+
+    Returns:
+      The number of incomplete artifacts dropped.
+    """
+    with self._lock:
+      keys = [(task_id, i) for i in self._task_artifacts.get(task_id, ())]
+      for key in keys:
+        self._remove(key)
+      self._counters["discarded"] += len(keys)
+      return len(keys)
+
+  def _position(self, artifact: Artifact, default: int) -> int:
+    if artifact.metadata and isinstance(
+        artifact.metadata.get(CHUNK_INDEX_KEY), int):
+      return artifact.metadata[CHUNK_INDEX_KEY]
+    return default
+
+  def _charge(self, task_id: str, size: int):
+    self._task_bytes[task_id] = self._task_bytes.get(task_id, 0) + size
+    self._total_bytes += size
+
+  def _remove(self, key: Tuple[str, int]):
+    pending = self._pending.pop(key)
+    task_id = key[0]
+    self._task_bytes[task_id] -= pending.size
+    self._task_artifacts[task_id].discard(key[1])
+    if not self._task_artifacts[task_id]:
+      del self._task_artifacts[task_id]
+      del self._task_bytes[task_id]
+    self._total_bytes -= pending.size
+
+  def metrics(self) -> dict[str, Any]:
+    with self._lock:
+      return {
+          **self._counters,
+          "pending_artifacts": len(self._pending),
+          "pending_tasks": len(self._task_artifacts),
+          "pending_bytes": self._total_bytes,
+      }
+
+
+def _assemble(pending: _PendingArtifact) -> Artifact:
+  parts: list[Part] = []
+  run: list[Part] = []
+
+  def flush():
+    if len(run) == 1:
+      parts.append(run[0])
+    elif run and isinstance(run[0], TextPart):
+      parts.append(TextPart(
+          text="".join(p.text for p in run), metadata=run[0].metadata))
+    elif run:
+      parts.append(_join_files(run))
+    run.clear()
+
+  for position in range(pending.last + 1):
+    for part in pending.chunks[position]:
+      if run and not _joinable(run[-1], part):
+        flush()
+      run.append(part)
+  flush()
+  return pending.header.model_copy(update={
+      "parts": parts, "append": None, "lastChunk": None})
+
+
+def _joinable(previous: Part, part: Part) -> bool:
+  if isinstance(previous, TextPart) and isinstance(part, TextPart):
+    return True
+  return (isinstance(previous, FilePart) and isinstance(part, FilePart) and
+          bool(previous.file.bytes) and bool(part.file.bytes) and
+          previous.file.mimeType == part.file.mimeType)
+
+
+def _join_files(run: list[FilePart]) -> FilePart:
+  try:
+    chunks = [base64.b64decode(p.file.bytes, validate=True) for p in run]
+  except (binascii.Error, ValueError):
+    # Not base64 after all: the chunks are plain text.
+    chunks = [p.file.bytes.encode("utf-8") for p in run]
+  buffer = bytearray(sum(map(len, chunks)))
+  view = memoryview(buffer)
+  offset = 0
+  for chunk in chunks:
+    view[offset:offset + len(chunk)] = chunk
+    offset += len(chunk)
+  return FilePart(
+      file=FileContent(
+          name=run[0].file.name,
+          mimeType=run[0].file.mimeType,
+          bytes=base64.b64encode(buffer).decode("ascii"),
+      ),
+      metadata=run[0].metadata,
+  )
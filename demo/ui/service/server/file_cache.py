@@ -0,0 +1,308 @@
+import base64
+import binascii
+import contextlib
+import dataclasses
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from logging import getLogger
+from typing import Iterator, Optional
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+from common.types import FilePart
+
+logger = getLogger(__name__)
+
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+# Types shown in the browser; anything else is downloaded, so that an agent
+# cannot run script on the UI's origin (SVG is an image that can).
+_INLINE_MIME_TYPES = re.compile(r"^(image/(png|jpeg|gif|webp|bmp)|application/pdf)$")
+
+
+@dataclasses.dataclass
+class CachedFile:
+  file_id: str
+  mime_type: str
+  size: int
+  # Exactly one of data and path is set.
+  data: Optional[bytes] = None
+  path: Optional[str] = None
+  # Set while the data is written to the spill directory.
+  spilling: bool = False
+  # The message parts served by this file.
+  keys: set[str] = dataclasses.field(default_factory=set)
+
+  @property
+  def etag(self) -> str:
+    return f'"{self.file_id}"'
+
+
+class FileCache:
+  """Size-capped cache of the files attached to or generated in messages.
+
+  Files are base64-decoded once when added and identified by the hash of
+  their content, so the same file attached twice is stored once and its url
+  stays the same if it is evicted and added again. The least recently used
+  files are moved from memory to `spill_dir` above `max_memory_bytes`, and
+  dropped altogether above `max_bytes`. Spill files are written and removed
+  outside the lock.
+  """
+
+  def __init__(
+      self,
+      max_bytes: int = 1024 * 1024 * 1024,
+      max_memory_bytes: int = 64 * 1024 * 1024,
+      spill_dir: Optional[str] = None,
+      chunk_size: int = 64 * 1024,
+  ):
+    self.max_bytes = max_bytes
+    self.max_memory_bytes = max_memory_bytes
+    self.chunk_size = chunk_size
+    self._spill_dir = spill_dir
+    self._owns_spill_dir = spill_dir is None
+    self._spill_dir_lock = threading.Lock()
+    self._lock = threading.Lock()
+    # file id -> file, least recently used first.
+    self._files: OrderedDict[str, CachedFile] = OrderedDict()
+    # message part key -> file id
+    self._keys: dict[str, str] = {}
+    self.memory_bytes = 0
+    self.disk_bytes = 0
+    self.evictions = 0
+
+  def __len__(self) -> int:
+    return len(self._files)
+
+  def __contains__(self, file_id: str) -> bool:
+    return file_id in self._files
+
+  def file_id(self, key: str) -> Optional[str]:
+    """The id of the file cached for a message part, if still cached."""
+    with self._lock:
+      return self._keys.get(key)
+
+  def put(self, key: str, part: FilePart) -> Optional[str]:
+    """Caches the content of a message part.
+
+    Args:
+      key: Identifies the message part, e.g. "<message id>:<part index>".
+      part: The file part; parts referring to a uri hold no content.
+
+    Returns:
+      The id to fetch the file with, or None if the part has no content.
+    """
+    with self._lock:
+      file_id = self._keys.get(key)
+      if file_id is not None:
+        self._files.move_to_end(file_id)
+        return file_id
+    if not part.file.bytes:
+      return None
+    try:
+      # FileContent.bytes is base64 by contract.
+      data = base64.b64decode(part.file.bytes, validate=True)
+    except (binascii.Error, ValueError) as e:
+      logger.warning("File part %s is not base64, not cached: %s", key, e)
+      return None
+    file_id = hashlib.sha256(data).hexdigest()[:32]
+    to_spill, to_remove = [], []
+    with self._lock:
+      cached = self._files.get(file_id)
+      if cached is None:
+        cached = CachedFile(
+            file_id=file_id,
+            mime_type=part.file.mimeType or "application/octet-stream",
+            size=len(data),
+            data=data,
+        )
+        self._files[file_id] = cached
+        self.memory_bytes += cached.size
+        to_spill, to_remove = self._shrink()
+      else:
+        self._files.move_to_end(file_id)
+      if file_id in self._files:
+        cached.keys.add(key)
+        self._keys[key] = file_id
+    self._remove(to_remove)
+    for spilled in to_spill:
+      self._spill(spilled)
+    return file_id
+
+  def get(self, file_id: str) -> Optional[CachedFile]:
+    with self._lock:
+      cached = self._files.get(file_id)
+      if cached is not None:
+        self._files.move_to_end(file_id)
+      return cached
+
+  def _shrink(self) -> tuple[list[CachedFile], list[str]]:
+    """Evicts above max_bytes and picks the files to spill; holds the lock.
+
+    Returns the files to spill and the spill files to remove, for the
+    caller to handle once the lock is released.
+    """
+    to_remove = []
+    for file_id in list(self._files):
+      if self.memory_bytes + self.disk_bytes <= self.max_bytes:
+        break
+      path = self._evict(self._files[file_id])
+      if path:
+        to_remove.append(path)
+    to_spill = []
+    # Files being spilled still count as memory until they are on disk.
+    memory_bytes = self.memory_bytes - sum(
+        c.size for c in self._files.values() if c.spilling)
+    for cached in list(self._files.values()):
+      if memory_bytes <= self.max_memory_bytes:
+        break
+      if cached.data is not None and not cached.spilling:
+        cached.spilling = True
+        memory_bytes -= cached.size
+        to_spill.append(cached)
+    return to_spill, to_remove
+
+  def _evict(self, cached: CachedFile) -> Optional[str]:
+    """Drops a file; holds the lock. Returns the spill file to remove."""
+    del self._files[cached.file_id]
+    for key in cached.keys:
+      self._keys.pop(key, None)
+    self.evictions += 1
+    if cached.data is not None:
+      self.memory_bytes -= cached.size
+      return None
+    self.disk_bytes -= cached.size
+    return cached.path
+
+  def _remove(self, paths: list[str]):
+    for path in paths:
+      # Responses in progress keep their open file.
+      with contextlib.suppress(OSError):
+        os.remove(path)
+
+  def _spill(self, cached: CachedFile):
+    """Moves a file picked by _shrink to disk; called without the lock."""
+    path = None
+    try:
+      with self._spill_dir_lock:
+        if self._spill_dir is None:
+          self._spill_dir = tempfile.mkdtemp(prefix="a2a-files-")
+        os.makedirs(self._spill_dir, exist_ok=True)
+        spill_dir = self._spill_dir
+      fd, path = tempfile.mkstemp(dir=spill_dir, prefix=f"{cached.file_id}.")
+      with os.fdopen(fd, "wb") as f:
+        f.write(cached.data)
+    except OSError as e:
+      logger.warning("Could not spill file %s: %s", cached.file_id, e)
+      with self._lock:
+        cached.spilling = False
+        if self._files.get(cached.file_id) is cached:
+          self._evict(cached)
+      self._remove([path] if path else [])
+      return
+    with self._lock:
+      cached.spilling = False
+      if self._files.get(cached.file_id) is cached:
+        cached.path, cached.data = path, None
+        self.memory_bytes -= cached.size
+        self.disk_bytes += cached.size
+        path = None
+    # Evicted while it was written.
+    self._remove([path] if path else [])
+
+  def clear(self):
+    with self._lock:
+      to_remove = [self._evict(c) for c in list(self._files.values())]
+    self._remove([path for path in to_remove if path])
+    with self._spill_dir_lock:
+      if self._owns_spill_dir and self._spill_dir:
+        shutil.rmtree(self._spill_dir, ignore_errors=True)
+        self._spill_dir = None
+
+  def metrics(self) -> dict[str, int]:
+    with self._lock:
+      return {
+          "files": len(self._files),
+          "memory_bytes": self.memory_bytes,
+          "disk_bytes": self.disk_bytes,
+          "evictions": self.evictions,
+      }
+
+  def response(self, file_id: str, request: Request) -> Response:
+    """Serves a cached file, honouring If-None-Match and single byte ranges."""
+    cached = self.get(file_id)
+    if cached is None:
+      return Response(status_code=404)
+    headers = {
+        "ETag": cached.etag,
+        "Accept-Ranges": "bytes",
+        # A file id always refers to the same content.
+        "Cache-Control": "private, max-age=86400, immutable",
+        "X-Content-Type-Options": "nosniff",
+        "Content-Disposition": (
+            "inline" if _INLINE_MIME_TYPES.match(cached.mime_type.lower())
+            else f'attachment; filename="{cached.file_id}"'),
+    }
+    if_none_match = request.headers.get("if-none-match", "")
+    if cached.etag in [t.strip() for t in if_none_match.split(",")] or if_none_match == "*":
+      return Response(status_code=304, headers=headers)
+    start, end = 0, cached.size - 1
+    status_code = 200
+    byte_range = request.headers.get("range")
+    if byte_range and request.headers.get("if-range", cached.etag) == cached.etag:
+      parsed = _parse_range(byte_range, cached.size)
+      if parsed is None:
+        headers["Content-Range"] = f"bytes */{cached.size}"
+        return Response(status_code=416, headers=headers)
+      start, end = parsed
+      status_code = 206
+      headers["Content-Range"] = f"bytes {start}-{end}/{cached.size}"
+    headers["Content-Length"] = str(end - start + 1)
+    if cached.data is not None:
+      return Response(
+          content=cached.data[start:end + 1],
+          status_code=status_code,
+          media_type=cached.mime_type,
+          headers=headers)
+    try:
+      # Opened now, so that an eviction before streaming does not matter.
+      f = open(cached.path, "rb")
+    except OSError:
+      return Response(status_code=404)
+    return StreamingResponse(
+        self._read(f, start, end - start + 1),
+        status_code=status_code,
+        media_type=cached.mime_type,
+        headers=headers)
+
+  def _read(self, f, start: int, length: int) -> Iterator[bytes]:
+    with f:
+      f.seek(start)
+      while length > 0:
+        chunk = f.read(min(self.chunk_size, length))
+        if not chunk:
+          break
+        length -= len(chunk)
+        yield chunk
+
+
+def _parse_range(value: str, size: int) -> Optional[tuple[int, int]]:
+  """Parses a single `bytes=` range into inclusive offsets."""
+  match = _RANGE.match(value.strip())
+  if not match or size == 0:
+    return None
+  first, last = match.groups()
+  if not first:
+    if not last:
+      return None
+    # A suffix range: the last bytes of the file.
+    return max(0, size - int(last)), size - 1
+  start = int(first)
+  end = min(int(last), size - 1) if last else size - 1
+  if start > end:
+    return None
+  return start, end
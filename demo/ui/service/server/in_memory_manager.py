@@ -15,6 +15,7 @@ from common.types import (
 )
 from utils.agent_card import get_agent_card
 from service.server.application_manager import ApplicationManager
+from service.server.state_store import StateStore
 from service.server import test_image
 
 class InMemoryFakeAgentManager(ApplicationManager):
@@ -24,20 +25,14 @@ class InMemoryFakeAgentManager(ApplicationManager):
   the AgentServer. This acts as the service contract that the Mesop app
   uses to send messages to the agent and provide information for the frontend.
   """
-  _conversations: list[Conversation]
-  _messages: list[Message]
-  _tasks: list[Task]
-  _events: list[Event]
-  _pending_message_ids: list[str]
+  _store: StateStore
   _next_message_idx: int
   _agents: list[AgentCard]
 
   def __init__(self):
-    self._conversations = []
-    self._messages = []
-    self._tasks = []
-    self._events = []
-    self._pending_message_ids = []
+    # Same indexed state and feeds as ADKHostManager, so that the UI and
+    # load tests exercise the same server paths.
+    self._store = StateStore()
     self._next_message_idx = 0
     self._agents = []
     self._task_map = {}
@@ -45,7 +40,7 @@ class InMemoryFakeAgentManager(ApplicationManager):
   def create_conversation(self) -> Conversation:
     conversation_id = str(uuid.uuid4())
     c = Conversation(conversation_id=conversation_id, is_active=True)
-    self._conversations.append(c)
+    self._store.add_conversation(c)
     return c
 
   def sanitize_message(self, message: Message) -> Message:
@@ -55,9 +50,9 @@ class InMemoryFakeAgentManager(ApplicationManager):
     return message
 
   async def process_message(self, message: Message):
-    self._messages.append(message)
+    self._store.add_message(message)
     message_id = message.metadata['message_id']
-    self._pending_message_ids.append(message_id)
+    self._store.add_pending_message(message_id)
     conversation_id = (
         message.metadata['conversation_id']
         if 'conversation_id' in message.metadata
@@ -66,8 +61,8 @@ class InMemoryFakeAgentManager(ApplicationManager):
     # Now check the conversation and attach the message id.
     conversation = self.get_conversation(conversation_id)
     if conversation:
-      conversation.messages.append(message)
-    self._events.append(Event(
+      self._store.add_conversation_message(conversation, message)
+    self.add_event(Event(
         id=str(uuid.uuid4()),
         actor="host",
         content=message,
@@ -90,17 +85,19 @@ class InMemoryFakeAgentManager(ApplicationManager):
       self._task_map[message_id] = task_id
       self.add_task(task)
     await asyncio.sleep(self._next_message_idx)
-    response = self.next_message()
+    # The canned responses are shared, so each response gets its own copy.
+    response = self.next_message().model_copy()
     response.metadata = {**message.metadata, **{'message_id': str(uuid.uuid4())}}
+    self._store.add_message(response)
     if conversation:
-      conversation.messages.append(response)
-    self._events.append(Event(
+      self._store.add_conversation_message(conversation, response)
+    self.add_event(Event(
         id=str(uuid.uuid4()),
         actor="host",
         content=response,
         timestamp=datetime.datetime.utcnow().timestamp(),
     ))
-    self._pending_message_ids.remove(message.metadata['message_id'])
+    self._store.remove_pending_message(message.metadata['message_id'])
     # Now clean up the task
     if task:
       task.status.state = TaskState.COMPLETED
@@ -109,16 +106,13 @@ class InMemoryFakeAgentManager(ApplicationManager):
       self.update_task(task)
 
   def add_task(self, task: Task):
-    self._tasks.append(task)
+    self._store.add_task(task)
 
   def update_task(self, task: Task):
-    for i, t in enumerate(self._tasks):
-      if t.id == task.id:
-        self._tasks[i] = task
-        return
+    self._store.update_task(task)
 
   def add_event(self, event: Event):
-    self._events.append(event)
+    self._store.add_event(event)
 
   def next_message(self) -> Message:
     message = _message_queue[self._next_message_idx]
@@ -129,18 +123,13 @@ class InMemoryFakeAgentManager(ApplicationManager):
       self,
       conversation_id: Optional[str]
   ) -> Optional[Conversation]:
-    if not conversation_id:
-      return None
-    return next(
-        filter(lambda c: c.conversation_id == conversation_id,
-               self._conversations), None)
+    return self._store.get_conversation(conversation_id)
 
   def get_pending_messages(self) -> list[Tuple[str,str]]:
     rval = []
-    for message_id in self._pending_message_ids:
+    for message_id in self._store.pending_message_ids:
       if message_id in self._task_map:
-        task_id = self._task_map[message_id]
-        task = next(filter(lambda x: x.id == task_id, self._tasks), None)
+        task = self._store.get_task(self._task_map[message_id])
         if not task:
           rval.append((message_id, ""))
         elif task.history and task.history[-1].parts:
@@ -153,8 +142,7 @@ class InMemoryFakeAgentManager(ApplicationManager):
                 part.text if part.type == "text" else "Working..."))
       else:
         rval.append((message_id, ""))
-      return rval
-    return self._pending_message_ids
+    return rval
 
   def register_agent(self, url):
     agent_data = get_agent_card(url)
@@ -168,15 +156,48 @@ class InMemoryFakeAgentManager(ApplicationManager):
 
   @property
   def conversations(self) -> list[Conversation]:
-    return self._conversations
+    return self._store.conversations
 
   @property
   def tasks(self) -> list[Task]:
-    return self._tasks
+    return self._store.tasks
 
   @property
   def events(self) -> list[Event]:
-    return self._events
+    return self._store.events
+
+  def events_since(
+      self, since: int = 0, limit: Optional[int] = None
+  ) -> Tuple[list[Event], int]:
+    return self._store.events_since(since, limit)
+
+  def tasks_since(
+      self, since: int = 0, limit: Optional[int] = None
+  ) -> Tuple[list[Task], int]:
+    return self._store.tasks_since(since, limit)
+
+  def messages_since(
+      self, conversation_id: str, since: int = 0, limit: Optional[int] = None
+  ) -> Tuple[list[Message], int]:
+    return self._store.conversation_messages_since(conversation_id, since, limit)
+
+  def conversation_message_ids(self, conversation_id: str) -> list[str]:
+    return self._store.message_ids(conversation_id)
+
+  @property
+  def notifies_changes(self) -> bool:
+    return True
+
+  def add_change_listener(self, listener) -> bool:
+    self._store.add_listener(listener)
+    return True
+
+  def remove_change_listener(self, listener):
+    self._store.remove_listener(listener)
+
+  @property
+  def versions(self) -> dict[str, int]:
+    return self._store.versions
 
 # This represents the precanned responses that will be returned in order.
 # Extend this list to test more functionality of the UI
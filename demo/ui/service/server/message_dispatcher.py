@@ -0,0 +1,193 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from logging import getLogger
+from typing import Any, Awaitable, Callable
+
+logger = getLogger(__name__)
+
+
+class DispatcherFullError(Exception):
+  """Raised when the dispatcher already holds max_pending messages."""
+
+
+class LatencyStats:
+  """Count, mean, max and recent percentiles of a duration in seconds."""
+
+  def __init__(self, window: int = 1024):
+    self._lock = threading.Lock()
+    self._recent: deque[float] = deque(maxlen=window)
+    self.count = 0
+    self.total = 0.0
+    self.max = 0.0
+
+  def observe(self, seconds: float):
+    with self._lock:
+      self.count += 1
+      self.total += seconds
+      self.max = max(self.max, seconds)
+      self._recent.append(seconds)
+
+  def snapshot(self) -> dict[str, float]:
+    with self._lock:
+      recent = sorted(self._recent)
+      count, total, maximum = self.count, self.total, self.max
+
+    def percentile(p: float) -> float:
+      if not recent:
+        return 0.0
+      return recent[min(len(recent) - 1, int(p * len(recent)))]
+
+    return {
+        "count": count,
+        "mean": total / count if count else 0.0,
+        "p50": percentile(0.5),
+        "p95": percentile(0.95),
+        "max": maximum,
+    }
+
+
+class MessageDispatcher:
+  """Runs message handlers on one long-lived event loop thread.
+
+  Messages sharing a key (the conversation id) are handled one at a time in
+  submission order, different keys run concurrently up to max_concurrency,
+  and at most max_pending messages may be queued or running at once, beyond
+  which submit raises DispatcherFullError so the caller can push back.
+  """
+
+  def __init__(
+      self,
+      handler: Callable[[Any], Awaitable[Any]],
+      max_pending: int = 256,
+      max_concurrency: int = 8,
+      name: str = "message-dispatcher",
+  ):
+    self._handler = handler
+    self.max_pending = max_pending
+    self.max_concurrency = max_concurrency
+    self.name = name
+    self._lock = threading.Lock()
+    self._loop: asyncio.AbstractEventLoop | None = None
+    self._thread: threading.Thread | None = None
+    self._semaphore: asyncio.Semaphore | None = None
+    # Only touched on the dispatcher loop: key -> (submitted at, message).
+    self._queues: dict[str, deque[tuple[float, Any]]] = {}
+    self._drains: set[asyncio.Task] = set()
+    self._pending = 0
+    self.submitted = 0
+    self.rejected = 0
+    self.completed = 0
+    self.failed = 0
+    self.queue_wait = LatencyStats()
+    self.processing = LatencyStats()
+
+  @property
+  def loop(self) -> asyncio.AbstractEventLoop:
+    """The dispatcher loop, started on first use."""
+    self.start()
+    return self._loop
+
+  @property
+  def pending(self) -> int:
+    with self._lock:
+      return self._pending
+
+  def start(self):
+    with self._lock:
+      if self._thread is not None and self._thread.is_alive():
+        return
+      loop = asyncio.new_event_loop()
+      ready = threading.Event()
+
+      def run():
+        asyncio.set_event_loop(loop)
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        loop.call_soon(ready.set)
+        try:
+          loop.run_forever()
+        finally:
+          for task in asyncio.all_tasks(loop):
+            task.cancel()
+          loop.run_until_complete(asyncio.sleep(0))
+          loop.close()
+
+      self._loop = loop
+      self._thread = threading.Thread(target=run, name=self.name, daemon=True)
+      self._thread.start()
+    ready.wait()
+
+  def stop(self, timeout: float | None = 5.0):
+    with self._lock:
+      loop, thread = self._loop, self._thread
+      self._thread = None
+    if thread is None:
+      return
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(timeout)
+
+  def submit(self, key: str, message: Any):
+    """Queues a message behind the earlier messages of the same key.
+
+    Raises:
+      DispatcherFullError: max_pending messages are already queued or running.
+    """
+    loop = self.loop
+    with self._lock:
+      if self._pending >= self.max_pending:
+        self.rejected += 1
+        raise DispatcherFullError(
+            f"{self._pending} messages are already pending")
+      self._pending += 1
+      self.submitted += 1
+    loop.call_soon_threadsafe(self._enqueue, key, message, time.monotonic())
+
+  def _enqueue(self, key: str, message: Any, submitted_at: float):
+    queue = self._queues.get(key)
+    if queue is not None:
+      # A drain task is running for this key and will pick the message up.
+      queue.append((submitted_at, message))
+      return
+    self._queues[key] = deque([(submitted_at, message)])
+    task = self._loop.create_task(self._drain(key))
+    self._drains.add(task)
+    task.add_done_callback(self._drains.discard)
+
+  async def _drain(self, key: str):
+    queue = self._queues[key]
+    try:
+      while queue:
+        submitted_at, message = queue[0]
+        async with self._semaphore:
+          started = time.monotonic()
+          self.queue_wait.observe(started - submitted_at)
+          try:
+            await self._handler(message)
+            self.completed += 1
+          except Exception:
+            self.failed += 1
+            logger.exception(f"Failed to process message for {key}")
+          finally:
+            self.processing.observe(time.monotonic() - started)
+            queue.popleft()
+            with self._lock:
+              self._pending -= 1
+    finally:
+      # Nothing is awaited between the last check and here, so no message
+      # can have been enqueued for this key in between.
+      del self._queues[key]
+
+  def metrics(self) -> dict[str, Any]:
+    return {
+        "pending": self.pending,
+        "max_pending": self.max_pending,
+        "max_concurrency": self.max_concurrency,
+        "active_conversations": len(self._queues),
+        "submitted": self.submitted,
+        "rejected": self.rejected,
+        "completed": self.completed,
+        "failed": self.failed,
+        "queue_wait_seconds": self.queue_wait.snapshot(),
+        "processing_seconds": self.processing.snapshot(),
+    }
@@ -1,15 +1,17 @@
-import asyncio
-import base64
-import threading
 import os
-import uuid
-from typing import Any
+import threading
+from collections import OrderedDict
+from typing import Any, Tuple
 from fastapi import APIRouter
 from fastapi import Request, Response
-from common.types import Message, Task, FilePart, FileContent
+from fastapi.responses import JSONResponse
+from common.types import Message, Task, FilePart, FileContent, Part
 from .in_memory_manager import InMemoryFakeAgentManager
 from .application_manager import ApplicationManager
 from .adk_host_manager import ADKHostManager, get_message_id
+from .file_cache import FileCache
+from .message_dispatcher import DispatcherFullError, MessageDispatcher
+from .state_stream import StateStreamer, build_snapshot
 from service.types import (
     Conversation,
     Event,
@@ -22,7 +24,12 @@ from service.types import (
     ListTaskResponse,
     RegisterAgentResponse,
     ListAgentResponse,
-    GetEventResponse
+    GetEventResponse,
+    ServerBusyError,
+    FeedParams,
+    ListMessageParams,
+    StateSnapshotParams,
+    StateSnapshotResponse,
 )
 
 class ConversationServer:
@@ -43,8 +50,26 @@ class ConversationServer:
       self.manager = ADKHostManager(api_key=api_key, uses_vertex_ai=uses_vertex_ai)
     else:
       self.manager = InMemoryFakeAgentManager()
-    self._file_cache = {} # dict[str, FilePart] maps file id to message data
-    self._message_to_cache = {} # dict[str, str] maps message id to cache id
+    # All messages are processed on one background loop instead of a thread
+    # and loop per message, so the manager state is only mutated from there.
+    self._dispatcher = MessageDispatcher(
+        self.manager.process_message,
+        max_pending=int(os.environ.get("A2A_MAX_PENDING_MESSAGES", "256")),
+        max_concurrency=int(os.environ.get("A2A_MESSAGE_WORKERS", "8")),
+    )
+    self._streamer = StateStreamer(
+        self.manager, self.cache_content, self.cache_task_content)
+    self._file_cache = FileCache(
+        max_bytes=int(os.environ.get("A2A_FILE_CACHE_BYTES", 1024 * 1024 * 1024)),
+        max_memory_bytes=int(
+            os.environ.get("A2A_FILE_CACHE_MEMORY_BYTES", 64 * 1024 * 1024)),
+        spill_dir=os.environ.get("A2A_FILE_CACHE_DIR") or None,
+    )
+    # message id -> (parts, view with file urls, file ids), see cache_content.
+    self._content_memo: OrderedDict[
+        str, Tuple[Tuple[Any, ...], Message, list[str]]] = OrderedDict()
+    self._content_memo_size = 4096
+    self._content_lock = threading.Lock()
 
     router.add_api_route(
         "/conversation/create",
@@ -82,6 +107,10 @@ class ConversationServer:
         "/agent/list",
         self._list_agents,
         methods=["POST"])
+    router.add_api_route(
+        "/message/file/metrics",
+        self._file_metrics,
+        methods=["GET"])
     router.add_api_route(
         "/message/file/{file_id}",
         self._files,
@@ -90,6 +119,51 @@ class ConversationServer:
         "/api_key/update",
         self._update_api_key,
         methods=["POST"])
+    router.add_api_route(
+        "/state/stream",
+        self._streamer.stream,
+        methods=["GET"])
+    router.add_api_route(
+        "/state/snapshot",
+        self._state_snapshot,
+        methods=["POST"])
+    router.add_api_route(
+        "/message/metrics",
+        self._message_metrics,
+        methods=["GET"])
+    router.add_api_route(
+        "/task/artifact/metrics",
+        self._artifact_metrics,
+        methods=["GET"])
+    router.add_api_route(
+        "/task/notify",
+        self._task_notification,
+        methods=["POST"])
+    router.add_api_route(
+        "/task/notify",
+        self._task_notification_validation,
+        methods=["GET"])
+
+  def _artifact_metrics(self):
+    assembler = getattr(self.manager, "artifact_assembler", None)
+    if assembler is None:
+      return Response(status_code=404)
+    return assembler.metrics()
+
+  def _notification_hub(self):
+    return getattr(self.manager, "push_notification_hub", None)
+
+  async def _task_notification(self, request: Request):
+    hub = self._notification_hub()
+    if hub is None:
+      return Response(status_code=404)
+    return await hub.handle_notification(request)
+
+  async def _task_notification_validation(self, request: Request):
+    hub = self._notification_hub()
+    if hub is None:
+      return Response(status_code=404)
+    return await hub.handle_validation_check(request)
 
   # Update API key in manager
   def update_api_key(self, api_key: str):
@@ -104,64 +178,153 @@ class ConversationServer:
     message_data = await request.json()
     message = Message(**message_data['params'])
     message = self.manager.sanitize_message(message)
-    t = threading.Thread(target=lambda: asyncio.run(self.manager.process_message(message)))
-    t.start()
+    message_id = message.metadata['message_id']
+    conversation_id = message.metadata['conversation_id'] if 'conversation_id' in message.metadata else ''
+    try:
+      # Messages of one conversation are processed in order.
+      self._dispatcher.submit(conversation_id or message_id, message)
+    except DispatcherFullError as e:
+      response = SendMessageResponse(
+          id=message_data.get('id'), error=ServerBusyError(data=str(e)))
+      return JSONResponse(
+          status_code=429,
+          content=response.model_dump(),
+          headers={"Retry-After": "1"})
     return SendMessageResponse(result=MessageInfo(
-        message_id=message.metadata['message_id'],
-        conversation_id=message.metadata['conversation_id'] if 'conversation_id' in message.metadata else '',
+        message_id=message_id,
+        conversation_id=conversation_id,
     ))
 
+  def _message_metrics(self):
+    return self._dispatcher.metrics()
+
   async def _list_messages(self, request: Request):
     message_data = await request.json()
-    conversation_id = message_data['params']
-    conversation = self.manager.get_conversation(conversation_id)
-    if conversation:
-      return ListMessageResponse(result=self.cache_content(
-          conversation.messages))
-    return ListMessageResponse(result=[])
-
-  def cache_content(self, messages: list[Message]):
+    params = message_data['params']
+    if isinstance(params, str):
+      params = ListMessageParams(conversation_id=params)
+    else:
+      params = ListMessageParams(**params)
+    messages, next_since = self.manager.messages_since(
+        params.conversation_id, params.since, params.limit)
+    return ListMessageResponse(
+        result=self.cache_content(messages), next_since=next_since)
+
+  def cache_content(self, messages: list[Message]) -> list[Message]:
+    """Views of the messages with file contents replaced by urls.
+
+    The messages are left untouched. Views are memoized per message id and
+    parts, so only new or changed messages are transformed.
+    """
     rval = []
     for m in messages:
       message_id = get_message_id(m)
       if not message_id:
         rval.append(m)
         continue
-      new_parts = []
-      for i, part in enumerate(m.parts):
-        if part.type != 'file':
-          new_parts.append(part)
-          continue
-        message_part_id = f"{message_id}:{i}"
-        if message_part_id in self._message_to_cache:
-          cache_id = self._message_to_cache[message_part_id]
-        else:
-          cache_id = str(uuid.uuid4())
-          self._message_to_cache[message_part_id] = cache_id
-        # Replace the part data with a url reference
-        new_parts.append(FilePart(
-            file=FileContent(
-                mimeType=part.file.mimeType,
-                uri=f"/message/file/{cache_id}",
-            )
-        ))
-        if cache_id not in self._file_cache:
-          self._file_cache[cache_id] = part
-      m.parts = new_parts
-      rval.append(m)
+      # The parts themselves are kept, so identity comparisons stay valid.
+      version = tuple(m.parts)
+      with self._content_lock:
+        memo = self._content_memo.get(message_id)
+        if memo is not None:
+          self._content_memo.move_to_end(message_id)
+      if (memo is not None and len(memo[0]) == len(version) and
+          all(a is b for a, b in zip(memo[0], version)) and
+          all(f in self._file_cache for f in memo[2])):
+        rval.append(memo[1])
+        continue
+      new_parts, file_ids = self._replace_files(message_id, m.parts)
+      view = m.model_copy(update={'parts': new_parts}) if file_ids else m
+      with self._content_lock:
+        self._content_memo[message_id] = (version, view, file_ids)
+        if len(self._content_memo) > self._content_memo_size:
+          self._content_memo.popitem(last=False)
+      rval.append(view)
+    return rval
+
+  def cache_task_content(self, tasks: list[Task]) -> list[Task]:
+    """Views of the tasks with file contents replaced by urls, like messages."""
+    rval = []
+    for t in tasks:
+      update = {}
+      if t.status.message:
+        message = self.cache_content([t.status.message])[0]
+        if message is not t.status.message:
+          update['status'] = t.status.model_copy(update={'message': message})
+      if t.history:
+        history = self.cache_content(t.history)
+        if any(a is not b for a, b in zip(history, t.history)):
+          update['history'] = history
+      if t.artifacts:
+        artifacts = []
+        for i, a in enumerate(t.artifacts):
+          parts, file_ids = self._replace_files(f"{t.id}:artifact:{i}", a.parts)
+          artifacts.append(a.model_copy(update={'parts': parts}) if file_ids else a)
+        if any(a is not b for a, b in zip(artifacts, t.artifacts)):
+          update['artifacts'] = artifacts
+      rval.append(t.model_copy(update=update) if update else t)
     return rval
 
+  def _replace_files(self, key: str, parts: list[Part]) -> Tuple[list[Part], list[str]]:
+    new_parts = []
+    file_ids = []
+    for i, part in enumerate(parts):
+      if part.type != 'file':
+        new_parts.append(part)
+        continue
+      cache_id = self._file_cache.put(f"{key}:{i}", part)
+      if cache_id is None:
+        # Already a reference, or content that is not base64.
+        new_parts.append(part)
+        continue
+      file_ids.append(cache_id)
+      # Replace the part data with a url reference
+      new_parts.append(FilePart(
+          file=FileContent(
+              mimeType=part.file.mimeType,
+              uri=f"/message/file/{cache_id}",
+          )
+      ))
+    return new_parts, file_ids
+
   async def _pending_messages(self):
     return PendingMessageResponse(result=self.manager.get_pending_messages())
 
   def _list_conversation(self):
-    return ListConversationResponse(result=self.manager.conversations)
+    # Only the conversation list: the SQLite store may have evicted the
+    # messages of any conversation, and they are read through the state
+    # snapshot, which loads them.
+    return ListConversationResponse(result=[
+        c.model_copy(update={'messages': []})
+        for c in self.manager.conversations
+    ])
 
-  def _get_events(self):
-    return GetEventResponse(result=self.manager.events)
+  async def _feed_params(self, request: Request) -> FeedParams:
+    try:
+      message_data = await request.json()
+    except ValueError:
+      return FeedParams()
+    params = message_data.get('params') if isinstance(message_data, dict) else None
+    return FeedParams(**params) if params else FeedParams()
 
-  def _list_tasks(self):
-    return ListTaskResponse(result=self.manager.tasks)
+  async def _get_events(self, request: Request):
+    params = await self._feed_params(request)
+    events, next_since = self.manager.events_since(params.since, params.limit)
+    return GetEventResponse(result=events, next_since=next_since)
+
+  async def _list_tasks(self, request: Request):
+    params = await self._feed_params(request)
+    tasks, next_since = self.manager.tasks_since(params.since, params.limit)
+    return ListTaskResponse(
+        result=self.cache_task_content(tasks), next_since=next_since)
+
+  async def _state_snapshot(self, request: Request):
+    message_data = await request.json()
+    params = StateSnapshotParams(**(message_data.get('params') or {}))
+    return StateSnapshotResponse(
+        id=message_data.get('id'),
+        result=build_snapshot(
+            self.manager, params, self.cache_content, self.cache_task_content))
 
   async def _register_agent(self, request: Request):
     message_data = await request.json()
@@ -172,15 +335,11 @@ class ConversationServer:
   async def _list_agents(self):
     return ListAgentResponse(result=self.manager.agents)
 
-  def _files(self, file_id):
-    if file_id not in self._file_cache:
-      raise Exception("file not found")
-    part = self._file_cache[file_id]
-    if "image" in part.file.mimeType:
-      return Response(
-          content=base64.b64decode(part.file.bytes),
-          media_type=part.file.mimeType)
-    return Response(content=part.file.bytes, media_type=part.file.mimeType)
+  def _files(self, file_id: str, request: Request):
+    return self._file_cache.response(file_id, request)
+
+  def _file_metrics(self):
+    return self._file_cache.metrics()
 
   async def _update_api_key(self, request: Request):
     """Update the API key"""
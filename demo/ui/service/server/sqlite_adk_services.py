@@ -0,0 +1,323 @@
+import json
+import time
+import uuid
+from typing import Any, Optional
+from google.adk.artifacts.base_artifact_service import BaseArtifactService
+from google.adk.events.event import Event
+from google.adk.sessions.base_session_service import (
+    BaseSessionService,
+    GetSessionConfig,
+    ListSessionsResponse,
+)
+from google.adk.sessions.session import Session
+from google.adk.sessions.state import State
+from google.genai import types
+from .sqlite_database import SQLiteDatabase
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS adk_sessions (
+  app_name TEXT NOT NULL,
+  user_id TEXT NOT NULL,
+  id TEXT NOT NULL,
+  state TEXT NOT NULL,
+  last_update_time REAL NOT NULL,
+  PRIMARY KEY (app_name, user_id, id)
+);
+CREATE TABLE IF NOT EXISTS adk_events (
+  seq INTEGER PRIMARY KEY AUTOINCREMENT,
+  id TEXT NOT NULL,
+  app_name TEXT NOT NULL,
+  user_id TEXT NOT NULL,
+  session_id TEXT NOT NULL,
+  timestamp REAL NOT NULL,
+  body TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS adk_events_by_session
+  ON adk_events (app_name, user_id, session_id, timestamp);
+CREATE TABLE IF NOT EXISTS adk_app_states (
+  app_name TEXT PRIMARY KEY,
+  state TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS adk_user_states (
+  app_name TEXT NOT NULL,
+  user_id TEXT NOT NULL,
+  state TEXT NOT NULL,
+  PRIMARY KEY (app_name, user_id)
+);
+CREATE TABLE IF NOT EXISTS adk_artifacts (
+  app_name TEXT NOT NULL,
+  user_id TEXT NOT NULL,
+  session_id TEXT NOT NULL,
+  filename TEXT NOT NULL,
+  version INTEGER NOT NULL,
+  mime_type TEXT,
+  data BLOB,
+  text TEXT,
+  PRIMARY KEY (app_name, user_id, session_id, filename, version)
+);
+"""
+
+_UPSERT_SESSION = """
+INSERT INTO adk_sessions (app_name, user_id, id, state, last_update_time)
+VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (app_name, user_id, id) DO UPDATE SET
+  state = excluded.state, last_update_time = excluded.last_update_time
+"""
+
+
+class SQLiteSessionService(BaseSessionService):
+  """ADK session service keeping sessions and their events in SQLite.
+
+  Events are appended through the write-behind batches of the database.
+  App and user state are kept in their own tables and merged into the
+  session state with their prefixes, as InMemorySessionService does.
+  """
+
+  def __init__(self, db: SQLiteDatabase):
+    self._db = db
+    db.executescript(SCHEMA)
+    # Caches of the app and user state, written through.
+    self._app_states: dict[str, dict[str, Any]] = {}
+    self._user_states: dict[tuple[str, str], dict[str, Any]] = {}
+
+  def _app_state(self, app_name: str) -> dict[str, Any]:
+    if app_name not in self._app_states:
+      rows = self._db.query(
+          "SELECT state FROM adk_app_states WHERE app_name = ?", (app_name,))
+      self._app_states[app_name] = json.loads(rows[0][0]) if rows else {}
+    return self._app_states[app_name]
+
+  def _user_state(self, app_name: str, user_id: str) -> dict[str, Any]:
+    key = (app_name, user_id)
+    if key not in self._user_states:
+      rows = self._db.query(
+          "SELECT state FROM adk_user_states WHERE app_name = ? AND user_id = ?",
+          key)
+      self._user_states[key] = json.loads(rows[0][0]) if rows else {}
+    return self._user_states[key]
+
+  def _update_state(self, session: Session, delta: dict[str, Any]):
+    """Applies a state delta to the session and to the app and user state."""
+    app_changed = user_changed = False
+    for key, value in delta.items():
+      if key.startswith(State.TEMP_PREFIX):
+        continue
+      session.state[key] = value
+      if key.startswith(State.APP_PREFIX):
+        self._app_state(session.app_name)[key[len(State.APP_PREFIX):]] = value
+        app_changed = True
+      elif key.startswith(State.USER_PREFIX):
+        self._user_state(session.app_name, session.user_id)[
+            key[len(State.USER_PREFIX):]] = value
+        user_changed = True
+    if app_changed:
+      self._db.write(
+          "INSERT OR REPLACE INTO adk_app_states (app_name, state) VALUES (?, ?)",
+          (session.app_name, json.dumps(self._app_state(session.app_name))))
+    if user_changed:
+      self._db.write(
+          "INSERT OR REPLACE INTO adk_user_states (app_name, user_id, state) "
+          "VALUES (?, ?, ?)",
+          (session.app_name, session.user_id,
+           json.dumps(self._user_state(session.app_name, session.user_id))))
+
+  def _session_state(self, session: Session) -> str:
+    """The state stored with the session, without app and user keys."""
+    return json.dumps({
+        k: v for k, v in session.state.items()
+        if not k.startswith((State.APP_PREFIX, State.USER_PREFIX))
+    })
+
+  def _merge_state(self, session: Session):
+    for key, value in self._app_state(session.app_name).items():
+      session.state[State.APP_PREFIX + key] = value
+    for key, value in self._user_state(session.app_name, session.user_id).items():
+      session.state[State.USER_PREFIX + key] = value
+
+  def create_session(
+      self,
+      *,
+      app_name: str,
+      user_id: str,
+      state: Optional[dict[str, Any]] = None,
+      session_id: Optional[str] = None,
+  ) -> Session:
+    session = Session(
+        id=session_id.strip() if session_id else str(uuid.uuid4()),
+        app_name=app_name,
+        user_id=user_id,
+        state={},
+        last_update_time=time.time(),
+    )
+    self._update_state(session, state or {})
+    self._db.write(_UPSERT_SESSION, (
+        app_name, user_id, session.id, self._session_state(session),
+        session.last_update_time))
+    self._merge_state(session)
+    return session
+
+  def get_session(
+      self,
+      *,
+      app_name: str,
+      user_id: str,
+      session_id: str,
+      config: Optional[GetSessionConfig] = None,
+  ) -> Optional[Session]:
+    self._db.flush()
+    rows = self._db.query(
+        "SELECT state, last_update_time FROM adk_sessions "
+        "WHERE app_name = ? AND user_id = ? AND id = ?",
+        (app_name, user_id, session_id))
+    if not rows:
+      return None
+    state, last_update_time = rows[0]
+    sql = ("SELECT body FROM adk_events "
+           "WHERE app_name = ? AND user_id = ? AND session_id = ?")
+    params: list[Any] = [app_name, user_id, session_id]
+    if config and config.after_timestamp:
+      sql += " AND timestamp > ?"
+      params.append(config.after_timestamp)
+    if config and config.num_recent_events:
+      sql += " ORDER BY seq DESC LIMIT ?"
+      params.append(config.num_recent_events)
+      bodies = reversed(self._db.query(sql, params))
+    else:
+      bodies = self._db.query(sql + " ORDER BY seq", params)
+    session = Session(
+        id=session_id,
+        app_name=app_name,
+        user_id=user_id,
+        state=json.loads(state),
+        events=[Event.model_validate_json(body) for (body,) in bodies],
+        last_update_time=last_update_time,
+    )
+    self._merge_state(session)
+    return session
+
+  def list_sessions(self, *, app_name: str, user_id: str) -> ListSessionsResponse:
+    self._db.flush()
+    rows = self._db.query(
+        "SELECT id, last_update_time FROM adk_sessions "
+        "WHERE app_name = ? AND user_id = ? ORDER BY last_update_time",
+        (app_name, user_id))
+    return ListSessionsResponse(sessions=[
+        Session(id=sid, app_name=app_name, user_id=user_id, state={},
+                last_update_time=last_update_time)
+        for sid, last_update_time in rows
+    ])
+
+  def delete_session(self, *, app_name: str, user_id: str, session_id: str) -> None:
+    key = (app_name, user_id, session_id)
+    self._db.write(
+        "DELETE FROM adk_events WHERE app_name = ? AND user_id = ? AND session_id = ?",
+        key)
+    self._db.write(
+        "DELETE FROM adk_sessions WHERE app_name = ? AND user_id = ? AND id = ?",
+        key)
+
+  def append_event(self, session: Session, event: Event) -> Event:
+    if event.partial:
+      return event
+    if event.actions and event.actions.state_delta:
+      self._update_state(session, event.actions.state_delta)
+    session.events.append(event)
+    session.last_update_time = event.timestamp
+    self._db.write(
+        "INSERT INTO adk_events (id, app_name, user_id, session_id, timestamp, body) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        (event.id, session.app_name, session.user_id, session.id,
+         event.timestamp, event.model_dump_json(exclude_none=True)))
+    self._db.write(_UPSERT_SESSION, (
+        session.app_name, session.user_id, session.id,
+        self._session_state(session), session.last_update_time))
+    return event
+
+
+class SQLiteArtifactService(BaseArtifactService):
+  """ADK artifact service keeping every artifact version in SQLite.
+
+  Files whose name starts with "user:" are shared by all the sessions of a
+  user, as in InMemoryArtifactService.
+  """
+
+  def __init__(self, db: SQLiteDatabase):
+    self._db = db
+    db.executescript(SCHEMA)
+
+  def _session(self, session_id: str, filename: str) -> str:
+    return "" if filename.startswith("user:") else session_id
+
+  def save_artifact(
+      self,
+      *,
+      app_name: str,
+      user_id: str,
+      session_id: str,
+      filename: str,
+      artifact: types.Part,
+  ) -> int:
+    session_id = self._session(session_id, filename)
+    versions = self.list_versions(
+        app_name=app_name, user_id=user_id, session_id=session_id,
+        filename=filename)
+    version = versions[-1] + 1 if versions else 0
+    data = artifact.inline_data
+    # Written at once: versions are numbered from what is in the table.
+    self._db.execute(
+        "INSERT INTO adk_artifacts (app_name, user_id, session_id, filename, "
+        "version, mime_type, data, text) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (app_name, user_id, session_id, filename, version,
+         data.mime_type if data else None, data.data if data else None,
+         artifact.text))
+    return version
+
+  def load_artifact(
+      self,
+      *,
+      app_name: str,
+      user_id: str,
+      session_id: str,
+      filename: str,
+      version: Optional[int] = None,
+  ) -> Optional[types.Part]:
+    sql = ("SELECT mime_type, data, text FROM adk_artifacts WHERE app_name = ? "
+           "AND user_id = ? AND session_id = ? AND filename = ?")
+    params: list[Any] = [
+        app_name, user_id, self._session(session_id, filename), filename]
+    if version is not None:
+      sql += " AND version = ?"
+      params.append(version)
+    rows = self._db.query(sql + " ORDER BY version DESC LIMIT 1", params)
+    if not rows:
+      return None
+    mime_type, data, text = rows[0]
+    if data is not None:
+      return types.Part.from_bytes(data=data, mime_type=mime_type)
+    return types.Part(text=text)
+
+  def list_artifact_keys(
+      self, *, app_name: str, user_id: str, session_id: str
+  ) -> list[str]:
+    rows = self._db.query(
+        "SELECT DISTINCT filename FROM adk_artifacts WHERE app_name = ? "
+        "AND user_id = ? AND session_id IN (?, '') ORDER BY filename",
+        (app_name, user_id, session_id))
+    return [filename for (filename,) in rows]
+
+  def delete_artifact(
+      self, *, app_name: str, user_id: str, session_id: str, filename: str
+  ) -> None:
+    self._db.execute(
+        "DELETE FROM adk_artifacts WHERE app_name = ? AND user_id = ? "
+        "AND session_id = ? AND filename = ?",
+        (app_name, user_id, self._session(session_id, filename), filename))
+
+  def list_versions(
+      self, *, app_name: str, user_id: str, session_id: str, filename: str
+  ) -> list[int]:
+    rows = self._db.query(
+        "SELECT version FROM adk_artifacts WHERE app_name = ? AND user_id = ? "
+        "AND session_id = ? AND filename = ? ORDER BY version",
+        (app_name, user_id, self._session(session_id, filename), filename))
+    return [version for (version,) in rows]
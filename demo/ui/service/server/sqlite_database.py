@@ -0,0 +1,128 @@
+import atexit
+import sqlite3
+import threading
+from logging import getLogger
+from typing import Any, Callable, Iterable, Sequence, Tuple
+
+logger = getLogger(__name__)
+
+# A statement and the rows to execute it with.
+Write = Tuple[str, Sequence[Sequence[Any]]]
+
+
+class SQLiteDatabase:
+  """A SQLite file shared by the persistent stores of the UI host.
+
+  Writes are batched behind the callers: `write` only queues a statement,
+  and a background thread commits everything queued every `flush_interval`
+  seconds, or as soon as `max_batch` statements are waiting, in a single
+  transaction. Stores that rewrite the same row often (e.g. a task on every
+  status update) register a `source` instead, which is asked for its
+  pending rows at flush time so that only the last version is written.
+
+  Reads see their own writes only after `flush`, which stores call before
+  reading rows they may have queued.
+  """
+
+  def __init__(
+      self,
+      path: str,
+      flush_interval: float = 0.05,
+      max_batch: int = 1000,
+  ):
+    self.path = path
+    self.flush_interval = flush_interval
+    self.max_batch = max_batch
+    self._connection = sqlite3.connect(
+        path, check_same_thread=False, isolation_level=None)
+    self._connection.execute("PRAGMA journal_mode=WAL")
+    self._connection.execute("PRAGMA synchronous=NORMAL")
+    # Guards the connection, used by the writer thread and by readers.
+    self._lock = threading.RLock()
+    self._queue_lock = threading.Condition()
+    self._queue: list[Write] = []
+    self._sources: list[Callable[[], list[Write]]] = []
+    self._closed = False
+    self.batches = 0
+    self.statements = 0
+    self._writer = threading.Thread(
+        target=self._run, name="sqlite-write-behind", daemon=True)
+    self._writer.start()
+    atexit.register(self.close)
+
+  def executescript(self, script: str):
+    with self._lock:
+      self._connection.executescript(script)
+
+  def query(self, sql: str, params: Sequence[Any] = ()) -> list[Tuple]:
+    with self._lock:
+      return self._connection.execute(sql, params).fetchall()
+
+  def execute(self, sql: str, params: Sequence[Any] = ()):
+    """Runs a statement at once, after the queued writes."""
+    with self._lock:
+      self.flush()
+      self._connection.execute(sql, params)
+
+  def write(self, sql: str, *rows: Sequence[Any]):
+    """Queues a statement, executed once per row."""
+    with self._queue_lock:
+      self._queue.append((sql, rows))
+      if len(self._queue) >= self.max_batch:
+        self._queue_lock.notify()
+
+  def add_source(self, source: Callable[[], list[Write]]):
+    """Registers a function returning the writes to add to each batch."""
+    self._sources.append(source)
+
+  def flush(self):
+    """Commits everything queued so far."""
+    with self._lock:
+      with self._queue_lock:
+        queue, self._queue = self._queue, []
+      for source in self._sources:
+        queue.extend(source())
+      if not queue:
+        return
+      self._commit(queue)
+
+  def _commit(self, queue: Iterable[Write]):
+    connection = self._connection
+    connection.execute("BEGIN")
+    try:
+      for sql, rows in queue:
+        if len(rows) == 1:
+          connection.execute(sql, rows[0])
+        else:
+          connection.executemany(sql, rows)
+        self.statements += len(rows)
+      connection.execute("COMMIT")
+      self.batches += 1
+    except Exception:
+      connection.execute("ROLLBACK")
+      raise
+
+  def _run(self):
+    while True:
+      with self._queue_lock:
+        if not self._closed:
+          self._queue_lock.wait(self.flush_interval)
+        if self._closed:
+          return
+      try:
+        self.flush()
+      except Exception as e:
+        # The rows are lost, but later batches may still succeed.
+        logger.exception("Write-behind batch failed: %s", e)
+
+  def close(self):
+    with self._queue_lock:
+      if self._closed:
+        return
+      self._closed = True
+      self._queue_lock.notify()
+    self._writer.join()
+    with self._lock:
+      self.flush()
+      self._connection.close()
+    atexit.unregister(self.close)
@@ -0,0 +1,355 @@
+import itertools
+from collections import OrderedDict
+from typing import Optional, Tuple
+from common.types import Message, Task
+from service.types import Conversation, Event
+from .sqlite_database import SQLiteDatabase, Write
+from .state_store import StateStore, _message_id
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+  id TEXT PRIMARY KEY,
+  name TEXT NOT NULL DEFAULT '',
+  is_active INTEGER NOT NULL DEFAULT 1,
+  position INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS messages (
+  id TEXT PRIMARY KEY,
+  conversation_id TEXT,
+  position INTEGER,
+  body TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_by_conversation
+  ON messages (conversation_id, position, id);
+CREATE TABLE IF NOT EXISTS tasks (
+  id TEXT PRIMARY KEY,
+  conversation_id TEXT,
+  position INTEGER NOT NULL,
+  body TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tasks_by_conversation ON tasks (conversation_id);
+CREATE TABLE IF NOT EXISTS events (
+  id TEXT PRIMARY KEY,
+  conversation_id TEXT,
+  timestamp REAL NOT NULL,
+  body TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_by_timestamp ON events (timestamp);
+CREATE INDEX IF NOT EXISTS events_by_conversation ON events (conversation_id, timestamp);
+"""
+
+_UPSERT_CONVERSATION = """
+INSERT INTO conversations (id, name, is_active, position) VALUES (?, ?, ?, ?)
+ON CONFLICT (id) DO UPDATE SET name = excluded.name, is_active = excluded.is_active
+"""
+_UPSERT_MESSAGE = """
+INSERT INTO messages (id, body) VALUES (?, ?)
+ON CONFLICT (id) DO UPDATE SET body = excluded.body
+"""
+_UPSERT_CONVERSATION_MESSAGE = """
+INSERT INTO messages (id, conversation_id, position, body) VALUES (?, ?, ?, ?)
+ON CONFLICT (id) DO UPDATE SET conversation_id = excluded.conversation_id,
+  position = excluded.position, body = excluded.body
+"""
+_UPSERT_TASK = """
+INSERT INTO tasks (id, conversation_id, position, body) VALUES (?, ?, ?, ?)
+ON CONFLICT (id) DO UPDATE SET conversation_id = excluded.conversation_id,
+  body = excluded.body
+"""
+_UPSERT_EVENT = """
+INSERT INTO events (id, conversation_id, timestamp, body) VALUES (?, ?, ?, ?)
+ON CONFLICT (id) DO UPDATE SET timestamp = excluded.timestamp, body = excluded.body
+"""
+
+
+def _conversation_id(item: Task | Event | Message | None) -> Optional[str]:
+  metadata = getattr(item, 'metadata', None)
+  if metadata and 'conversation_id' in metadata:
+    return metadata['conversation_id']
+  content = getattr(item, 'content', None)
+  if content is not None:
+    return _conversation_id(content)
+  return getattr(item, 'sessionId', None)
+
+
+class SQLiteStateStore(StateStore):
+  """StateStore persisted to SQLite, so conversations survive a restart.
+
+  The in-memory indexes of StateStore still serve every read; SQLite keeps
+  the history. Writes go through the write-behind batches of the database,
+  and a task updated many times between two batches is written once.
+
+  On start only the conversation list, the message ids of each
+  conversation, the latest `max_tasks` tasks and the latest `max_events`
+  events are loaded. The messages of a conversation are loaded when it is
+  first read, and only the `max_loaded_conversations` most recently read
+  conversations keep theirs in memory. Only the `max_tasks` most recently
+  changed tasks stay in memory; `get_task` reads an older one back from the
+  database. Older events and messages are read by page from the database
+  with `events_page` and `get_message`.
+  """
+
+  def __init__(
+      self,
+      db: SQLiteDatabase,
+      max_loaded_conversations: int = 64,
+      max_events: int = 10000,
+      max_cached_messages: int = 10000,
+      max_tasks: int = 10000,
+  ):
+    super().__init__()
+    self._db = db
+    self.max_loaded_conversations = max_loaded_conversations
+    self.max_events = max_events
+    self.max_cached_messages = max_cached_messages
+    self.max_tasks = max_tasks
+    # conversation id -> ids of its messages, whether loaded or not.
+    self._message_ids: dict[str, list[str]] = {}
+    # Conversations whose messages are in memory, least recently read first.
+    self._loaded: OrderedDict[str, None] = OrderedDict()
+    self._dirty_tasks: dict[str, Task] = {}
+    # task id -> its row position, which outlives the in-memory list order.
+    self._task_db_positions: dict[str, int] = {}
+    self._next_task_position = 0
+    self._loading = False
+    db.executescript(SCHEMA)
+    db.add_source(self._task_writes)
+    self._load()
+
+  def _load(self):
+    self._loading = True
+    try:
+      for cid, name, is_active in self._db.query(
+          "SELECT id, name, is_active FROM conversations ORDER BY position"):
+        super().add_conversation(Conversation(
+            conversation_id=cid, name=name, is_active=bool(is_active)))
+        self._message_ids[cid] = []
+      # Served from the index alone, without reading the message bodies.
+      for cid, message_id in self._db.query(
+          "SELECT conversation_id, id FROM messages "
+          "WHERE conversation_id IS NOT NULL ORDER BY conversation_id, position"):
+        if cid in self._message_ids:
+          self._message_ids[cid].append(message_id)
+      rows = self._db.query(
+          "SELECT position, body FROM tasks ORDER BY position DESC LIMIT ?",
+          (self.max_tasks,))
+      self._next_task_position = rows[0][0] + 1 if rows else 0
+      for position, body in reversed(rows):
+        task = Task.model_validate_json(body)
+        self._task_db_positions[task.id] = position
+        super().add_task(task)
+      for event in reversed(self.events_page(limit=self.max_events)):
+        super().add_event(event)
+    finally:
+      self._loading = False
+
+  # Conversations
+
+  def add_conversation(self, conversation: Conversation):
+    if conversation.conversation_id in self._conversations:
+      return
+    self._message_ids[conversation.conversation_id] = [
+        _message_id(m) or '' for m in conversation.messages]
+    self._loaded[conversation.conversation_id] = None
+    super().add_conversation(conversation)
+    self._db.write(_UPSERT_CONVERSATION, (
+        conversation.conversation_id, conversation.name,
+        int(conversation.is_active), len(self._conversation_list)))
+    self._evict_conversations()
+
+  def get_conversation(self, conversation_id: Optional[str]) -> Optional[Conversation]:
+    conversation = super().get_conversation(conversation_id)
+    if conversation is not None:
+      self._ensure_loaded(conversation)
+    return conversation
+
+  def message_ids(self, conversation_id: str) -> list[str]:
+    return list(self._message_ids.get(conversation_id, ()))
+
+  def add_conversation_message(self, conversation: Conversation, message: Message):
+    self._ensure_loaded(conversation)
+    super().add_conversation_message(conversation, message)
+    ids = self._message_ids.setdefault(conversation.conversation_id, [])
+    message_id = _message_id(message) or f"{conversation.conversation_id}:{len(ids)}"
+    self._db.write(_UPSERT_CONVERSATION_MESSAGE, (
+        message_id, conversation.conversation_id, len(ids),
+        message.model_dump_json(exclude_none=True)))
+    ids.append(message_id)
+
+  def conversation_messages_since(
+      self,
+      conversation_id: str,
+      since: int = 0,
+      limit: Optional[int] = None,
+  ) -> Tuple[list[Message], int]:
+    conversation = self._conversations.get(conversation_id)
+    if conversation is not None:
+      self._ensure_loaded(conversation)
+    return super().conversation_messages_since(conversation_id, since, limit)
+
+  def _ensure_loaded(self, conversation: Conversation):
+    cid = conversation.conversation_id
+    with self._lock:
+      if cid in self._loaded:
+        self._loaded.move_to_end(cid)
+        return
+    # The database is not used under the store lock: its writer thread
+    # takes the store lock to serialize tasks.
+    self._db.flush()
+    messages = [
+        Message.model_validate_json(body) for (body,) in self._db.query(
+            "SELECT body FROM messages WHERE conversation_id = ? ORDER BY position",
+            (cid,))
+    ]
+    with self._lock:
+      if cid in self._loaded:
+        return
+      conversation.messages = messages
+      # Fresh sequence numbers: readers that had them before the eviction
+      # get them again, and merge them by id.
+      self._conversation_logs[cid] = [(self._next_seq(), m) for m in messages]
+      self._loaded[cid] = None
+    self._evict_conversations()
+
+  def _evict_conversations(self):
+    with self._lock:
+      while len(self._loaded) > self.max_loaded_conversations:
+        cid, _ = self._loaded.popitem(last=False)
+        self._conversations[cid].messages = []
+        self._conversation_logs.pop(cid, None)
+
+  # Messages
+
+  def add_message(self, message: Message):
+    super().add_message(message)
+    message_id = _message_id(message)
+    if message_id:
+      self._db.write(_UPSERT_MESSAGE, (
+          message_id, message.model_dump_json(exclude_none=True)))
+    while len(self._messages) > self.max_cached_messages:
+      self._messages.pop(next(iter(self._messages)))
+
+  def get_message(self, message_id: str) -> Optional[Message]:
+    message = super().get_message(message_id)
+    if message is not None:
+      return message
+    self._db.flush()
+    rows = self._db.query("SELECT body FROM messages WHERE id = ?", (message_id,))
+    return Message.model_validate_json(rows[0][0]) if rows else None
+
+  # Tasks
+
+  def has_task(self, task_id: str) -> bool:
+    return super().has_task(task_id) or self.get_task(task_id) is not None
+
+  def get_task(self, task_id: Optional[str]) -> Optional[Task]:
+    task = super().get_task(task_id)
+    if task is not None or not task_id:
+      return task
+    # Evicted from memory: read it back, so that its updates are kept.
+    self._db.flush()
+    rows = self._db.query(
+        "SELECT position, body FROM tasks WHERE id = ?", (task_id,))
+    if not rows:
+      return None
+    position, body = rows[0]
+    task = Task.model_validate_json(body)
+    with self._lock:
+      self._task_db_positions[task.id] = position
+    super().add_task(task)
+    self._trim_tasks()
+    return task
+
+  def add_task(self, task: Task):
+    with self._lock:
+      if task.id not in self._task_db_positions:
+        self._task_db_positions[task.id] = self._next_task_position
+        self._next_task_position += 1
+    super().add_task(task)
+    if not self._loading:
+      with self._lock:
+        self._dirty_tasks[task.id] = task
+    if len(self._task_list) > self.max_tasks * 5 // 4:
+      self._trim_tasks()
+
+  def update_task(self, task: Task):
+    super().update_task(task)
+    with self._lock:
+      if task.id in self._tasks and not self._loading:
+        self._dirty_tasks[task.id] = task
+
+  def _trim_tasks(self):
+    with self._lock:
+      excess = len(self._task_list) - self.max_tasks
+      if excess <= 0:
+        return
+      # The least recently changed tasks go first.
+      dropped = set(itertools.islice(self._task_changes, excess))
+      for task_id in dropped:
+        del self._tasks[task_id]
+        del self._task_changes[task_id]
+        self._task_message_ids.pop(task_id, None)
+        if task_id not in self._dirty_tasks:
+          self._task_db_positions.pop(task_id, None)
+      self._task_list = [t for t in self._task_list if t.id not in dropped]
+      self._task_positions = {t.id: i for i, t in enumerate(self._task_list)}
+
+  def _task_writes(self) -> list[Write]:
+    with self._lock:
+      if not self._dirty_tasks:
+        return []
+      tasks, self._dirty_tasks = self._dirty_tasks, {}
+      rows = [
+          (t.id, _conversation_id(t), self._task_db_positions[t.id],
+           t.model_dump_json(exclude_none=True))
+          for t in tasks.values()
+      ]
+      for task_id in tasks:
+        if task_id not in self._tasks:
+          self._task_db_positions.pop(task_id, None)
+    return [(_UPSERT_TASK, rows)]
+
+  # Events
+
+  def add_event(self, event: Event):
+    super().add_event(event)
+    if self._loading:
+      return
+    self._db.write(_UPSERT_EVENT, (
+        event.id, _conversation_id(event), event.timestamp,
+        event.model_dump_json(exclude_none=True)))
+    if len(self._event_list) > self.max_events * 5 // 4:
+      self._trim_events()
+
+  def _trim_events(self):
+    with self._lock:
+      dropped = self._event_list[:len(self._event_list) - self.max_events]
+      del self._event_list[:len(dropped)]
+      del self._event_keys[:len(dropped)]
+      for event in dropped:
+        self._events.pop(event.id, None)
+      self._event_log = [
+          (seq, e) for seq, e in self._event_log if e.id in self._events]
+
+  def events_page(
+      self,
+      before: Optional[float] = None,
+      limit: int = 100,
+      conversation_id: Optional[str] = None,
+  ) -> list[Event]:
+    """Events older than the timestamp `before`, most recent first."""
+    self._db.flush()
+    clauses, params = [], []
+    if before is not None:
+      clauses.append("timestamp < ?")
+      params.append(before)
+    if conversation_id is not None:
+      clauses.append("conversation_id = ?")
+      params.append(conversation_id)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    params.append(limit)
+    return [
+        Event.model_validate_json(body) for (body,) in self._db.query(
+            f"SELECT body FROM events {where} ORDER BY timestamp DESC LIMIT ?",
+            params)
+    ]
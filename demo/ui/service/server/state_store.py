@@ -0,0 +1,313 @@
+import bisect
+import contextlib
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple, TypeVar
+from common.types import Message, Task
+from service.types import Conversation, Event
+
+T = TypeVar('T')
+
+
+def _message_id(m: Message | None) -> str | None:
+  if not m or not m.metadata or 'message_id' not in m.metadata:
+    return None
+  return m.metadata['message_id']
+
+
+class StateStore:
+  """Indexed in-memory state of a host manager.
+
+  Conversations, tasks and messages are kept in dicts keyed by id, the
+  message ids already in each task history are kept in a set, and the
+  list views handed to the UI are maintained incrementally, so every
+  callback costs O(1) whatever the number of tasks.
+
+  Every change is also stamped with a sequence number, so that readers can
+  ask for what changed after the last number they saw (`*_since`) and pay
+  for the new data only. Listeners are called after every change, from
+  the thread that made it.
+  """
+
+  def __init__(self):
+    # Writers run on the message processing loop while readers serve HTTP
+    # requests, so a sequence number and its entry are published together.
+    self._lock = threading.RLock()
+    self._listeners: tuple[Callable[[int], None], ...] = ()
+    self._seq = 0
+    # Sequence numbers of the last change of the small, fully re-sent views.
+    self._conversations_seq = 0
+    self._pending_seq = 0
+    self._conversations: dict[str, Conversation] = {}
+    self._conversation_list: list[Conversation] = []
+    # conversation id -> (seq, message) in the order they were appended.
+    self._conversation_logs: dict[str, list[Tuple[int, Message]]] = {}
+    self._tasks: dict[str, Task] = {}
+    self._task_list: list[Task] = []
+    self._task_positions: dict[str, int] = {}
+    self._task_message_ids: dict[str, set[str]] = {}
+    # task id -> seq of its last change, oldest change first.
+    self._task_changes: OrderedDict[str, int] = OrderedDict()
+    self._messages: dict[str, Message] = {}
+    self._events: dict[str, Event] = {}
+    # Events sorted by timestamp, with their sort keys alongside for bisect.
+    self._event_list: list[Event] = []
+    self._event_keys: list[float] = []
+    self._event_log: list[Tuple[int, Event]] = []
+    # Ordered set of the messages still being processed.
+    self._pending_message_ids: dict[str, None] = {}
+
+  @property
+  def seq(self) -> int:
+    """The sequence number of the latest change."""
+    return self._seq
+
+  def _next_seq(self) -> int:
+    self._seq += 1
+    return self._seq
+
+  @property
+  def versions(self) -> dict[str, int]:
+    """Change detection for the views that have no feed."""
+    return {
+        'seq': self._seq,
+        'conversations': self._conversations_seq,
+        'pending': self._pending_seq,
+    }
+
+  def add_listener(self, listener: Callable[[int], None]):
+    with self._lock:
+      self._listeners = self._listeners + (listener,)
+
+  def remove_listener(self, listener: Callable[[int], None]):
+    with self._lock:
+      self._listeners = tuple(l for l in self._listeners if l is not listener)
+
+  @contextlib.contextmanager
+  def _changing(self):
+    with self._lock:
+      yield
+      seq = self._seq
+    for listener in self._listeners:
+      listener(seq)
+
+  def _after(
+      self,
+      log: list[Tuple[int, T]],
+      since: int,
+      limit: Optional[int],
+      head: int,
+  ) -> Tuple[list[T], int]:
+    if since > head:
+      # The cursor comes from before a restart: start over.
+      since = 0
+    start = bisect.bisect_right(log, since, key=lambda entry: entry[0])
+    entries = log[start:] if limit is None else log[start:start + limit]
+    if limit is not None and start + limit < len(log):
+      return [item for _, item in entries], entries[-1][0]
+    return [item for _, item in entries], max(head, since)
+
+  # Conversations
+
+  def add_conversation(self, conversation: Conversation):
+    with self._changing():
+      if conversation.conversation_id in self._conversations:
+        return
+      self._conversations[conversation.conversation_id] = conversation
+      self._conversation_list.append(conversation)
+      self._conversations_seq = self._next_seq()
+
+  def get_conversation(self, conversation_id: Optional[str]) -> Optional[Conversation]:
+    if not conversation_id:
+      return None
+    return self._conversations.get(conversation_id)
+
+  @property
+  def conversations(self) -> list[Conversation]:
+    return self._conversation_list
+
+  def add_conversation_message(self, conversation: Conversation, message: Message):
+    with self._changing():
+      conversation.messages.append(message)
+      seq = self._next_seq()
+      self._conversation_logs.setdefault(conversation.conversation_id, []).append(
+          (seq, message))
+      self._conversations_seq = seq
+
+  def message_ids(self, conversation_id: str) -> list[str]:
+    conversation = self._conversations.get(conversation_id)
+    if conversation is None:
+      return []
+    return [_message_id(m) or '' for m in conversation.messages]
+
+  def conversation_messages_since(
+      self,
+      conversation_id: str,
+      since: int = 0,
+      limit: Optional[int] = None,
+  ) -> Tuple[list[Message], int]:
+    """Messages appended to a conversation after the cursor `since`.
+
+    Returns:
+      The messages, oldest first, and the cursor to pass next time.
+    """
+    with self._lock:
+      return self._after(
+          self._conversation_logs.get(conversation_id, []), since, limit,
+          self._seq)
+
+  # Messages
+
+  def add_message(self, message: Message):
+    self._messages[_message_id(message) or str(uuid.uuid4())] = message
+
+  def get_message(self, message_id: str) -> Optional[Message]:
+    return self._messages.get(message_id)
+
+  @property
+  def messages(self) -> list[Message]:
+    return list(self._messages.values())
+
+  def add_pending_message(self, message_id: str):
+    with self._changing():
+      self._pending_message_ids[message_id] = None
+      self._pending_seq = self._next_seq()
+
+  def remove_pending_message(self, message_id: str):
+    with self._changing():
+      self._pending_message_ids.pop(message_id, None)
+      self._pending_seq = self._next_seq()
+
+  @property
+  def pending_message_ids(self) -> list[str]:
+    return list(self._pending_message_ids)
+
+  # Tasks
+
+  def has_task(self, task_id: str) -> bool:
+    return task_id in self._tasks
+
+  def get_task(self, task_id: Optional[str]) -> Optional[Task]:
+    if not task_id:
+      return None
+    return self._tasks.get(task_id)
+
+  def add_task(self, task: Task):
+    with self._changing():
+      if task.id in self._tasks:
+        self.update_task(task)
+        return
+      self._tasks[task.id] = task
+      self._task_positions[task.id] = len(self._task_list)
+      self._task_list.append(task)
+      self._index_history(task)
+      self._task_changes[task.id] = self._next_seq()
+
+  def update_task(self, task: Task):
+    """Replaces the stored task with the same id, if any."""
+    with self._changing():
+      position = self._task_positions.get(task.id)
+      if position is None:
+        return
+      previous = self._tasks[task.id]
+      self._tasks[task.id] = task
+      self._task_list[position] = task
+      if previous is not task or len(task.history or []) != len(
+          self._task_message_ids[task.id]):
+        self._index_history(task)
+      # Tasks are usually modified in place before being updated, so every
+      # update counts as a change.
+      self._task_changes[task.id] = self._next_seq()
+      self._task_changes.move_to_end(task.id)
+
+  def _index_history(self, task: Task):
+    self._task_message_ids[task.id] = {
+        m for m in map(_message_id, task.history or []) if m
+    }
+
+  def add_task_message(self, task: Task, message: Message) -> bool:
+    """Appends a message to the task history unless its id is already there.
+
+    Returns:
+      True if the message was appended.
+    """
+    message_id = _message_id(message)
+    ids = self._task_message_ids.setdefault(task.id, set())
+    if message_id in ids:
+      return False
+    if task.history is None:
+      task.history = []
+    task.history.append(message)
+    if message_id:
+      ids.add(message_id)
+    return True
+
+  @property
+  def tasks(self) -> list[Task]:
+    return self._task_list
+
+  def tasks_since(
+      self,
+      since: int = 0,
+      limit: Optional[int] = None,
+  ) -> Tuple[list[Task], int]:
+    """Tasks added or changed after the cursor `since`, least recent first.
+
+    Returns:
+      The tasks and the cursor to pass next time.
+    """
+    with self._lock:
+      head = self._seq
+      if since > head:
+        since = 0
+      changes = []
+      # Walk back from the most recent change, so the cost depends on the
+      # number of changes since the cursor rather than on the number of tasks.
+      for task_id in reversed(self._task_changes):
+        seq = self._task_changes[task_id]
+        if seq <= since:
+          break
+        changes.append((seq, self._tasks[task_id]))
+      changes.reverse()
+      return self._after(changes, since, limit, head)
+
+  # Events
+
+  def add_event(self, event: Event):
+    with self._changing():
+      previous = self._events.get(event.id)
+      if previous is not None:
+        self._remove_event(previous)
+      self._events[event.id] = event
+      # Events nearly always arrive in timestamp order, so this is an append.
+      position = bisect.bisect_right(self._event_keys, event.timestamp)
+      self._event_keys.insert(position, event.timestamp)
+      self._event_list.insert(position, event)
+      self._event_log.append((self._next_seq(), event))
+
+  def _remove_event(self, event: Event):
+    start = bisect.bisect_left(self._event_keys, event.timestamp)
+    for i in range(start, len(self._event_list)):
+      if self._event_list[i] is event:
+        del self._event_list[i]
+        del self._event_keys[i]
+        return
+
+  @property
+  def events(self) -> list[Event]:
+    with self._lock:
+      return list(self._event_list)
+
+  def events_since(
+      self,
+      since: int = 0,
+      limit: Optional[int] = None,
+  ) -> Tuple[list[Event], int]:
+    """Events recorded after the cursor `since`, in the order they arrived.
+
+    Returns:
+      The events and the cursor to pass next time.
+    """
+    with self._lock:
+      return self._after(self._event_log, since, limit, self._seq)
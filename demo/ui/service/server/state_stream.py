@@ -0,0 +1,156 @@
+import asyncio
+from logging import getLogger
+from typing import AsyncIterator, Callable
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+from common.types import Message, Task
+from service.types import (
+    ConversationSummary,
+    StateSnapshot,
+    StateSnapshotParams,
+)
+from .application_manager import ApplicationManager
+
+logger = getLogger(__name__)
+
+
+class StateStreamer:
+  """Pushes state deltas to the browser over server-sent events.
+
+  A browser opens one stream per page with the cursors it already has and
+  receives `delta` events carrying the messages of its conversation, the
+  tasks and events recorded since, and the conversation list and pending
+  messages whenever they change. Nothing is sent while nothing changes
+  except a comment line every `heartbeat` seconds that keeps proxies from
+  closing the connection.
+  """
+
+  def __init__(
+      self,
+      manager: ApplicationManager,
+      prepare_messages: Callable[[list[Message]], list[Message]] = lambda m: m,
+      prepare_tasks: Callable[[list[Task]], list[Task]] = lambda t: t,
+      heartbeat: float = 15.0,
+      coalesce: float = 0.05,
+  ):
+    """
+    Args:
+      manager: The manager whose state is streamed.
+      prepare_messages: Applied to messages before they are sent, e.g. to
+        replace inline file contents by urls.
+      prepare_tasks: The same for tasks.
+      heartbeat: Seconds between keep-alive comments on an idle stream.
+      coalesce: Seconds to wait after a change for more changes to batch.
+    """
+    self.manager = manager
+    self.prepare_messages = prepare_messages
+    self.prepare_tasks = prepare_tasks
+    self.heartbeat = heartbeat
+    self.coalesce = coalesce
+    self.connections = 0
+
+  async def stream(self, request: Request) -> Response:
+    if not self.manager.notifies_changes:
+      # The manager cannot notify: the browser falls back to polling.
+      return Response(status_code=204)
+    return StreamingResponse(
+        self._events(request, request.query_params),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+  async def _events(self, request: Request, query) -> AsyncIterator[str]:
+    changed = asyncio.Event()
+    loop = asyncio.get_running_loop()
+
+    def listener(_seq: int):
+      if not changed.is_set():
+        loop.call_soon_threadsafe(changed.set)
+
+    params = StateSnapshotParams(
+        conversation_id=query.get("conversation_id", ""),
+        messages_since=int(query.get("messages_since", 0)),
+        tasks_since=int(query.get("tasks_since", 0)),
+        # Events are only streamed to the pages that ask for them.
+        events_since=int(query.get("events_since", -1)),
+    )
+    self.connections += 1
+    try:
+      # Registered here rather than in `stream`, so that a client that leaves
+      # before the body starts does not leave the listener behind.
+      self.manager.add_change_listener(listener)
+      while True:
+        changed.clear()
+        snapshot = build_snapshot(
+            self.manager, params, self.prepare_messages, self.prepare_tasks)
+        advance(params, snapshot)
+        if has_changes(snapshot):
+          yield f"event: delta\ndata: {snapshot.model_dump_json(exclude_none=True)}\n\n"
+        try:
+          await asyncio.wait_for(changed.wait(), self.heartbeat)
+          await asyncio.sleep(self.coalesce)
+        except asyncio.TimeoutError:
+          if await request.is_disconnected():
+            break
+          yield ": keep-alive\n\n"
+    finally:
+      self.connections -= 1
+      self.manager.remove_change_listener(listener)
+
+
+def build_snapshot(
+    manager: ApplicationManager,
+    params: StateSnapshotParams,
+    prepare_messages: Callable[[list[Message]], list[Message]] = lambda m: m,
+    prepare_tasks: Callable[[list[Task]], list[Task]] = lambda t: t,
+) -> StateSnapshot:
+  """Collects the state changed after the cursors and versions in params."""
+  versions = manager.versions
+  snapshot = StateSnapshot(
+      conversation_id=params.conversation_id,
+      messages_since=params.messages_since,
+      events_since=params.events_since,
+      versions=versions,
+  )
+  if params.conversation_id:
+    messages, snapshot.messages_since = manager.messages_since(
+        params.conversation_id, params.messages_since)
+    if messages:
+      snapshot.messages = prepare_messages(messages)
+  tasks, snapshot.tasks_since = manager.tasks_since(params.tasks_since)
+  if tasks:
+    snapshot.tasks = prepare_tasks(tasks)
+  if params.events_since >= 0:
+    events, snapshot.events_since = manager.events_since(params.events_since)
+    if events:
+      snapshot.events = events
+  if versions.get("conversations") != params.conversations_version:
+    snapshot.conversations = [
+        ConversationSummary(
+            conversation_id=c.conversation_id,
+            name=c.name,
+            is_active=c.is_active,
+            message_ids=manager.conversation_message_ids(c.conversation_id),
+        ) for c in manager.conversations
+    ]
+  # Pending messages show the progress of their tasks, so they are re-sent
+  # when tasks change too.
+  if tasks or versions.get("pending") != params.pending_version:
+    snapshot.pending = dict(manager.get_pending_messages())
+  return snapshot
+
+
+def advance(params: StateSnapshotParams, snapshot: StateSnapshot):
+  """Moves the cursors and versions in params past the snapshot."""
+  params.messages_since = snapshot.messages_since
+  params.tasks_since = snapshot.tasks_since
+  params.events_since = snapshot.events_since
+  params.conversations_version = snapshot.versions.get("conversations", -1)
+  params.pending_version = snapshot.versions.get("pending", -1)
+
+
+def has_changes(snapshot: StateSnapshot) -> bool:
+  return any(
+      view is not None for view in (
+          snapshot.messages, snapshot.tasks, snapshot.events,
+          snapshot.conversations, snapshot.pending))
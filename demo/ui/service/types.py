@@ -27,13 +27,22 @@ class SendMessageRequest(JSONRPCRequest):
   method: Literal["message/send"] = "message/send"
   params: Message
 
+class FeedParams(BaseModel):
+  # Cursor returned as next_since by the previous call; 0 reads everything.
+  since: int = 0
+  limit: int | None = None
+
+class ListMessageParams(FeedParams):
+  conversation_id: str
+
 class ListMessageRequest(JSONRPCRequest):
   method: Literal["message/list"] = "message/list"
-  # This is the conversation id
-  params: str
+  # This is the conversation id, optionally with a cursor
+  params: str | ListMessageParams
 
 class ListMessageResponse(JSONRPCResponse):
   result: list[Message] | None = None
+  next_since: int | None = None
 
 class MessageInfo(BaseModel):
   message_id: str
@@ -42,11 +51,17 @@ class MessageInfo(BaseModel):
 class SendMessageResponse(JSONRPCResponse):
   result: Message | MessageInfo | None = None
 
+class ServerBusyError(JSONRPCError):
+  code: int = -32001
+  message: str = "Too many pending messages, retry later"
+
 class GetEventRequest(JSONRPCRequest):
   method: Literal["events/get"] = "events/get"
+  params: FeedParams | None = None
 
 class GetEventResponse(JSONRPCResponse):
   result: list[Event] | None = None
+  next_since: int | None = None
 
 class ListConversationRequest(JSONRPCRequest):
   method: Literal["conversation/list"] = "conversation/list"
@@ -68,9 +83,11 @@ class CreateConversationResponse(JSONRPCResponse):
 
 class ListTaskRequest(JSONRPCRequest):
   method: Literal["task/list"] = "task/list"
+  params: FeedParams | None = None
 
 class ListTaskResponse(JSONRPCResponse):
   result: list[Task] | None = None
+  next_since: int | None = None
 
 class RegisterAgentRequest(JSONRPCRequest):
   method: Literal["agent/register"] = "agent/register"
@@ -86,6 +103,43 @@ class ListAgentRequest(JSONRPCRequest):
 class ListAgentResponse(JSONRPCResponse):
   result: list[AgentCard] | None = None
 
+class ConversationSummary(BaseModel):
+  conversation_id: str
+  name: str = ''
+  is_active: bool = True
+  message_ids: list[str] = Field(default_factory=list)
+
+class StateSnapshotParams(BaseModel):
+  conversation_id: str = ''
+  # Cursors returned by the previous snapshot; 0 reads everything.
+  messages_since: int = 0
+  tasks_since: int = 0
+  # -1 leaves the events out.
+  events_since: int = -1
+  # Versions returned by the previous snapshot; unchanged views are omitted.
+  conversations_version: int = -1
+  pending_version: int = -1
+
+class StateSnapshot(BaseModel):
+  """What a page needs for one conversation. Unchanged views are None."""
+  conversation_id: str = ''
+  messages: list[Message] | None = None
+  messages_since: int = 0
+  tasks: list[Task] | None = None
+  tasks_since: int = 0
+  events: list[Event] | None = None
+  events_since: int = -1
+  conversations: list[ConversationSummary] | None = None
+  pending: dict[str, str] | None = None
+  versions: dict[str, int] = Field(default_factory=dict)
+
+class StateSnapshotRequest(JSONRPCRequest):
+  method: Literal["state/snapshot"] = "state/snapshot"
+  params: StateSnapshotParams = Field(default_factory=StateSnapshotParams)
+
+class StateSnapshotResponse(JSONRPCResponse):
+  result: StateSnapshot | None = None
+
 AgentRequest = TypeAdapter(
     Annotated[
         Union[
@@ -12,11 +12,18 @@ from service.types import (
     ListConversationRequest,
     SendMessageRequest,
     ListMessageRequest,
+    ListMessageParams,
+    FeedParams,
     PendingMessageRequest,
     ListTaskRequest,
     RegisterAgentRequest,
     ListAgentRequest,
-    GetEventRequest
+    GetEventRequest,
+    StateSnapshot,
+    StateSnapshotParams,
+    StateSnapshotRequest,
+    MessageInfo,
+    AgentClientHTTPError,
 )
 from .state import (
     AppState,
@@ -31,25 +38,71 @@ import threading
 from common.types import Artifact, Message, Task, Part
 
 server_url = "http://localhost:12000"
+_client: ConversationClient | None = None
+_client_lock = threading.Lock()
+
+def get_client() -> ConversationClient:
+  """The ConversationClient shared by all handlers, for `server_url`."""
+  global _client
+  with _client_lock:
+    if _client is None or _client.base_url != server_url.rstrip("/"):
+      _client = ConversationClient(server_url)
+    return _client
 
 async def ListConversations() -> list[Conversation]:
-  client = ConversationClient(server_url)
+  client = get_client()
   try:
     response = await client.list_conversation(ListConversationRequest())
     return response.result
   except Exception as e:
     print("Failed to list conversations: ", e)
 
-async def SendMessage(message: Message) -> str | None:
-  client = ConversationClient(server_url)
-  try:
-    response = await client.send_message(SendMessageRequest(params=message))
+class MessageNotSentError(Exception):
+  """The server did not take a message, even after retrying."""
+
+# Attempts after the first one while the server answers 429, and the delay
+# before the first of them; the delay doubles on every attempt.
+send_message_retries = 3
+send_message_backoff = 1.0
+
+async def SendMessage(message: Message) -> MessageInfo:
+  """Sends a message, retrying with backoff while the server is busy.
+
+  Raises MessageNotSentError when the message could not be handed over.
+  """
+  client = get_client()
+  for attempt in range(send_message_retries + 1):
+    try:
+      response = await client.send_message(SendMessageRequest(params=message))
+    except AgentClientHTTPError as e:
+      if e.status_code != 429:
+        raise MessageNotSentError(e.message) from e
+      if attempt == send_message_retries:
+        raise MessageNotSentError(
+            "The server is busy, please try again later") from e
+      await asyncio.sleep(send_message_backoff * 2 ** attempt)
+      continue
+    except Exception as e:
+      raise MessageNotSentError(str(e)) from e
+    if response.error:
+      raise MessageNotSentError(response.error.message)
     return response.result
-  except Exception as e:
-    print("Failed to send message: ", e)
+
+def AddSendError(state: AppState, message_id: str, text: str, error: Exception):
+  """Shows in the conversation that a message was not sent."""
+  state.background_tasks.pop(message_id, None)
+  if state.messages is None:
+    state.messages = []
+  # The local copy of the message has no id and leaves with the next refresh;
+  # this one has an id, so it stays, and repeats the text to resend.
+  state.messages.append(StateMessage(
+      message_id=f"{message_id}:not-sent",
+      role="agent",
+      content=[(f"Message not sent: {error}\n\n> {text}", "text/plain")],
+  ))
 
 async def CreateConversation() -> Conversation:
-  client = ConversationClient(server_url)
+  client = get_client()
   try:
    response = await client.create_conversation(CreateConversationRequest())
    return response.result
@@ -57,7 +110,7 @@ async def CreateConversation() -> Conversation:
     print("Failed to create conversation", e)
 
 async def ListRemoteAgents():
-  client = ConversationClient(server_url)
+  client = get_client()
   try:
     response = await client.list_agents(ListAgentRequest())
     return response.result
@@ -65,14 +118,14 @@ async def ListRemoteAgents():
     print("Failed to read agents", e)
 
 async def AddRemoteAgent(path: str):
-  client = ConversationClient(server_url)
+  client = get_client()
   try:
     await client.register_agent(RegisterAgentRequest(params=path))
   except Exception as e:
     print("Failed to register the agent", e)
 
 async def GetEvents() -> list[Event]:
-  client = ConversationClient(server_url)
+  client = get_client()
   try:
     response = await client.get_events(GetEventRequest())
     return response.result
@@ -80,7 +133,7 @@ async def GetEvents() -> list[Event]:
     print("Failed to get events", e)
 
 async def GetProcessingMessages():
-  client = ConversationClient(server_url)
+  client = get_client()
   try:
     response = await client.get_pending_messages(PendingMessageRequest())
     return dict(response.result)
@@ -90,50 +143,57 @@ async def GetProcessingMessages():
 def GetMessageAliases():
   return {}
 
-async def GetTasks():
-  client = ConversationClient(server_url)
+async def GetTasks(since: int = 0) -> Tuple[list[Task], int]:
+  """Tasks changed after the cursor `since`, and the next cursor."""
+  client = get_client()
   try:
-    response = await client.list_tasks(ListTaskRequest())
-    return response.result
+    response = await client.list_tasks(ListTaskRequest(
+        params=FeedParams(since=since)))
+    return response.result or [], response.next_since or 0
   except Exception as e:
     print("Failed to list tasks ", e)
+    return [], since
 
-async def ListMessages(conversation_id: str) -> list[Message]:
-  client = ConversationClient(server_url)
+async def ListMessages(conversation_id: str, since: int = 0) -> Tuple[list[Message], int]:
+  """Messages of the conversation after the cursor `since`, and the next cursor."""
+  client = get_client()
   try:
-    response = await client.list_messages(ListMessageRequest(params=conversation_id))
-    return response.result
+    response = await client.list_messages(ListMessageRequest(
+        params=ListMessageParams(conversation_id=conversation_id, since=since)))
+    return response.result or [], response.next_since or 0
   except Exception as e:
     print("Failed to list messages ", e)
+    return [], since
 
 
+async def GetStateSnapshot(params: StateSnapshotParams) -> StateSnapshot | None:
+  """What changed after the cursors and versions in params, in one request."""
+  client = get_client()
+  try:
+    response = await client.get_state_snapshot(StateSnapshotRequest(params=params))
+    return response.result
+  except Exception as e:
+    print("Failed to get state snapshot ", e)
+
 async def UpdateAppState(state: AppState, conversation_id: str):
   """Update the app state."""
   try:
     if conversation_id:
       state.current_conversation_id = conversation_id
-      messages = await ListMessages(conversation_id)
-      if not messages:
+      if (conversation_id != state.messages_conversation_id or
+          not state.messages):
         state.messages = []
-      else:
-        state.messages = [convert_message_to_state(x) for x in messages]
-    conversations = await ListConversations()
-    if not conversations:
-      state.conversations = []
-    else:
-      state.conversations = [
-          convert_conversation_to_state(x) for x in conversations
-      ]
-
-    state.task_list = []
-    for task in await GetTasks():
-      state.task_list.append(
-          SessionTask(
-              session_id=extract_conversation_id(task),
-              task=convert_task_to_state(task)
-          )
-      )
-    state.background_tasks = await GetProcessingMessages()
+        state.messages_cursor = 0
+        state.messages_conversation_id = conversation_id
+    snapshot = await GetStateSnapshot(StateSnapshotParams(
+        conversation_id=conversation_id,
+        messages_since=state.messages_cursor,
+        tasks_since=state.task_cursor,
+        conversations_version=state.conversations_version,
+        pending_version=state.pending_version,
+    ))
+    if snapshot:
+      ApplyStateDelta(state, snapshot)
     state.message_aliases = GetMessageAliases()
   except Exception as e:
     print("Failed to update state: ", e)
@@ -159,6 +219,66 @@ async def UpdateApiKey(api_key: str):
         print("Failed to update API key: ", e)
         return False
 
+def ApplyStateDelta(state: AppState, delta: StateSnapshot):
+  """Applies a snapshot from /state/snapshot or a delta from /state/stream."""
+  if (delta.messages is not None and
+      delta.conversation_id == state.current_conversation_id):
+    if state.messages_conversation_id != state.current_conversation_id:
+      state.messages = []
+      state.messages_conversation_id = state.current_conversation_id
+    merge_messages(state, delta.messages)
+    state.messages_cursor = delta.messages_since
+  if delta.tasks is not None:
+    merge_tasks(state, delta.tasks)
+  state.task_cursor = delta.tasks_since
+  if delta.conversations is not None:
+    state.conversations = [
+        StateConversation(
+            conversation_id=c.conversation_id,
+            conversation_name=c.name,
+            is_active=c.is_active,
+            message_ids=c.message_ids,
+        ) for c in delta.conversations
+    ]
+  if delta.pending is not None:
+    state.background_tasks = delta.pending
+  state.conversations_version = delta.versions.get('conversations', -1)
+  state.pending_version = delta.versions.get('pending', -1)
+
+def merge_messages(state: AppState, messages: list[Message]):
+  """Applies a delta of conversation messages to the state."""
+  if not messages:
+    return
+  if state.messages is None:
+    state.messages = []
+  # Messages added locally by send_message have no id yet; the server copy
+  # in the delta replaces them.
+  state.messages = [m for m in state.messages if m.message_id]
+  positions = {m.message_id: i for i, m in enumerate(state.messages)}
+  for message in messages:
+    state_message = convert_message_to_state(message)
+    i = positions.get(state_message.message_id)
+    if i is None or not state_message.message_id:
+      positions[state_message.message_id] = len(state.messages)
+      state.messages.append(state_message)
+    else:
+      state.messages[i] = state_message
+
+def merge_tasks(state: AppState, tasks: list[Task]):
+  """Applies a delta of changed tasks to the state."""
+  positions = {t.task.task_id: i for i, t in enumerate(state.task_list)}
+  for task in tasks:
+    session_task = SessionTask(
+        session_id=extract_conversation_id(task),
+        task=convert_task_to_state(task)
+    )
+    i = positions.get(task.id)
+    if i is None:
+      positions[task.id] = len(state.task_list)
+      state.task_list.append(session_task)
+    else:
+      state.task_list[i] = session_task
+
 def convert_message_to_state(message: Message) -> StateMessage:
   if not message:
     return StateMessage()
@@ -66,6 +66,15 @@ class AppState:
   # This is used to track the message sent to agent with form data
   form_responses: dict[str, str] = dataclasses.field(default_factory=dict)
   polling_interval: int = 1
+  # Cursors of the incremental feeds, see UpdateAppState.
+  messages_conversation_id: str = ""
+  messages_cursor: int = 0
+  task_cursor: int = 0
+  # Versions of the conversation list and pending messages last received.
+  conversations_version: int = -1
+  pending_version: int = -1
+  # True while the server pushes updates; polling is only a fallback.
+  stream_connected: bool = False
 
   # Added for API key management
   api_key: str = ""
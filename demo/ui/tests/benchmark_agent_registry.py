@@ -0,0 +1,143 @@
+"""Benchmark of the host routing prompt with many registered agents.
+
+Compares the instruction that lists every agent (previous behaviour) with
+the skill-indexed top-k instruction, and the cost of registering agents
+when every registration re-serializes all cards versus the incremental
+registry.
+
+run:
+  PYTHONPATH=.:../../a2a_sdk python tests/benchmark_agent_registry.py
+"""
+import json
+import logging
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+from google.genai import types
+from common.types import AgentCapabilities, AgentCard, AgentSkill
+from hosts.multiagent.host_agent import HostAgent
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+AGENT_COUNTS = [5, 50, 500]
+QUERY = "Please analyze Toyota's annual securities report"
+ROUTING_ITERATIONS = 200
+
+_TOPICS = [
+    "weather", "travel", "recipe", "calendar", "translation", "currency",
+    "shopping", "music", "movie", "news", "fitness", "medical", "legal",
+    "insurance", "real estate", "tax", "payroll", "logistics", "email",
+    "image generation", "code review", "stock price", "crypto", "school",
+]
+
+
+def make_card(i: int, rng: random.Random) -> AgentCard:
+  topic = rng.choice(_TOPICS)
+  words = " ".join(rng.sample(_TOPICS, 4))
+  return AgentCard(
+      name=f"{topic.title()} Agent {i}",
+      description=f"Handles {topic} requests. Also knows about {words}.",
+      url=f"http://agent-{i}.local/",
+      version="0.0.1",
+      capabilities=AgentCapabilities(),
+      skills=[AgentSkill(
+          id=f"skill-{i}",
+          name=f"{topic} skill",
+          description=f"Answers questions about {topic}.",
+          tags=[topic, rng.choice(_TOPICS)],
+          examples=[f"Help me with {topic}"],
+      )],
+  )
+
+
+def securities_card() -> AgentCard:
+  return AgentCard(
+      name="Asset Securities Report",
+      description=(
+          "Based on the company name, I will search for the relevant annual "
+          "securities report (Yukashoken Hokokusho) and analyze it."),
+      url="http://securities.local/",
+      version="0.0.1",
+      capabilities=AgentCapabilities(),
+      skills=[AgentSkill(
+          id="asset_securities_report_agent",
+          name="Asset Securities Report",
+          tags=["analyze financial report", "analyze asset securities report"],
+          examples=["Analyze ACCESS Co., Ltd.'s annual securities report."],
+      )],
+  )
+
+
+def fake_context(query: str):
+  return SimpleNamespace(
+      state={},
+      user_content=types.Content(
+          role="user", parts=[types.Part.from_text(text=query)]),
+  )
+
+
+def full_listing(host: HostAgent) -> str:
+  """Agent section built the way it was before the registry existed."""
+  return "\n".join(json.dumps(ra) for ra in host.list_remote_agents())
+
+
+def run(count: int) -> dict:
+  rng = random.Random(count)
+  cards = [make_card(i, rng) for i in range(count - 1)] + [securities_card()]
+
+  # Previous behaviour: every registration re-serialized all cards.
+  start = time.perf_counter()
+  listed: dict[str, AgentCard] = {}
+  for card in cards:
+    listed[card.name] = card
+    "\n".join(
+        json.dumps({"name": c.name, "description": c.description})
+        for c in listed.values())
+  eager_registration = time.perf_counter() - start
+
+  host = HostAgent([])
+  start = time.perf_counter()
+  for card in cards:
+    host.register_agent_card(card)
+  incremental_registration = time.perf_counter() - start
+
+  context = fake_context(QUERY)
+  start = time.perf_counter()
+  for _ in range(ROUTING_ITERATIONS):
+    instruction = host.root_instruction(context)
+  routing = (time.perf_counter() - start) / ROUTING_ITERATIONS
+  candidates = host.routing_candidates(context)
+
+  full_prompt = len(host.root_instruction(context)) - len(
+      host.registry.describe(candidates)) + len(full_listing(host))
+  return {
+      "agents": count,
+      "full_prompt_chars": full_prompt,
+      "topk_prompt_chars": len(instruction),
+      "eager_registration_ms": eager_registration * 1000,
+      "incremental_registration_ms": incremental_registration * 1000,
+      "routing_instruction_us": routing * 1e6,
+      "securities_agent_selected": "Asset Securities Report" in candidates,
+  }
+
+
+def main():
+  logger.info("Starting agent registry benchmark...")
+  results = [run(count) for count in AGENT_COUNTS]
+  header = list(results[0].keys())
+  print("\t".join(header))
+  for r in results:
+    print("\t".join(
+        f"{r[k]:.1f}" if isinstance(r[k], float) else str(r[k])
+        for k in header))
+  if not all(r["securities_agent_selected"] for r in results):
+    logger.error("The relevant agent was not among the routing candidates")
+    sys.exit(1)
+  sys.exit(0)
+
+
+if __name__ == "__main__":
+  main()
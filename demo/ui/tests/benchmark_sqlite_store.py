@@ -0,0 +1,153 @@
+"""Benchmark of the SQLite-backed state of the host manager.
+
+Cold start: fills a database with CONVERSATIONS conversations of
+MESSAGES_PER_CONVERSATION messages, their tasks and events, then measures
+how long SQLiteStateStore takes to load it (message bodies are lazy), and
+how long reading every message body would take.
+
+Steady state: measures the task updates, events and messages written per
+second with the in-memory StateStore, with SQLiteStateStore and its
+write-behind batches, and with a commit after every write.
+
+run:
+  PYTHONPATH=.:../../a2a_sdk python tests/benchmark_sqlite_store.py
+"""
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from common.types import Message, Task, TaskState, TaskStatus, TextPart
+from service.server.sqlite_database import SQLiteDatabase
+from service.server.sqlite_state_store import SQLiteStateStore
+from service.server.state_store import StateStore
+from service.types import Conversation, Event
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CONVERSATIONS = 1_000
+MESSAGES_PER_CONVERSATION = 20
+OPERATIONS = 5_000
+
+
+def make_message(i: int, conversation_id: str) -> Message:
+  return Message(
+      role="agent",
+      parts=[TextPart(text=f"message {i} " + "lorem ipsum " * 20)],
+      metadata={"message_id": f"{conversation_id}-m{i}",
+                "conversation_id": conversation_id},
+  )
+
+
+def fill(store: StateStore):
+  for c in range(CONVERSATIONS):
+    cid = f"c{c}"
+    conversation = Conversation(conversation_id=cid, is_active=True)
+    store.add_conversation(conversation)
+    for i in range(MESSAGES_PER_CONVERSATION):
+      message = make_message(i, cid)
+      store.add_message(message)
+      store.add_conversation_message(conversation, message)
+      store.add_event(Event(
+          id=f"{cid}-e{i}", actor="agent", content=message,
+          timestamp=float(c * MESSAGES_PER_CONVERSATION + i)))
+    store.add_task(Task(
+        id=f"{cid}-t", sessionId=cid,
+        status=TaskStatus(state=TaskState.COMPLETED)))
+
+
+def cold_start(directory: str) -> dict:
+  path = os.path.join(directory, "cold.sqlite")
+  db = SQLiteDatabase(path)
+  start = time.perf_counter()
+  fill(SQLiteStateStore(db))
+  db.close()
+  fill_seconds = time.perf_counter() - start
+
+  db = SQLiteDatabase(path)
+  start = time.perf_counter()
+  store = SQLiteStateStore(db)
+  load_seconds = time.perf_counter() - start
+  start = time.perf_counter()
+  store.conversation_messages_since("c0")
+  first_read_seconds = time.perf_counter() - start
+  start = time.perf_counter()
+  bodies = [
+      Message.model_validate_json(body)
+      for (body,) in db.query("SELECT body FROM messages")
+  ]
+  eager_seconds = time.perf_counter() - start
+  db.close()
+  return {
+      "conversations": CONVERSATIONS,
+      "messages": len(bodies),
+      "fill_s": fill_seconds,
+      "cold_start_ms": load_seconds * 1000,
+      "first_conversation_read_ms": first_read_seconds * 1000,
+      "all_bodies_ms": eager_seconds * 1000,
+  }
+
+
+def steady_state(store: StateStore, after_write=lambda: None) -> float:
+  conversation = Conversation(conversation_id="steady", is_active=True)
+  store.add_conversation(conversation)
+  tasks = [
+      Task(id=f"steady-{i}", sessionId="steady",
+           status=TaskStatus(state=TaskState.WORKING))
+      for i in range(50)
+  ]
+  for task in tasks:
+    store.add_task(task)
+  start = time.perf_counter()
+  for i in range(OPERATIONS):
+    # A status update of one of the running tasks, its event, and every
+    # tenth time a message in the conversation.
+    task = tasks[i % len(tasks)]
+    task.status = TaskStatus(state=TaskState.WORKING)
+    store.update_task(task)
+    after_write()
+    store.add_event(Event(
+        id=f"steady-e{i}", actor="agent",
+        content=make_message(i, "steady"), timestamp=float(i)))
+    after_write()
+    if i % 10 == 0:
+      store.add_conversation_message(conversation, make_message(i, "steady"))
+      after_write()
+  return OPERATIONS / (time.perf_counter() - start)
+
+
+def main():
+  logger.info("Starting SQLite store benchmark...")
+  directory = tempfile.mkdtemp()
+  try:
+    cold = cold_start(directory)
+    header = list(cold.keys())
+    print("\t".join(header))
+    print("\t".join(
+        f"{cold[k]:.1f}" if isinstance(cold[k], float) else str(cold[k])
+        for k in header))
+
+    results = {"memory": steady_state(StateStore())}
+    db = SQLiteDatabase(os.path.join(directory, "behind.sqlite"))
+    results["sqlite_write_behind"] = steady_state(SQLiteStateStore(db))
+    db.close()
+    db = SQLiteDatabase(os.path.join(directory, "sync.sqlite"))
+    results["sqlite_commit_per_write"] = steady_state(
+        SQLiteStateStore(db), db.flush)
+    db.close()
+    print("store\tupdates_per_s")
+    for name, rate in results.items():
+      print(f"{name}\t{rate:.0f}")
+  finally:
+    shutil.rmtree(directory, ignore_errors=True)
+  if results["sqlite_write_behind"] < results["sqlite_commit_per_write"]:
+    logger.error("Write-behind is slower than committing every write")
+    sys.exit(1)
+  sys.exit(0)
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,137 @@
+"""Benchmark of the host manager state with many tasks.
+
+Compares the cost of one task status callback when tasks are kept in a list
+and found with linear scans (previous behaviour) with the indexed StateStore
+used by ADKHostManager.
+
+run:
+  PYTHONPATH=.:../../a2a_sdk python tests/benchmark_state_store.py
+"""
+import logging
+import random
+import sys
+import time
+import uuid
+
+from common.types import (
+    AgentCapabilities,
+    AgentCard,
+    Message,
+    Task,
+    TaskState,
+    TaskStatus,
+    TaskStatusUpdateEvent,
+    TextPart,
+)
+from service.server.adk_host_manager import ADKHostManager, get_message_id
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+TASK_COUNTS = [1_000, 10_000, 100_000]
+CALLBACKS = 500
+HISTORY_LENGTH = 5
+
+CARD = AgentCard(
+    name="Benchmark Agent",
+    url="http://benchmark.local/",
+    version="0.0.1",
+    capabilities=AgentCapabilities(),
+    skills=[],
+)
+
+
+def make_message(text: str) -> Message:
+  return Message(
+      role="agent",
+      parts=[TextPart(text=text)],
+      metadata={"message_id": str(uuid.uuid4())},
+  )
+
+
+def make_task(i: int) -> Task:
+  return Task(
+      id=f"task-{i}",
+      sessionId="session",
+      status=TaskStatus(state=TaskState.WORKING),
+      history=[make_message(f"step {j}") for j in range(HISTORY_LENGTH)],
+  )
+
+
+def make_events(count: int, rng: random.Random) -> list[TaskStatusUpdateEvent]:
+  return [
+      TaskStatusUpdateEvent(
+          id=f"task-{rng.randrange(count)}",
+          status=TaskStatus(
+              state=TaskState.WORKING, message=make_message("progress")),
+      )
+      for _ in range(CALLBACKS)
+  ]
+
+
+def linear_callback(tasks: list[Task], event: TaskStatusUpdateEvent):
+  """The lookups a status callback performed before the store existed."""
+  current_task = next(filter(lambda x: x.id == event.id, tasks), None)
+  current_task.status = event.status
+  if get_message_id(event.status.message) not in [
+      get_message_id(x) for x in current_task.history
+  ]:
+    current_task.history.append(event.status.message)
+  for i, t in enumerate(tasks):
+    if t.id == current_task.id:
+      tasks[i] = current_task
+      break
+  # The open-task check of process_message scanned the list once more.
+  next(filter(lambda x: x.id == current_task.id, tasks), None)
+
+
+def run(count: int, manager: ADKHostManager) -> dict:
+  rng = random.Random(count)
+  tasks = [make_task(i) for i in range(count)]
+
+  start = time.perf_counter()
+  for task in tasks:
+    manager._store.add_task(task)
+  indexed_load = time.perf_counter() - start
+
+  linear_tasks = list(tasks)
+  events = make_events(count, rng)
+
+  start = time.perf_counter()
+  for event in events:
+    linear_callback(linear_tasks, event)
+  linear = (time.perf_counter() - start) / CALLBACKS
+
+  start = time.perf_counter()
+  for event in events:
+    current_task = manager.task_callback(event, CARD)
+    manager._store.get_task(current_task.id)
+  indexed = (time.perf_counter() - start) / CALLBACKS
+
+  return {
+      "tasks": count,
+      "linear_callback_us": linear * 1e6,
+      "indexed_callback_us": indexed * 1e6,
+      "speedup": linear / indexed,
+      "indexed_load_ms": indexed_load * 1000,
+  }
+
+
+def main():
+  logger.info("Starting state store benchmark...")
+  results = [run(count, ADKHostManager()) for count in TASK_COUNTS]
+  header = list(results[0].keys())
+  print("\t".join(header))
+  for r in results:
+    print("\t".join(
+        f"{r[k]:.1f}" if isinstance(r[k], float) else str(r[k])
+        for k in header))
+  # The indexed callback must not grow with the number of tasks.
+  if results[-1]["indexed_callback_us"] > 10 * results[0]["indexed_callback_us"]:
+    logger.error("Indexed callback cost grows with the task count")
+    sys.exit(1)
+  sys.exit(0)
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,189 @@
+"""Benchmark of polling versus server-pushed state updates with idle tabs.
+
+Starts the ConversationServer locally, opens TABS simulated browser tabs and
+changes one task every CHANGE_INTERVAL seconds. With polling, every tab
+issues the /state/snapshot request of UpdateAppState each POLLING_INTERVAL; with streaming,
+every tab holds one /state/stream connection. Reports the backend requests
+per minute and the delay between a change and the tabs seeing it.
+
+run:
+  PYTHONPATH=.:../../a2a_sdk python tests/benchmark_state_stream.py
+"""
+import asyncio
+import json
+import logging
+import socket
+import statistics
+import sys
+import threading
+import time
+
+import httpx
+import uvicorn
+from fastapi import APIRouter, FastAPI, Request
+
+from common.types import AgentCapabilities, AgentCard, Task, TaskState, TaskStatus
+from service.server.server import ConversationServer
+from service.server.state_stream import advance
+from service.types import (
+    StateSnapshotParams,
+    StateSnapshotRequest,
+    StateSnapshotResponse,
+)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+TABS = 50
+DURATION = 20.0
+CHANGE_INTERVAL = 2.0
+POLLING_INTERVAL = 1.0
+
+CARD = AgentCard(
+    name="Benchmark Agent",
+    url="http://benchmark.local/",
+    version="0.0.1",
+    capabilities=AgentCapabilities(),
+    skills=[],
+)
+
+
+class Backend:
+  """The ConversationServer on a local port, counting the requests it serves."""
+
+  def __init__(self):
+    router = APIRouter()
+    self.server = ConversationServer(router)
+    self.requests = 0
+    app = FastAPI()
+    app.include_router(router)
+
+    @app.middleware("http")
+    async def count(request: Request, call_next):
+      self.requests += 1
+      return await call_next(request)
+
+    with socket.socket() as s:
+      s.bind(("127.0.0.1", 0))
+      self.port = s.getsockname()[1]
+    self.url = f"http://127.0.0.1:{self.port}"
+    self._uvicorn = uvicorn.Server(uvicorn.Config(
+        app, host="127.0.0.1", port=self.port, log_level="warning"))
+    self._thread = threading.Thread(target=self._uvicorn.run, daemon=True)
+
+  def start(self):
+    self._thread.start()
+    while not self._uvicorn.started:
+      time.sleep(0.05)
+
+  def stop(self):
+    self._uvicorn.should_exit = True
+    self._thread.join(5)
+
+  def change(self, i: int) -> str:
+    task_id = f"task-{i}"
+    self.server.manager.task_callback(Task(
+        id=task_id,
+        status=TaskStatus(state=TaskState.COMPLETED),
+    ), CARD)
+    return task_id
+
+
+async def changer(backend: Backend, changes: dict[str, float], stop: asyncio.Event):
+  i = 0
+  while not stop.is_set():
+    await asyncio.sleep(CHANGE_INTERVAL)
+    changes[backend.change(i)] = time.perf_counter()
+    i += 1
+
+
+async def polling_tab(client: httpx.AsyncClient, backend: Backend,
+                      seen: dict[str, float], stop: asyncio.Event):
+  params = StateSnapshotParams()
+  while not stop.is_set():
+    # The single request UpdateAppState issues on every tick.
+    response = await client.post(
+        backend.url + "/state/snapshot",
+        json=StateSnapshotRequest(params=params).model_dump())
+    snapshot = StateSnapshotResponse(**response.json()).result
+    advance(params, snapshot)
+    now = time.perf_counter()
+    for task in snapshot.tasks or []:
+      seen.setdefault(task.id, now)
+    await asyncio.sleep(POLLING_INTERVAL)
+
+
+async def streaming_tab(client: httpx.AsyncClient, backend: Backend,
+                        seen: dict[str, float], stop: asyncio.Event):
+  async with client.stream("GET", backend.url + "/state/stream") as response:
+    async for line in response.aiter_lines():
+      if stop.is_set():
+        break
+      if not line.startswith("data: "):
+        continue
+      now = time.perf_counter()
+      for task in json.loads(line[len("data: "):]).get("tasks", []):
+        seen.setdefault(task["id"], now)
+
+
+async def run(mode: str) -> dict:
+  backend = Backend()
+  backend.start()
+  stop = asyncio.Event()
+  changes: dict[str, float] = {}
+  # Per tab: task id -> when the tab first saw it.
+  seen: list[dict[str, float]] = [{} for _ in range(TABS)]
+  tab = polling_tab if mode == "polling" else streaming_tab
+  limits = httpx.Limits(max_connections=TABS * 2, max_keepalive_connections=TABS * 2)
+  async with httpx.AsyncClient(limits=limits, timeout=None) as client:
+    tabs = [
+        asyncio.create_task(tab(client, backend, tab_seen, stop))
+        for tab_seen in seen
+    ]
+    # Let the tabs load the page before measuring.
+    await asyncio.sleep(1.0)
+    requests_before = backend.requests
+    start = time.perf_counter()
+    change_task = asyncio.create_task(changer(backend, changes, stop))
+    await asyncio.sleep(DURATION)
+    requests = backend.requests - requests_before
+    elapsed = time.perf_counter() - start
+    stop.set()
+    for t in tabs + [change_task]:
+      t.cancel()
+    await asyncio.gather(*tabs, change_task, return_exceptions=True)
+  backend.stop()
+
+  latencies = [
+      (first_seen - changes[task_id]) * 1000
+      for tab_seen in seen
+      for task_id, first_seen in tab_seen.items() if task_id in changes
+  ]
+  return {
+      "mode": mode,
+      "tabs": TABS,
+      "requests_per_minute": requests * 60 / elapsed,
+      "updates_seen": len(latencies),
+      "mean_latency_ms": statistics.mean(latencies) if latencies else 0.0,
+      "max_latency_ms": max(latencies) if latencies else 0.0,
+  }
+
+
+def main():
+  logger.info("Starting state stream benchmark...")
+  results = [asyncio.run(run("polling")), asyncio.run(run("streaming"))]
+  header = list(results[0].keys())
+  print("\t".join(header))
+  for r in results:
+    print("\t".join(
+        f"{r[k]:.1f}" if isinstance(r[k], float) else str(r[k])
+        for k in header))
+  if results[1]["updates_seen"] == 0:
+    logger.error("The streaming tabs did not receive any update")
+    sys.exit(1)
+  sys.exit(0)
+
+
+if __name__ == "__main__":
+  main()
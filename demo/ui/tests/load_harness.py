@@ -0,0 +1,218 @@
+"""Load harness for the ConversationServer backend.
+
+Starts the ConversationServer with the InMemoryFakeAgentManager in a child
+process and simulates USERS users against it. Each user creates a
+conversation, sends a message every THINK_TIME seconds and refreshes its
+state every POLLING_INTERVAL seconds with /state/snapshot, as UpdateAppState
+does. Users start over RAMP_UP seconds.
+
+Every second the harness prints the requests completed, the thread count
+and the RSS of the server process; at the end it prints the throughput,
+error count and latency percentiles of every endpoint. Nothing leaves the
+machine, so it runs offline.
+
+run:
+  PYTHONPATH=.:../../a2a_sdk python tests/load_harness.py --users 200 --duration 60
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import socket
+import statistics
+import sys
+import time
+from collections import defaultdict
+
+import httpx
+
+from common.types import Message, TextPart
+from service.server.state_stream import advance
+from service.types import (
+    CreateConversationRequest,
+    SendMessageRequest,
+    StateSnapshotParams,
+    StateSnapshotRequest,
+    StateSnapshotResponse,
+)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+USERS = 50
+DURATION = 30.0
+RAMP_UP = 5.0
+THINK_TIME = 5.0
+POLLING_INTERVAL = 1.0
+
+
+def serve(port: int):
+  """Runs the backend; the target of the child process."""
+  os.environ["A2A_HOST"] = "fake"
+  import uvicorn
+  from fastapi import APIRouter, FastAPI
+  from service.server.server import ConversationServer
+  router = APIRouter()
+  ConversationServer(router)
+  app = FastAPI()
+  app.include_router(router)
+  uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def process_stats(pid: int) -> tuple[int, float]:
+  """Thread count and RSS in MB of a process, or -1 where /proc is missing."""
+  try:
+    with open(f"/proc/{pid}/status") as f:
+      fields = dict(line.split(":", 1) for line in f if ":" in line)
+    return (int(fields["Threads"].strip()),
+            int(fields["VmRSS"].split()[0]) / 1024)
+  except (OSError, KeyError, ValueError):
+    return -1, -1.0
+
+
+class Recorder:
+  """Latencies and failures per endpoint."""
+
+  def __init__(self):
+    self.latencies: dict[str, list[float]] = defaultdict(list)
+    self.errors: dict[str, int] = defaultdict(int)
+    self.rejected: dict[str, int] = defaultdict(int)
+    self.completed = 0
+
+  async def post(self, client: httpx.AsyncClient, path: str, payload) -> dict | None:
+    start = time.perf_counter()
+    try:
+      response = await client.post(path, json=payload.model_dump())
+    except httpx.HTTPError as e:
+      self.errors[path] += 1
+      logger.debug("%s failed: %s", path, e)
+      return None
+    self.latencies[path].append(time.perf_counter() - start)
+    self.completed += 1
+    if response.status_code == 429:
+      # Back pressure of the message dispatcher, not a failure.
+      self.rejected[path] += 1
+      return None
+    if response.status_code >= 400:
+      self.errors[path] += 1
+      return None
+    return response.json()
+
+
+async def user(client: httpx.AsyncClient, recorder: Recorder, delay: float,
+               stop: asyncio.Event):
+  await asyncio.sleep(delay)
+  created = await recorder.post(
+      client, "/conversation/create", CreateConversationRequest())
+  if not created:
+    return
+  conversation_id = created["result"]["conversation_id"]
+  params = StateSnapshotParams(conversation_id=conversation_id)
+  next_message = time.perf_counter()
+  while not stop.is_set():
+    if time.perf_counter() >= next_message:
+      await recorder.post(client, "/message/send", SendMessageRequest(
+          params=Message(
+              role="user",
+              parts=[TextPart(text="How are you?")],
+              metadata={"conversation_id": conversation_id},
+          )))
+      next_message += THINK_TIME
+    body = await recorder.post(
+        client, "/state/snapshot", StateSnapshotRequest(params=params))
+    if body:
+      advance(params, StateSnapshotResponse(**body).result)
+    await asyncio.sleep(POLLING_INTERVAL)
+
+
+async def sample(pid: int, recorder: Recorder, stop: asyncio.Event,
+                 timeline: list[tuple]):
+  start = time.perf_counter()
+  previous = 0
+  while not stop.is_set():
+    await asyncio.sleep(1.0)
+    threads, rss = process_stats(pid)
+    completed = recorder.completed
+    timeline.append((time.perf_counter() - start, completed - previous, threads, rss))
+    previous = completed
+    print(f"{timeline[-1][0]:.0f}\t{timeline[-1][1]}\t{threads}\t{rss:.1f}")
+
+
+async def run(url: str, pid: int, users: int, duration: float) -> tuple[Recorder, list]:
+  recorder = Recorder()
+  timeline: list[tuple] = []
+  stop = asyncio.Event()
+  limits = httpx.Limits(max_connections=users, max_keepalive_connections=users)
+  async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30.0) as client:
+    print("second\trequests\tthreads\trss_mb")
+    tasks = [
+        asyncio.create_task(user(client, recorder, RAMP_UP * i / users, stop))
+        for i in range(users)
+    ]
+    sampler = asyncio.create_task(sample(pid, recorder, stop, timeline))
+    await asyncio.sleep(duration)
+    stop.set()
+    await asyncio.gather(*tasks, sampler, return_exceptions=True)
+  return recorder, timeline
+
+
+def percentile(values: list[float], p: float) -> float:
+  return values[min(len(values) - 1, int(p * len(values)))] if values else 0.0
+
+
+def report(recorder: Recorder, duration: float):
+  header = ["endpoint", "requests", "per_second", "rejected", "errors",
+            "p50_ms", "p90_ms", "p99_ms", "max_ms", "mean_ms"]
+  print("\t".join(header))
+  for path in sorted(set(recorder.latencies) | set(recorder.errors)):
+    latencies = sorted(recorder.latencies[path])
+    print("\t".join([
+        path,
+        str(len(latencies)),
+        f"{len(latencies) / duration:.1f}",
+        str(recorder.rejected[path]),
+        str(recorder.errors[path]),
+        *(f"{percentile(latencies, p) * 1000:.1f}" for p in (.5, .9, .99, 1)),
+        f"{statistics.mean(latencies) * 1000 if latencies else 0:.1f}",
+    ]))
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+  parser.add_argument("--users", type=int, default=USERS)
+  parser.add_argument("--duration", type=float, default=DURATION)
+  args = parser.parse_args()
+
+  with socket.socket() as s:
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+  server = multiprocessing.Process(target=serve, args=(port,), daemon=True)
+  server.start()
+  url = f"http://127.0.0.1:{port}"
+  for _ in range(300):
+    try:
+      httpx.get(url + "/message/metrics", timeout=1.0)
+      break
+    except httpx.HTTPError:
+      time.sleep(0.1)
+  else:
+    logger.error("The server did not start")
+    sys.exit(1)
+
+  logger.info("Simulating %d users for %.0f seconds...", args.users, args.duration)
+  try:
+    recorder, _ = asyncio.run(run(url, server.pid, args.users, args.duration))
+  finally:
+    server.terminate()
+    server.join(5)
+  report(recorder, args.duration)
+  if any(recorder.errors.values()):
+    logger.error("Some requests failed")
+    sys.exit(1)
+  sys.exit(0)
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,59 @@
+import unittest
+from common.types import AgentCapabilities, AgentCard, AgentSkill
+from hosts.multiagent.agent_registry import AgentRegistry, tokenize
+
+
+def make_card(name: str, description: str, tags: list[str] | None = None) -> AgentCard:
+  return AgentCard(
+      name=name,
+      description=description,
+      url=f"http://{name.replace(' ', '-').lower()}/",
+      version="0.0.1",
+      capabilities=AgentCapabilities(),
+      skills=[AgentSkill(id=name, name=name, tags=tags or [])],
+  )
+
+
+class AgentRegistryTest(unittest.TestCase):
+  """Tests for the skill-indexed agent registry used by the host agent."""
+
+  def setUp(self) -> None:
+    self.registry = AgentRegistry()
+    self.registry.register(make_card("Weather", "Forecasts the weather", ["rain"]))
+    self.registry.register(make_card("Securities", "Analyzes annual securities reports", ["有価証券報告書"]))
+    self.registry.register(make_card("Travel", "Books flights and hotels", ["trip"]))
+
+  def test_tokenize_japanese_uses_bigrams(self) -> None:
+    """Japanese text is indexed as character bigrams."""
+    self.assertEqual(tokenize("決算書"), ["決算", "算書"])
+    self.assertEqual(tokenize("Annual report"), ["annual", "report"])
+
+  def test_search_ranks_relevant_agent_first(self) -> None:
+    """The agent matching the query terms ranks first."""
+    self.assertEqual(self.registry.search("analyze the securities report")[0][0], "Securities")
+    self.assertEqual(self.registry.search("トヨタの有価証券報告書")[0][0], "Securities")
+
+  def test_candidates_limits_to_top_k(self) -> None:
+    """Only top_k agents are returned once the registry grows past it."""
+    candidates = self.registry.candidates("weather tomorrow", top_k=2)
+    self.assertEqual(len(candidates), 2)
+    self.assertEqual(candidates[0], "Weather")
+
+  def test_candidates_keeps_active_agent(self) -> None:
+    """The active agent is always a candidate."""
+    candidates = self.registry.candidates("weather", top_k=2, always_include=["Travel"])
+    self.assertIn("Travel", candidates)
+    self.assertIn("Weather", candidates)
+
+  def test_register_replaces_and_remove_cleans_index(self) -> None:
+    """Re-registering a card replaces its postings; removing drops them."""
+    self.registry.register(make_card("Weather", "Tells jokes"))
+    self.assertEqual(self.registry.search("forecasts"), [])
+    self.registry.remove("Weather")
+    self.assertEqual(len(self.registry), 2)
+    self.assertEqual(self.registry.search("jokes"), [])
+    self.assertNotIn("Weather", self.registry.describe())
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,135 @@
+import base64
+import random
+import unittest
+from common.types import (
+    Artifact,
+    FileContent,
+    FilePart,
+    Task,
+    TaskArtifactUpdateEvent,
+    TaskState,
+    TaskStatus,
+    TaskStatusUpdateEvent,
+    TextPart,
+)
+from service.server.artifact_assembler import ArtifactAssembler
+
+
+def text_chunk(index: int, position: int, last: bool, text: str,
+               with_position: bool = False) -> Artifact:
+  return Artifact(
+      name=f"artifact-{index}",
+      index=index,
+      parts=[TextPart(text=text)],
+      append=position > 0,
+      lastChunk=last,
+      metadata={"chunk_index": position} if with_position else None,
+  )
+
+
+def file_chunk(index: int, position: int, last: bool, data: bytes) -> Artifact:
+  return Artifact(
+      index=index,
+      parts=[FilePart(file=FileContent(
+          bytes=base64.b64encode(data).decode("ascii"), mimeType="image/png"))],
+      append=position > 0,
+      lastChunk=last,
+      metadata={"chunk_index": position},
+  )
+
+
+class ArtifactAssemblerTest(unittest.TestCase):
+  """Tests for the reassembly of artifacts streamed in chunks."""
+
+  def setUp(self) -> None:
+    self.assembler = ArtifactAssembler()
+
+  def test_append_before_first_chunk(self) -> None:
+    """A chunk appended before the first one waits for it instead of failing."""
+    self.assertIsNone(self.assembler.add("t1", text_chunk(0, 1, False, "b")))
+    self.assertIsNone(self.assembler.add("t1", text_chunk(0, 0, False, "a")))
+    artifact = self.assembler.add("t1", text_chunk(0, 2, True, "c"))
+    self.assertEqual([p.text for p in artifact.parts], ["abc"])
+    self.assertEqual(artifact.name, "artifact-0")
+    self.assertIsNone(artifact.lastChunk)
+    self.assertEqual(self.assembler.metrics()["out_of_order"], 1)
+
+  def test_binary_chunks_are_joined(self) -> None:
+    """File chunks are decoded and joined into one file part."""
+    data = bytes(range(256)) * 3
+    chunks = [data[i:i + 100] for i in range(0, len(data), 100)]
+    artifact = None
+    for position in reversed(range(len(chunks))):
+      artifact = self.assembler.add("t1", file_chunk(
+          0, position, position == len(chunks) - 1, chunks[position]))
+    self.assertEqual(len(artifact.parts), 1)
+    self.assertEqual(base64.b64decode(artifact.parts[0].file.bytes), data)
+
+  def test_limits_and_terminal_cleanup(self) -> None:
+    """Chunks are bounded per task and freed when the task ends."""
+    assembler = ArtifactAssembler(max_task_bytes=10, max_total_bytes=15)
+    assembler.add("t1", text_chunk(0, 0, False, "x" * 6))
+    assembler.add("t1", text_chunk(0, 1, False, "x" * 6))
+    self.assertEqual(assembler.metrics()["dropped"], 1)
+    assembler.add("t2", text_chunk(0, 0, False, "y" * 8))
+    assembler.add("t3", text_chunk(0, 0, False, "z" * 8))
+    metrics = assembler.metrics()
+    self.assertEqual(metrics["evicted"], 1)
+    self.assertEqual(metrics["pending_bytes"], 8)
+    self.assertEqual(assembler.discard("t3"), 1)
+    self.assertEqual(assembler.metrics()["pending_artifacts"], 0)
+
+  def test_host_manager_frees_chunks_of_failed_tasks(self) -> None:
+    """A task failing mid-stream leaves no chunks behind."""
+    from service.server.adk_host_manager import ADKHostManager
+    from common.types import AgentCapabilities, AgentCard
+    manager = ADKHostManager()
+    card = AgentCard(name="agent", url="http://agent.local/", version="1",
+                     capabilities=AgentCapabilities(), skills=[])
+    manager.task_callback(TaskArtifactUpdateEvent(
+        id="t1", artifact=text_chunk(0, 0, False, "partial")), card)
+    self.assertEqual(manager.artifact_assembler.metrics()["pending_artifacts"], 1)
+    manager.task_callback(TaskStatusUpdateEvent(
+        id="t1", status=TaskStatus(state=TaskState.FAILED)), card)
+    self.assertEqual(manager.artifact_assembler.metrics()["pending_artifacts"], 0)
+
+  def test_stress_interleaved_artifacts(self) -> None:
+    """Thousands of chunked artifacts interleaved, shuffled and duplicated."""
+    rng = random.Random(7)
+    expected = {}
+    streams = []
+    for t in range(100):
+      for index in range(20):
+        words = [f"{t}-{index}-{c};" for c in range(rng.randrange(2, 12))]
+        expected[(f"task-{t}", index)] = "".join(words)
+        # Half of the artifacts carry their chunk positions and are shuffled;
+        # the others arrive in order.
+        positioned = index % 2 == 0
+        chunks = [
+            (f"task-{t}", text_chunk(index, c, c == len(words) - 1, w, positioned))
+            for c, w in enumerate(words)
+        ]
+        if positioned:
+          chunks += rng.sample(chunks, 2)
+          rng.shuffle(chunks)
+        streams.append(chunks)
+    assembled = {}
+    while streams:
+      stream = streams[rng.randrange(len(streams))]
+      task_id, chunk = stream.pop(0)
+      artifact = self.assembler.add(task_id, chunk)
+      if artifact:
+        self.assertNotIn((task_id, artifact.index), assembled)
+        assembled[(task_id, artifact.index)] = "".join(p.text for p in artifact.parts)
+      if not stream:
+        streams.remove(stream)
+    self.assertEqual(assembled, expected)
+    metrics = self.assembler.metrics()
+    self.assertEqual(metrics["completed"], 2000)
+    self.assertEqual(metrics["pending_artifacts"], 0)
+    self.assertEqual(metrics["pending_bytes"], 0)
+    self.assertGreater(metrics["duplicates"], 0)
+
+
+if __name__ == "__main__":
+  unittest.main()
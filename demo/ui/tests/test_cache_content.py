@@ -0,0 +1,58 @@
+import base64
+import os
+import unittest
+from unittest import mock
+from fastapi import APIRouter
+from common.types import FileContent, FilePart, Message, TextPart
+from service.server.server import ConversationServer
+
+
+def make_message(message_id: str, with_file: bool = True) -> Message:
+  parts = [TextPart(text=message_id)]
+  if with_file:
+    parts.append(FilePart(file=FileContent(
+        bytes=base64.b64encode(message_id.encode()).decode(),
+        mimeType="image/png")))
+  return Message(role="agent", parts=parts, metadata={"message_id": message_id})
+
+
+class CacheContentTest(unittest.TestCase):
+  """Tests for the message views served with file urls."""
+
+  def setUp(self) -> None:
+    with mock.patch.dict(os.environ, {"A2A_HOST": "fake"}):
+      self.server = ConversationServer(APIRouter())
+
+  def tearDown(self) -> None:
+    self.server._dispatcher.stop()
+    self.server._file_cache.clear()
+
+  def test_messages_are_not_mutated(self) -> None:
+    """Views replace file contents by urls and leave the messages alone."""
+    message = make_message("m1")
+    view = self.server.cache_content([message])[0]
+    self.assertIsNot(view, message)
+    self.assertTrue(view.parts[1].file.uri.startswith("/message/file/"))
+    self.assertIsNone(view.parts[1].file.bytes)
+    self.assertIsNotNone(message.parts[1].file.bytes)
+    plain = make_message("m2", with_file=False)
+    self.assertIs(self.server.cache_content([plain])[0], plain)
+
+  def test_views_are_reused_until_the_parts_change(self) -> None:
+    """A message is transformed again only when its parts change."""
+    message = make_message("m1")
+    first = self.server.cache_content([message])[0]
+    self.assertIs(self.server.cache_content([message])[0], first)
+    message.parts.append(TextPart(text="more"))
+    second = self.server.cache_content([message])[0]
+    self.assertIsNot(second, first)
+    self.assertEqual(len(second.parts), 3)
+    # An evicted file is cached again under the same url.
+    self.server._file_cache.clear()
+    third = self.server.cache_content([message])[0]
+    self.assertIsNot(third, second)
+    self.assertEqual(third.parts[1].file.uri, second.parts[1].file.uri)
+
+
+if __name__ == "__main__":
+  unittest.main()
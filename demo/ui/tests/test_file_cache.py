@@ -0,0 +1,115 @@
+import base64
+import os
+import shutil
+import tempfile
+import unittest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from common.types import FileContent, FilePart
+from service.server.file_cache import FileCache
+
+
+def make_part(data: bytes, mime_type: str = "application/pdf") -> FilePart:
+  return FilePart(file=FileContent(
+      bytes=base64.b64encode(data).decode("ascii"), mimeType=mime_type))
+
+
+class FileCacheTest(unittest.TestCase):
+  """Tests for the bounded cache behind /message/file."""
+
+  def setUp(self) -> None:
+    self.spill_dir = tempfile.mkdtemp()
+    self.cache = FileCache(
+        max_bytes=300, max_memory_bytes=100, spill_dir=self.spill_dir)
+    app = FastAPI()
+
+    @app.get("/message/file/{file_id}")
+    def files(file_id: str, request: Request):
+      return self.cache.response(file_id, request)
+
+    self.client = TestClient(app)
+
+  def tearDown(self) -> None:
+    self.cache.clear()
+    shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+  def test_same_content_is_stored_once(self) -> None:
+    """Identical parts share one decoded copy and one id."""
+    first = self.cache.put("m1:0", make_part(b"x" * 50))
+    second = self.cache.put("m2:0", make_part(b"x" * 50))
+    self.assertEqual(first, second)
+    self.assertEqual(self.cache.metrics()["memory_bytes"], 50)
+    self.assertIsNone(self.cache.put("m3:0", FilePart(file=FileContent(
+        uri="/message/file/abc", mimeType="image/png"))))
+
+  def test_spills_and_evicts_least_recently_used(self) -> None:
+    """Files move to disk above the memory cap and are dropped above max_bytes."""
+    ids = [self.cache.put(f"m{i}:0", make_part(bytes([i]) * 80)) for i in range(4)]
+    metrics = self.cache.metrics()
+    self.assertLessEqual(metrics["memory_bytes"], 100)
+    self.assertLessEqual(metrics["memory_bytes"] + metrics["disk_bytes"], 300)
+    self.assertEqual(metrics["evictions"], 1)
+    self.assertIsNone(self.cache.get(ids[0]))
+    self.assertIsNone(self.cache.file_id("m0:0"))
+    self.assertEqual(len(os.listdir(self.spill_dir)), 2)
+    response = self.client.get(f"/message/file/{ids[1]}")
+    self.assertEqual(response.content, bytes([1]) * 80)
+
+  def test_etag_and_range(self) -> None:
+    """Conditional and partial requests are answered without the full body."""
+    data = bytes(range(200))
+    file_id = self.cache.put("m1:0", make_part(data[:90]))
+    response = self.client.get(f"/message/file/{file_id}")
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(response.headers["content-type"], "application/pdf")
+    etag = response.headers["etag"]
+    response = self.client.get(
+        f"/message/file/{file_id}", headers={"If-None-Match": etag})
+    self.assertEqual(response.status_code, 304)
+    response = self.client.get(
+        f"/message/file/{file_id}", headers={"Range": "bytes=10-19"})
+    self.assertEqual(response.status_code, 206)
+    self.assertEqual(response.content, data[10:20])
+    self.assertEqual(response.headers["content-range"], "bytes 10-19/90")
+    response = self.client.get(
+        f"/message/file/{file_id}", headers={"Range": "bytes=500-"})
+    self.assertEqual(response.status_code, 416)
+    self.assertEqual(self.client.get("/message/file/missing").status_code, 404)
+
+  def test_content_must_be_base64(self) -> None:
+    """Parts are decoded by their contract, not by guessing."""
+    part = FilePart(file=FileContent(bytes="<b>not base64</b>", mimeType="text/html"))
+    self.assertIsNone(self.cache.put("m1:0", part))
+    self.assertEqual(len(self.cache), 0)
+
+  def test_only_images_and_pdfs_are_inline(self) -> None:
+    """Other types, SVG and HTML included, are served as downloads."""
+    for mime_type, disposition in (
+        ("image/png", "inline"),
+        ("application/pdf", "inline"),
+        ("image/svg+xml", "attachment"),
+        ("text/html", "attachment"),
+    ):
+      file_id = self.cache.put(
+          f"{mime_type}:0", make_part(mime_type.encode(), mime_type))
+      response = self.client.get(f"/message/file/{file_id}")
+      self.assertEqual(response.headers["x-content-type-options"], "nosniff")
+      self.assertTrue(
+          response.headers["content-disposition"].startswith(disposition),
+          mime_type)
+
+  def test_file_evicted_while_spilling(self) -> None:
+    """A spill that finishes after its file was evicted leaves nothing behind."""
+    file_id = self.cache.put("m1:0", make_part(b"a" * 80))
+    cached = self.cache.get(file_id)
+    with self.cache._lock:
+      cached.spilling = True
+      self.cache._evict(cached)
+    self.cache._spill(cached)
+    self.assertEqual(os.listdir(self.spill_dir), [])
+    self.assertEqual(self.cache.metrics()["memory_bytes"], 0)
+    self.assertEqual(self.cache.metrics()["disk_bytes"], 0)
+
+
+if __name__ == "__main__":
+  unittest.main()
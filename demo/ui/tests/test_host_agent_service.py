@@ -0,0 +1,97 @@
+import unittest
+from unittest import mock
+from common.types import Message, TextPart
+from service.types import (
+    AgentClientHTTPError,
+    MessageInfo,
+    SendMessageResponse,
+    ServerBusyError,
+)
+from state import host_agent_service
+from state.host_agent_service import (
+    AddSendError,
+    MessageNotSentError,
+    SendMessage,
+)
+from state.state import AppState
+
+
+class FakeClient:
+  """Answers send_message with the queued responses or errors, in order."""
+
+  def __init__(self, *outcomes):
+    self.outcomes = list(outcomes)
+    self.calls = 0
+
+  async def send_message(self, request) -> SendMessageResponse:
+    self.calls += 1
+    outcome = self.outcomes.pop(0)
+    if isinstance(outcome, Exception):
+      raise outcome
+    return outcome
+
+
+def make_message() -> Message:
+  return Message(
+      role="user",
+      parts=[TextPart(text="hello")],
+      metadata={"conversation_id": "c1"},
+  )
+
+
+def busy() -> AgentClientHTTPError:
+  return AgentClientHTTPError(429, "Too Many Requests")
+
+
+class SendMessageTest(unittest.IsolatedAsyncioTestCase):
+  """Tests for how the UI hands messages to the conversation server."""
+
+  def setUp(self):
+    patcher = mock.patch.object(host_agent_service, "send_message_backoff", 0)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+
+  def use_client(self, client: FakeClient):
+    patcher = mock.patch.object(
+        host_agent_service, "get_client", return_value=client)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+
+  async def test_busy_server_is_retried(self):
+    info = MessageInfo(message_id="m1", conversation_id="c1")
+    client = FakeClient(busy(), busy(), SendMessageResponse(result=info))
+    self.use_client(client)
+    self.assertEqual(await SendMessage(make_message()), info)
+    self.assertEqual(client.calls, 3)
+
+  async def test_gives_up_while_the_server_stays_busy(self):
+    client = FakeClient(*[busy() for _ in range(4)])
+    self.use_client(client)
+    with self.assertRaisesRegex(MessageNotSentError, "busy"):
+      await SendMessage(make_message())
+    self.assertEqual(client.calls, 4)
+
+  async def test_other_errors_are_not_retried(self):
+    client = FakeClient(AgentClientHTTPError(500, "Internal Server Error"))
+    self.use_client(client)
+    with self.assertRaises(MessageNotSentError):
+      await SendMessage(make_message())
+    self.assertEqual(client.calls, 1)
+
+  async def test_json_rpc_error_is_raised(self):
+    self.use_client(FakeClient(SendMessageResponse(error=ServerBusyError())))
+    with self.assertRaisesRegex(MessageNotSentError, "Too many pending"):
+      await SendMessage(make_message())
+
+  def test_error_is_shown_in_the_conversation(self):
+    state = AppState(
+        conversations=[], messages=[], background_tasks={"m1": ""})
+    AddSendError(state, "m1", "hello", MessageNotSentError("busy"))
+    self.assertEqual(state.background_tasks, {})
+    self.assertEqual(state.messages[-1].message_id, "m1:not-sent")
+    self.assertEqual(state.messages[-1].role, "agent")
+    self.assertIn("hello", state.messages[-1].content[0][0])
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,98 @@
+import unittest
+from common.utils.in_memory_cache import LRUCache
+
+
+class FakeClock:
+
+  def __init__(self):
+    self.now = 0.0
+
+  def __call__(self) -> float:
+    return self.now
+
+
+class LRUCacheTest(unittest.TestCase):
+  """Tests for the LRU order, TTL and caps of LRUCache."""
+
+  def test_evicts_least_recently_used_across_stripes(self):
+    cache = LRUCache(max_entries=3, stripes=16)
+    for key in ("a", "b", "c"):
+      cache.set(key, key)
+    # Reading "a" makes "b" the least recently used entry.
+    self.assertEqual(cache.get("a"), "a")
+    cache.set("d", "d")
+    self.assertIsNone(cache.get("b"))
+    self.assertEqual(
+        [cache.get(key) for key in ("a", "c", "d")], ["a", "c", "d"])
+    self.assertEqual(cache.stats().evictions, 1)
+
+  def test_ttl_expiry(self):
+    clock = FakeClock()
+    cache = LRUCache(default_ttl=10, clock=clock)
+    cache.set("default", 1)
+    cache.set("short", 2, ttl=1)
+    clock.now = 5
+    self.assertIsNone(cache.get("short"))
+    self.assertEqual(cache.get("default"), 1)
+    clock.now = 10
+    self.assertIsNone(cache.get("default"))
+    self.assertEqual(cache.stats().expirations, 2)
+
+  def test_entries_without_ttl_do_not_expire(self):
+    clock = FakeClock()
+    cache = LRUCache(clock=clock)
+    cache.set("forever", 3)
+    clock.now = 1e9
+    self.assertEqual(cache.get("forever"), 3)
+
+  def test_sweep_drops_unread_expired_entries(self):
+    clock = FakeClock()
+    cache = LRUCache(clock=clock)
+    for key in range(10):
+      cache.set(key, key, ttl=1)
+    clock.now = 2
+    self.assertEqual(cache.sweep(), 10)
+    self.assertEqual(len(cache), 0)
+
+  def test_byte_cap_is_global(self):
+    cache = LRUCache(max_bytes=1000, stripes=16)
+    cache.set("a", "x" * 100)
+    self.assertEqual(cache.get("a"), "x" * 100)
+    for key in range(20):
+      cache.set(key, "y" * 100)
+    self.assertLessEqual(cache.stats().bytes, 1000)
+    self.assertEqual(cache.stats().entries, 10)
+    self.assertIsNone(cache.get("a"))
+    self.assertEqual(cache.get(19), "y" * 100)
+
+  def test_value_larger_than_byte_cap_is_rejected(self):
+    cache = LRUCache(max_bytes=100)
+    cache.set("small", "x" * 10)
+    cache.set("large", "x" * 101)
+    self.assertIsNone(cache.get("large"))
+    self.assertEqual(cache.get("small"), "x" * 10)
+
+  def test_entry_cap_is_global(self):
+    cache = LRUCache(max_entries=1000, stripes=16)
+    for key in range(1000):
+      cache.set(key, key)
+    self.assertEqual(len(cache), 1000)
+    self.assertEqual(cache.stats().evictions, 0)
+    cache.set(1000, 1000)
+    self.assertEqual(len(cache), 1000)
+    self.assertIsNone(cache.get(0))
+    self.assertEqual(cache.get(1000), 1000)
+
+  def test_clear_resets_the_caps(self):
+    cache = LRUCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.clear()
+    cache.set("c", 3)
+    cache.set("d", 4)
+    self.assertEqual(cache.stats().evictions, 0)
+    self.assertEqual(len(cache), 2)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,225 @@
+import asyncio
+import threading
+import time
+import unittest
+from common.utils.in_memory_cache import LRUCache
+from common.utils.memoize import MISSING, MemoryBackend, cached
+
+
+class FakeClock:
+
+  def __init__(self):
+    self.now = 0.0
+
+  def __call__(self) -> float:
+    return self.now
+
+
+class StaleFirstReadBackend(MemoryBackend):
+  """Misses the first read of every key, as if the value landed just after."""
+
+  def __init__(self, **kwargs):
+    super().__init__(**kwargs)
+    self.reads: dict[str, int] = {}
+
+  def get(self, key: str):
+    self.reads[key] = self.reads.get(key, 0) + 1
+    if self.reads[key] == 1:
+      return MISSING
+    return super().get(key)
+
+
+class FirstReadOfEachCallMissesBackend(MemoryBackend):
+  """Misses every other read, so each call reaches the leader's re-check."""
+
+  def __init__(self, **kwargs):
+    super().__init__(**kwargs)
+    self.reads = 0
+
+  def get(self, key: str):
+    self.reads += 1
+    if self.reads % 2:
+      return MISSING
+    return super().get(key)
+
+
+class CachedSyncTest(unittest.TestCase):
+  """Tests for @cached on plain functions."""
+
+  def test_concurrent_callers_share_one_call(self):
+    calls = []
+    barrier = threading.Barrier(8)
+
+    @cached(ttl=60)
+    def lookup(name: str) -> str:
+      calls.append(name)
+      time.sleep(0.1)
+      return name.upper()
+
+    results = []
+
+    def run():
+      barrier.wait()
+      results.append(lookup("acme"))
+
+    threads = [threading.Thread(target=run) for _ in range(8)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    self.assertEqual(calls, ["acme"])
+    self.assertEqual(results, ["ACME"] * 8)
+    self.assertEqual(lookup.stats().misses, 1)
+
+  def test_leader_rechecks_the_backend(self):
+    calls = []
+    backend = StaleFirstReadBackend()
+
+    @cached(ttl=60, backend=backend)
+    def lookup(name: str) -> str:
+      calls.append(name)
+      return name.upper()
+
+    backend.set(lookup.cache_key("acme"), "STORED", None)
+    self.assertEqual(lookup("acme"), "STORED")
+    self.assertEqual(calls, [])
+
+  def test_exception_reaches_every_waiting_caller(self):
+    calls = []
+    barrier = threading.Barrier(4)
+
+    @cached(ttl=60)
+    def lookup(name: str) -> str:
+      calls.append(name)
+      time.sleep(0.1)
+      raise KeyError(name)
+
+    errors = []
+
+    def run():
+      barrier.wait()
+      try:
+        lookup("missing")
+      except KeyError as e:
+        errors.append(e)
+
+    threads = [threading.Thread(target=run) for _ in range(4)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    self.assertEqual(len(calls), 1)
+    self.assertEqual(len(errors), 4)
+    # Errors not listed in cache_errors are not cached.
+    with self.assertRaises(KeyError):
+      lookup("missing")
+    self.assertEqual(len(calls), 2)
+
+  def test_cached_errors_are_replayed(self):
+    calls = []
+
+    @cached(ttl=60, cache_errors=(LookupError,), error_ttl=30)
+    def lookup(name: str) -> str:
+      calls.append(name)
+      raise LookupError(name)
+
+    for _ in range(3):
+      with self.assertRaises(LookupError):
+        lookup("missing")
+    self.assertEqual(calls, ["missing"])
+
+  def test_leader_replays_a_cached_error(self):
+    clock = FakeClock()
+    backend = FirstReadOfEachCallMissesBackend(cache=LRUCache(clock=clock))
+    calls = []
+
+    @cached(ttl=60, backend=backend, cache_errors=(LookupError,), error_ttl=30)
+    def lookup(name: str) -> str:
+      calls.append(name)
+      raise LookupError(name)
+
+    with self.assertRaises(LookupError):
+      lookup("missing")
+    # The leader finds the error on its re-check and raises it as is.
+    clock.now = 10
+    with self.assertRaises(LookupError):
+      lookup("missing")
+    self.assertEqual(calls, ["missing"])
+    # The replay did not store the error again, so it expires on time.
+    clock.now = 30
+    with self.assertRaises(LookupError):
+      lookup("missing")
+    self.assertEqual(calls, ["missing", "missing"])
+
+  def test_ttl(self):
+    clock = FakeClock()
+    backend = MemoryBackend(cache=LRUCache(clock=clock))
+    calls = []
+
+    @cached(ttl=10, backend=backend)
+    def lookup(name: str) -> int:
+      calls.append(name)
+      return len(calls)
+
+    self.assertEqual(lookup("a"), 1)
+    clock.now = 9
+    self.assertEqual(lookup("a"), 1)
+    clock.now = 10
+    self.assertEqual(lookup("a"), 2)
+
+  def test_callable_ttl_can_skip_caching(self):
+    calls = []
+
+    @cached(ttl=lambda result: 60 if result else 0)
+    def lookup(name: str) -> str:
+      calls.append(name)
+      return "" if name == "empty" else name
+
+    lookup("empty")
+    lookup("empty")
+    lookup("full")
+    lookup("full")
+    self.assertEqual(calls, ["empty", "empty", "full"])
+
+  def test_equivalent_arguments_share_a_key(self):
+
+    @cached(ttl=60)
+    def lookup(a: int, b: int = 2) -> int:
+      return a + b
+
+    self.assertEqual(lookup.cache_key(1), lookup.cache_key(a=1, b=2))
+
+
+class CachedAsyncTest(unittest.IsolatedAsyncioTestCase):
+  """Tests for @cached on coroutines."""
+
+  async def test_concurrent_callers_share_one_call(self):
+    calls = []
+
+    @cached(ttl=60)
+    async def lookup(name: str) -> str:
+      calls.append(name)
+      await asyncio.sleep(0.05)
+      return name.upper()
+
+    results = await asyncio.gather(*(lookup("acme") for _ in range(8)))
+    self.assertEqual(results, ["ACME"] * 8)
+    self.assertEqual(calls, ["acme"])
+
+  async def test_exception_reaches_every_waiting_caller(self):
+    calls = []
+
+    @cached(ttl=60)
+    async def lookup(name: str) -> str:
+      calls.append(name)
+      await asyncio.sleep(0.05)
+      raise KeyError(name)
+
+    results = await asyncio.gather(
+        *(lookup("missing") for _ in range(4)), return_exceptions=True)
+    self.assertTrue(all(isinstance(r, KeyError) for r in results))
+    self.assertEqual(len(calls), 1)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,64 @@
+import asyncio
+import threading
+import unittest
+from service.server.message_dispatcher import DispatcherFullError, MessageDispatcher
+
+
+class MessageDispatcherTest(unittest.TestCase):
+  """Tests for the background loop processing the UI messages."""
+
+  def setUp(self) -> None:
+    self.processed = []
+    self.done = threading.Event()
+    self.release = None
+    self.expected = 0
+
+  def tearDown(self) -> None:
+    self.dispatcher.stop()
+
+  async def handle(self, message):
+    if self.release is not None:
+      await asyncio.wrap_future(self.release)
+    await asyncio.sleep(0.01 if message[1] == 0 else 0)
+    self.processed.append(message)
+    if len(self.processed) == self.expected:
+      self.done.set()
+
+  def flush(self) -> None:
+    # Lets the dispatcher loop finish the bookkeeping of the last message.
+    asyncio.run_coroutine_threadsafe(asyncio.sleep(0), self.dispatcher.loop).result()
+
+  def test_preserves_order_per_conversation(self) -> None:
+    """Messages of one conversation run in submission order on one thread."""
+    self.dispatcher = MessageDispatcher(self.handle, max_concurrency=4)
+    self.expected = 20
+    for i in range(10):
+      self.dispatcher.submit("a", ("a", i))
+      self.dispatcher.submit("b", ("b", i))
+    self.assertTrue(self.done.wait(5))
+    self.flush()
+    for key in ("a", "b"):
+      self.assertEqual([m[1] for m in self.processed if m[0] == key], list(range(10)))
+    metrics = self.dispatcher.metrics()
+    self.assertEqual(metrics["completed"], 20)
+    self.assertEqual(metrics["pending"], 0)
+    self.assertEqual(metrics["processing_seconds"]["count"], 20)
+
+  def test_rejects_when_full(self) -> None:
+    """Submissions beyond max_pending are rejected until work completes."""
+    self.dispatcher = MessageDispatcher(self.handle, max_pending=2)
+    self.release = asyncio.run_coroutine_threadsafe(
+        asyncio.sleep(0.2), self.dispatcher.loop)
+    self.expected = 2
+    self.dispatcher.submit("a", ("a", 1))
+    self.dispatcher.submit("b", ("b", 1))
+    with self.assertRaises(DispatcherFullError):
+      self.dispatcher.submit("c", ("c", 1))
+    self.assertEqual(self.dispatcher.metrics()["rejected"], 1)
+    self.assertTrue(self.done.wait(5))
+    self.flush()
+    self.dispatcher.submit("c", ("c", 1))
+
+
+if __name__ == "__main__":
+  unittest.main()
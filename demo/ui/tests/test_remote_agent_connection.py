@@ -0,0 +1,103 @@
+import asyncio
+import unittest
+from common.types import (
+    AgentCapabilities,
+    AgentCard,
+    GetTaskResponse,
+    Message,
+    SendTaskResponse,
+    Task,
+    TaskSendParams,
+    TaskState,
+    TaskStatus,
+    TextPart,
+)
+from hosts.multiagent.push_notification_hub import PushNotificationHub
+from hosts.multiagent.remote_agent_connection import (
+    PollPolicy,
+    RemoteAgentConnections,
+)
+
+
+def make_task(state: TaskState) -> Task:
+  return Task(id="task-1", sessionId="session-1", status=TaskStatus(state=state))
+
+
+class FakeClient:
+  """Answers tasks/send with WORKING and tasks/get with the given states."""
+
+  def __init__(self, states: list[TaskState]):
+    self.states = states
+    self.sent = []
+    self.polls = 0
+
+  async def send_task(self, payload: dict) -> SendTaskResponse:
+    self.sent.append(payload)
+    return SendTaskResponse(id=1, result=make_task(TaskState.WORKING))
+
+  async def get_task(self, payload: dict) -> GetTaskResponse:
+    state = self.states[min(self.polls, len(self.states) - 1)]
+    self.polls += 1
+    return GetTaskResponse(id=1, result=make_task(state))
+
+
+class RemoteAgentConnectionsTest(unittest.TestCase):
+  """Tests for the submit-then-poll mode of non-streaming agents."""
+
+  def make_connection(self, states, push=False, **policy):
+    card = AgentCard(
+        name="Reports",
+        url="http://reports/",
+        version="0.0.1",
+        capabilities=AgentCapabilities(streaming=False, pushNotifications=push),
+        skills=[],
+    )
+    hub = PushNotificationHub("http://host/task/notify") if push else None
+    connection = RemoteAgentConnections(
+        card,
+        poll_policy=PollPolicy(initial_interval=0.01, jitter=0, **policy),
+        notification_hub=hub,
+    )
+    connection.agent_client = FakeClient(states)
+    return connection
+
+  def send(self, connection, callback=None):
+    request = TaskSendParams(
+        id="task-1",
+        sessionId="session-1",
+        message=Message(role="user", parts=[TextPart(text="analyze")]),
+    )
+    return asyncio.run(connection.send_task(request, callback))
+
+  def test_polls_until_final_state(self) -> None:
+    """The task is polled until it completes and each change is reported once."""
+    connection = self.make_connection(
+        [TaskState.WORKING, TaskState.WORKING, TaskState.COMPLETED])
+    seen = []
+    task = self.send(connection, lambda t, card: seen.append(t.status.state))
+    self.assertEqual(task.status.state, TaskState.COMPLETED)
+    self.assertEqual(connection.agent_client.polls, 3)
+    self.assertEqual(seen[0], TaskState.WORKING)
+    self.assertEqual(seen[-1], TaskState.COMPLETED)
+
+  def test_timeout_raises(self) -> None:
+    """A task that never leaves WORKING fails after the poll timeout."""
+    connection = self.make_connection([TaskState.WORKING], timeout=0.05)
+    with self.assertRaises(TimeoutError):
+      self.send(connection)
+
+  def test_push_notification_wakes_poller(self) -> None:
+    """With push notifications the next poll happens on notification."""
+    connection = self.make_connection(
+        [TaskState.COMPLETED], push=True, push_interval=30)
+    # Delivered before the poller waits, so it must not be lost.
+    connection.notification_hub.notify("task-1")
+    task = self.send(connection)
+    self.assertEqual(task.status.state, TaskState.COMPLETED)
+    self.assertEqual(
+        connection.agent_client.sent[0]["pushNotification"]["url"],
+        "http://host/task/notify")
+
+
+if __name__ == "__main__":
+  unittest.main()
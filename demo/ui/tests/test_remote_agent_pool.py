@@ -0,0 +1,275 @@
+import asyncio
+import unittest
+import httpx
+from common.types import (
+    AgentCapabilities,
+    AgentCard,
+    Task,
+    TaskSendParams,
+    TaskState,
+    TaskStatus,
+)
+from hosts.multiagent.host_agent import HostAgent
+from hosts.multiagent.remote_agent_pool import (
+    CircuitBreaker,
+    RemoteAgentConnectionPool,
+)
+
+
+class FakeClock:
+
+  def __init__(self):
+    self.now = 0.0
+
+  def __call__(self) -> float:
+    return self.now
+
+
+class HangingConnection:
+  """Never answers, like a replica that is slower than the caller's timeout."""
+
+  async def send_task(self, request: TaskSendParams, callback=None) -> Task:
+    await asyncio.Event().wait()
+
+
+class FakeConnection:
+  """Completes every task, or raises `error` without reaching the agent."""
+
+  def __init__(self, error: Exception | None = None):
+    self.error = error
+    self.requests: list[TaskSendParams] = []
+
+  async def send_task(self, request: TaskSendParams, callback=None) -> Task:
+    self.requests.append(request)
+    if self.error:
+      raise self.error
+    return Task(
+        id=request.id,
+        sessionId=request.sessionId,
+        status=TaskStatus(state=TaskState.COMPLETED),
+    )
+
+
+def make_card(url: str = "http://reports-1/", description: str = "") -> AgentCard:
+  return AgentCard(
+      name="Reports",
+      description=description,
+      url=url,
+      version="0.0.1",
+      capabilities=AgentCapabilities(),
+      skills=[],
+  )
+
+
+def make_request(session_id: str = "session-1") -> TaskSendParams:
+  return TaskSendParams(
+      id="task-1",
+      sessionId=session_id,
+      message={"role": "user", "parts": [{"type": "text", "text": "hi"}]},
+  )
+
+
+class CircuitBreakerTest(unittest.TestCase):
+  """Tests for the open, half-open and closed states."""
+
+  def make_breaker(self) -> tuple[CircuitBreaker, FakeClock]:
+    clock = FakeClock()
+    breaker = CircuitBreaker(
+        failure_rate_threshold=0.5, min_requests=4, open_seconds=30,
+        clock=clock)
+    return breaker, clock
+
+  def test_opens_at_the_failure_rate(self):
+    breaker, _ = self.make_breaker()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_success()
+    self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+    breaker.record_failure()
+    self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+    self.assertFalse(breaker.allow_request())
+
+  def test_half_open_lets_one_trial_through(self):
+    breaker, clock = self.make_breaker()
+    for _ in range(4):
+      breaker.record_failure()
+    clock.now = 30
+    self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+    self.assertTrue(breaker.allow_request())
+    self.assertFalse(breaker.allow_request())
+    self.assertFalse(breaker.is_available())
+
+  def test_successful_trial_closes(self):
+    breaker, clock = self.make_breaker()
+    for _ in range(4):
+      breaker.record_failure()
+    clock.now = 30
+    breaker.allow_request()
+    breaker.record_success()
+    self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+    self.assertTrue(breaker.allow_request())
+
+  def test_failed_trial_reopens(self):
+    breaker, clock = self.make_breaker()
+    for _ in range(4):
+      breaker.record_failure()
+    clock.now = 30
+    breaker.allow_request()
+    breaker.record_failure()
+    self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+    clock.now = 59
+    self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+    clock.now = 60
+    self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+
+  def test_released_trial_can_be_retried(self):
+    breaker, clock = self.make_breaker()
+    for _ in range(4):
+      breaker.record_failure()
+    clock.now = 30
+    self.assertTrue(breaker.allow_request())
+    breaker.release()
+    self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+    self.assertTrue(breaker.is_available())
+    self.assertTrue(breaker.allow_request())
+
+  def test_old_outcomes_leave_the_window(self):
+    clock = FakeClock()
+    breaker = CircuitBreaker(min_requests=2, window_seconds=10, clock=clock)
+    breaker.record_failure()
+    clock.now = 11
+    breaker.record_failure()
+    self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+
+class RemoteAgentConnectionPoolTest(unittest.IsolatedAsyncioTestCase):
+  """Tests for failover and the lazy health checks of the pool."""
+
+  def make_pool(self, *connections: FakeConnection,
+                **kwargs) -> RemoteAgentConnectionPool:
+    urls = [f"http://reports-{i + 1}/" for i in range(len(connections))]
+    pool = RemoteAgentConnectionPool(
+        make_card(urls[0]), replica_urls=urls[1:], **kwargs)
+    for endpoint, connection in zip(pool.endpoints, connections):
+      endpoint.connection = connection
+    return pool
+
+  async def test_unreachable_endpoint_fails_over(self):
+    down = FakeConnection(httpx.ConnectError("refused"))
+    up = FakeConnection()
+    pool = self.make_pool(down, up, health_check_interval=3600)
+    pool._last_health_check = float("inf")
+    for i in range(4):
+      task = await pool.send_task(make_request(f"session-{i}"), None)
+      self.assertEqual(task.status.state, TaskState.COMPLETED)
+    self.assertEqual(len(up.requests), 4)
+    # The failed endpoint is out of rotation after the first failure.
+    self.assertEqual(len(down.requests), 1)
+    self.assertFalse(pool.endpoints[0].healthy)
+
+  async def test_session_sticks_to_its_endpoint(self):
+    first, second = FakeConnection(), FakeConnection()
+    pool = self.make_pool(first, second)
+    pool._last_health_check = float("inf")
+    for _ in range(3):
+      await pool.send_task(make_request("session-1"), None)
+    self.assertEqual(
+        sorted([len(first.requests), len(second.requests)]), [0, 3])
+
+  async def test_other_errors_are_not_retried(self):
+    broken = FakeConnection(ValueError("bad request"))
+    other = FakeConnection()
+    pool = self.make_pool(broken, other)
+    pool._last_health_check = float("inf")
+    pool._affinity.set("session-1", "http://reports-1/")
+    with self.assertRaises(ValueError):
+      await pool.send_task(make_request("session-1"), None)
+    self.assertEqual(other.requests, [])
+
+  async def test_every_endpoint_open_raises(self):
+    down = FakeConnection(httpx.ConnectError("refused"))
+    pool = self.make_pool(
+        down, breaker_factory=lambda: CircuitBreaker(min_requests=1))
+    with self.assertRaises(ValueError):
+      await pool.send_task(make_request(), None)
+    with self.assertRaises(ValueError):
+      await pool.send_task(make_request(), None)
+    self.assertEqual(len(down.requests), 1)
+
+  async def test_cancelled_trial_frees_the_endpoint(self):
+    clock = FakeClock()
+    pool = self.make_pool(
+        HangingConnection(),
+        breaker_factory=lambda: CircuitBreaker(min_requests=1, clock=clock))
+    pool._last_health_check = float("inf")
+    endpoint = pool.endpoints[0]
+    endpoint.breaker.record_failure()
+    clock.now = 30
+    with self.assertRaises(asyncio.TimeoutError):
+      await asyncio.wait_for(pool.send_task(make_request(), None), timeout=0.05)
+    self.assertEqual(endpoint.breaker.state, CircuitBreaker.HALF_OPEN)
+    self.assertEqual(endpoint.outstanding, 0)
+    # The next call is let through as the trial and closes the breaker.
+    endpoint.connection = FakeConnection()
+    task = await pool.send_task(make_request(), None)
+    self.assertEqual(task.status.state, TaskState.COMPLETED)
+    self.assertEqual(endpoint.breaker.state, CircuitBreaker.CLOSED)
+
+  async def test_health_check_does_not_block_requests(self):
+    pool = self.make_pool(FakeConnection(), FakeConnection())
+    started = asyncio.Event()
+    release = asyncio.Event()
+    checks = []
+
+    async def slow_check():
+      checks.append(1)
+      started.set()
+      await release.wait()
+
+    pool.check_health = slow_check
+    await asyncio.wait_for(pool.send_task(make_request(), None), timeout=1)
+    await asyncio.wait_for(started.wait(), timeout=1)
+    # A second request while the probe is in flight starts no other probe.
+    pool._last_health_check = 0.0
+    await asyncio.wait_for(pool.send_task(make_request(), None), timeout=1)
+    self.assertEqual(len(checks), 1)
+    release.set()
+    await pool._check_task
+
+  async def test_failed_health_check_is_contained(self):
+    pool = self.make_pool(FakeConnection(), FakeConnection())
+
+    async def failing_check():
+      raise RuntimeError("probe failed")
+
+    pool.check_health = failing_check
+    await pool.send_task(make_request(), None)
+    await pool._check_task
+    self.assertIsNone(pool._check_task.exception())
+
+
+class RegisterAgentCardTest(unittest.TestCase):
+  """Tests for how HostAgent maps cards onto pools."""
+
+  def test_same_url_reuses_the_pool(self):
+    host = HostAgent([])
+    host.register_agent_card(make_card())
+    pool = host.remote_agent_connections["Reports"]
+    host.register_agent_card(make_card(description="refreshed"))
+    self.assertIs(host.remote_agent_connections["Reports"], pool)
+    self.assertEqual(pool.card.description, "refreshed")
+    self.assertEqual(host.cards["Reports"].description, "refreshed")
+    self.assertEqual(len(pool.endpoints), 1)
+
+  def test_other_url_joins_as_a_replica(self):
+    host = HostAgent([])
+    host.register_agent_card(make_card("http://reports-1/"))
+    host.register_agent_card(make_card("http://reports-2/"))
+    pool = host.remote_agent_connections["Reports"]
+    self.assertEqual(
+        [e.url for e in pool.endpoints],
+        ["http://reports-1/", "http://reports-2/"])
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,122 @@
+import asyncio
+import types
+import unittest
+from common.types import (
+    Artifact,
+    Task,
+    TaskSendParams,
+    TaskState,
+    TaskStatus,
+    TextPart,
+)
+from hosts.multiagent.host_agent import HostAgent
+
+
+class FakePool:
+  """Answers every task after `delay` seconds, or raises `error`."""
+
+  def __init__(self, delay: float = 0.0, error: Exception | None = None):
+    self.delay = delay
+    self.error = error
+    self.requests: list[TaskSendParams] = []
+    self.in_flight = 0
+    self.peak = 0
+
+  async def send_task(self, request: TaskSendParams, callback=None) -> Task:
+    self.requests.append(request)
+    self.in_flight += 1
+    self.peak = max(self.peak, self.in_flight)
+    try:
+      await asyncio.sleep(self.delay)
+      if self.error:
+        raise self.error
+      text = request.message.parts[0].text
+      return Task(
+          id=request.id,
+          sessionId=request.sessionId,
+          status=TaskStatus(state=TaskState.COMPLETED),
+          artifacts=[Artifact(parts=[TextPart(text=f"done: {text}")])],
+      )
+    finally:
+      self.in_flight -= 1
+
+
+def make_tool_context() -> types.SimpleNamespace:
+  return types.SimpleNamespace(
+      state={
+          'session_id': 'session-1',
+          'input_message_metadata': {'message_id': 'user-message-1'},
+      },
+      actions=types.SimpleNamespace(skip_summarization=False, escalate=False),
+  )
+
+
+class SendTasksParallelTest(unittest.IsolatedAsyncioTestCase):
+  """Tests for the scatter-gather tool of HostAgent."""
+
+  def make_host(self, pools: dict[str, FakePool], **kwargs) -> HostAgent:
+    host = HostAgent([], **kwargs)
+    host.remote_agent_connections.update(pools)
+    return host
+
+  async def test_results_keep_the_input_order(self):
+    pools = {'slow': FakePool(delay=0.1), 'fast': FakePool(delay=0.0)}
+    host = self.make_host(pools)
+    results = await host.send_tasks_parallel(
+        ['slow', 'fast', 'slow'], ['a', 'b', 'c'], make_tool_context())
+    self.assertEqual(
+        [r['agent_name'] for r in results], ['slow', 'fast', 'slow'])
+    self.assertEqual(
+        [r['response'] for r in results],
+        [['done: a'], ['done: b'], ['done: c']])
+    self.assertTrue(all(r['state'] == 'completed' for r in results))
+
+  async def test_slow_subtask_times_out_alone(self):
+    pools = {'slow': FakePool(delay=1.0), 'fast': FakePool()}
+    host = self.make_host(pools, subtask_timeout=0.1)
+    results = await host.send_tasks_parallel(
+        ['slow', 'fast'], ['a', 'b'], make_tool_context())
+    self.assertEqual(results[0]['state'], 'failed')
+    self.assertIn('timed out', results[0]['error'])
+    self.assertEqual(results[1]['state'], 'completed')
+
+  async def test_failure_does_not_sink_the_others(self):
+    pools = {'broken': FakePool(error=RuntimeError('boom')), 'ok': FakePool()}
+    host = self.make_host(pools)
+    results = await host.send_tasks_parallel(
+        ['ok', 'broken', 'ok'], ['a', 'b', 'c'], make_tool_context())
+    self.assertEqual(
+        [r['state'] for r in results], ['completed', 'failed', 'completed'])
+    self.assertEqual(results[1]['error'], 'boom')
+
+  async def test_in_flight_subtasks_are_bounded(self):
+    pool = FakePool(delay=0.05)
+    host = self.make_host({'agent': pool}, max_parallel_tasks=2)
+    await host.send_tasks_parallel(
+        ['agent'] * 6, [str(i) for i in range(6)], make_tool_context())
+    self.assertEqual(pool.peak, 2)
+
+  async def test_subtasks_get_their_own_message_ids(self):
+    pool = FakePool()
+    host = self.make_host({'agent': pool})
+    tool_context = make_tool_context()
+    await host.send_tasks_parallel(
+        ['agent'] * 3, ['a', 'b', 'c'], tool_context)
+    metadata = [r.message.metadata for r in pool.requests]
+    message_ids = {m['message_id'] for m in metadata}
+    self.assertEqual(len(message_ids), 3)
+    self.assertNotIn('user-message-1', message_ids)
+    self.assertTrue(
+        all(m['parent_message_id'] == 'user-message-1' for m in metadata))
+    # The session's active task and agent are left untouched.
+    self.assertNotIn('task_id', tool_context.state)
+    self.assertNotIn('agent', tool_context.state)
+
+  async def test_unknown_agent_is_rejected(self):
+    host = self.make_host({'agent': FakePool()})
+    with self.assertRaises(ValueError):
+      await host.send_tasks_parallel(['other'], ['a'], make_tool_context())
+
+
+if __name__ == "__main__":
+  unittest.main()
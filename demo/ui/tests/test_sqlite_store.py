@@ -0,0 +1,168 @@
+import os
+import shutil
+import tempfile
+import unittest
+from google.adk.events.event import Event as ADKEvent
+from google.adk.events.event_actions import EventActions
+from google.genai import types
+from common.types import Message, Task, TaskState, TaskStatus, TextPart
+from service.server.sqlite_adk_services import (
+    SQLiteArtifactService,
+    SQLiteSessionService,
+)
+from service.server.sqlite_database import SQLiteDatabase
+from service.server.sqlite_state_store import SQLiteStateStore
+from service.types import Conversation, Event
+
+
+def make_message(message_id: str, conversation_id: str) -> Message:
+  return Message(
+      role="user",
+      parts=[TextPart(text=message_id)],
+      metadata={"message_id": message_id, "conversation_id": conversation_id},
+  )
+
+
+class SQLiteStoreTest(unittest.TestCase):
+  """Tests for the SQLite persistence of the UI host state."""
+
+  def setUp(self) -> None:
+    self.directory = tempfile.mkdtemp()
+    self.path = os.path.join(self.directory, "state.sqlite")
+    self.db = SQLiteDatabase(self.path)
+
+  def tearDown(self) -> None:
+    self.db.close()
+    shutil.rmtree(self.directory, ignore_errors=True)
+
+  def restart(self) -> None:
+    self.db.close()
+    self.db = SQLiteDatabase(self.path)
+
+  def test_state_survives_restart(self) -> None:
+    """Conversations, messages, tasks and events are reloaded from the file."""
+    store = SQLiteStateStore(self.db)
+    conversation = Conversation(conversation_id="c1", is_active=True, name="first")
+    store.add_conversation(conversation)
+    for i in range(3):
+      store.add_conversation_message(conversation, make_message(f"m{i}", "c1"))
+    task = Task(id="t1", sessionId="c1", status=TaskStatus(state=TaskState.WORKING))
+    store.add_task(task)
+    task.status = TaskStatus(state=TaskState.COMPLETED)
+    store.update_task(task)
+    store.add_event(Event(
+        id="e1", actor="user", content=make_message("m0", "c1"), timestamp=1.0))
+    self.restart()
+
+    store = SQLiteStateStore(self.db)
+    self.assertEqual([c.name for c in store.conversations], ["first"])
+    self.assertEqual(store.message_ids("c1"), ["m0", "m1", "m2"])
+    # Message bodies are only read with their conversation.
+    self.assertEqual(store.conversations[0].messages, [])
+    messages, _ = store.conversation_messages_since("c1")
+    self.assertEqual([m.parts[0].text for m in messages], ["m0", "m1", "m2"])
+    self.assertEqual(store.get_task("t1").status.state, TaskState.COMPLETED)
+    self.assertEqual([e.id for e in store.events], ["e1"])
+    self.assertEqual(store.get_message("m1").parts[0].text, "m1")
+
+  def test_conversation_messages_are_evicted(self) -> None:
+    """Only the most recently read conversations keep messages in memory."""
+    store = SQLiteStateStore(self.db, max_loaded_conversations=1)
+    for cid in ("c1", "c2"):
+      conversation = Conversation(conversation_id=cid, is_active=True)
+      store.add_conversation(conversation)
+      store.add_conversation_message(conversation, make_message(f"{cid}-m", cid))
+    self.assertEqual(store._conversations["c1"].messages, [])
+    messages, cursor = store.conversation_messages_since("c1")
+    self.assertEqual([m.parts[0].text for m in messages], ["c1-m"])
+    self.assertEqual(store._conversations["c2"].messages, [])
+    self.assertEqual(store.conversation_messages_since("c1", cursor), ([], cursor))
+
+  def test_events_page(self) -> None:
+    """Events beyond the in-memory window are read by page."""
+    store = SQLiteStateStore(self.db, max_events=4)
+    for i in range(10):
+      store.add_event(Event(
+          id=f"e{i}", actor="agent", content=make_message(f"m{i}", "c1"),
+          timestamp=float(i)))
+    self.assertLessEqual(len(store.events), 5)
+    page = store.events_page(before=6.0, limit=3)
+    self.assertEqual([e.id for e in page], ["e5", "e4", "e3"])
+    self.assertEqual(len(store.events_page(conversation_id="c1", limit=100)), 10)
+
+  def test_tasks_are_bounded(self) -> None:
+    """Only the most recently changed tasks stay in memory."""
+    store = SQLiteStateStore(self.db, max_tasks=4)
+    tasks = []
+    for i in range(10):
+      task = Task(
+          id=f"t{i}", sessionId="c1", status=TaskStatus(state=TaskState.WORKING))
+      store.add_task(task)
+      tasks.append(task)
+      if i == 0:
+        # Kept alive by its updates.
+        continue
+      tasks[0].status = TaskStatus(state=TaskState.WORKING)
+      store.update_task(tasks[0])
+    self.assertLessEqual(len(store.tasks), 5)
+    self.assertIn("t0", [t.id for t in store.tasks])
+    self.assertNotIn("t1", [t.id for t in store.tasks])
+    updated, _ = store.tasks_since(0)
+    self.assertEqual(len(updated), len(store.tasks))
+    # An evicted task is read back and its updates are kept.
+    task = store.get_task("t1")
+    self.assertEqual(task.id, "t1")
+    task.status = TaskStatus(state=TaskState.COMPLETED)
+    store.update_task(task)
+    self.assertTrue(store.has_task("t2"))
+    self.assertFalse(store.has_task("missing"))
+    self.restart()
+
+    store = SQLiteStateStore(self.db, max_tasks=4)
+    self.assertEqual(len(store.tasks), 4)
+    self.assertEqual(store.get_task("t1").status.state, TaskState.COMPLETED)
+    store.add_task(Task(
+        id="t10", sessionId="c1", status=TaskStatus(state=TaskState.WORKING)))
+    self.db.flush()
+    positions = dict(self.db.query("SELECT id, position FROM tasks"))
+    self.assertEqual(positions["t10"], 10)
+    self.assertEqual(positions["t1"], 1)
+
+  def test_session_service(self) -> None:
+    """Sessions, their state and events are kept across restarts."""
+    service = SQLiteSessionService(self.db)
+    session = service.create_session(
+        app_name="A2A", user_id="u", state={"user:lang": "ja"})
+    service.append_event(session, ADKEvent(
+        author="host_agent",
+        invocation_id="i1",
+        actions=EventActions(state_delta={"task_id": "t1", "temp:x": 1}),
+    ))
+    self.restart()
+    service = SQLiteSessionService(self.db)
+    loaded = service.get_session(app_name="A2A", user_id="u", session_id=session.id)
+    self.assertEqual(loaded.state, {"task_id": "t1", "user:lang": "ja"})
+    self.assertEqual(len(loaded.events), 1)
+    self.assertEqual(
+        [s.id for s in service.list_sessions(app_name="A2A", user_id="u").sessions],
+        [session.id])
+    other = service.create_session(app_name="A2A", user_id="u")
+    self.assertEqual(other.state, {"user:lang": "ja"})
+
+  def test_artifact_versions(self) -> None:
+    """Every saved artifact gets a new version."""
+    service = SQLiteArtifactService(self.db)
+    key = dict(app_name="A2A", user_id="u", session_id="s", filename="a.png")
+    for data in (b"one", b"two"):
+      service.save_artifact(
+          **key, artifact=types.Part.from_bytes(data=data, mime_type="image/png"))
+    self.assertEqual(service.list_versions(**key), [0, 1])
+    self.assertEqual(service.load_artifact(**key).inline_data.data, b"two")
+    self.assertEqual(service.load_artifact(**key, version=0).inline_data.data, b"one")
+    self.assertEqual(
+        service.list_artifact_keys(app_name="A2A", user_id="u", session_id="s"),
+        ["a.png"])
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,96 @@
+import types
+import unittest
+from common.types import Message, Task, TaskState, TaskStatus, TextPart
+from service.server.adk_host_manager import ADKHostManager
+from service.server.state_stream import (
+    StateStreamer,
+    advance,
+    build_snapshot,
+    has_changes,
+)
+from service.types import Conversation, StateSnapshotParams
+
+
+class StateSnapshotTest(unittest.TestCase):
+  """Tests for the snapshot served by /state/snapshot and /state/stream."""
+
+  def setUp(self) -> None:
+    self.manager = ADKHostManager()
+    self.store = self.manager._store
+    self.conversation = Conversation(conversation_id="c1", is_active=True)
+    self.store.add_conversation(self.conversation)
+
+  def add_message(self, message_id: str) -> None:
+    self.store.add_conversation_message(self.conversation, Message(
+        role="user",
+        parts=[TextPart(text=message_id)],
+        metadata={"message_id": message_id, "conversation_id": "c1"},
+    ))
+
+  def test_first_snapshot_has_everything(self) -> None:
+    """A snapshot without cursors carries every view of the page."""
+    self.add_message("m1")
+    self.store.add_task(Task(id="t1", status=TaskStatus(state=TaskState.WORKING)))
+    snapshot = build_snapshot(
+        self.manager, StateSnapshotParams(conversation_id="c1"))
+    self.assertEqual([m.metadata["message_id"] for m in snapshot.messages], ["m1"])
+    self.assertEqual([t.id for t in snapshot.tasks], ["t1"])
+    self.assertEqual(snapshot.conversations[0].message_ids, ["m1"])
+    self.assertEqual(snapshot.pending, {})
+    self.assertIsNone(snapshot.events)
+    self.assertEqual(snapshot.versions, self.store.versions)
+
+  def test_unchanged_views_are_omitted(self) -> None:
+    """After advancing the cursors only the changed views are returned."""
+    params = StateSnapshotParams(conversation_id="c1")
+    advance(params, build_snapshot(self.manager, params))
+    snapshot = build_snapshot(self.manager, params)
+    self.assertFalse(has_changes(snapshot))
+    self.add_message("m2")
+    snapshot = build_snapshot(self.manager, params)
+    self.assertEqual([m.metadata["message_id"] for m in snapshot.messages], ["m2"])
+    self.assertIsNotNone(snapshot.conversations)
+    self.assertIsNone(snapshot.tasks)
+    self.assertIsNone(snapshot.pending)
+
+
+class FakeRequest:
+
+  query_params = {"conversation_id": "c1"}
+
+  async def is_disconnected(self) -> bool:
+    return False
+
+
+class StateStreamerTest(unittest.IsolatedAsyncioTestCase):
+  """Tests for the change listeners of /state/stream."""
+
+  def setUp(self) -> None:
+    self.manager = ADKHostManager()
+    self.streamer = StateStreamer(self.manager, coalesce=0)
+
+  async def test_unstarted_stream_leaves_no_listener(self) -> None:
+    """A client gone before the first event never registers a listener."""
+    response = await self.streamer.stream(FakeRequest())
+    await response.body_iterator.aclose()
+    self.assertEqual(self.manager._store._listeners, ())
+    self.assertEqual(self.streamer.connections, 0)
+
+  async def test_listener_is_removed_when_the_stream_ends(self) -> None:
+    response = await self.streamer.stream(FakeRequest())
+    events = response.body_iterator
+    self.assertTrue((await anext(events)).startswith("event: delta"))
+    self.assertEqual(len(self.manager._store._listeners), 1)
+    self.assertEqual(self.streamer.connections, 1)
+    await events.aclose()
+    self.assertEqual(self.manager._store._listeners, ())
+    self.assertEqual(self.streamer.connections, 0)
+
+  async def test_manager_without_notifications(self) -> None:
+    streamer = StateStreamer(types.SimpleNamespace(notifies_changes=False))
+    response = await streamer.stream(FakeRequest())
+    self.assertEqual(response.status_code, 204)
+
+
+if __name__ == "__main__":
+  unittest.main()
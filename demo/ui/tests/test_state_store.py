@@ -0,0 +1,70 @@
+import unittest
+from common.types import Message, Task, TaskState, TaskStatus, TextPart
+from service.server.state_store import StateStore
+from service.types import Conversation, Event
+
+
+def make_message(message_id: str) -> Message:
+  return Message(
+      role="agent",
+      parts=[TextPart(text=message_id)],
+      metadata={"message_id": message_id},
+  )
+
+
+def make_task(task_id: str) -> Task:
+  return Task(id=task_id, status=TaskStatus(state=TaskState.WORKING), history=[])
+
+
+class StateStoreTest(unittest.TestCase):
+  """Tests for the indexed state and incremental feeds of the host manager."""
+
+  def setUp(self) -> None:
+    self.store = StateStore()
+
+  def test_task_history_is_deduplicated(self) -> None:
+    """A message id is appended to a task history only once."""
+    task = make_task("t1")
+    self.store.add_task(task)
+    self.assertTrue(self.store.add_task_message(task, make_message("m1")))
+    self.assertFalse(self.store.add_task_message(task, make_message("m1")))
+    self.assertEqual(len(task.history), 1)
+    self.assertIs(self.store.get_task("t1"), task)
+
+  def test_tasks_since_returns_changed_tasks(self) -> None:
+    """Only tasks changed after the cursor are returned, least recent first."""
+    for task_id in ("t1", "t2", "t3"):
+      self.store.add_task(make_task(task_id))
+    tasks, cursor = self.store.tasks_since(0)
+    self.assertEqual([t.id for t in tasks], ["t1", "t2", "t3"])
+    self.assertEqual(self.store.tasks_since(cursor), ([], cursor))
+    task = self.store.get_task("t1")
+    task.status = TaskStatus(state=TaskState.COMPLETED)
+    self.store.update_task(task)
+    tasks, _ = self.store.tasks_since(cursor)
+    self.assertEqual([t.id for t in tasks], ["t1"])
+
+  def test_limit_pages_through_the_log(self) -> None:
+    """A limited read returns a cursor that resumes after the last item."""
+    conversation = Conversation(conversation_id="c1", is_active=True)
+    self.store.add_conversation(conversation)
+    for i in range(5):
+      self.store.add_conversation_message(conversation, make_message(f"m{i}"))
+    first, cursor = self.store.conversation_messages_since("c1", 0, limit=3)
+    rest, cursor = self.store.conversation_messages_since("c1", cursor, limit=3)
+    self.assertEqual(
+        [m.metadata["message_id"] for m in first + rest],
+        [f"m{i}" for i in range(5)])
+    self.assertEqual(self.store.conversation_messages_since("c1", cursor), ([], cursor))
+
+  def test_events_sorted_and_stale_cursor_restarts(self) -> None:
+    """Events are listed by timestamp and a cursor from the future resets."""
+    self.store.add_event(Event(id="e2", content=make_message("b"), timestamp=2.0))
+    self.store.add_event(Event(id="e1", content=make_message("a"), timestamp=1.0))
+    self.assertEqual([e.id for e in self.store.events], ["e1", "e2"])
+    events, _ = self.store.events_since(1000)
+    self.assertEqual([e.id for e in events], ["e2", "e1"])
+
+
+if __name__ == "__main__":
+  unittest.main()
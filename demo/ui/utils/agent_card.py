@@ -1,9 +1,15 @@
 import requests
 from common.types import AgentCard
+from common.utils.memoize import cached
 
+
+# Cards rarely change; the UI fetches the same card on every page render and
+# registration, so keep it for a minute and replay failures briefly.
+@cached(ttl=60, maxsize=256, cache_errors=(requests.RequestException,), error_ttl=5)
 def get_agent_card(remote_agent_address: str) -> AgentCard:
   """Get the agent card."""
   agent_card = requests.get(
       f"http://{remote_agent_address}/.well-known/agent.json"
   )
+  agent_card.raise_for_status()
   return AgentCard(**agent_card.json())